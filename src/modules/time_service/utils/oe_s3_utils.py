@@ -0,0 +1 @@
+../../../scripts/oe_s3_utils.py
\ No newline at end of file
@@ -28,6 +28,7 @@ import botocore.session
 from botocore.stub import Stubber
 import os
 import threading
+from oe_s3_utils import listObjects
 
 TEST_RESPONSE = {
     'IsTruncated': False,
@@ -175,21 +176,11 @@ def invenGetAllKeys(conn, bucket):
     return keys
 
 
-def getAllKeys(conn, bucket):
-    # https://alexwlchan.net/2017/07/listing-s3-keys/   
-    keys = []
-    kwargs = {'Bucket': bucket}
+def getAllKeys(conn, bucket, shard_depth=3):
+    # Lists projection/layer/year prefixes concurrently and yields the keys as they arrive
     print('Using boto list_objects_v2')
-    while True:
-        resp = conn.list_objects_v2(**kwargs)
-        for obj in resp['Contents']:
-            keys.append(obj['Key'])
-
-        try:
-            kwargs['ContinuationToken'] = resp['NextContinuationToken']
-        except KeyError:
-            break
-    return keys
+    for obj in listObjects(conn, bucket, shard_depth=shard_depth):
+        yield obj['Key']
 
 
 def updateDateService(redis_uri,
@@ -210,8 +201,10 @@ def updateDateService(redis_uri,
         print(f'Data already exists - skipping time scrape')
         return
 
-    # Use mock S3 if test
+    # Use mock S3 if test. The stubbed client only serves a single, unsharded listing
+    shard_depth = 3
     if bucket == 'test-bucket':
+        shard_depth = 0
         s3 = botocore.session.get_session().create_client('s3')
         stubber = Stubber(s3)
         stubber.add_response('list_objects_v2', TEST_RESPONSE)
@@ -240,9 +233,9 @@ def updateDateService(redis_uri,
         if(invenKeys):
             objects = reduce(keyMapper, invenKeys, {})
         else:
-            objects = reduce(keyMapper, getAllKeys(s3, bucket), {})
+            objects = reduce(keyMapper, getAllKeys(s3, bucket, shard_depth), {})
     else:
-        objects = reduce(keyMapper, getAllKeys(s3, bucket), {})
+        objects = reduce(keyMapper, getAllKeys(s3, bucket, shard_depth), {})
 
     with open(os.path.dirname(os.path.realpath(__file__)) + '/periods.lua',
               'r') as f:
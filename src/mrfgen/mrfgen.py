@@ -77,6 +77,7 @@ import subprocess
 import sys
 import time
 import urllib.parse
+import urllib.request
 import xml.dom.minidom
 import shutil
 import imghdr
@@ -85,12 +86,15 @@ import math
 import oe_utils
 import json
 import re
+import hashlib
+import numpy as np
 from overtiffpacker import pack
 from decimal import *
 from osgeo import gdal
-from oe_utils import basename, sigevent, log_sig_exit, log_sig_err, log_sig_warn, log_info_mssg, log_info_mssg_with_timestamp, log_the_command, get_modification_time, get_dom_tag_value, remove_file, check_abs_path, add_trailing_slash, verify_directory_path_exists, get_input_files, get_doy_string
+from oe_utils import sigevent, log_sig_exit, log_sig_warn, log_info_mssg, log_info_mssg_with_timestamp, log_the_command, get_modification_time, get_dom_tag_value, remove_file, check_abs_path, add_trailing_slash, verify_directory_path_exists, get_input_files, get_doy_string
 
 import multiprocessing
+import concurrent.futures
 import datetime
 from contextlib import contextmanager  # used to build context pool
 import functools
@@ -99,6 +103,17 @@ import random
 versionNumber = os.environ.get('ONEARTH_VERSION')
 oe_utils.basename = None
 errors = 0
+sigevent_url = ''
+mrf_compression_type = None
+mrf_maxsize = None
+
+# Intermediate files of the current run; released if mrfgen aborts
+intermediates = None
+
+# Caches that may be shared between runs when mrfgen is driven by mrfgen_batch.py
+empty_tile_cache = {}
+metadata_cache = {}
+colormap_cache_dir = None
 
 
 def lookupEmptyTile(empty_tile):
@@ -108,15 +123,18 @@ def lookupEmptyTile(empty_tile):
     script_dir = os.path.dirname(__file__)
     if script_dir == '/usr/bin':
         script_dir = '/usr/share/onearth/mrfgen'  # use default directory if in bin
-    try:
-        empty_config_file = open(script_dir+"/empty_config", 'r')
-    except IOError:
-        log_sig_exit('ERROR', script_dir+"/empty_config could not be found", sigevent_url)
-    tiles = {}
-    for line in empty_config_file:
-        (key, val) = line.split()
-        tiles[key] = val
-    empty_config_file.close()
+    tiles = empty_tile_cache.get(script_dir)
+    if tiles is None:
+        try:
+            empty_config_file = open(script_dir+"/empty_config", 'r')
+        except IOError:
+            log_sig_exit('ERROR', script_dir+"/empty_config could not be found", sigevent_url)
+        tiles = {}
+        for line in empty_config_file:
+            (key, val) = line.split()
+            tiles[key] = val
+        empty_config_file.close()
+        empty_tile_cache[script_dir] = tiles
     try:
         if tiles[empty_tile][0] == '/':   
             return os.path.abspath(tiles[empty_tile])
@@ -127,6 +145,81 @@ def lookupEmptyTile(empty_tile):
         log_sig_exit('ERROR', mssg, sigevent_url)
 
 
+def get_gdalinfo(tile):
+    """
+    Runs gdalinfo -json on a tile and returns the parsed output, or None if gdalinfo failed.
+    Results for local files are cached by path, size, and modification time.
+    Argument:
+        tile -- Tile to inspect
+    """
+    if tile.startswith("/vsi"):
+        cache_key = tile
+    else:
+        try:
+            stat = os.stat(tile)
+            cache_key = "{0}:{1}:{2}".format(os.path.abspath(tile), stat.st_size, stat.st_mtime)
+        except OSError:
+            cache_key = None
+    if cache_key is not None and cache_key in metadata_cache:
+        return metadata_cache[cache_key]
+
+    gdalinfo_command_list = ['gdalinfo', '-json', tile]
+    log_the_command(gdalinfo_command_list)
+    gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        outs, errs_warns = gdalinfo.communicate(timeout=90)
+    except subprocess.TimeoutExpired:
+        gdalinfo.kill()
+        log_sig_err('gdalinfo timed out', sigevent_url)
+        return None
+    errs_warns = str(errs_warns, encoding='utf-8')
+    # Split up any errors and warnings, log them each appropriately
+    errs = []
+    warns = []
+    for message in errs_warns.split('\n'):
+        if len(message) > 0:
+            if message.lower().startswith("error"):
+                errs.append(message)
+            else:
+                warns.append(message)
+    if len(errs) > 0:
+        log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
+    if len(warns) > 0:
+        log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
+    try:
+        tileInfo = json.loads(outs)
+    except ValueError:
+        log_sig_err('Unable to parse gdalinfo output for ' + tile, sigevent_url)
+        return None
+
+    if cache_key is not None and gdalinfo.returncode == 0:
+        metadata_cache[cache_key] = tileInfo
+    return tileInfo
+
+
+def get_colormap(colormap):
+    """
+    Returns a local copy of a remote colormap if a colormap cache directory is set, otherwise the colormap as given.
+    Argument:
+        colormap -- Colormap path or URL
+    """
+    if colormap_cache_dir is None or '://' not in colormap:
+        return colormap
+    cached_colormap = os.path.join(colormap_cache_dir, urllib.parse.quote(colormap, safe=''))
+    if not os.path.isfile(cached_colormap):
+        log_info_mssg("Caching colormap " + colormap + " to " + cached_colormap)
+        temp_colormap = cached_colormap + '.' + str(os.getpid())
+        try:
+            with urllib.request.urlopen(colormap, timeout=60) as response, open(temp_colormap, 'wb') as f:
+                shutil.copyfileobj(response, f)
+            os.replace(temp_colormap, cached_colormap)
+        except (urllib.error.URLError, OSError) as e:
+            log_sig_warn("Unable to cache colormap " + colormap + ": " + str(e), sigevent_url)
+            remove_file(temp_colormap)
+            return colormap
+    return cached_colormap
+
+
 def get_mrf_names(mrf_data, mrf_name, parameter_name, date_of_data, time_of_data):
     """
     Convert MRF filenames to specified naming convention (mrf_name).
@@ -169,51 +262,24 @@ def diff_resolution(tiles):
     log_info_mssg("Checking for different resolutions in tiles")
     res = None
     for tile in tiles:
-        gdalinfo_command_list = ['gdalinfo', '-json', tile]
-        log_the_command(gdalinfo_command_list)
-        gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        """
-        returncode = gdalinfo.wait()
-        if returncode != 0:
-            log_sig_err('gdalinfo return code {0}'.format(returncode), sigevent_url)
-            return(False, next_x)
-        tileInfo = json.loads(gdalinfo.stdout.read())
-        """
-        try:
-            outs, errs_warns = gdalinfo.communicate(timeout=90)
-            errs_warns = str(errs_warns, encoding='utf-8')
-            # Split up any errors and warnings, log them each appropriately
-            errs = []
-            warns = []
-            for message in errs_warns.split('\n'):
-                if len(message) > 0:
-                    if message.lower().startswith("error"):
-                        errs.append(message)
-                    else:
-                        warns.append(message)
-            if len(errs) > 0:
-                log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
-            if len(warns) > 0:
-                log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
-            tileInfo = json.loads(outs)
-
-            tile_res_x = float(tileInfo["geoTransform"][1])
-            tile_res_y = float(tileInfo["geoTransform"][5])
-
-            if not res:
-                log_info_mssg("Input tile pixel size is: " + str(tile_res_x) + ", " + str(tile_res_y))
-                res = tile_res_x
-                res_x = tile_res_x
-                res_y = tile_res_y
-            else:
-                next_x = tile_res_x
-                next_y = tile_res_y
-                if res_x != next_x and res_y != next_y:
-                    log_info_mssg("Different tile resolutions detected")
-                    return (True, next_x)
-        except subprocess.TimeoutExpired:
-            gdalinfo.kill()
-            log_sig_err('gdalinfo timed out', sigevent_url)
+        tileInfo = get_gdalinfo(tile)
+        if tileInfo is None:
+            continue
+
+        tile_res_x = float(tileInfo["geoTransform"][1])
+        tile_res_y = float(tileInfo["geoTransform"][5])
+
+        if not res:
+            log_info_mssg("Input tile pixel size is: " + str(tile_res_x) + ", " + str(tile_res_y))
+            res = tile_res_x
+            res_x = tile_res_x
+            res_y = tile_res_y
+        else:
+            next_x = tile_res_x
+            next_y = tile_res_y
+            if res_x != next_x and res_y != next_y:
+                log_info_mssg("Different tile resolutions detected")
+                return (True, next_x)
 
     return (False, next_x)
 
@@ -232,34 +298,8 @@ def is_global_image(tile, xmin, ymin, xmax, ymax):
     upper_left = False
     lower_right = False
 
-    gdalinfo_command_list = ['gdalinfo', '-json', tile]
-    log_the_command(gdalinfo_command_list)
-    gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    """
-    returncode = gdalinfo.wait()
-    if returncode != 0:
-        log_sig_err('gdalinfo return code {0}'.format(returncode), sigevent_url)
-        return False
-    tileInfo = json.loads(gdalinfo.stdout.read())
-    """
-    try:
-        outs, errs_warns = gdalinfo.communicate(timeout=90)
-        errs_warns = str(errs_warns, encoding='utf-8')
-        # Split up any errors and warnings, log them each appropriately
-        errs = []
-        warns = []
-        for message in errs_warns.split('\n'):
-            if len(message) > 0:
-                if message.lower().startswith("error"):
-                    errs.append(message)
-                else:
-                    warns.append(message)
-        if len(errs) > 0:
-            log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
-        if len(warns) > 0:
-            log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
-        tileInfo = json.loads(outs)
-
+    tileInfo = get_gdalinfo(tile)
+    if tileInfo is not None:
         in_xmin = str(tileInfo["cornerCoordinates"]["upperLeft"][0])
         in_ymax = str(tileInfo["cornerCoordinates"]["upperLeft"][1])
         in_xmax = str(tileInfo["cornerCoordinates"]["lowerRight"][0])
@@ -271,9 +311,6 @@ def is_global_image(tile, xmin, ymin, xmax, ymax):
         if (int(round(float(in_xmax))) >= int(round(float(xmax))) and
                 int(round(float(in_ymin))) <= int(round(float(ymin)+10))):
             lower_right = True
-    except subprocess.TimeoutExpired:
-        gdalinfo.kill()
-        log_sig_err('gdalinfo timed out', sigevent_url)
 
     if upper_left and lower_right:
         log_info_mssg(tile + " is a global image")
@@ -290,35 +327,9 @@ def get_image_epsg(tile):
     """
     log_info_mssg("Getting image epsg")
 
-    gdalinfo_command_list = ['gdalinfo', '-json', tile]
-    log_the_command(gdalinfo_command_list)
-    gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    """
-    returncode = gdalinfo.wait()
-    if returncode != 0:
-        log_sig_err('gdalinfo return code {0}'.format(returncode), sigevent_url)
-        return None
-    tileInfo = json.loads(gdalinfo.stdout.read())
-    """
     epsg = None
-    try:
-        outs, errs_warns = gdalinfo.communicate(timeout=90)
-        errs_warns = str(errs_warns, encoding='utf-8')
-        # Split up any errors and warnings, log them each appropriately
-        errs = []
-        warns = []
-        for message in errs_warns.split('\n'):
-            if len(message) > 0:
-                if message.lower().startswith("error"):
-                    errs.append(message)
-                else:
-                    warns.append(message)
-        if len(errs) > 0:
-            log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
-        if len(warns) > 0:
-            log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
-        tileInfo = json.loads(outs)
-
+    tileInfo = get_gdalinfo(tile)
+    if tileInfo is not None:
         wkt = tileInfo["coordinateSystem"]["wkt"]
 
         if wkt != "":
@@ -332,10 +343,7 @@ def get_image_epsg(tile):
                 if epsg_id != -1:
                     m = re.search(".*EPSG.*([0-9]{4}).*", wkt[epsg_id:])
                     if m:
-                        epsg = "EPSG:" + m.group(1)               
-    except subprocess.TimeoutExpired:
-        gdalinfo.kill()
-        log_sig_err('gdalinfo timed out', sigevent_url)
+                        epsg = "EPSG:" + m.group(1)
     log_info_mssg(epsg)
     return epsg
 
@@ -348,45 +356,16 @@ def get_image_extents(tile):
     """
     log_info_mssg("Getting image extents")
 
-    gdalinfo_command_list = ['gdalinfo', '-json', tile]
-    log_the_command(gdalinfo_command_list)
-
-    gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    """
-    returncode = gdalinfo.wait()
-    if returncode != 0:
-        log_sig_err('gdalinfo return code {0}'.format(returncode), sigevent_url)
-    try:
-        tileInfo = json.loads(gdalinfo.stdout.read())
-    """
+    tileInfo = get_gdalinfo(tile)
+    if tileInfo is None:
+        return None
     try:
-        outs, errs_warns = gdalinfo.communicate(timeout=90)
-        errs_warns = str(errs_warns, encoding='utf-8')
-        # Split up any errors and warnings, log them each appropriately
-        errs = []
-        warns = []
-        for message in errs_warns.split('\n'):
-            if len(message) > 0:
-                if message.lower().startswith("error"):
-                    errs.append(message)
-                else:
-                    warns.append(message)
-        if len(errs) > 0:
-            log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
-        if len(warns) > 0:
-            log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
-        tileInfo = json.loads(outs)
-
         ulx = str(tileInfo["cornerCoordinates"]["upperLeft"][0])
         uly = str(tileInfo["cornerCoordinates"]["upperLeft"][1])
         lrx = str(tileInfo["cornerCoordinates"]["lowerRight"][0])
         lry = str(tileInfo["cornerCoordinates"]["lowerRight"][1])
 
         return [ulx, uly, lrx, lry]
-
-    except subprocess.TimeoutExpired:
-        gdalinfo.kill()
-        log_sig_err('gdalinfo timed out', sigevent_url)
     except:
         log_sig_exit('ERROR', "Error reading " + tile, sigevent_url)
 
@@ -400,41 +379,11 @@ def has_color_table(tile):
     log_info_mssg("Checking for color table in " + tile)
     has_color_table = False
 
-    gdalinfo_command_list = ['gdalinfo', '-json', tile]
-    log_the_command(gdalinfo_command_list)
-    gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    """
-    returncode = gdalinfo.wait()
-    if returncode != 0:
-        log_sig_err('gdalinfo return code {0}'.format(returncode), sigevent_url)
-        return False
-    tileInfo = json.loads(gdalinfo.stdout.read())
-    """
-    try:
-        outs, errs_warns = gdalinfo.communicate(timeout=90)
-        errs_warns = str(errs_warns, encoding='utf-8')
-        # Split up any errors and warnings, log them each appropriately
-        errs = []
-        warns = []
-        for message in errs_warns.split('\n'):
-            if len(message) > 0:
-                if message.lower().startswith("error"):
-                    errs.append(message)
-                else:
-                    warns.append(message)
-        if len(errs) > 0:
-            log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
-        if len(warns) > 0:
-            log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
-        tileInfo = json.loads(outs)
-
+    tileInfo = get_gdalinfo(tile)
+    if tileInfo is not None:
         for band in tileInfo["bands"]:
             has_color_table |= "colorTable" in band
 
-    except subprocess.TimeoutExpired:
-        gdalinfo.kill()
-        log_sig_err('gdalinfo timed out', sigevent_url)
-
     log_info_mssg(("No color table found", "Color table found in image")[has_color_table])
     return has_color_table
 
@@ -493,7 +442,7 @@ def mrf_block_align(extents, xmin, ymin, xmax, ymax, target_x, target_y, mrf_blo
 
 
 def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin, xmax, ymax, nodata,
-              resize_resampling, working_dir, target_epsg):
+              resize_resampling, target_epsg):
     """
     Runs gdalmerge and returns merged tile
     Arguments:
@@ -509,15 +458,18 @@ def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin,
         ymax -- Maximum y value
         nodata -- nodata value
         resize_resampling -- resampling method; nearest is used for PPNG
-        working_dir -- Directory to use for temporary files
         target_epsg -- EPSG code for output tile
+    The merged tile and the VRTs it is built from are tracked intermediates, to be removed once it is inserted.
     """
     if resize_resampling == '':
         resize_resampling = "average"  # use average as default for RGBA
     ulx, uly, lrx, lry = mrf_block_align(extents, xmin, ymin, xmax, ymax, target_x, target_y, mrf_blocksize)
-    new_tile = working_dir + os.path.basename(tile)+".merge.tif"
 
     if has_color_table(tile) is True:
+        # The merged paletted GeoTIFF is uncompressed, one byte per pixel of the block-aligned extents
+        merge_size = int(round((Decimal(lrx)-Decimal(ulx))/((Decimal(xmax)-Decimal(xmin))/Decimal(target_x)))) * \
+                     int(round((Decimal(lry)-Decimal(uly))/((Decimal(ymin)-Decimal(ymax))/Decimal(target_y))))
+        new_tile = intermediates.path(os.path.basename(tile)+".merge.tif", merge_size)
         gdal_merge_command_list = ['gdal_merge.py', '-ul_lr', ulx, uly, lrx, lry, '-ps',
                                    str((Decimal(xmax)-Decimal(xmin))/Decimal(target_x)),
                                    str((Decimal(ymin)-Decimal(ymax))/Decimal(target_y)),
@@ -533,7 +485,7 @@ def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin,
     else:  # use gdalbuildvrt/gdalwarp/gdal_translate for RGBA imagery
 
         # Build a VRT, adding SRS to the input. Technically, if this is a TIF we wouldn't have to do that
-        vrt_tile = working_dir + os.path.basename(tile) + ".vrt"
+        vrt_tile = intermediates.path(os.path.basename(tile) + ".vrt")
         gdal_vrt_command_list = ['gdalbuildvrt', '-a_srs', target_epsg, vrt_tile, tile]
         log_the_command(gdal_vrt_command_list)
         gdal_vrt = subprocess.Popen(gdal_vrt_command_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
@@ -549,7 +501,7 @@ def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin,
             return None
 
         # Warp the input image VRT to have the right resolution
-        warp_vrt_tile = working_dir + os.path.basename(tile) + ".warp.vrt"
+        warp_vrt_tile = intermediates.path(os.path.basename(tile) + ".warp.vrt")
         gdal_warp_command_list = ['gdalwarp', '-overwrite', '-of', 'VRT', '-tr',
                                   str((Decimal(xmax)-Decimal(xmin))/Decimal(target_x)),
                                   str((Decimal(ymin)-Decimal(ymax))/Decimal(target_y)),
@@ -568,7 +520,7 @@ def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin,
             return None
 
         # Now build a combined VRT for both the input VRT and the MRF
-        combined_vrt_tile = working_dir + os.path.basename(tile) + ".combined.vrt"
+        combined_vrt_tile = intermediates.path(os.path.basename(tile) + ".combined.vrt")
         gdal_vrt_command_list2 = ['gdalbuildvrt']
         if nodata != "":
             gdal_vrt_command_list2.extend(['-vrtnodata', nodata, '-srcnodata', nodata])
@@ -588,7 +540,7 @@ def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin,
             return None
 
         # Create a merged VRT containing only the portion of the combined VRT we will insert back into the MRF
-        new_tile = working_dir + os.path.basename(tile)+".merge.vrt"
+        new_tile = intermediates.path(os.path.basename(tile)+".merge.vrt")
         gdal_merge_command_list = ['gdal_translate', '-outsize',
                                    str(int(round((Decimal(lrx)-Decimal(ulx))/((Decimal(xmax)-Decimal(xmin))/Decimal(target_x))))),
                                    str(int(round((Decimal(lry)-Decimal(uly))/((Decimal(ymin)-Decimal(ymax))/Decimal(target_y))))),
@@ -610,7 +562,7 @@ def gdalmerge(mrf, tile, extents, target_x, target_y, mrf_blocksize, xmin, ymin,
     return new_tile
 
 
-def split_across_antimeridian(tile, source_extents, antimeridian, xres, yres, working_dir):
+def split_across_antimeridian(tile, source_extents, antimeridian, xres, yres, target_x, target_y):
     """
     Splits up a tile that crosses the antimeridian
     Arguments:
@@ -619,9 +571,11 @@ def split_across_antimeridian(tile, source_extents, antimeridian, xres, yres, wo
         antimeridian -- The antimeridian for the projection
         xres -- output x resolution
         yres -- output y resolution
-        working_dir -- Directory to use for temporary files
+        target_x -- The target size for x of each cut
+        target_y -- The target size for y of each cut
+    The VRT of the tile and its cuts are tracked intermediates, to be removed once the cuts are inserted.
     """
-    temp_tile = working_dir + os.path.basename(tile) + '.temp.vrt'
+    temp_tile = intermediates.path(os.path.basename(tile) + '.temp.vrt')
     log_info_mssg("Splitting across antimeridian with " + temp_tile)
     ulx, uly, lrx, lry = source_extents
     if Decimal(lrx) <= Decimal(antimeridian):
@@ -651,8 +605,8 @@ def split_across_antimeridian(tile, source_extents, antimeridian, xres, yres, wo
     if returncode != 0 or err:
         return (None, None)
     tile = temp_tile
-    tile_left = tile + ".left_cut.vrt"
-    tile_right = tile + ".right_cut.vrt"
+    tile_left = intermediates.path(os.path.basename(tile) + ".left_cut.vrt")
+    tile_right = intermediates.path(os.path.basename(tile) + ".right_cut.vrt")
 
     if Decimal(source_extents[2]) <= Decimal(antimeridian):
         # modify input into >180 space if not already
@@ -719,14 +673,14 @@ def split_across_antimeridian(tile, source_extents, antimeridian, xres, yres, wo
     return (tile_left, tile_right)
 
 
-def crop_to_extents(tile, tile_extents, projection_extents, working_dir):
+def crop_to_extents(tile, tile_extents, projection_extents):
     """
     Crops a tile to be within projection extents
     Arguments:
         tile -- Tile to crop
         tile_extents -- The spatial extents of the tile as ulx, uly, lrx, lry
         projection_extents -- The spatial extents of the projection as xmin, ymin, xmax, ymax
-        working_dir -- Directory to use for temporary files
+    The cut VRT is a tracked intermediate, to be removed once it is inserted.
     """
     ulx, uly, lrx, lry     = tile_extents
     xmin, ymin, xmax, ymax = projection_extents
@@ -738,7 +692,7 @@ def crop_to_extents(tile, tile_extents, projection_extents, working_dir):
         lrx = xmax
     if float(lry) < float(ymin):
         lry = ymin
-    cut_tile = working_dir + os.path.basename(tile) + '._cut.vrt'
+    cut_tile = intermediates.path(os.path.basename(tile) + '._cut.vrt')
     gdalwarp_command_list = ['gdalwarp', '-overwrite', '-of', 'VRT', '-te', ulx, lry, lrx, uly, tile, cut_tile]
     log_the_command(gdalwarp_command_list)
     subprocess.call(gdalwarp_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -786,8 +740,136 @@ class rw_lock:
 lock = rw_lock()  # used to ensure that gdal_merge doesn't happen at the same time as a parallel insert
 
 
+class intermediate_storage:
+    """
+    Places and tracks the intermediate files (reprojection VRTs, paletted and encoded PNGs, ZenJPEG input MRFs,
+    merge tiles, and stderr captures) written while an MRF is built.
+    Intermediates go to intermediate_dir, typically a tmpfs mount such as /dev/shm, while the files there stay
+    within the memory budget and the mount has room, and spill to working_dir otherwise.  Every file handed out is
+    recorded so it can be removed explicitly once the MRF is done.
+    Arguments:
+        working_dir -- Directory for intermediates that don't fit in memory and for stderr captures
+        intermediate_dir -- Memory-backed directory for intermediates, or None to keep everything in working_dir
+        memory_budget -- Maximum bytes of intermediates to keep in intermediate_dir, or None for no limit
+    """
+    def __init__(self, working_dir, intermediate_dir=None, memory_budget=None):
+        self.working_dir = add_trailing_slash(working_dir)
+        self.intermediate_dir = add_trailing_slash(intermediate_dir) if intermediate_dir else None
+        self.memory_budget = memory_budget
+        self.files = []
+        # Expected sizes of the tracked files in intermediate_dir, kept as a running total
+        self.sizes = {}
+        self.memory_used = 0
+        self.spilled = False
+        if self.intermediate_dir is not None and not os.path.isdir(self.intermediate_dir):
+            os.makedirs(self.intermediate_dir, exist_ok=True)
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes expected to be used by tracked files in intermediate_dir, based on the
+        size hints they were handed out with.
+        """
+        return self.memory_used
+
+    def get_dir(self, size_hint=0):
+        """
+        Returns the directory (with trailing slash) the next intermediate should be written to.
+        Argument:
+            size_hint -- Expected size in bytes of the intermediate
+        """
+        if self.intermediate_dir is None:
+            return self.working_dir
+        fits = shutil.disk_usage(self.intermediate_dir).free > size_hint
+        if fits and self.memory_budget is not None:
+            fits = self.memory_usage() + size_hint <= self.memory_budget
+        if not fits:
+            if not self.spilled:
+                log_info_mssg("Intermediate memory budget reached, spilling intermediates to " + self.working_dir)
+                self.spilled = True
+            return self.working_dir
+        return self.intermediate_dir
+
+    def path(self, filename, size_hint=0, in_memory=True):
+        """
+        Returns a tracked path for an intermediate file.
+        Arguments:
+            filename -- Name of the intermediate file
+            size_hint -- Expected size in bytes of the intermediate, usually the size of its source tile
+            in_memory -- Whether the file may be kept in intermediate_dir; stderr captures always go to working_dir
+        """
+        directory = self.get_dir(size_hint) if in_memory else self.working_dir
+        filepath = directory + filename
+        self.track(filepath)
+        if directory == self.intermediate_dir and filepath not in self.sizes:
+            self.sizes[filepath] = size_hint
+            self.memory_used += size_hint
+        return filepath
+
+    def track(self, *filenames):
+        """
+        Records files created alongside an intermediate (e.g. .aux.xml, world files, MRF index and data files).
+        """
+        for filename in filenames:
+            if filename not in self.files:
+                self.files.append(filename)
+
+    def remove(self, *filenames):
+        """
+        Removes intermediate files and stops tracking them.
+        """
+        for filename in filenames:
+            remove_file(filename)
+            if filename in self.files:
+                self.files.remove(filename)
+            self.memory_used -= self.sizes.pop(filename, 0)
+
+    @contextmanager
+    def scope(self):
+        """
+        Removes the intermediates handed out within the block when it exits, however it exits.  Used for the files
+        written to insert a tile, which parallel inserts hand out in worker processes that the parent doesn't track.
+        """
+        tracked = list(self.files)
+        try:
+            yield
+        finally:
+            self.remove(*[f for f in self.files if f not in tracked])
+
+    def cleanup(self, keep=()):
+        """
+        Removes all tracked intermediates except those in keep.
+        """
+        removed = [f for f in self.files if f not in keep and os.path.exists(f)]
+        for filename in removed:
+            remove_file(filename)
+        self.files = [f for f in self.files if f in keep]
+        self.sizes = dict([(f, size) for f, size in self.sizes.items() if f in keep])
+        self.memory_used = sum(self.sizes.values())
+        log_info_mssg("Removed {0} intermediate files".format(len(removed)))
+
+    def release(self):
+        """
+        Removes only the intermediates held in memory.  Used when mrfgen aborts, leaving the files in working_dir
+        (e.g. stderr captures) for troubleshooting.
+        """
+        if self.intermediate_dir is not None:
+            self.remove(*[f for f in self.files if f.startswith(self.intermediate_dir)])
+
+
+def get_size_hint(tile):
+    """
+    Returns the size of a local tile in bytes, or 0 if it can't be determined (e.g. /vsi paths).
+    Argument:
+        tile -- Path to the tile
+    """
+    try:
+        return os.path.getsize(tile)
+    except OSError:
+        return 0
+
+
 def parallel_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                        target_extents, target_epsg, nodata, merge, working_dir, no_cpus):
+                        target_extents, target_epsg, nodata, merge, no_cpus):
     """
     Launches multiple workers each handling a fraction of the tiles to be merged into the final mrf file.
     Also sets the mrf to be mp_safe to allow for simultaneous access. Generally 2-4 workers is ideal.
@@ -795,9 +877,10 @@ def parallel_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x,
     synchronize access between the processes, since gdal_merge must be performed while no other process is running
     mrf_insert. If mrf_maxsize is None, will run mrf_insert with max_size max(2 * total size of input tiles, 50GB).
     Otherwise uses mrf_maxsize.
+    Each worker places its intermediates against its own copy of the memory budget, and removes them itself.
 
     Arguments:
-        tiles ... working_dir: Same as mrf_insert
+        tiles ... merge: Same as mrf_insert
         no_cpus (int) -- Number of CPUs to run mrf_insert in parallel
     """
 
@@ -809,7 +892,7 @@ def parallel_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x,
     if len(tiles) == 1 or no_pools == 1:
         log_info_mssg("making serial call since not enough tiles or cores")
         errors = run_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                                target_extents, target_epsg, nodata, merge, working_dir, max_size=mrf_maxsize)
+                                target_extents, target_epsg, nodata, merge, max_size=mrf_maxsize)
     else:
         if mrf_maxsize is None:
             total_size = sum([os.stat(tile).st_size for tile in tiles])
@@ -822,7 +905,7 @@ def parallel_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x,
         func = functools.partial(run_mrf_insert, mrf=mrf, insert_method = insert_method, \
                                  resize_resampling = resize_resampling, target_x = target_x, target_y = target_y, \
                                  mrf_blocksize = mrf_blocksize, target_extents = target_extents, target_epsg = target_epsg, \
-                                 nodata = nodata, merge = merge, working_dir = working_dir, mp_safe=True, max_size=max_size)
+                                 nodata = nodata, merge = merge, mp_safe=True, max_size=max_size)
 
         with open(mrf) as f: # make mp_safe
             data = f.read()
@@ -872,8 +955,353 @@ def clean_mrf(data_filename): # cleans mrf files in place.
     os.rename(index_name(target_path), index_name(data_filename))
 
 
+def get_empty_block_detector(dataset, nodata):
+    """
+    Returns a function that tests whether a decoded block (bands x rows x columns array) is effectively empty,
+    or None if the MRF has no alpha band, nodata value, or transparent palette entry to test against.
+    A block is empty if its alpha band is all 0, if every value equals nodata, or if every value is a palette fill index.
+    Arguments:
+        dataset -- GDAL dataset of the MRF
+        nodata -- nodata value (e.g., vrtnodata); the nodata value of the first band is used if empty
+    """
+    alpha_bands = [band_no for band_no in range(dataset.RasterCount)
+                   if dataset.GetRasterBand(band_no + 1).GetColorInterpretation() == gdal.GCI_AlphaBand]
+    if nodata is None or str(nodata).strip() == '':
+        nodata_value = dataset.GetRasterBand(1).GetNoDataValue()
+    else:
+        nodata_value = float(str(nodata).split()[0])
+    fill_values = None
+    color_table = dataset.GetRasterBand(1).GetColorTable()
+    if color_table is not None:
+        if nodata_value is not None:
+            fill_values = np.array([nodata_value])
+        else:
+            transparent = [index for index in range(color_table.GetCount()) if color_table.GetColorEntry(index)[3] == 0]
+            if len(transparent) > 0:
+                fill_values = np.array(transparent)
+
+    if len(alpha_bands) == 0 and nodata_value is None and fill_values is None:
+        return None
+
+    def is_empty(block):
+        if len(alpha_bands) > 0 and not block[alpha_bands].any():
+            return True
+        if fill_values is not None:
+            return bool(np.isin(block[0], fill_values).all())
+        if nodata_value is not None:
+            if math.isnan(nodata_value):
+                return bool(np.isnan(block).all())
+            return bool((block == nodata_value).all())
+        return False
+
+    return is_empty
+
+
+def get_level_layout(dataset):
+    """
+    Returns the bands, block size, and (rows, columns) of tiles of every level of an MRF, base resolution first,
+    or None if its index does not hold a single entry per tile (band interleaved).
+    Arguments:
+        dataset -- GDAL dataset of the MRF
+    """
+    if dataset.RasterCount > 1 and dataset.GetMetadataItem('INTERLEAVE', 'IMAGE_STRUCTURE') == 'BAND':
+        return None
+    levels = [[dataset.GetRasterBand(band_no + 1) for band_no in range(dataset.RasterCount)]]
+    for level in range(dataset.GetRasterBand(1).GetOverviewCount()):
+        levels.append([dataset.GetRasterBand(band_no + 1).GetOverview(level) for band_no in range(dataset.RasterCount)])
+    block_x, block_y = levels[0][0].GetBlockSize()
+    level_tiles = [(int(math.ceil(float(bands[0].YSize) / block_y)), int(math.ceil(float(bands[0].XSize) / block_x)))
+                   for bands in levels]
+    return levels, (block_x, block_y), level_tiles
+
+
+def clear_index_entries(mrf, idx_filename, tiles):
+    """
+    Replaces the index entries of the given tiles with zero-size entries, so that the server uses the layer's
+    empty tile instead.  Run mrf_clean afterwards to drop the unreferenced tiles from the data file.
+    Returns the number of entries that were cleared.
+    Arguments:
+        mrf -- An MRF file
+        idx_filename -- The MRF index file
+        tiles -- List of (level, row, column) of the tiles, level 0 being the base resolution
+    """
+    if len(tiles) == 0:
+        return 0
+    dataset = gdal.Open(mrf)
+    if dataset is None:
+        log_sig_warn("Unable to open " + mrf + " to suppress empty tiles", sigevent_url)
+        return 0
+    layout = get_level_layout(dataset)
+    dataset = None
+    if layout is None:
+        log_info_mssg("Empty tile suppression is not supported for band interleaved MRFs")
+        return 0
+    level_tiles = layout[2]
+    index = np.fromfile(idx_filename, dtype='>u8').reshape(-1, 2)
+    if len(index) != sum([rows * cols for rows, cols in level_tiles]):
+        log_info_mssg("Index layout of " + idx_filename + " does not match a single slice MRF, not suppressing empty tiles")
+        return 0
+    level_offsets = np.cumsum([0] + [rows * cols for rows, cols in level_tiles])
+    for level, row, col in tiles:
+        index[level_offsets[level] + row * level_tiles[level][1] + col] = 0
+    index.tofile(idx_filename)
+    log_info_mssg("Suppressed {0} empty tiles in {1}".format(len(tiles), mrf))
+    return len(tiles)
+
+
+def suppress_empty_tiles(mrf, idx_filename, data_filename, nodata):
+    """
+    Replaces the index entries of effectively empty tiles in every level of an MRF with zero-size entries,
+    so that the server uses the layer's empty tile instead.  Identical encoded tiles are only decoded once.
+    Only used when the overviews are not built by build_overviews, which detects empty tiles as it goes.
+    Run mrf_clean afterwards to drop the unreferenced tiles from the data file.
+    Returns the number of tiles that were suppressed.
+    Arguments:
+        mrf -- An MRF file
+        idx_filename -- The MRF index file
+        data_filename -- The MRF data file
+        nodata -- nodata value (e.g., vrtnodata)
+    """
+    dataset = gdal.Open(mrf)
+    if dataset is None:
+        log_sig_warn("Unable to open " + mrf + " to suppress empty tiles", sigevent_url)
+        return 0
+    is_empty = get_empty_block_detector(dataset, nodata)
+    if is_empty is None:
+        log_info_mssg("No alpha band, nodata, or palette fill value to detect empty tiles in " + mrf)
+        return 0
+    layout = get_level_layout(dataset)
+    if layout is None:
+        log_info_mssg("Empty tile suppression is not supported for band interleaved MRFs")
+        return 0
+    levels, (block_x, block_y), level_tiles = layout
+
+    index = np.fromfile(idx_filename, dtype='>u8').reshape(-1, 2)
+    if len(index) != sum([rows * cols for rows, cols in level_tiles]):
+        log_info_mssg("Index layout of " + idx_filename + " does not match a single slice MRF, not suppressing empty tiles")
+        return 0
+
+    empty = np.zeros(len(index), dtype=bool)
+    decoded = {}
+    tile = 0
+    with open(data_filename, 'rb') as data_file:
+        for bands, (rows, cols) in zip(levels, level_tiles):
+            for row in range(rows):
+                for col in range(cols):
+                    offset, size = index[tile]
+                    if size > 0:
+                        data_file.seek(int(offset))
+                        key = hashlib.sha1(data_file.read(int(size))).digest()
+                        if key not in decoded:
+                            x_off = col * block_x
+                            y_off = row * block_y
+                            x_size = min(block_x, bands[0].XSize - x_off)
+                            y_size = min(block_y, bands[0].YSize - y_off)
+                            block = np.array([band.ReadAsArray(x_off, y_off, x_size, y_size) for band in bands])
+                            decoded[key] = is_empty(block)
+                        empty[tile] = decoded[key]
+                    tile += 1
+    dataset = None
+
+    suppressed = int(empty.sum())
+    if suppressed > 0:
+        index[empty] = 0
+        index.tofile(idx_filename)
+    log_info_mssg("Suppressed {0} empty tiles in {1} ({2} distinct tiles decoded)".format(suppressed, mrf, len(decoded)))
+    return suppressed
+
+
+# gdaladdo resampling methods that can be reproduced with RasterIO when building overviews level by level.
+# Each target pixel of these only reads the source pixels it covers, so block-aligned stripes need no halo and the
+# result doesn't depend on the number of stripes. Kernels that read neighbouring pixels (bilinear, cubic,
+# cubicspline, lanczos, gauss) would leave seams at stripe edges, so those are left to gdaladdo.
+overview_resample_algs = {
+    'nearest': gdal.GRIORA_NearestNeighbour,
+    'near': gdal.GRIORA_NearestNeighbour,
+    'nnb': gdal.GRIORA_NearestNeighbour,
+    'average': gdal.GRIORA_Average,
+    'avg': gdal.GRIORA_Average,
+    'mode': gdal.GRIORA_Mode
+}
+
+# Maximum number of source bytes read (and resampled) at once for one stripe of an overview level
+overview_stripe_bytes = 256 * 1024 * 1024
+
+
+def uniform_overview_levels(overview_levels, overview):
+    """
+    Returns True if the overview levels are those allocated by UNIFORM_SCALE, i.e. none are configured or they are
+    successive powers of the overview factor.
+    Arguments:
+        overview_levels -- List of <overview_levels>, or '' if not configured
+        overview -- The overview factor
+    """
+    if overview_levels == '':
+        return True
+    return [int(level) for level in overview_levels] == [int(overview) ** (i + 1) for i in range(len(overview_levels))]
+
+
+def plan_overviews(mrf, overview_resampling, mrf_blocksize, no_cpus):
+    """
+    Plans cascaded overview generation for an MRF that was created with UNIFORM_SCALE.
+    Returns a list with one entry per overview level, each containing the level size and the block-aligned
+    stripes (y offset, y size) that can be built concurrently, or None if the overviews must be built with gdaladdo.
+    Arguments:
+        mrf -- An MRF file (may include :MRF:Z<n>)
+        overview_resampling -- The gdaladdo resampling method
+        mrf_blocksize -- The block size of MRF tiles
+        no_cpus (int) -- Number of CPUs used to build each level
+    """
+    dataset = gdal.Open(mrf)
+    if dataset is None:
+        log_sig_warn("Unable to open " + mrf + " to plan overviews, using gdaladdo", sigevent_url)
+        return None
+    band = dataset.GetRasterBand(1)
+    if band.GetColorTable() is not None and overview_resample_algs[overview_resampling.lower()] != gdal.GRIORA_NearestNeighbour:
+        log_info_mssg("Paletted MRF with " + overview_resampling + " resampling, using gdaladdo")
+        return None
+    if band.GetOverviewCount() == 0:
+        log_info_mssg(mrf + " has no overview levels allocated, using gdaladdo")
+        return None
+
+    blocksize = int(mrf_blocksize)
+    pixel_bytes = dataset.RasterCount * gdal.GetDataTypeSize(band.DataType) // 8
+    plan = []
+    for level in range(band.GetOverviewCount()):
+        overview = band.GetOverview(level)
+        source = band if level == 0 else band.GetOverview(level - 1)
+        block_rows = int(math.ceil(float(overview.YSize) / blocksize))
+        # Split the level into full-width stripes of whole block rows so that no two stripes write the same tile
+        no_stripes = max(1, min(no_cpus, block_rows))
+        rows_per_stripe = int(math.ceil(float(block_rows) / no_stripes))
+        # Keep the source rows read for each stripe within the memory budget, however few CPUs are used
+        source_block_row_bytes = source.XSize * pixel_bytes * blocksize * float(source.YSize) / overview.YSize
+        rows_per_stripe = max(1, min(rows_per_stripe, int(overview_stripe_bytes // source_block_row_bytes)))
+        stripes = []
+        for row in range(0, block_rows, rows_per_stripe):
+            y_off = row * blocksize
+            stripes.append((y_off, min(rows_per_stripe * blocksize, overview.YSize - y_off)))
+        plan.append({'level': level, 'x_size': overview.XSize, 'y_size': overview.YSize, 'stripes': stripes})
+    dataset = None
+    return plan
+
+
+def build_overview_stripe(stripe, mrf, level, overview_resampling, suppress_empty=False, nodata=None):
+    """
+    Builds one stripe of an overview level from the level below it
+    Arguments:
+        stripe -- Tuple of y offset and y size of the stripe in the overview level
+        mrf -- An MRF file (may include :MRF:Z<n>)
+        level -- The overview level to build; level 0 is built from the base resolution
+        overview_resampling -- The gdaladdo resampling method
+        suppress_empty -- Detect effectively empty blocks of the level (and of the base resolution when building level 0)
+        nodata -- nodata value used to detect empty blocks
+    Returns (errors, empty tiles), the empty tiles being (level, row, column) with level 0 the base resolution.
+    Empty blocks that read back the same when left unwritten are skipped and not listed, so the next level is
+    always built from the values it would have been built from otherwise.
+    """
+    y_off, y_size = stripe
+    resample_alg = overview_resample_algs[overview_resampling.lower()]
+    dataset = gdal.Open(mrf, gdal.GA_Update)
+    if dataset is None:
+        return 1, []
+    is_empty = get_empty_block_detector(dataset, nodata) if suppress_empty else None
+    sources = []
+    targets = []
+    for band_no in range(1, dataset.RasterCount + 1):
+        band = dataset.GetRasterBand(band_no)
+        sources.append(band if level == 0 else band.GetOverview(level - 1))
+        targets.append(band.GetOverview(level))
+    scale_y = float(sources[0].YSize) / targets[0].YSize
+    source_y_off = int(round(y_off * scale_y))
+    source_y_size = min(sources[0].YSize - source_y_off, int(round(y_size * scale_y)))
+    x_size = targets[0].XSize
+    empty_tiles = []
+
+    if is_empty is None:
+        for source, target in zip(sources, targets):
+            data = source.ReadRaster(0, source_y_off, source.XSize, source_y_size, x_size, y_size,
+                                     resample_alg=resample_alg)
+            target.WriteRaster(0, y_off, x_size, y_size, data)
+    else:
+        block_x, block_y = targets[0].GetBlockSize()
+        if level == 0:
+            # The base resolution rows are read anyway to build the first level, so check its blocks here too
+            source_data = np.array([source.ReadAsArray(0, source_y_off, source.XSize, source_y_size)
+                                    for source in sources])
+            for row in range(0, source_y_size, block_y):
+                for col in range(0, source_data.shape[2], block_x):
+                    if is_empty(source_data[:, row:row + block_y, col:col + block_x]):
+                        empty_tiles.append((0, (source_y_off + row) // block_y, col // block_x))
+            source_data = None
+        # Blocks that are never written read back as the band's nodata value (or 0)
+        missing = np.array([dataset.GetRasterBand(band_no).GetNoDataValue() or 0
+                            for band_no in range(1, dataset.RasterCount + 1)]).reshape(-1, 1, 1)
+        stripe_data = np.array([source.ReadAsArray(0, source_y_off, source.XSize, source_y_size, x_size, y_size,
+                                                   resample_alg=resample_alg) for source in sources])
+        for row in range(0, y_size, block_y):
+            for col in range(0, x_size, block_x):
+                block = stripe_data[:, row:row + block_y, col:col + block_x]
+                if is_empty(block):
+                    if np.array_equal(block, np.broadcast_to(missing, block.shape), equal_nan=True):
+                        continue
+                    # Written so the next level is built from it, and suppressed once all levels are built
+                    empty_tiles.append((level + 1, (y_off + row) // block_y, col // block_x))
+                for band_no, target in enumerate(targets):
+                    target.WriteArray(block[band_no], col, y_off + row)
+    dataset.FlushCache()
+    dataset = None
+    return 0, empty_tiles
+
+
+def build_overviews(mrf, plan, overview_resampling, no_cpus, suppress_empty=False, nodata=None):
+    """
+    Builds each overview level from the level below it, never from the base resolution.
+    The stripes of each level are built concurrently with mp_safe writes, and the time spent on each level is logged.
+    Returns a list of (level, x size, y size, seconds) for each level, and the (level, row, column) of the
+    empty tiles that were written, to be suppressed with clear_index_entries.
+    Arguments:
+        mrf -- An MRF file (may include :MRF:Z<n>)
+        plan -- Overview plan from plan_overviews
+        overview_resampling -- The gdaladdo resampling method
+        no_cpus (int) -- Number of CPUs used to build each level
+        suppress_empty -- Detect effectively empty blocks, skipping those that need not be written
+        nodata -- nodata value used to detect empty blocks
+    """
+    # Stripes are written by multiple processes, so the MRF must be mp_safe
+    mrf_header = mrf.split(':MRF:')[0]
+    with open(mrf_header) as f:
+        data = f.read()
+    if 'mp_safe' not in data:
+        with open(mrf_header, 'w') as f:
+            f.write(data.replace("<Raster>", "<Raster mp_safe=\"on\">"))
+
+    no_pools = max(1, min(multiprocessing.cpu_count() - 1, no_cpus))
+    timings = []
+    empty_tiles = []
+    with poolcontext(processes=no_pools) as pool:
+        for level in plan:
+            start_time = time.time()
+            func = functools.partial(build_overview_stripe, mrf=mrf, level=level['level'],
+                                     overview_resampling=overview_resampling, suppress_empty=suppress_empty,
+                                     nodata=nodata)
+            if len(level['stripes']) == 1:
+                results = [func(level['stripes'][0])]
+            else:
+                results = pool.map(func, level['stripes'], 1)
+            for result in results:
+                empty_tiles.extend(result[1])
+            if sum([result[0] for result in results]) > 0:
+                log_sig_err("Failed to build overview level {0} for {1}".format(level['level'] + 1, mrf), sigevent_url)
+            seconds = time.time() - start_time
+            log_info_mssg("Overview level {0} ({1}x{2}, {3} stripes) built in {4:.2f} seconds".format(
+                          level['level'] + 1, level['x_size'], level['y_size'], len(level['stripes']), seconds))
+            timings.append((level['level'] + 1, level['x_size'], level['y_size'], seconds))
+    return timings, empty_tiles
+
+
 def run_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                   target_extents, target_epsg, nodata, merge, working_dir, mp_safe=False, max_size=None):
+                   target_extents, target_epsg, nodata, merge, mp_safe=False, max_size=None):
     """
     Inserts a list of tiles into an existing MRF
     Arguments:
@@ -888,9 +1316,9 @@ def run_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x, targe
         target_epsg -- The target EPSG code
         nodata -- nodata value
         merge -- Merge over transparent regions of imagery
-        working_dir -- Directory to use for temporary files
         mp_safe -- mrf_insert should be mp_safe (default False)
         max_size -- run clean_mrf on target mrf when this size is reached (in bytes)
+    The intermediates written to insert each tile (cuts, merged tiles, and VRTs) are removed once it is inserted.
     """
     errors = 0
     t_xmin, t_ymin, t_xmax, t_ymax  = target_extents
@@ -907,174 +1335,160 @@ def run_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x, targe
         global lock
 
     for i, tile in enumerate(tiles):
-        if should_lock:
-            lock.down_read()
-
-        s_xmin, s_ymax, s_xmax, s_ymin = get_image_extents(tile)
-        print("Source extents: " + ",".join([s_xmin, s_ymax, s_xmax, s_ymin]))
-
-        # Commenting this out because I am not aware of anywhere that we are _not_ invoking this method with the exact
-        # set of tiles that we want to insert...
-        '''
-        if os.path.splitext(tile)[1] == ".vrt" and not ("_cut." in tile or "_reproject." in tile):
-            # ignore temp VRTs unless it's an antimeridian cut or reprojected source image
-            log_info_mssg("Skipping insert of " + tile)
-            if should_lock:
-                lock.up_read()
-            continue
-        '''
-
-        # check if image fits within extents
-        if target_epsg in ['EPSG:3031','EPSG:3413','EPSG:3857'] and \
-            ((float(s_xmin) < float(t_xmin)) or \
-            (float(s_ymax) > float(t_ymax)) or \
-            (float(s_xmax) > float(t_xmax)) or \
-            (float(s_ymin) < float(t_ymin))):
-            log_info_mssg(tile + " falls outside of extents for " + target_epsg)
-            cut_tile = crop_to_extents(tile, [s_xmin, s_ymax, s_xmax, s_ymin], target_extents, working_dir)
-            if should_lock:
-                lock.up_read()
-
-            errors += run_mrf_insert([cut_tile], mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                                     target_extents, target_epsg, nodata, True, working_dir)
-            continue
-
-        elif target_epsg in ['EPSG:4326','EPSG:3857'] and ((float(s_xmin) > float(s_xmax)) or
-                                                           (float(s_xmax) > float(t_xmax)) or
-                                                           (float(s_xmin) < float(t_xmin))):
-            log_info_mssg(tile + " crosses antimeridian")
-            left_half, right_half = split_across_antimeridian(tile, [s_xmin, s_ymax, s_xmax, s_ymin], t_xmax,
-                                                              str((Decimal(t_xmax)-Decimal(t_xmin))/Decimal(target_x)),
-                                                              str((Decimal(t_ymin)-Decimal(t_ymax))/Decimal(target_y)),
-                                                              working_dir)
+        with intermediates.scope():
             if should_lock:
-                lock.up_read()
+                lock.down_read()
 
-            insert_tiles = []
+            s_xmin, s_ymax, s_xmax, s_ymin = get_image_extents(tile)
+            print("Source extents: " + ",".join([s_xmin, s_ymax, s_xmax, s_ymin]))
 
-            # The left half of the split could be None if there wasn't a full pixel beyond the antimeridian
-            if left_half:
-                log_info_mssg('Will insert left half ' + left_half)
-                insert_tiles.append(left_half)
+            # Commenting this out because I am not aware of anywhere that we are _not_ invoking this method with the exact
+            # set of tiles that we want to insert...
+            '''
+            if os.path.splitext(tile)[1] == ".vrt" and not ("_cut." in tile or "_reproject." in tile):
+                # ignore temp VRTs unless it's an antimeridian cut or reprojected source image
+                log_info_mssg("Skipping insert of " + tile)
+                if should_lock:
+                    lock.up_read()
+                continue
+            '''
+
+            # check if image fits within extents
+            if target_epsg in ['EPSG:3031','EPSG:3413','EPSG:3857'] and \
+                ((float(s_xmin) < float(t_xmin)) or \
+                (float(s_ymax) > float(t_ymax)) or \
+                (float(s_xmax) > float(t_xmax)) or \
+                (float(s_ymin) < float(t_ymin))):
+                log_info_mssg(tile + " falls outside of extents for " + target_epsg)
+                cut_tile = crop_to_extents(tile, [s_xmin, s_ymax, s_xmax, s_ymin], target_extents)
+                if should_lock:
+                    lock.up_read()
 
-            # The right half of the split could be None if there wasn't a full pixel beyond the antimeridian
-            if right_half:
-                log_info_mssg('Will insert right half ' + right_half)
-                insert_tiles.append(right_half)
+                errors += run_mrf_insert([cut_tile], mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
+                                         target_extents, target_epsg, nodata, True)
+                continue
 
-            if len(insert_tiles) > 0:
-                errors += run_mrf_insert(insert_tiles, mrf, insert_method, resize_resampling, target_x, target_y,
-                                         mrf_blocksize, target_extents, target_epsg, nodata, True, working_dir)
-            else:
-                log_sig_err("No tiles to insert after splitting across antimeridian", sigevent_url)
-            continue
+            elif target_epsg in ['EPSG:4326','EPSG:3857'] and ((float(s_xmin) > float(s_xmax)) or
+                                                               (float(s_xmax) > float(t_xmax)) or
+                                                               (float(s_xmin) < float(t_xmin))):
+                log_info_mssg(tile + " crosses antimeridian")
+                left_half, right_half = split_across_antimeridian(tile, [s_xmin, s_ymax, s_xmax, s_ymin], t_xmax,
+                                                                  str((Decimal(t_xmax)-Decimal(t_xmin))/Decimal(target_x)),
+                                                                  str((Decimal(t_ymin)-Decimal(t_ymax))/Decimal(target_y)),
+                                                                  str(target_x), str(int(float(target_y))))
+                if should_lock:
+                    lock.up_read()
 
-        if merge: # merge tile with existing imagery if true
-            if should_lock:
-                lock.up_read()
-                lock.down_write()
+                insert_tiles = []
 
-            tile = gdalmerge(mrf, tile, [s_xmin, s_ymax, s_xmax, s_ymin], target_x, target_y, mrf_blocksize,
-                             t_xmin, t_ymin, t_xmax, t_ymax, nodata, resize_resampling, working_dir, target_epsg)
-            
-            if tile is None:
-                errors += 1
-                return errors
+                # The left half of the split could be None if there wasn't a full pixel beyond the antimeridian
+                if left_half:
+                    log_info_mssg('Will insert left half ' + left_half)
+                    insert_tiles.append(left_half)
 
-            if should_lock:
-                lock.up_write()
-                lock.down_read()
+                # The right half of the split could be None if there wasn't a full pixel beyond the antimeridian
+                if right_half:
+                    log_info_mssg('Will insert right half ' + right_half)
+                    insert_tiles.append(right_half)
 
-        vrt_tile = working_dir + os.path.basename(tile)+".vrt"
-
-        diff_res, ps = diff_resolution([tile, mrf])
-
-        if diff_res:
-            # convert tile to matching resolution
-            if resize_resampling == '':
-                resize_resampling = "near" # use nearest neighbor as default
-
-            tile_vrt_command_list = ['gdalwarp', '-of', 'VRT', '-r', resize_resampling, '-overwrite', '-tr',
-                                     str((Decimal(t_xmax)-Decimal(t_xmin))/Decimal(target_x)),
-                                     str((Decimal(t_ymin)-Decimal(t_ymax))/Decimal(target_y))]
-
-            # build the vrt for the entire projection if we have one image that covers the entire projection
-            # TODO ... not sure this is needed actually...
-            if is_global_image(tile, t_xmin, t_ymin, t_xmax, t_ymax) and len(tiles) == 1:
-                tile_vrt_command_list.append('-te')
-                tile_vrt_command_list.append(t_xmin)
-                tile_vrt_command_list.append(t_ymin)
-                tile_vrt_command_list.append(t_xmax)
-                tile_vrt_command_list.append(t_ymax)
-
-            tile_vrt_command_list.append(tile)
-            tile_vrt_command_list.append(vrt_tile)
-            log_the_command(tile_vrt_command_list)
-            tile_vrt = subprocess.Popen(tile_vrt_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            returncode = tile_vrt.wait()
-            if returncode != 0:
-                log_sig_err('build tile VRT (gdalwarp) return code {0}'.format(returncode), sigevent_url)
+                if len(insert_tiles) > 0:
+                    errors += run_mrf_insert(insert_tiles, mrf, insert_method, resize_resampling, target_x, target_y,
+                                             mrf_blocksize, target_extents, target_epsg, nodata, True)
+                else:
+                    log_sig_err("No tiles to insert after splitting across antimeridian", sigevent_url)
+                continue
 
-            if merge: # merge tile with existing imagery
+            if merge: # merge tile with existing imagery if true
                 if should_lock:
                     lock.up_read()
                     lock.down_write()
 
-                s_xmin, s_ymax, s_xmax, s_ymin = get_image_extents(vrt_tile) # get new extents
-                log_info_mssg("Image extents " + str(extents))
-                tile = gdalmerge(mrf, vrt_tile, [s_xmin, s_ymax, s_xmax, s_ymin], target_x, target_y, mrf_blocksize,
-                                 t_xmin, t_ymin, t_xmax, t_ymax, nodata, resize_resampling, working_dir, target_epsg)
+                tile = gdalmerge(mrf, tile, [s_xmin, s_ymax, s_xmax, s_ymin], target_x, target_y, mrf_blocksize,
+                                 t_xmin, t_ymin, t_xmax, t_ymax, nodata, resize_resampling, target_epsg)
+            
                 if tile is None:
                     errors += 1
                     return errors
-                mrf_insert_command_list.append(tile)
 
                 if should_lock:
                     lock.up_write()
                     lock.down_read()
 
-            else:
-                mrf_insert_command_list.append(vrt_tile)
-        else:
-            mrf_insert_command_list.append(tile)
-
-        mrf_insert_command_list.append(mrf)
-        log_the_command(mrf_insert_command_list)
-
-        try:
-            mrf_insert = subprocess.Popen(mrf_insert_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            mrf_insert_command_list.pop()
-            mrf_insert_command_list.pop()
-        except OSError:
-            log_sig_exit('ERROR', "mrf_insert tool cannot be found.", sigevent_url)
+            vrt_tile = intermediates.path(os.path.basename(tile)+".vrt")
+
+            diff_res, ps = diff_resolution([tile, mrf])
+
+            if diff_res:
+                # convert tile to matching resolution
+                if resize_resampling == '':
+                    resize_resampling = "near" # use nearest neighbor as default
+
+                tile_vrt_command_list = ['gdalwarp', '-of', 'VRT', '-r', resize_resampling, '-overwrite', '-tr',
+                                         str((Decimal(t_xmax)-Decimal(t_xmin))/Decimal(target_x)),
+                                         str((Decimal(t_ymin)-Decimal(t_ymax))/Decimal(target_y))]
+
+                # build the vrt for the entire projection if we have one image that covers the entire projection
+                # TODO ... not sure this is needed actually...
+                if is_global_image(tile, t_xmin, t_ymin, t_xmax, t_ymax) and len(tiles) == 1:
+                    tile_vrt_command_list.append('-te')
+                    tile_vrt_command_list.append(t_xmin)
+                    tile_vrt_command_list.append(t_ymin)
+                    tile_vrt_command_list.append(t_xmax)
+                    tile_vrt_command_list.append(t_ymax)
+
+                tile_vrt_command_list.append(tile)
+                tile_vrt_command_list.append(vrt_tile)
+                log_the_command(tile_vrt_command_list)
+                tile_vrt = subprocess.Popen(tile_vrt_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                returncode = tile_vrt.wait()
+                if returncode != 0:
+                    log_sig_err('build tile VRT (gdalwarp) return code {0}'.format(returncode), sigevent_url)
+
+                if merge: # merge tile with existing imagery
+                    if should_lock:
+                        lock.up_read()
+                        lock.down_write()
+
+                    s_xmin, s_ymax, s_xmax, s_ymin = get_image_extents(vrt_tile) # get new extents
+                    log_info_mssg("Image extents " + str([s_xmin, s_ymax, s_xmax, s_ymin]))
+                    tile = gdalmerge(mrf, vrt_tile, [s_xmin, s_ymax, s_xmax, s_ymin], target_x, target_y, mrf_blocksize,
+                                     t_xmin, t_ymin, t_xmax, t_ymax, nodata, resize_resampling, target_epsg)
+                    if tile is None:
+                        errors += 1
+                        return errors
+                    mrf_insert_command_list.append(tile)
+
+                    if should_lock:
+                        lock.up_write()
+                        lock.down_read()
 
-        insert_message = mrf_insert.stderr.readlines()
-        for message in insert_message:
-            if 'Access window out of range' in str(message):
-                log_sig_warn(str(message), sigevent_url)
-            elif 'ERROR' in str(message):
-                errors += 1
-                log_sig_err("mrf_insert {0}".format(message), sigevent_url)
+                else:
+                    mrf_insert_command_list.append(vrt_tile)
             else:
-                log_info_mssg(str(message).strip())
-        returncode = mrf_insert.wait()
-        if returncode != 0:
-            log_sig_err('mrf_insert return code {0}'.format(returncode), sigevent_url)
-
-        # Remove temporary merged files (if created)
-        if ".merge." in tile:
-            remove_file(tile)
+                mrf_insert_command_list.append(tile)
 
-        # Remove the temporary (if created) vrt tile used to sort out differing resolutions of the tile and MRF
-        remove_file(vrt_tile)
+            mrf_insert_command_list.append(mrf)
+            log_the_command(mrf_insert_command_list)
 
-        # Commenting this out because I am not aware of any lingering VRT files that must be removed... and this causes
-        # some issues if the input tile list had VRTs in it
-        '''
-        temp_vrt_files = glob.glob(working_dir + os.path.basename(tile) + "*vrt*")
-        for vrt in temp_vrt_files:
-            remove_file(vrt)
-        '''
+            try:
+                mrf_insert = subprocess.Popen(mrf_insert_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                mrf_insert_command_list.pop()
+                mrf_insert_command_list.pop()
+            except OSError:
+                log_sig_exit('ERROR', "mrf_insert tool cannot be found.", sigevent_url)
+
+            insert_message = mrf_insert.stderr.readlines()
+            for message in insert_message:
+                if 'Access window out of range' in str(message):
+                    log_sig_warn(str(message), sigevent_url)
+                elif 'ERROR' in str(message):
+                    errors += 1
+                    log_sig_err("mrf_insert {0}".format(message), sigevent_url)
+                else:
+                    log_info_mssg(str(message).strip())
+            returncode = mrf_insert.wait()
+            if returncode != 0:
+                log_sig_err('mrf_insert return code {0}'.format(returncode), sigevent_url)
 
         if should_lock:
             lock.up_read()
@@ -1095,7 +1509,7 @@ def run_mrf_insert(tiles, mrf, insert_method, resize_resampling, target_x, targe
     return errors
 
 
-def insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units):
+def insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units, preassigned=False):
     """
     Inserts a list of tiles into an existing MRF
     Argument:
@@ -1106,6 +1520,7 @@ def insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units):
         scale -- Scale factor for encoded data values
         offset -- Offset of encoded data values
         units -- Units for encoded data values
+        preassigned -- The key was already assigned a z-level by assign_zdb_slots
     """
     log_info_mssg("Modifying zdb for " + mrf + " with key " + zkey)  
     # Check if z-dimension is consistent if it's being used
@@ -1163,8 +1578,11 @@ def insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units):
             cur.execute("SELECT COUNT(*) FROM ZINDEX WHERE key_str='"+zkey+"';")
             lid = int(cur.fetchone()[0])
             if lid > 0:
-                mssg = zkey + " key already exists...overwriting"
-                log_sig_warn(mssg, sigevent_url)
+                if preassigned:
+                    log_info_mssg("Using z-level assigned to " + zkey)
+                else:
+                    mssg = zkey + " key already exists...overwriting"
+                    log_sig_warn(mssg, sigevent_url)
                 cur.execute("SELECT z FROM ZINDEX WHERE key_str='"+zkey+"';")
                 z = int(cur.fetchone()[0])
                 is_update = True
@@ -1211,7 +1629,7 @@ def insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units):
         mssg = "%s:" % e.args[0]
         if "database is locked" in mssg or "no such table" in mssg:
             log_sig_warn(mssg + " retrying connection to " + zdb_out, sigevent_url)
-            return insert_zdb(mrf, zlevels, zkey)
+            return insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units, preassigned)
         else:
             log_sig_exit('ERROR', mssg, sigevent_url)
 
@@ -1224,6 +1642,63 @@ def insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units):
     return (gdal_mrf_filename, z, zdb_out, con)
 
 
+def assign_zdb_slots(mrf, zlevels, zkeys, source_url, scale):
+    """
+    Assigns z-levels for a list of keys in a single ZDB transaction, so that time slices can then be written in
+    parallel.  Keys that already exist keep their z-level.  Returns a dictionary of key to z-level.
+    Arguments:
+        mrf -- An MRF file
+        zlevels -- The number of z-levels expected
+        zkeys -- The keys to be used with the z-index
+        source_url -- The URL of the source dataset
+        scale -- Scale factor for encoded data values, used only to create the ZDB schema
+    """
+    zdb_out = mrf.replace('.mrf','.zdb')
+    log_info_mssg("Assigning {0} z-levels in {1}".format(len(zkeys), zdb_out))
+    slots = {}
+    con = None
+    try:
+        con = sqlite3.connect(zdb_out, timeout=1800.0) # 30 minute timeout
+        cur = con.cursor()
+        create_script = "CREATE TABLE IF NOT EXISTS ZINDEX(z INTEGER PRIMARY KEY AUTOINCREMENT, key_str TEXT);"
+        if source_url != "":
+            create_script = "CREATE TABLE IF NOT EXISTS ZINDEX(z INTEGER PRIMARY KEY AUTOINCREMENT, key_str TEXT, source_url TEXT);"
+        if scale != None:
+            create_script = "CREATE TABLE IF NOT EXISTS ZINDEX(z INTEGER PRIMARY KEY AUTOINCREMENT, key_str TEXT, source_url TEXT, scale INTEGER, offset INTEGER, uom TEXT);"
+        cur.executescript(create_script)
+        # Hold the write lock for the whole assignment so concurrent mrfgen runs can't take the same slots
+        cur.execute("BEGIN IMMEDIATE")
+        for zkey in zkeys:
+            cur.execute("SELECT z FROM ZINDEX WHERE key_str=?", (zkey,))
+            row = cur.fetchone()
+            if row is not None:
+                log_sig_warn(zkey + " key already exists...overwriting", sigevent_url)
+                slots[zkey] = int(row[0])
+                continue
+            cur.execute("SELECT COUNT(*) FROM ZINDEX;")
+            lid = int(cur.fetchone()[0])
+            if lid >= int(zlevels):
+                con.rollback()
+                con.close()
+                mssg = str(lid+1) + " z-levels is more than the maximum allowed: " + str(zlevels)
+                log_sig_exit('ERROR', mssg, sigevent_url)
+            if lid == 0:
+                cur.execute("INSERT INTO ZINDEX(z, key_str) VALUES (0, ?)", (zkey,))
+            else:
+                cur.execute("INSERT INTO ZINDEX(key_str) VALUES (?)", (zkey,))
+            slots[zkey] = cur.lastrowid
+            log_info_mssg("Assigned z-level {0} to {1}".format(slots[zkey], zkey))
+        con.commit()
+        con.close()
+    except sqlite3.Error as e:
+        if con:
+            con.rollback()
+            con.close()
+        log_sig_exit('ERROR', "%s: %s" % (e.args[0], zdb_out), sigevent_url)
+    log_info_mssg("Successfully committed {0} records to {1}".format(len(zkeys), zdb_out))
+    return slots
+
+
 def create_vrt(basename, empty_tile, epsg, xmin, ymin, xmax, ymax):
     """
     Generates an empty VRT for a blank MRF
@@ -1296,870 +1771,1073 @@ def log_sig_err(mssg, sigevent_url, count_err=True):
         errors += 1
 
 
-#-------------------------------------------------------------------------------
-# Finished defining subroutines.  Begin main program.
-#-------------------------------------------------------------------------------
+def get_extension(compression_type):
+    """
+    Returns the MRF data file extension for a compression type
+    Argument:
+        compression_type -- MRF compression type
+    """
+    if compression_type in ['PNG', 'PPNG', 'EPNG', 'JPNG']:
+        return "ppg"
+    elif compression_type in ['JPG', 'JPEG']:
+        return "pjg"
+    elif compression_type in ['TIF', 'TIFF']:
+        return "ptf"
+    elif compression_type == 'LERC':
+        return "lrc"
+    else:
+        return None
+
+
+def data_name(mrf_name):
+    """
+    Returns the data file name of an MRF using the current compression type
+    Argument:
+        mrf_name -- MRF header filename
+    """
+    bname, ext = os.path.splitext(mrf_name)
+    return bname + os.extsep + get_extension(mrf_compression_type)
 
-# Define command line options and args.
-parser=OptionParser(version=versionNumber)
-parser.add_option('-c', '--configuration_filename',
-                  action='store', type='string', dest='configuration_filename',
-                  default='./mrfgen_configuration_file.xml',
-                  help='Full path of configuration filename.  Default:  ./mrfgen_configuration_file.xml')
-parser.add_option("-d", "--data_only", action="store_true", dest="data_only",
-                  default=False, help="Only output the MRF data, index, and header files")
-parser.add_option("-s", "--send_email", action="store_true", dest="send_email",
-                  default=False, help="Send email notification for errors and warnings.")
-parser.add_option('--email_server', action='store', type='string', dest='email_server',
-                  default='', help='The server where email is sent from (overrides configuration file value)')
-parser.add_option('--email_recipient', action='store', type='string', dest='email_recipient',
-                  default='', help='The recipient address for email notifications (overrides configuration file value)')
-parser.add_option('--email_sender', action='store', type='string', dest='email_sender',
-                  default='', help='The sender for email notifications (overrides configuration file value)')
-parser.add_option('--email_logging_level', action='store', type='string', dest='email_logging_level',
-                  default='ERROR', help='Logging level for email notifications: ERROR, WARN, or INFO.  Default: ERROR')
-
-# Read command line args.
-(options, args) = parser.parse_args()
-# Configuration filename.
-configuration_filename=options.configuration_filename
-# Send email.
-send_email=options.send_email
-# Email server.
-email_server=options.email_server
-# Email recipient
-email_recipient=options.email_recipient
-# Email sender.
-email_sender=options.email_sender
-# Data only.
-data_only = options.data_only
-# Email logging level
-logging_level = options.email_logging_level.upper()
-
-# Email metadata replaces sigevent_url
-if send_email:
-    sigevent_url = (email_server, email_recipient, email_sender, logging_level)
-else:
-    sigevent_url = ''
-
-# Get current time, which is written to a file as the previous cycle time.
-# Time format is "yyyymmdd.hhmmss.f".  Do this first to avoid any gap where tiles
-# may get passed over because they were created while this script is running.
-current_cycle_time = datetime.datetime.now().strftime("%Y%m%d.%H%M%S.%f")
-
-
-# Read XML configuration file.
-try:
-    # Open file.
-    config_file=open(configuration_filename, 'r')
-except IOError:
-    mssg=str().join(['Cannot read configuration file:  ',
-                     configuration_filename])
-    log_sig_exit('ERROR', mssg, sigevent_url)
-else:
-    # Get dom from XML file.
-    dom=xml.dom.minidom.parse(config_file)
-    # Parameter name.
-    parameter_name         =get_dom_tag_value(dom, 'parameter_name')
-    date_of_data           =get_dom_tag_value(dom, 'date_of_data')
-
-    # Define output basename for log, txt, vrt, .mrf, .idx and .ppg or .pjg
-    # Files get date_of_date added, links do not.
-    oe_utils.basename = basename = str().join([parameter_name, '_', date_of_data, '___', 'mrfgen_', current_cycle_time, '_', str(os.getpid())])
-
-    # Get default email server and recipient if not override
-    if email_server == '':
-        try:
-            email_server = get_dom_tag_value(dom, 'email_server')
-        except:
-            email_server = ''
-    if email_recipient == '':
-        try:
-            email_recipient = get_dom_tag_value(dom, 'email_recipient')
-        except:
-            email_recipient = ''
-    if email_sender == '':
-        try:
-            email_sender = get_dom_tag_value(dom, 'email_sender')
-        except:
-            email_sender = ''
-    if send_email:
-        sigevent_url = (email_server, email_recipient, email_sender, logging_level)
-        if email_recipient == '':
-            log_sig_err("No email recipient provided for notifications.", sigevent_url)
 
-    # for sub-daily imagery
+def get_time_slices(dom, date_of_data):
+    """
+    Returns a list of (time_of_data, zkey, input_files) for each <time_slice> in a configuration.
+    Argument:
+        dom -- The XML dom of the mrfgen configuration
+        date_of_data -- The date of the data, used as the prefix of the default z key
+    """
+    time_slices = []
+    for element in dom.getElementsByTagName('time_slice'):
+        time_of_data = element.getAttribute('time_of_data').strip()
+        if len(time_of_data) != 6:
+            log_sig_exit('ERROR', 'Format for time_of_data attribute of <time_slice> is:  HHMMSS', sigevent_url)
+        zkey = element.getAttribute('mrf_z_key').strip()
+        if zkey == '':
+            zkey = date_of_data + time_of_data
+        files = [check_abs_path(f.firstChild.data.strip()) for f in element.getElementsByTagName('file')]
+        if len(files) == 0:
+            log_sig_exit('ERROR', 'No input files for time slice ' + time_of_data, sigevent_url)
+        time_slices.append((time_of_data, zkey, files))
+    return time_slices
+
+
+def write_time_slice_config(configuration_filename, slice_filename, time_of_data, zkey, files):
+    """
+    Writes the configuration for a single time slice: the original configuration without <time_slices>,
+    using the time, z key, and input files of the slice.
+    Arguments:
+        configuration_filename -- The mrfgen configuration with <time_slices>
+        slice_filename -- The configuration file to write
+        time_of_data -- The time of the slice, HHMMSS
+        zkey -- The z key of the slice
+        files -- List of input files for the slice
+    """
+    dom = xml.dom.minidom.parse(configuration_filename)
+    root = dom.documentElement
+    for tag in ['time_slices', 'time_of_data', 'mrf_z_key', 'input_files', 'input_dir']:
+        for element in dom.getElementsByTagName(tag):
+            element.parentNode.removeChild(element)
+    for tag, value in [('time_of_data', time_of_data), ('mrf_z_key', zkey)]:
+        element = dom.createElement(tag)
+        element.appendChild(dom.createTextNode(value))
+        root.appendChild(element)
+    input_files = dom.createElement('input_files')
+    for f in files:
+        file_element = dom.createElement('file')
+        file_element.appendChild(dom.createTextNode(f))
+        input_files.appendChild(file_element)
+    root.appendChild(input_files)
+    with open(slice_filename, 'w') as slice_file:
+        dom.writexml(slice_file)
+
+
+def run_time_slice(slice_filename, data_only, send_email, email_server, email_recipient, email_sender, logging_level):
+    """
+    Runs mrfgen for a single time slice in a worker process.  Returns (mrf, errors).
+    Arguments:
+        slice_filename -- The configuration file of the time slice
+        data_only ... logging_level: Same as mrfgen
+    """
+    # mrfgen changes to its working_dir; restore the directory so relative paths in the next slice resolve
+    cwd = os.getcwd()
     try:
-        time_of_data = get_dom_tag_value(dom, 'time_of_data')
-    except:
-        time_of_data = ''
-    # Directories.
+        return mrfgen(slice_filename, data_only, send_email, email_server, email_recipient, email_sender,
+                      logging_level, time_slice=True)
+    except SystemExit:
+        if intermediates is not None:
+            intermediates.release()
+        return None, max(errors, 1)
+    finally:
+        os.chdir(cwd)
+
+
+def mrfgen_time_slices(configuration_filename, dom, data_only, send_email, email_server, email_recipient, email_sender,
+                       logging_level):
+    """
+    Generates every <time_slice> of a z-level configuration in one run.  The z-levels for all slices are assigned
+    in one ZDB transaction, then the slices (base and overviews) are written in parallel into the mp_safe MRF.
+    A slice that creates a new MRF is written first.  Returns (comma-separated MRF filenames, errors).
+    Arguments:
+        configuration_filename -- Full path of the mrfgen configuration file
+        dom -- The XML dom of the configuration
+        data_only ... logging_level: Same as mrfgen
+    """
+    current_cycle_time = datetime.datetime.now().strftime("%Y%m%d.%H%M%S.%f")
+    parameter_name = get_dom_tag_value(dom, 'parameter_name')
+    date_of_data = get_dom_tag_value(dom, 'date_of_data')
+    oe_utils.basename = basename = str().join([parameter_name, '_', date_of_data, '___', 'mrfgen_time_slices_',
+                                               current_cycle_time, '_', str(os.getpid())])
+    output_dir = add_trailing_slash(check_abs_path(get_dom_tag_value(dom, 'output_dir')))
     try:
-        input_dir = get_dom_tag_value(dom, 'input_dir')
+        working_dir = add_trailing_slash(check_abs_path(get_dom_tag_value(dom, 'working_dir')))
     except:
-        input_dir = None
-    output_dir = get_dom_tag_value(dom, 'output_dir')
-    try:
-        working_dir            =get_dom_tag_value(dom, 'working_dir')
-        working_dir = add_trailing_slash(check_abs_path(working_dir))
-    except: # use /tmp/ as default
-        working_dir            ='/tmp/'
+        working_dir = '/tmp/'
     try:
-        logfile_dir = get_dom_tag_value(dom, 'logfile_dir')
-    except: #use working_dir if not specified
+        logfile_dir = add_trailing_slash(check_abs_path(get_dom_tag_value(dom, 'logfile_dir')))
+    except:
         logfile_dir = working_dir
+    logging.basicConfig(filename=str().join([logfile_dir, basename, '.log']), level=logging.INFO, force=True)
     try:
-        mrf_name=get_dom_tag_value(dom, 'mrf_name')
+        mrf_name = get_dom_tag_value(dom, 'mrf_name')
     except:
-        # default to GIBS naming convention
-        mrf_name='{$parameter_name}%Y%j_.mrf'
-    # MRF specific parameters.
+        mrf_name = '{$parameter_name}%Y%j_.mrf'
     try:
-        mrf_empty_tile_filename=check_abs_path(get_dom_tag_value(dom, 'mrf_empty_tile_filename'))
+        zlevels = get_dom_tag_value(dom, 'mrf_z_levels')
     except:
-        try:
-            mrf_empty_tile_filename=lookupEmptyTile(get_dom_tag_value(dom, 'empty_tile'))
-        except:
-            log_sig_warn("Empty tile was not found for " + parameter_name, sigevent_url)
-            mrf_empty_tile_filename = ''
+        log_sig_exit('ERROR', "<mrf_z_levels> is required with <time_slices>", sigevent_url)
     try:
-        vrtnodata = get_dom_tag_value(dom, 'vrtnodata')
+        compression_type = get_dom_tag_value(dom, 'mrf_compression_type').upper()
     except:
-        vrtnodata = ""
-    mrf_blocksize          =get_dom_tag_value(dom, 'mrf_blocksize')
-    mrf_compression_type   =get_dom_tag_value(dom, 'mrf_compression_type')
+        compression_type = 'PNG'
     try:
-        outsize = get_dom_tag_value(dom, 'outsize')
-        target_x, target_y = outsize.split(' ')
+        source_url = get_dom_tag_value(dom, 'source_url')
     except:
-        outsize = ''
-        try:
-            target_x = get_dom_tag_value(dom, 'target_x')
-        except:
-            target_x = '' # if no target_x then use rasterXSize and rasterYSize from VRT file
-        try:
-            target_y = get_dom_tag_value(dom, 'target_y')
-        except:
-            target_y = ''
-    # EPSG code projection.
+        source_url = "NONE" if len(dom.getElementsByTagName('source_url')) > 0 else ''
     try:
-        target_epsg = 'EPSG:' + str(get_dom_tag_value(dom, 'target_epsg'))
+        mrf_cores = int(get_dom_tag_value(dom, 'mrf_cores'))
     except:
-        target_epsg = 'EPSG:4326' # default to geographic
+        mrf_cores = 4
     try:
-        if get_dom_tag_value(dom, 'source_epsg') == "detect":
-            source_epsg = "detect"
-        else:
-            source_epsg = 'EPSG:' + str(get_dom_tag_value(dom, 'source_epsg'))
+        mrf_parallel = get_dom_tag_value(dom, 'mrf_parallel') == "true"
     except:
-        source_epsg = 'EPSG:4326' # default to geographic
-
-    # Source extents.
+        mrf_parallel = False
     try:
-        extents = get_dom_tag_value(dom, 'extents')
+        mrf_clean = get_dom_tag_value(dom, 'mrf_clean') == "true"
     except:
-        extents = '-180,-90,180,90' # default to geographic
-    source_xmin, source_ymin, source_xmax, source_ymax = extents.split(',')
+        mrf_clean = mrf_parallel
+
+    time_slices = get_time_slices(dom, date_of_data)
+    log_info_mssg("Processing {0} time slices with {1} cores".format(len(time_slices), mrf_cores))
+
+    # Group the slices by the MRF they are written to and assign all of their z-levels up front
+    data_extension = get_extension('JPEG' if compression_type == 'ZEN' else compression_type)
+    groups = {}
+    for time_of_data, zkey, files in time_slices:
+        mrf = output_dir + get_mrf_names('.' + str(data_extension), mrf_name, parameter_name, date_of_data,
+                                         time_of_data)[0]
+        groups.setdefault(mrf, []).append((time_of_data, zkey, files))
+    first_slices = []
+    other_slices = []
+    for mrf, group in groups.items():
+        new_mrf = not os.path.isfile(mrf)
+        slots = assign_zdb_slots(mrf, zlevels, [zkey for time_of_data, zkey, files in group], source_url,
+                                 0 if compression_type == 'EPNG' else None)
+        group.sort(key=lambda time_slice: slots[time_slice[1]])
+        for i, (time_of_data, zkey, files) in enumerate(group):
+            slice_filename = str().join([working_dir, basename, '_', time_of_data, '.configuration_file.xml'])
+            write_time_slice_config(configuration_filename, slice_filename, time_of_data, zkey, files)
+            # The slice that creates the MRF has to finish before the others can write to it
+            if new_mrf and i == 0:
+                first_slices.append(slice_filename)
+            else:
+                other_slices.append(slice_filename)
+
+    mrfs = []
+    slice_errors = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, mrf_cores)) as executor:
+        for slice_filenames in [first_slices, other_slices]:
+            futures = [executor.submit(run_time_slice, slice_filename, data_only, send_email, email_server,
+                                       email_recipient, email_sender, logging_level)
+                       for slice_filename in slice_filenames]
+            for slice_filename, future in zip(slice_filenames, futures):
+                mrf, slice_error = future.result()
+                slice_errors += slice_error
+                if mrf is None:
+                    log_sig_err("Time slice failed: " + slice_filename, sigevent_url)
+                elif mrf not in mrfs:
+                    mrfs.append(mrf)
+                remove_file(slice_filename)
+
+    for mrf in mrfs:
+        if mrf_clean and data_extension is not None:
+            mrf_data_name = os.path.splitext(mrf)[0] + os.extsep + data_extension
+            log_info_mssg("running mrf_clean on data file {}".format(mrf_data_name))
+            clean_mrf(mrf_data_name)
+        if not data_only and os.path.isfile(mrf + ".aux.xml"):
+            log_info_mssg(str().join(['Moving ', mrf + ".aux.xml", ' to ', working_dir + os.path.basename(mrf) + ".aux.xml"]))
+            shutil.move(mrf + ".aux.xml", working_dir + os.path.basename(mrf) + ".aux.xml")
+
+    log_info_mssg("Time slices complete: {0} slices, {1} errors".format(len(time_slices), slice_errors))
+    return ",".join(mrfs), errors + slice_errors
 
-    # Target extents.
-    try:
-        target_extents = get_dom_tag_value(dom, 'target_extents')
-    except:
-        if target_epsg == 'EPSG:3857':
-            target_extents = '-20037508.34,-20037508.34,20037508.34,20037508.34'
-        elif target_epsg in ['EPSG:3413','EPSG:3031']:
-            target_extents = '-4194304,-4194304,4194304,4194304'
-        else:
-            target_extents = '-180,-90,180,90'
-    target_xmin, target_ymin, target_xmax, target_ymax = target_extents.split(',')
 
-    # Input files.
+#-------------------------------------------------------------------------------
+# Finished defining subroutines.  Begin main program.
+#-------------------------------------------------------------------------------
+
+def mrfgen(configuration_filename, data_only=False, send_email=False, email_server='', email_recipient='',
+           email_sender='', logging_level='ERROR', time_slice=False):
+    """
+    Runs the mrfgen pipeline for a single configuration file.
+    Returns a tuple of the MRF that was created or updated and the number of errors encountered.
+    Arguments:
+        configuration_filename -- Full path of the mrfgen configuration file
+        data_only -- Only output the MRF data, index, and header files
+        send_email -- Send email notification for errors and warnings
+        email_server -- The server where email is sent from (overrides configuration file value)
+        email_recipient -- The recipient address for email notifications (overrides configuration file value)
+        email_sender -- The sender for email notifications (overrides configuration file value)
+        logging_level -- Logging level for email notifications: ERROR, WARN, or INFO
+        time_slice -- Run as one slice of a <time_slices> configuration: the z-level is already assigned, and
+                      mrf_clean and the MRF .aux.xml are handled once all slices are done
+    """
+    global sigevent_url, errors, mrf_compression_type, mrf_maxsize, intermediates
+    errors = 0
+    intermediates = None
+
+    # Email metadata replaces sigevent_url
+    if send_email:
+        sigevent_url = (email_server, email_recipient, email_sender, logging_level)
+    else:
+        sigevent_url = ''
+
+    # Get current time, which is written to a file as the previous cycle time.
+    # Time format is "yyyymmdd.hhmmss.f".  Do this first to avoid any gap where tiles
+    # may get passed over because they were created while this script is running.
+    current_cycle_time = datetime.datetime.now().strftime("%Y%m%d.%H%M%S.%f")
+
+
+    # Read XML configuration file.
     try:
-        input_files = get_input_files(dom)
-        empty_vrt = None
-        if input_files == '':
-            raise ValueError('No input files provided')
-    except:
-        if input_dir is None:
-            if mrf_empty_tile_filename != '':
-                input_files = None
-                empty_vrt = create_vrt(add_trailing_slash(check_abs_path(working_dir))+basename, mrf_empty_tile_filename,
-                                       target_epsg, target_xmin, target_ymin, target_xmax, target_ymax)
+        # Open file.
+        config_file=open(configuration_filename, 'r')
+    except IOError:
+        mssg=str().join(['Cannot read configuration file:  ',
+                         configuration_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    else:
+        # Get dom from XML file.
+        dom=xml.dom.minidom.parse(config_file)
+        # Several sub-daily time slices of a z-level MRF in one run
+        if not time_slice and len(dom.getElementsByTagName('time_slices')) > 0:
+            config_file.close()
+            return mrfgen_time_slices(configuration_filename, dom, data_only, send_email, email_server,
+                                      email_recipient, email_sender, logging_level)
+        # Parameter name.
+        parameter_name         =get_dom_tag_value(dom, 'parameter_name')
+        date_of_data           =get_dom_tag_value(dom, 'date_of_data')
+
+        # Define output basename for log, txt, vrt, .mrf, .idx and .ppg or .pjg
+        # Files get date_of_date added, links do not.
+        oe_utils.basename = basename = str().join([parameter_name, '_', date_of_data, '___', 'mrfgen_', current_cycle_time, '_', str(os.getpid())])
+
+        # Get default email server and recipient if not override
+        if email_server == '':
+            try:
+                email_server = get_dom_tag_value(dom, 'email_server')
+            except:
+                email_server = ''
+        if email_recipient == '':
+            try:
+                email_recipient = get_dom_tag_value(dom, 'email_recipient')
+            except:
+                email_recipient = ''
+        if email_sender == '':
+            try:
+                email_sender = get_dom_tag_value(dom, 'email_sender')
+            except:
+                email_sender = ''
+        if send_email:
+            sigevent_url = (email_server, email_recipient, email_sender, logging_level)
+            if email_recipient == '':
+                log_sig_err("No email recipient provided for notifications.", sigevent_url)
+
+        # for sub-daily imagery
+        try:
+            time_of_data = get_dom_tag_value(dom, 'time_of_data')
+        except:
+            time_of_data = ''
+        # Directories.
+        try:
+            input_dir = get_dom_tag_value(dom, 'input_dir')
+        except:
+            input_dir = None
+        output_dir = get_dom_tag_value(dom, 'output_dir')
+        try:
+            working_dir            =get_dom_tag_value(dom, 'working_dir')
+            working_dir = add_trailing_slash(check_abs_path(working_dir))
+        except: # use /tmp/ as default
+            working_dir            ='/tmp/'
+        # memory-backed directory (e.g. tmpfs) for intermediate files, defaults to working_dir
+        try:
+            intermediate_dir = add_trailing_slash(check_abs_path(get_dom_tag_value(dom, 'intermediate_dir')))
+        except:
+            intermediate_dir = None
+        try:
+            intermediate_memory_budget = int(get_dom_tag_value(dom, 'intermediate_memory_budget'))
+        except:
+            intermediate_memory_budget = None
+        try:
+            logfile_dir = get_dom_tag_value(dom, 'logfile_dir')
+        except: #use working_dir if not specified
+            logfile_dir = working_dir
+        try:
+            mrf_name=get_dom_tag_value(dom, 'mrf_name')
+        except:
+            # default to GIBS naming convention
+            mrf_name='{$parameter_name}%Y%j_.mrf'
+        # MRF specific parameters.
+        try:
+            mrf_empty_tile_filename=check_abs_path(get_dom_tag_value(dom, 'mrf_empty_tile_filename'))
+        except:
+            try:
+                mrf_empty_tile_filename=lookupEmptyTile(get_dom_tag_value(dom, 'empty_tile'))
+            except:
+                log_sig_warn("Empty tile was not found for " + parameter_name, sigevent_url)
+                mrf_empty_tile_filename = ''
+        try:
+            vrtnodata = get_dom_tag_value(dom, 'vrtnodata')
+        except:
+            vrtnodata = ""
+        mrf_blocksize          =get_dom_tag_value(dom, 'mrf_blocksize')
+        mrf_compression_type   =get_dom_tag_value(dom, 'mrf_compression_type')
+        try:
+            outsize = get_dom_tag_value(dom, 'outsize')
+            target_x, target_y = outsize.split(' ')
+        except:
+            outsize = ''
+            try:
+                target_x = get_dom_tag_value(dom, 'target_x')
+            except:
+                target_x = '' # if no target_x then use rasterXSize and rasterYSize from VRT file
+            try:
+                target_y = get_dom_tag_value(dom, 'target_y')
+            except:
+                target_y = ''
+        # EPSG code projection.
+        try:
+            target_epsg = 'EPSG:' + str(get_dom_tag_value(dom, 'target_epsg'))
+        except:
+            target_epsg = 'EPSG:4326' # default to geographic
+        try:
+            if get_dom_tag_value(dom, 'source_epsg') == "detect":
+                source_epsg = "detect"
             else:
-                log_sig_exit('ERROR', "<input_files> or <input_dir> or <mrf_empty_tile_filename> is required", sigevent_url)
-        else:
-            input_files = None
+                source_epsg = 'EPSG:' + str(get_dom_tag_value(dom, 'source_epsg'))
+        except:
+            source_epsg = 'EPSG:4326' # default to geographic
+
+        # Source extents.
+        try:
+            extents = get_dom_tag_value(dom, 'extents')
+        except:
+            extents = '-180,-90,180,90' # default to geographic
+        source_xmin, source_ymin, source_xmax, source_ymax = extents.split(',')
+
+        # Target extents.
+        try:
+            target_extents = get_dom_tag_value(dom, 'target_extents')
+        except:
+            if target_epsg == 'EPSG:3857':
+                target_extents = '-20037508.34,-20037508.34,20037508.34,20037508.34'
+            elif target_epsg in ['EPSG:3413','EPSG:3031']:
+                target_extents = '-4194304,-4194304,4194304,4194304'
+            else:
+                target_extents = '-180,-90,180,90'
+        target_xmin, target_ymin, target_xmax, target_ymax = target_extents.split(',')
+
+        # Input files.
+        try:
+            input_files = get_input_files(dom)
             empty_vrt = None
-    # overview levels
-    try:
-        overview_levels = get_dom_tag_value(dom, 'overview_levels').split(' ')
-        for level in overview_levels:
-            if level.isdigit() == False:
-                log_sig_exit("ERROR", "'" + level + "' is not a valid overview value.", sigevent_url)
-        if len(overview_levels) > 1:
-            overview = int(overview_levels[1]) / int(overview_levels[0])
-        else:
+            if input_files == '':
+                raise ValueError('No input files provided')
+        except:
+            if input_dir is None:
+                if mrf_empty_tile_filename != '':
+                    input_files = None
+                    empty_vrt = create_vrt(add_trailing_slash(check_abs_path(working_dir))+basename, mrf_empty_tile_filename,
+                                           target_epsg, target_xmin, target_ymin, target_xmax, target_ymax)
+                else:
+                    log_sig_exit('ERROR', "<input_files> or <input_dir> or <mrf_empty_tile_filename> is required", sigevent_url)
+            else:
+                input_files = None
+                empty_vrt = None
+        # overview levels
+        try:
+            overview_levels = get_dom_tag_value(dom, 'overview_levels').split(' ')
+            for level in overview_levels:
+                if level.isdigit() == False:
+                    log_sig_exit("ERROR", "'" + level + "' is not a valid overview value.", sigevent_url)
+            if len(overview_levels) > 1:
+                overview = int(overview_levels[1]) / int(overview_levels[0])
+            else:
+                overview = 2
+        except:
+            overview_levels = ''
             overview = 2
-    except:
-        overview_levels = ''
-        overview = 2
-    # resampling method
-    try:
-        overview_resampling = get_dom_tag_value(dom, 'overview_resampling')
-    except:
-        overview_resampling = 'nearest'
-        # gdalwarp resampling method for resizing
-    try:
-        resize_resampling = get_dom_tag_value(dom, 'resize_resampling')
-        if resize_resampling == "none":
+        # resampling method
+        try:
+            overview_resampling = get_dom_tag_value(dom, 'overview_resampling')
+        except:
+            overview_resampling = 'nearest'
+            # gdalwarp resampling method for resizing
+        try:
+            resize_resampling = get_dom_tag_value(dom, 'resize_resampling')
+            if resize_resampling == "none":
+                resize_resampling = ''
+        except:
             resize_resampling = ''
-    except:
-        resize_resampling = ''
-    if resize_resampling != '' and target_x == '':
-        log_sig_exit('ERROR', "target_x or outsize must be provided for resizing", sigevent_url)
+        if resize_resampling != '' and target_x == '':
+            log_sig_exit('ERROR', "target_x or outsize must be provided for resizing", sigevent_url)
 
-    # gdalwarp resampling method for reprojection
-    try:
-        reprojection_resampling = get_dom_tag_value(dom, 'reprojection_resampling')
-    except:
-        reprojection_resampling = 'cubic' # default to cubic
-    # colormap
-    try:
-        colormap = get_dom_tag_value(dom, 'colormap')
-    except:
-        colormap = ''
-    # quality/precision
-    try:
-        quality_prec = get_dom_tag_value(dom, 'quality_prec')
-    except:
-        if mrf_compression_type.lower() == 'lerc':
-            quality_prec = '0.001' # default to standard floating point precision if LERC
-        else:
-            quality_prec = '80' # default to 80 quality for everything else
-    # z-levels
-    try:
-        zlevels = get_dom_tag_value(dom, 'mrf_z_levels')
-    except:
-        zlevels = ''
-        # z key
-    z = None
-    zkey_type = "string" # default to only string for now
-    try:
-        zkey = get_dom_tag_value(dom, 'mrf_z_key')
-    except:
-        zkey = ''
-    # nocopy
-    try:
-        if get_dom_tag_value(dom, 'mrf_nocopy') == "true":
-            nocopy = True
-        else:
-            nocopy = False
-    except:
-        nocopy = None
-    # noaddo
-    try:
-        if get_dom_tag_value(dom, 'mrf_noaddo') == "false":
-            noaddo = False
-        else:
-            noaddo = True
-    except:
-        noaddo = None
+        # gdalwarp resampling method for reprojection
+        try:
+            reprojection_resampling = get_dom_tag_value(dom, 'reprojection_resampling')
+        except:
+            reprojection_resampling = 'cubic' # default to cubic
+        # colormap
+        try:
+            colormap = get_dom_tag_value(dom, 'colormap')
+        except:
+            colormap = ''
+        # quality/precision
+        try:
+            quality_prec = get_dom_tag_value(dom, 'quality_prec')
+        except:
+            if mrf_compression_type.lower() == 'lerc':
+                quality_prec = '0.001' # default to standard floating point precision if LERC
+            else:
+                quality_prec = '80' # default to 80 quality for everything else
+        # z-levels
+        try:
+            zlevels = get_dom_tag_value(dom, 'mrf_z_levels')
+        except:
+            zlevels = ''
+            # z key
+        z = None
+        try:
+            zkey = get_dom_tag_value(dom, 'mrf_z_key')
+        except:
+            zkey = ''
+        # nocopy
+        try:
+            if get_dom_tag_value(dom, 'mrf_nocopy') == "true":
+                nocopy = True
+            else:
+                nocopy = False
+        except:
+            nocopy = None
+        # noaddo
+        try:
+            if get_dom_tag_value(dom, 'mrf_noaddo') == "false":
+                noaddo = False
+            else:
+                noaddo = True
+        except:
+            noaddo = None
 
-    # mrf_cores (max number of cpu cores to run on if mrf_parallel is set, defaults to 4
-    try:
-        mrf_cores = int(get_dom_tag_value(dom, 'mrf_cores'))
-    except:
-        mrf_cores = 4 # multiprocessing.cpu_count()
+        # mrf_cores (max number of cpu cores to run on if mrf_parallel is set, defaults to 4
+        try:
+            mrf_cores = int(get_dom_tag_value(dom, 'mrf_cores'))
+        except:
+            mrf_cores = 4 # multiprocessing.cpu_count()
 
-    # mrf_parallel (run mrf_insert in parallel), defaults to False
-    try:
-        if get_dom_tag_value(dom, 'mrf_parallel') == "true":
-            mrf_parallel = True
-        else:
+        # mrf_parallel (run mrf_insert in parallel), defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_parallel') == "true":
+                mrf_parallel = True
+            else:
+                mrf_parallel = False
+        except:
             mrf_parallel = False
-    except:
-        mrf_parallel = False
 
-    # run the mrf_clean utility to reduce the size of the generated MRFs, defaults to mrf_parallel.
-    try:
-        if get_dom_tag_value(dom, 'mrf_clean') == "true":
-            mrf_clean = True
-        else:
-            mrf_clean = False
-    except:
-        if mrf_parallel:
-            mrf_clean = True
-        else:
-            mrf_clean = False
+        # build each overview level from the level below it instead of running gdaladdo, defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_cascade_overviews') == "true":
+                cascade_overviews = True
+            else:
+                cascade_overviews = False
+        except:
+            cascade_overviews = False
+        # only cascade when the levels allocated with UNIFORM_SCALE are the ones gdaladdo would build
+        if cascade_overviews and overview_resampling.lower() not in overview_resample_algs:
+            log_sig_warn("Overview resampling " + overview_resampling + " can't be cascaded, using gdaladdo", sigevent_url)
+            cascade_overviews = False
+        if cascade_overviews and not uniform_overview_levels(overview_levels, overview):
+            log_sig_warn("<overview_levels> are not successive powers of " + str(int(overview)) +
+                         ", using gdaladdo", sigevent_url)
+            cascade_overviews = False
+
+        # replace effectively empty tiles with zero-size index entries, defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_suppress_empty') == "true":
+                suppress_empty = True
+            else:
+                suppress_empty = False
+        except:
+            suppress_empty = False
 
-    # set a maximum size for the mrf before running mrf_clean. used to manage MRF sizes for mrf_parallel and mrf_noaddo
-    try:
-        mrf_maxsize = int(get_dom_tag_value(dom, 'mrf_maxsize'))
-    except:
-        mrf_maxsize = None
+        # run the mrf_clean utility to reduce the size of the generated MRFs, defaults to mrf_parallel.
+        try:
+            if get_dom_tag_value(dom, 'mrf_clean') == "true":
+                mrf_clean = True
+            else:
+                mrf_clean = False
+        except:
+            if mrf_parallel:
+                mrf_clean = True
+            else:
+                mrf_clean = False
 
-    # Use brunsli JPEG compression, defaults to False
-    try:
-        if get_dom_tag_value(dom, 'mrf_brunsli') == "false":
+        # set a maximum size for the mrf before running mrf_clean. used to manage MRF sizes for mrf_parallel and mrf_noaddo
+        try:
+            mrf_maxsize = int(get_dom_tag_value(dom, 'mrf_maxsize'))
+        except:
+            mrf_maxsize = None
+
+        # Use brunsli JPEG compression, defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_brunsli') == "false":
+                use_brunsli = False
+            else:
+                use_brunsli = True
+        except:
             use_brunsli = False
-        else:
-            use_brunsli = True
-    except:
-        use_brunsli = False
 
-    # merge, defaults to False
-    try:
-        if get_dom_tag_value(dom, 'mrf_merge') == "false":
+        # merge, defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_merge') == "false":
+                merge = False
+            else:
+                merge = True
+        except:
             merge = False
-        else:
-            merge = True
-    except:
-        merge = False
-    # strict_palette, defaults to False
-    try:
-        if get_dom_tag_value(dom, 'mrf_strict_palette') == "false":
+        # strict_palette, defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_strict_palette') == "false":
+                strict_palette = False
+            else:
+                strict_palette = True
+        except:
             strict_palette = False
-        else:
-            strict_palette = True
-    except:
-        strict_palette = False
-    # overwrite_colormap, defaults to False
-    try:
-        if get_dom_tag_value(dom, 'mrf_overwrite_colormap') == "false":
+        # overwrite_colormap, defaults to False
+        try:
+            if get_dom_tag_value(dom, 'mrf_overwrite_colormap') == "false":
+                overwrite_colormap = False
+            else:
+                overwrite_colormap = True
+        except:
             overwrite_colormap = False
-        else:
-            overwrite_colormap = True
-    except:
-        overwrite_colormap = False
-    # mrf data
-    try:
-        mrf_data_scale = get_dom_tag_value(dom, 'mrf_data_scale')
-    except:
-        mrf_data_scale = ''
-    try:
-        mrf_data_offset = get_dom_tag_value(dom, 'mrf_data_offset')
-    except:
-        mrf_data_offset = ''
-    if mrf_data_scale != '' and mrf_data_offset == '':
-        log_sig_exit('ERROR', "<mrf_data_offset> is required if <mrf_data_scale> is set", sigevent_url)
-    if (mrf_data_scale == '' and mrf_data_offset != ''):
-        log_sig_exit('ERROR', "<mrf_data_scale> is required if <mrf_data_offset> is set", sigevent_url)
-    try:
-        mrf_data_units = get_dom_tag_value(dom, 'mrf_data_units')
-    except:
-        mrf_data_units = ''
-    try:
-        source_url = get_dom_tag_value(dom, 'source_url')
-    except:
-        if len(dom.getElementsByTagName('source_url')) > 0:
-            source_url = "NONE"
-        else:
-            source_url = ''
-    # Close file.
-    config_file.close()
-
-# Make certain each directory exists and has a trailing slash.
-if input_dir != None:
-    input_dir = add_trailing_slash(check_abs_path(input_dir))
-output_dir = add_trailing_slash(check_abs_path(output_dir))
-logfile_dir = add_trailing_slash(check_abs_path(logfile_dir))
-
-# Save script_dir
-script_dir = add_trailing_slash(os.path.dirname(os.path.abspath(__file__)))
-
-# Ensure that mrf_compression_type is uppercase.
-mrf_compression_type=mrf_compression_type.upper()
-
-# Verify logfile_dir first so that the log can be started.
-verify_directory_path_exists(logfile_dir, 'logfile_dir', sigevent_url)
-# Initialize log file.
-log_filename=str().join([logfile_dir, basename, '.log'])
-logging.basicConfig(filename=log_filename, level=logging.INFO)
-
-# Verify remaining directory paths.
-if input_dir != None:
-    verify_directory_path_exists(input_dir, 'input_dir', sigevent_url)
-verify_directory_path_exists(output_dir, 'output_dir', sigevent_url)
-verify_directory_path_exists(working_dir, 'working_dir', sigevent_url)
-
-# Make certain color map can be found
-if colormap != '' and '://' not in colormap:
-    colormap = check_abs_path(colormap)
-
-# Log all of the configuration information.
-log_info_mssg_with_timestamp(str().join(['config XML file:  ', configuration_filename]))
+        # mrf data
+        try:
+            mrf_data_scale = get_dom_tag_value(dom, 'mrf_data_scale')
+        except:
+            mrf_data_scale = ''
+        try:
+            mrf_data_offset = get_dom_tag_value(dom, 'mrf_data_offset')
+        except:
+            mrf_data_offset = ''
+        if mrf_data_scale != '' and mrf_data_offset == '':
+            log_sig_exit('ERROR', "<mrf_data_offset> is required if <mrf_data_scale> is set", sigevent_url)
+        if (mrf_data_scale == '' and mrf_data_offset != ''):
+            log_sig_exit('ERROR', "<mrf_data_scale> is required if <mrf_data_offset> is set", sigevent_url)
+        try:
+            mrf_data_units = get_dom_tag_value(dom, 'mrf_data_units')
+        except:
+            mrf_data_units = ''
+        try:
+            source_url = get_dom_tag_value(dom, 'source_url')
+        except:
+            if len(dom.getElementsByTagName('source_url')) > 0:
+                source_url = "NONE"
+            else:
+                source_url = ''
+        # Close file.
+        config_file.close()
+
+    # Make certain each directory exists and has a trailing slash.
+    if input_dir != None:
+        input_dir = add_trailing_slash(check_abs_path(input_dir))
+    output_dir = add_trailing_slash(check_abs_path(output_dir))
+    logfile_dir = add_trailing_slash(check_abs_path(logfile_dir))
+
+    # Save script_dir
+    script_dir = add_trailing_slash(os.path.dirname(os.path.abspath(__file__)))
+
+    # Ensure that mrf_compression_type is uppercase.
+    mrf_compression_type=mrf_compression_type.upper()
+
+    # Verify logfile_dir first so that the log can be started.
+    verify_directory_path_exists(logfile_dir, 'logfile_dir', sigevent_url)
+    # Initialize log file.
+    log_filename=str().join([logfile_dir, basename, '.log'])
+    logging.basicConfig(filename=log_filename, level=logging.INFO, force=True)
+
+    # Verify remaining directory paths.
+    if input_dir != None:
+        verify_directory_path_exists(input_dir, 'input_dir', sigevent_url)
+    verify_directory_path_exists(output_dir, 'output_dir', sigevent_url)
+    verify_directory_path_exists(working_dir, 'working_dir', sigevent_url)
+
+    # Make certain color map can be found
+    if colormap != '' and '://' not in colormap:
+        colormap = check_abs_path(colormap)
+    elif colormap != '':
+        colormap = get_colormap(colormap)
+
+    # Log all of the configuration information.
+    log_info_mssg_with_timestamp(str().join(['config XML file:  ', configuration_filename]))
                                       
-# Copy configuration file to working_dir (if it's not already there)
-# so that the MRF can be recreated if needed.
-if os.path.dirname(configuration_filename) != os.path.dirname(working_dir):
-    config_preexisting=glob.glob(configuration_filename)
-    if len(config_preexisting) > 0:
-        at_dest_filename=str().join([working_dir, configuration_filename])
-        at_dest_preexisting=glob.glob(at_dest_filename)
-        if len(at_dest_preexisting) > 0:
-            remove_file(at_dest_filename)
-        shutil.copy(configuration_filename, working_dir+"/"+basename+".configuration_file.xml")
-        log_info_mssg(str().join([
-                          'config XML file:  copied to     ', working_dir]))
-log_info_mssg(str().join(['config parameter_name:          ', parameter_name]))
-log_info_mssg(str().join(['config date_of_data:            ', date_of_data]))
-log_info_mssg(str().join(['config time_of_data:            ', time_of_data]))
-if input_files is not None:
-    log_info_mssg(str().join(['config input_files:             ', input_files]))
-if input_dir is not None:
-    log_info_mssg(str().join(['config input_dir:               ', input_dir]))
-if empty_vrt is not None:
-    log_info_mssg(str().join(['config empty_vrt:               ', empty_vrt]))
-log_info_mssg(str().join(['config output_dir:              ', output_dir]))
-log_info_mssg(str().join(['config working_dir:             ', working_dir]))
-log_info_mssg(str().join(['config logfile_dir:             ', logfile_dir]))
-log_info_mssg(str().join(['config mrf_name:                ', mrf_name]))
-log_info_mssg(str().join(['config mrf_empty_tile_filename: ',
-                          mrf_empty_tile_filename]))
-log_info_mssg(str().join(['config vrtnodata:               ', vrtnodata]))
-log_info_mssg(str().join(['config mrf_blocksize:           ', mrf_blocksize]))
-log_info_mssg(str().join(['config mrf_compression_type:    ',
-                          mrf_compression_type]))
-log_info_mssg(str().join(['config outsize:                 ', outsize]))
-log_info_mssg(str().join(['config target_x:                ', target_x]))
-log_info_mssg(str().join(['config target_y:                ', target_y]))
-log_info_mssg(str().join(['config target_epsg:             ', target_epsg]))
-log_info_mssg(str().join(['config source_epsg:             ', source_epsg]))
-log_info_mssg(str().join(['config extents:                 ', extents]))
-log_info_mssg(str().join(['config target_extents:          ', target_extents]))
-log_info_mssg(str().join(['config overview levels:         ', ' '.join(overview_levels)]))
-log_info_mssg(str().join(['config overview resampling:     ', overview_resampling]))
-log_info_mssg(str().join(['config reprojection resampling: ', reprojection_resampling]))
-log_info_mssg(str().join(['config resize resampling:       ', resize_resampling]))
-log_info_mssg(str().join(['config colormap:                ', colormap]))
-log_info_mssg(str().join(['config quality_prec:            ', quality_prec]))
-log_info_mssg(str().join(['config mrf_nocopy:              ', str(nocopy)]))
-log_info_mssg(str().join(['config mrf_noaddo:              ', str(noaddo)]))
-log_info_mssg(str().join(['config mrf_merge:               ', str(merge)]))
-log_info_mssg(str().join(['config mrf_brunsli:             ', str(use_brunsli)]))
-log_info_mssg(str().join(['config mrf_parallel:            ', str(mrf_parallel)]))
-log_info_mssg(str().join(['config mrf_cores:               ', str(mrf_cores)]))
-log_info_mssg(str().join(['config mrf_clean:               ', str(mrf_clean)]))
-log_info_mssg(str().join(['config mrf_maxsize:             ', str(mrf_maxsize)]))
-log_info_mssg(str().join(['config mrf_strict_palette:      ', str(strict_palette)]))
-log_info_mssg(str().join(['config mrf_overwrite_colormap:  ', str(overwrite_colormap)]))
-log_info_mssg(str().join(['config mrf_z_levels:            ', zlevels]))
-log_info_mssg(str().join(['config mrf_z_key:               ', zkey]))
-log_info_mssg(str().join(['config mrf_data_scale:          ', mrf_data_scale]))
-log_info_mssg(str().join(['config mrf_data_offset:         ', mrf_data_offset]))
-log_info_mssg(str().join(['config mrf_data_units:          ', mrf_data_units]))
-log_info_mssg(str().join(['config source_url:              ', source_url]))
-log_info_mssg(str().join(['mrfgen current_cycle_time:      ', current_cycle_time]))
-log_info_mssg(str().join(['mrfgen basename:                ', basename]))
-
-# Verify that date is 8 characters.
-if len(date_of_data) != 8:
-    mssg='Format for <date_of_data> (in mrfgen XML config file) is:  yyyymmdd'
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-if time_of_data != '' and len(time_of_data) != 6:
-    mssg='Format for <time_of_data> (in mrfgen XML config file) is:  HHMMSS'
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-# Check if empty tile filename was specified.
-if len(mrf_empty_tile_filename) == 0:
-    log_info_mssg(str('Empty tile not specified, none will be used.'))
-    mrf_empty_tile_bytes=0
-else:
-    # Verify that the empty tile can be found.
-    mrf_empty_tile_existing=glob.glob(mrf_empty_tile_filename)
-    if len(mrf_empty_tile_existing) == 0:
-        mssg=str().join(['Specified empty tile file not found:  ', mrf_empty_tile_filename])
+    # Copy configuration file to working_dir (if it's not already there)
+    # so that the MRF can be recreated if needed.
+    if os.path.dirname(configuration_filename) != os.path.dirname(working_dir):
+        config_preexisting=glob.glob(configuration_filename)
+        if len(config_preexisting) > 0:
+            at_dest_filename=str().join([working_dir, configuration_filename])
+            at_dest_preexisting=glob.glob(at_dest_filename)
+            if len(at_dest_preexisting) > 0:
+                remove_file(at_dest_filename)
+            shutil.copy(configuration_filename, working_dir+"/"+basename+".configuration_file.xml")
+            log_info_mssg(str().join([
+                              'config XML file:  copied to     ', working_dir]))
+    log_info_mssg(str().join(['config parameter_name:          ', parameter_name]))
+    log_info_mssg(str().join(['config date_of_data:            ', date_of_data]))
+    log_info_mssg(str().join(['config time_of_data:            ', time_of_data]))
+    if input_files is not None:
+        log_info_mssg(str().join(['config input_files:             ', input_files]))
+    if input_dir is not None:
+        log_info_mssg(str().join(['config input_dir:               ', input_dir]))
+    if empty_vrt is not None:
+        log_info_mssg(str().join(['config empty_vrt:               ', empty_vrt]))
+    log_info_mssg(str().join(['config output_dir:              ', output_dir]))
+    log_info_mssg(str().join(['config working_dir:             ', working_dir]))
+    if intermediate_dir is not None:
+        log_info_mssg(str().join(['config intermediate_dir:        ', intermediate_dir]))
+        log_info_mssg(str().join(['config intermediate_memory_budget: ', str(intermediate_memory_budget)]))
+    log_info_mssg(str().join(['config logfile_dir:             ', logfile_dir]))
+    log_info_mssg(str().join(['config mrf_name:                ', mrf_name]))
+    log_info_mssg(str().join(['config mrf_empty_tile_filename: ',
+                              mrf_empty_tile_filename]))
+    log_info_mssg(str().join(['config vrtnodata:               ', vrtnodata]))
+    log_info_mssg(str().join(['config mrf_blocksize:           ', mrf_blocksize]))
+    log_info_mssg(str().join(['config mrf_compression_type:    ',
+                              mrf_compression_type]))
+    log_info_mssg(str().join(['config outsize:                 ', outsize]))
+    log_info_mssg(str().join(['config target_x:                ', target_x]))
+    log_info_mssg(str().join(['config target_y:                ', target_y]))
+    log_info_mssg(str().join(['config target_epsg:             ', target_epsg]))
+    log_info_mssg(str().join(['config source_epsg:             ', source_epsg]))
+    log_info_mssg(str().join(['config extents:                 ', extents]))
+    log_info_mssg(str().join(['config target_extents:          ', target_extents]))
+    log_info_mssg(str().join(['config overview levels:         ', ' '.join(overview_levels)]))
+    log_info_mssg(str().join(['config overview resampling:     ', overview_resampling]))
+    log_info_mssg(str().join(['config reprojection resampling: ', reprojection_resampling]))
+    log_info_mssg(str().join(['config resize resampling:       ', resize_resampling]))
+    log_info_mssg(str().join(['config colormap:                ', colormap]))
+    log_info_mssg(str().join(['config quality_prec:            ', quality_prec]))
+    log_info_mssg(str().join(['config mrf_nocopy:              ', str(nocopy)]))
+    log_info_mssg(str().join(['config mrf_noaddo:              ', str(noaddo)]))
+    log_info_mssg(str().join(['config mrf_merge:               ', str(merge)]))
+    log_info_mssg(str().join(['config mrf_brunsli:             ', str(use_brunsli)]))
+    log_info_mssg(str().join(['config mrf_parallel:            ', str(mrf_parallel)]))
+    log_info_mssg(str().join(['config mrf_cores:               ', str(mrf_cores)]))
+    log_info_mssg(str().join(['config mrf_cascade_overviews:   ', str(cascade_overviews)]))
+    log_info_mssg(str().join(['config mrf_suppress_empty:      ', str(suppress_empty)]))
+    log_info_mssg(str().join(['config mrf_clean:               ', str(mrf_clean)]))
+    log_info_mssg(str().join(['config mrf_maxsize:             ', str(mrf_maxsize)]))
+    log_info_mssg(str().join(['config mrf_strict_palette:      ', str(strict_palette)]))
+    log_info_mssg(str().join(['config mrf_overwrite_colormap:  ', str(overwrite_colormap)]))
+    log_info_mssg(str().join(['config mrf_z_levels:            ', zlevels]))
+    log_info_mssg(str().join(['config mrf_z_key:               ', zkey]))
+    log_info_mssg(str().join(['config mrf_data_scale:          ', mrf_data_scale]))
+    log_info_mssg(str().join(['config mrf_data_offset:         ', mrf_data_offset]))
+    log_info_mssg(str().join(['config mrf_data_units:          ', mrf_data_units]))
+    log_info_mssg(str().join(['config source_url:              ', source_url]))
+    log_info_mssg(str().join(['mrfgen current_cycle_time:      ', current_cycle_time]))
+    log_info_mssg(str().join(['mrfgen basename:                ', basename]))
+
+    # Verify that date is 8 characters.
+    if len(date_of_data) != 8:
+        mssg='Format for <date_of_data> (in mrfgen XML config file) is:  yyyymmdd'
         log_sig_exit('ERROR', mssg, sigevent_url)
 
-    # Verify that the empty tile image format is either PNG or JPEG.
-    mrf_empty_tile_what=imghdr.what(mrf_empty_tile_filename)
-    if mrf_empty_tile_what != 'png' and mrf_empty_tile_what != 'jpeg' and mrf_empty_tile_what != 'tiff' and mrf_empty_tile_what != 'lerc':
-        mssg='Empty tile image format must be either png, jpeg, tiff, or lerc.'
+    if time_of_data != '' and len(time_of_data) != 6:
+        mssg='Format for <time_of_data> (in mrfgen XML config file) is:  HHMMSS'
         log_sig_exit('ERROR', mssg, sigevent_url)
 
-    # Verify that the empty tile matches MRF compression type.
-    if mrf_empty_tile_what == 'png':
-        # Check the last 3 characters in case of PNG or PPNG or JPNG.
-        if mrf_compression_type[-3:len(mrf_compression_type)] != 'PNG':
-            mssg='Empty tile format does not match MRF compression type.'
+    # Check if empty tile filename was specified.
+    if len(mrf_empty_tile_filename) == 0:
+        log_info_mssg(str('Empty tile not specified, none will be used.'))
+        mrf_empty_tile_bytes=0
+    else:
+        # Verify that the empty tile can be found.
+        mrf_empty_tile_existing=glob.glob(mrf_empty_tile_filename)
+        if len(mrf_empty_tile_existing) == 0:
+            mssg=str().join(['Specified empty tile file not found:  ', mrf_empty_tile_filename])
             log_sig_exit('ERROR', mssg, sigevent_url)
 
-    if mrf_empty_tile_what == 'jpeg':
-        # Check the first 2 characters in case of JPG or JPEG.
-        if mrf_compression_type.lower() not in ['jpeg', 'jpg', 'zen']:
-            mssg='Empty tile format does not match MRF compression type.'
+        # Verify that the empty tile image format is either PNG or JPEG.
+        mrf_empty_tile_what=imghdr.what(mrf_empty_tile_filename)
+        if mrf_empty_tile_what != 'png' and mrf_empty_tile_what != 'jpeg' and mrf_empty_tile_what != 'tiff' and mrf_empty_tile_what != 'lerc':
+            mssg='Empty tile image format must be either png, jpeg, tiff, or lerc.'
             log_sig_exit('ERROR', mssg, sigevent_url)
 
-    # Report empty tile size in bytes.
-    mrf_empty_tile_bytes=os.path.getsize(mrf_empty_tile_filename)
-    log_info_mssg(str().join(['Empty tile size is:             ',
-                              str(mrf_empty_tile_bytes), ' bytes.']))
-
-##IS LOCK FILE NECESSARY?
-## Lock file indicates tile generation in progress.
-#lock=glob.glob(str().join([input_dir, '*lock*']))
-#if len(lock) > 0:
-#    mssg='Lock found.'
-#    log_sig_exit('INFO', mssg, sigevent_url)
-
-#-------------------------------------------------------------------------------
-# Organize output filenames.
-#-------------------------------------------------------------------------------
+        # Verify that the empty tile matches MRF compression type.
+        if mrf_empty_tile_what == 'png':
+            # Check the last 3 characters in case of PNG or PPNG or JPNG.
+            if mrf_compression_type[-3:len(mrf_compression_type)] != 'PNG':
+                mssg='Empty tile format does not match MRF compression type.'
+                log_sig_exit('ERROR', mssg, sigevent_url)
 
-# Change directory to working_dir.
-os.chdir(working_dir)
+        if mrf_empty_tile_what == 'jpeg':
+            # Check the first 2 characters in case of JPG or JPEG.
+            if mrf_compression_type.lower() not in ['jpeg', 'jpg', 'zen']:
+                mssg='Empty tile format does not match MRF compression type.'
+                log_sig_exit('ERROR', mssg, sigevent_url)
 
-# transparency flag for custom color maps; default to False
-add_transparency = False
+        # Report empty tile size in bytes.
+        mrf_empty_tile_bytes=os.path.getsize(mrf_empty_tile_filename)
+        log_info_mssg(str().join(['Empty tile size is:             ',
+                                  str(mrf_empty_tile_bytes), ' bytes.']))
+
+    ##IS LOCK FILE NECESSARY?
+    ## Lock file indicates tile generation in progress.
+    #lock=glob.glob(str().join([input_dir, '*lock*']))
+    #if len(lock) > 0:
+    #    mssg='Lock found.'
+    #    log_sig_exit('INFO', mssg, sigevent_url)
+
+    #-------------------------------------------------------------------------------
+    # Organize output filenames.
+    #-------------------------------------------------------------------------------
+
+    # Change directory to working_dir.
+    os.chdir(working_dir)
+
+    # Intermediate files are tracked so they can be placed in memory and removed explicitly
+    intermediates = intermediate_storage(working_dir, intermediate_dir,
+                                         intermediate_memory_budget * 1024 * 1024 if intermediate_memory_budget else None)
+    if empty_vrt is not None:
+        intermediates.track(empty_vrt)
+
+    # transparency flag for custom color maps; default to False
+    add_transparency = False
+
+    # Declare scale, offset, and units
+    scale = None
+    offset = None
+    units = None
+
+    # Get list of all tile filenames.
+    alltiles = []
+    if input_files is not None:
+        input_files = input_files.strip()
+        alltiles = input_files.split(',')
+
+    if input_dir is not None:
+        if mrf_compression_type.lower() in ['jpeg', 'jpg', 'zen']:
+            alltiles = alltiles + glob.glob(str().join([input_dir, '*.jpg']))
+        if mrf_compression_type.lower() in ['png', 'ppng', 'zen']:
+            alltiles = alltiles + glob.glob(str().join([input_dir, '*.png']))
+        # check for tiffs
+        alltiles = alltiles + glob.glob(str().join([input_dir, '*.tif']))
+        alltiles = alltiles + glob.glob(str().join([input_dir, '*.tiff']))
+        # check for mrfs
+        alltiles = alltiles + glob.glob(str().join([input_dir, '*.mrf']))
+
+    # Sanitize input in case there were extra spaces
+    striptiles = []
+    for tile in alltiles:
+        striptiles.append(tile.strip())
+    alltiles = striptiles
+
+    # Set compression type in case of TIFF
+    if mrf_compression_type.lower() in ['jpeg', 'jpg', 'zen']:
+        tiff_compress = "JPEG"
+    else: # Default to png
+        tiff_compress = "PNG"
 
-# Declare scale, offset, and units
-scale = None
-offset = None
-units = None
+    # Set the blocksize for gdal_translate (-co NAME=VALUE).
+    blocksize=str().join(['BLOCKSIZE=', mrf_blocksize])
 
-# Get list of all tile filenames.
-alltiles = []
-if input_files is not None:
-    input_files = input_files.strip()
-    alltiles = input_files.split(',')
+    # Sanity check to make sure all of the input files exist
+    for i, tile in enumerate(alltiles):
 
-if input_dir is not None:
-    if mrf_compression_type.lower() in ['jpeg', 'jpg', 'zen']:
-        alltiles = alltiles + glob.glob(str().join([input_dir, '*.jpg']))
-    if mrf_compression_type.lower() in ['png', 'ppng', 'zen']:
-        alltiles = alltiles + glob.glob(str().join([input_dir, '*.png']))
-    # check for tiffs
-    alltiles = alltiles + glob.glob(str().join([input_dir, '*.tif']))
-    alltiles = alltiles + glob.glob(str().join([input_dir, '*.tiff']))
-    # check for mrfs
-    alltiles = alltiles + glob.glob(str().join([input_dir, '*.mrf']))
-
-# Sanitize input in case there were extra spaces
-striptiles = []
-for tile in alltiles:
-    striptiles.append(tile.strip())
-alltiles = striptiles
-
-# Set compression type in case of TIFF
-if mrf_compression_type.lower() in ['jpeg', 'jpg', 'zen']:
-    tiff_compress = "JPEG"
-else: # Default to png
-    tiff_compress = "PNG"
-
-# Set the blocksize for gdal_translate (-co NAME=VALUE).
-blocksize=str().join(['BLOCKSIZE=', mrf_blocksize])
-
-# Sanity check to make sure all of the input files exist
-for i, tile in enumerate(alltiles):
+        if tile.startswith("/vsi"):
+            try:
+                img = gdal.Open(tile)
+                img = None
+            except:
+                log_info_mssg("Missing input file: " + tile)
+                log_sig_exit('ERROR', 'Invalid input files', sigevent_url)
 
-    if tile.startswith("/vsi"):
-        try:
-            img = gdal.Open(tile)
-            img = None
-        except:
+        elif not os.path.exists(tile):
             log_info_mssg("Missing input file: " + tile)
             log_sig_exit('ERROR', 'Invalid input files', sigevent_url)
 
-    elif not os.path.exists(tile):
-        log_info_mssg("Missing input file: " + tile)
-        log_sig_exit('ERROR', 'Invalid input files', sigevent_url)
 
+    # Filter out bad JPEGs
+    goodtiles = []
+    if mrf_compression_type.lower() in ['jpeg', 'jpg', 'zen']:
+        for i, tile in enumerate(alltiles):
+            if ".mrf" in tile or ".vrt" in tile:  # ignore MRFs and VRTs
+                goodtiles.append(tile)
+                continue
 
-# Filter out bad JPEGs
-goodtiles = []
-if mrf_compression_type.lower() in ['jpeg', 'jpg', 'zen']:
-    for i, tile in enumerate(alltiles):
-        if ".mrf" in tile or ".vrt" in tile:  # ignore MRFs and VRTs
-            goodtiles.append(tile)
-            continue
+            try:
+                img = gdal.Open(tile)
 
-        try:
-            img = gdal.Open(tile)
+                if img is None:
+                    log_sig_err("Bad JPEG tile detected: {0}".format(tile), sigevent_url)
+                    continue
+            except RuntimeError as e:
+                log_sig_exit('ERROR', 'Failed to execute gdal.Open', sigevent_url)
 
-            if img is None:
+            if img.RasterCount == 1:
                 log_sig_err("Bad JPEG tile detected: {0}".format(tile), sigevent_url)
+                img = None
                 continue
-        except RuntimeError as e:
-            log_sig_exit('ERROR', 'Failed to execute gdal.Open', sigevent_url)
 
-        if img.RasterCount == 1:
-            log_sig_err("Bad JPEG tile detected: {0}".format(tile), sigevent_url)
             img = None
-            continue
 
-        img = None
-
-        goodtiles.append(tile)
+            goodtiles.append(tile)
 
-    alltiles = goodtiles
+        alltiles = goodtiles
 
-# Convert RGBA PNGs to indexed paletted PNGs if requested
-if mrf_compression_type == 'PPNG' and colormap != '':
-    for i, tile in enumerate(alltiles):
-        temp_tile = None
-        tile_path = os.path.dirname(tile)
-        tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
+    # Convert RGBA PNGs to indexed paletted PNGs if requested
+    if mrf_compression_type == 'PPNG' and colormap != '':
+        for i, tile in enumerate(alltiles):
+            temp_tile = None
+            tile_path = os.path.dirname(tile)
+            tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
 
-        # Check input PNGs/TIFFs if RGBA, then convert       
-        if tile.lower().endswith(('.png', '.tif', '.tiff')):
+            # Check input PNGs/TIFFs if RGBA, then convert       
+            if tile.lower().endswith(('.png', '.tif', '.tiff')):
  
-            gdalinfo_command_list = ['gdalinfo', '-json', tile]
-            log_the_command(gdalinfo_command_list)
-            gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            """
-            returncode = gdalinfo.wait()
-            if returncode != 0:
-                log_sig_err('gdalinfo return code {0}'.format(returncode), sigevent_url)
-            tileInfo = json.loads(gdalinfo.stdout.read())
-            """
-            has_palette = False
-            try:
-                outs, errs_warns = gdalinfo.communicate(timeout=90)
-                errs_warns = str(errs_warns, encoding='utf-8')
-                # Split up any errors and warnings, log them each appropriately
-                errs = []
-                warns = []
-                for message in errs_warns.split('\n'):
-                    if len(message) > 0:
-                        if message.lower().startswith("error"):
-                            errs.append(message)
-                        else:
-                            warns.append(message)
-                if len(errs) > 0:
-                    log_sig_err('gdalinfo errors: {0}'.format('\n'.join(errs)), sigevent_url)
-                if len(warns) > 0:
-                    log_sig_warn('gdalinfo warnings: {0}'.format('\n'.join(warns)), sigevent_url)
-                tileInfo = json.loads(outs)           
-                for band in tileInfo["bands"]:
-                    has_palette |= (band["colorInterpretation"] == "Palette")
-            except subprocess.TimeoutExpired:
-                gdalinfo.kill()
-                log_sig_err('gdalinfo timed out', sigevent_url)
-
-            # Read gdal_info output
-            if not has_palette:
-
-                # Download tile locally for RgbPngToPalPng script
-                if tile.startswith("/vsi"):
-                    log_info_mssg("Downloading remote file " + tile)
-
-                    # Create the gdal_translate command.
-                    gdal_translate_command_list=['gdal_translate', '-q', '-co', 'WORLDFILE=YES',
-                                                 tile, working_dir+os.path.basename(tile)]
-
-                    # Log the gdal_translate command.
-                    log_the_command(gdal_translate_command_list)
-
-                    # Execute gdal_translate.
-                    subprocess.call(gdal_translate_command_list, stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE)
-
-                    # Replace with new tiles
-                    tile = working_dir+os.path.basename(tile)
-
-                if '.tif' in tile.lower():
-                    # Convert TIFF files to PNG
-                    log_info_mssg("Converting TIFF file " + tile + " to " + tiff_compress)
-
-                    # Create the gdal_translate command.
-                    gdal_translate_command_list=['gdal_translate', '-q', '-of', tiff_compress, '-co', 'WORLDFILE=YES',
-                                                 tile, working_dir+tile_basename+'.'+str(tiff_compress).lower()]
-                    # Log the gdal_translate command.
-                    log_the_command(gdal_translate_command_list)
-
-                    # Execute gdal_translate.
-                    subprocess.call(gdal_translate_command_list, stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE)
-
-                    # Replace with new tiles
-                    tile = working_dir+tile_basename+'.'+str(tiff_compress).lower()
-                    temp_tile = tile
-
-                log_info_mssg("Converting RGBA PNG to indexed paletted PNG")
-
-                output_tile = working_dir + tile_basename+'_indexed.png'
-                output_tile_path = os.path.dirname(output_tile)
-                output_tile_basename, output_tile_extension = os.path.splitext(os.path.basename(output_tile))
-
-                # Create the RgbPngToPalPng command.
-                if vrtnodata == "":
-                    fill = 0
-                else:
-                    fill = vrtnodata
-                RgbPngToPalPng_command_list=['python3 ' + script_dir + 'RgbPngToPalPng.py -v -c ' + colormap +
-                                             ' -f ' + str(fill) + ' -o ' + output_tile + ' -i ' + tile]
-
-                # Log the RgbPngToPalPng command.
-                log_the_command(RgbPngToPalPng_command_list)
-
-                # Execute RgbPngToPalPng.
-                try:
-                    RgbPngToPalPng = subprocess.Popen(RgbPngToPalPng_command_list, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                except OSError:
-                    log_sig_exit('ERROR', "RgbPngToPalPng tool cannot be found.", sigevent_url)
-
-                RgbPngToPalPng.wait()
-                if RgbPngToPalPng.returncode != None:
-                    if  0 < RgbPngToPalPng.returncode < 255:
-                        mssg = "RgbPngToPalPng: " + str(RgbPngToPalPng.returncode) + " colors in image not found in color table"
-                        log_sig_warn(mssg, sigevent_url)
-                    if RgbPngToPalPng.returncode == 255:
-                        mssg = str(RgbPngToPalPng.stderr.readlines()[-1])
-                        log_sig_err("RgbPngToPalPng: " + mssg, sigevent_url, count_err=False)
-                    errors += RgbPngToPalPng.returncode
-
-                if os.path.isfile(output_tile):
-                    mssg = output_tile + " created"
-                    try:
-                        log_info_mssg(mssg)
-                        # sigevent('INFO', mssg, sigevent_url)
-                    except urllib.error.URLError:
-                        print('sigevent service is unavailable')
-                    # Replace with new tiles
-                    alltiles[i] = output_tile
-                else:
-                    log_sig_err("RgbPngToPalPng failed to create {0}".format(output_tile), sigevent_url)
-
-                # Make a copy of world file
-                try:
-                    if os.path.isfile(tile_path+'/'+tile_basename+'.pgw'):
-                        shutil.copy(tile_path+'/'+tile_basename+'.pgw', output_tile_path+'/'+output_tile_basename+'.pgw')
-                    elif os.path.isfile(working_dir+'/'+tile_basename+'.wld'):
-                        shutil.copy(working_dir+'/'+tile_basename+'.wld', output_tile_path+'/'+output_tile_basename+'.pgw')
+                has_palette = False
+                tileInfo = get_gdalinfo(tile)
+                if tileInfo is not None:
+                    for band in tileInfo["bands"]:
+                        has_palette |= (band["colorInterpretation"] == "Palette")
+
+                # Read gdal_info output
+                if not has_palette:
+
+                    # Download tile locally for RgbPngToPalPng script
+                    if tile.startswith("/vsi"):
+                        log_info_mssg("Downloading remote file " + tile)
+
+                        # Create the gdal_translate command.
+                        local_tile = intermediates.path(os.path.basename(tile))
+                        intermediates.track(os.path.splitext(local_tile)[0]+'.wld', local_tile+'.aux.xml')
+                        gdal_translate_command_list=['gdal_translate', '-q', '-co', 'WORLDFILE=YES',
+                                                     tile, local_tile]
+
+                        # Log the gdal_translate command.
+                        log_the_command(gdal_translate_command_list)
+
+                        # Execute gdal_translate.
+                        subprocess.call(gdal_translate_command_list, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+
+                        # Replace with new tiles
+                        tile = local_tile
+
+                    if '.tif' in tile.lower():
+                        # Convert TIFF files to PNG
+                        log_info_mssg("Converting TIFF file " + tile + " to " + tiff_compress)
+
+                        # Create the gdal_translate command.
+                        converted_tile = intermediates.path(tile_basename+'.'+str(tiff_compress).lower(),
+                                                            get_size_hint(tile))
+                        gdal_translate_command_list=['gdal_translate', '-q', '-of', tiff_compress, '-co', 'WORLDFILE=YES',
+                                                     tile, converted_tile]
+                        # Log the gdal_translate command.
+                        log_the_command(gdal_translate_command_list)
+
+                        # Execute gdal_translate.
+                        subprocess.call(gdal_translate_command_list, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+
+                        # Replace with new tiles
+                        tile = converted_tile
+                        temp_tile = tile
+
+                    log_info_mssg("Converting RGBA PNG to indexed paletted PNG")
+
+                    output_tile = intermediates.path(tile_basename+'_indexed.png', get_size_hint(tile))
+                    output_tile_path = os.path.dirname(output_tile)
+                    output_tile_basename, output_tile_extension = os.path.splitext(os.path.basename(output_tile))
+                    intermediates.track(output_tile_path+'/'+output_tile_basename+'.pgw', output_tile+'.aux.xml')
+                    temp_tile_path = os.path.dirname(tile)
+
+                    # Create the RgbPngToPalPng command.
+                    if vrtnodata == "":
+                        fill = 0
                     else:
-                        log_info_mssg("World file does not exist for tile: {0}".format(tile))
-                except:
-                    log_sig_err("ERROR: " + mssg, sigevent_url)
+                        fill = vrtnodata
+                    RgbPngToPalPng_command_list=['python3 ' + script_dir + 'RgbPngToPalPng.py -v -c ' + colormap +
+                                                 ' -f ' + str(fill) + ' -o ' + output_tile + ' -i ' + tile]
 
+                    # Log the RgbPngToPalPng command.
+                    log_the_command(RgbPngToPalPng_command_list)
 
-                # Save projection information for EPSG detection
-                try:
-                    if os.path.isfile(working_dir+'/'+tile_basename+'.png.aux.xml'):
-                        shutil.copy(working_dir+'/'+tile_basename+'.png.aux.xml', output_tile_path+'/'+output_tile_basename+'.png.aux.xml')
+                    # Execute RgbPngToPalPng.
+                    try:
+                        RgbPngToPalPng = subprocess.Popen(RgbPngToPalPng_command_list, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    except OSError:
+                        log_sig_exit('ERROR', "RgbPngToPalPng tool cannot be found.", sigevent_url)
+
+                    RgbPngToPalPng.wait()
+                    if RgbPngToPalPng.returncode != None:
+                        if  0 < RgbPngToPalPng.returncode < 255:
+                            mssg = "RgbPngToPalPng: " + str(RgbPngToPalPng.returncode) + " colors in image not found in color table"
+                            log_sig_warn(mssg, sigevent_url)
+                        if RgbPngToPalPng.returncode == 255:
+                            mssg = str(RgbPngToPalPng.stderr.readlines()[-1])
+                            log_sig_err("RgbPngToPalPng: " + mssg, sigevent_url, count_err=False)
+                        errors += RgbPngToPalPng.returncode
+
+                    if os.path.isfile(output_tile):
+                        mssg = output_tile + " created"
+                        try:
+                            log_info_mssg(mssg)
+                            # sigevent('INFO', mssg, sigevent_url)
+                        except urllib.error.URLError:
+                            print('sigevent service is unavailable')
+                        # Replace with new tiles
+                        alltiles[i] = output_tile
                     else:
-                        log_info_mssg("Geolocation file does not exist for tile: " + tile)
-                except:
-                    log_sig_err("ERROR: " + mssg, sigevent_url)
+                        log_sig_err("RgbPngToPalPng failed to create {0}".format(output_tile), sigevent_url)
 
-                # add transparency flag for custom color map
-                add_transparency = True
-            else:
-                log_info_mssg("Paletted image found for PPNG output, no palettization required")
-
-            # ONEARTH-348 - Validate the palette, but don't do anything about it yet
-            # For now, we won't enforce any issues, but will log issues validating imagery
-            if strict_palette:
-                oe_validate_palette_command_list=[script_dir + 'oe_validate_palette.py', '-v', '-c', colormap, '-i', alltiles[i]]
+                    # Make a copy of world file
+                    try:
+                        if os.path.isfile(tile_path+'/'+tile_basename+'.pgw'):
+                            shutil.copy(tile_path+'/'+tile_basename+'.pgw', output_tile_path+'/'+output_tile_basename+'.pgw')
+                        elif os.path.isfile(temp_tile_path+'/'+tile_basename+'.wld'):
+                            shutil.copy(temp_tile_path+'/'+tile_basename+'.wld', output_tile_path+'/'+output_tile_basename+'.pgw')
+                        else:
+                            log_info_mssg("World file does not exist for tile: {0}".format(tile))
+                    except:
+                        log_sig_err("ERROR: " + mssg, sigevent_url)
 
-                # Log the oe_validate_palette.py command.
-                log_the_command(oe_validate_palette_command_list)
 
-                # Execute oe_validate_palette.py
-                try:
-                    oeValidatePalette = subprocess.Popen(oe_validate_palette_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    oeValidatePalette.wait()
+                    # Save projection information for EPSG detection
+                    try:
+                        if os.path.isfile(temp_tile_path+'/'+tile_basename+'.png.aux.xml'):
+                            shutil.copy(temp_tile_path+'/'+tile_basename+'.png.aux.xml', output_tile_path+'/'+output_tile_basename+'.png.aux.xml')
+                        else:
+                            log_info_mssg("Geolocation file does not exist for tile: " + tile)
+                    except:
+                        log_sig_err("ERROR: " + mssg, sigevent_url)
 
-                    if oeValidatePalette.returncode != None:
-                        if  oeValidatePalette.returncode != 0:
-                            mssg = "oe_validate_palette.py: Mismatching palette entries between the image and colormap; Resulting image may be invalid"
-                            log_sig_warn(mssg, sigevent_url)
+                    # add transparency flag for custom color map
+                    add_transparency = True
+                else:
+                    log_info_mssg("Paletted image found for PPNG output, no palettization required")
 
-                except OSError:
-                    log_sig_warn("Error executing oe_validate_palette.py", sigevent_url)
+                # ONEARTH-348 - Validate the palette, but don't do anything about it yet
+                # For now, we won't enforce any issues, but will log issues validating imagery
+                if strict_palette:
+                    oe_validate_palette_command_list=[script_dir + 'oe_validate_palette.py', '-v', '-c', colormap, '-i', alltiles[i]]
 
+                    # Log the oe_validate_palette.py command.
+                    log_the_command(oe_validate_palette_command_list)
 
-        # remove tif temp tiles
-        if temp_tile != None:
-            remove_file(temp_tile)
-            remove_file(temp_tile+'.aux.xml')
-            remove_file(temp_tile.split('.')[0]+'.wld')
+                    # Execute oe_validate_palette.py
+                    try:
+                        oeValidatePalette = subprocess.Popen(oe_validate_palette_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                        oeValidatePalette.wait()
 
-# Create VRTs with the target EPSG for input images if the source EPSG is different or is to be detected:
-if source_epsg == "detect" or source_epsg != target_epsg:
-    log_info_mssg("source EPSG != target EPSG or source EPSG is to be detected; Creating VRTs for each input tile in target EPSG")
+                        if oeValidatePalette.returncode != None:
+                            if  oeValidatePalette.returncode != 0:
+                                mssg = "oe_validate_palette.py: Mismatching palette entries between the image and colormap; Resulting image may be invalid"
+                                log_sig_warn(mssg, sigevent_url)
 
-    for i, tile in enumerate(alltiles):
-        temp_tile = None
-        tile_path = os.path.dirname(tile)
-        tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
-        tile_vrt = os.path.join(working_dir, tile_basename + "_reproject.vrt")
+                    except OSError:
+                        log_sig_warn("Error executing oe_validate_palette.py", sigevent_url)
 
-        if source_epsg == "detect":
-            s_epsg = get_image_epsg(tile)
-        else:
-            s_epsg = source_epsg
 
-        if not s_epsg:
-            # if EPSG can't be determined, remove the tile
-            log_sig_warn(tile + " has undetectable EPSG", sigevent_url)
-            del alltiles[i]
-        elif s_epsg != target_epsg:
-            log_info_mssg("Creating VRT for input tile: " + tile)
+            # remove tif temp tiles
+            if temp_tile != None:
+                intermediates.remove(temp_tile, temp_tile+'.aux.xml', os.path.splitext(temp_tile)[0]+'.wld')
 
-            # if the source and target EPSGs are not the same, create a VRT
+    # Create VRTs with the target EPSG for input images if the source EPSG is different or is to be detected:
+    if source_epsg == "detect" or source_epsg != target_epsg:
+        log_info_mssg("source EPSG != target EPSG or source EPSG is to be detected; Creating VRTs for each input tile in target EPSG")
 
-            gdalwarp_command_list = ['gdalwarp', '-q', '-overwrite', '-of', 'vrt', '-s_srs', s_epsg, '-t_srs', target_epsg, tile, tile_vrt]
+        for i, tile in enumerate(alltiles):
+            temp_tile = None
+            tile_path = os.path.dirname(tile)
+            tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
+            tile_vrt = intermediates.path(tile_basename + "_reproject.vrt")
 
-            # Log the gdalbuildvrt command.
-            log_the_command(gdalwarp_command_list)
+            if source_epsg == "detect":
+                s_epsg = get_image_epsg(tile)
+            else:
+                s_epsg = source_epsg
 
-            # Capture stderr to record skipped .png files that are not valid PNG+World.
-            gdalwarp_stderr_filename = str().join([working_dir, basename, '_gdalwarp_stderr.txt'])
-            # Open stderr file for write.
-            gdalwarp_stderr_file = open(gdalwarp_stderr_filename, 'w+')
-
-            # ---------------------------------------------------------------------------
-            # Execute gdalwarp.
-            subprocess.call(gdalwarp_command_list, stderr=gdalwarp_stderr_file)
-            # ---------------------------------------------------------------------------
-
-            gdalwarp_stderr_file.seek(0)
-            gdalwarp_stderr = gdalwarp_stderr_file.read()
-            if "Error" in gdalwarp_stderr:
-                log_info_mssg(gdalwarp_stderr)
-                log_sig_err('ERROR', "Error creating VRT for input image", sigevent_url)
-                gdalwarp_stderr_file.close()
+            if not s_epsg:
+                # if EPSG can't be determined, remove the tile
+                log_sig_warn(tile + " has undetectable EPSG", sigevent_url)
                 del alltiles[i]
-                continue
-
-            # If we made it this far, the VRT was created successfully, so replace it in the input list
-            alltiles[i] = tile_vrt
-
-# Create an encoded PNG from GeoTIFF
-if mrf_compression_type == 'EPNG':
-    scale = 0
-    offset = 0
-    units = mrf_data_units
-    for i, tile in enumerate(alltiles):
-        tile_path = os.path.dirname(tile)
-        tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
-        output_tile = working_dir+tile_basename+'.png'
-        # Check if input is TIFF
-        if tile.lower().endswith(('.tif', '.tiff')):
-            # NOTE: Did not convert to JSON parsing because of a lack of test data
-            # Get Scale and Offset from gdalinfo
-            gdalinfo_command_list = ['gdalinfo', tile]
-            log_the_command(gdalinfo_command_list)
-            gdalinfo = subprocess.Popen(gdalinfo_command_list,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-            returncode = gdalinfo.wait()
-            if returncode != 0:
-                log_sig_err("gdalinfo return code {0}".format(returncode), sigevent_url)
-            gdalinfo_out = gdalinfo.stdout.readlines()
-            if "Color Table" in ''.join(gdalinfo_out):
-                log_sig_warn("{0} contains a palette".format(tile), sigevent_url)
-                mrf_compression_type = 'PPNG'
-            if "Offset:" in ''.join(gdalinfo_out) and "Scale:" in ''.join(gdalinfo_out):
-                log_info_mssg("{0} is already an encoded TIFF".format(tile))
-            else: # Encode the TIFF file
-                encoded_tile = working_dir+tile_basename+'_encoded.tif'
-                log_info_mssg("{0} will be encoded as {1}".format(tile, encoded_tile))
-                if mrf_data_scale != '' and mrf_data_offset != '':
-                    scale_offset = [float(mrf_data_scale), float(mrf_data_offset)]
-                else:
-                    scale_offset = None
-                pack(tile, encoded_tile, False, True, None, None, scale_offset, False)
-                tile = encoded_tile
+            elif s_epsg != target_epsg:
+                log_info_mssg("Creating VRT for input tile: " + tile)
+
+                # if the source and target EPSGs are not the same, create a VRT
+
+                gdalwarp_command_list = ['gdalwarp', '-q', '-overwrite', '-of', 'vrt', '-s_srs', s_epsg, '-t_srs', target_epsg, tile, tile_vrt]
+
+                # Log the gdalbuildvrt command.
+                log_the_command(gdalwarp_command_list)
+
+                # Capture stderr to record skipped .png files that are not valid PNG+World.
+                gdalwarp_stderr_filename = intermediates.path(basename + '_gdalwarp_stderr.txt', in_memory=False)
+                # Open stderr file for write.
+                gdalwarp_stderr_file = open(gdalwarp_stderr_filename, 'w+')
+
+                # ---------------------------------------------------------------------------
+                # Execute gdalwarp.
+                subprocess.call(gdalwarp_command_list, stderr=gdalwarp_stderr_file)
+                # ---------------------------------------------------------------------------
+
+                gdalwarp_stderr_file.seek(0)
+                gdalwarp_stderr = gdalwarp_stderr_file.read()
+                if "Error" in gdalwarp_stderr:
+                    log_info_mssg(gdalwarp_stderr)
+                    log_sig_err('ERROR', "Error creating VRT for input image", sigevent_url)
+                    gdalwarp_stderr_file.close()
+                    del alltiles[i]
+                    continue
+
+                # If we made it this far, the VRT was created successfully, so replace it in the input list
+                alltiles[i] = tile_vrt
+
+    # Create an encoded PNG from GeoTIFF
+    if mrf_compression_type == 'EPNG':
+        scale = 0
+        offset = 0
+        units = mrf_data_units
+        for i, tile in enumerate(alltiles):
+            tile_path = os.path.dirname(tile)
+            tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
+            # Check if input is TIFF
+            if tile.lower().endswith(('.tif', '.tiff')):
+                output_tile = intermediates.path(tile_basename+'.png', get_size_hint(tile))
+                intermediates.track(output_tile+'.aux.xml')
+                # NOTE: Did not convert to JSON parsing because of a lack of test data
+                # Get Scale and Offset from gdalinfo
                 gdalinfo_command_list = ['gdalinfo', tile]
                 log_the_command(gdalinfo_command_list)
                 gdalinfo = subprocess.Popen(gdalinfo_command_list,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
@@ -2167,208 +2845,261 @@ if mrf_compression_type == 'EPNG':
                 if returncode != 0:
                     log_sig_err("gdalinfo return code {0}".format(returncode), sigevent_url)
                 gdalinfo_out = gdalinfo.stdout.readlines()
-            log_info_mssg("Reading scale and offset from bands")
-            for line in gdalinfo_out:
-                if "Offset:" in str(line) and "Scale:" in str(line):
-                    offset,scale = str(line).strip().replace("Offset: ","").replace("Scale:","").split(",")
-                    log_info_mssg("Offset: " + offset + ", Scale: " + scale)
-                    scale = int(scale)
-                    offset = int(offset)
-            gdalinfo_stderr = gdalinfo.stderr.read()
-            if len(gdalinfo_stderr) > 0:
-                log_sig_err(gdalinfo_stderr, sigevent_url)
-
-            # Convert the tile to PNG
-            gdal_translate_command_list = ['gdal_translate', '-of', 'PNG', tile, output_tile]
+                if "Color Table" in ''.join(gdalinfo_out):
+                    log_sig_warn("{0} contains a palette".format(tile), sigevent_url)
+                    mrf_compression_type = 'PPNG'
+                if "Offset:" in ''.join(gdalinfo_out) and "Scale:" in ''.join(gdalinfo_out):
+                    log_info_mssg("{0} is already an encoded TIFF".format(tile))
+                else: # Encode the TIFF file
+                    encoded_tile = intermediates.path(tile_basename+'_encoded.tif', get_size_hint(tile))
+                    intermediates.track(encoded_tile+'.aux.xml')
+                    log_info_mssg("{0} will be encoded as {1}".format(tile, encoded_tile))
+                    if mrf_data_scale != '' and mrf_data_offset != '':
+                        scale_offset = [float(mrf_data_scale), float(mrf_data_offset)]
+                    else:
+                        scale_offset = None
+                    pack(tile, encoded_tile, False, True, None, None, scale_offset, False)
+                    tile = encoded_tile
+                    gdalinfo_command_list = ['gdalinfo', tile]
+                    log_the_command(gdalinfo_command_list)
+                    gdalinfo = subprocess.Popen(gdalinfo_command_list,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+                    returncode = gdalinfo.wait()
+                    if returncode != 0:
+                        log_sig_err("gdalinfo return code {0}".format(returncode), sigevent_url)
+                    gdalinfo_out = gdalinfo.stdout.readlines()
+                log_info_mssg("Reading scale and offset from bands")
+                for line in gdalinfo_out:
+                    if "Offset:" in str(line) and "Scale:" in str(line):
+                        offset,scale = str(line).strip().replace("Offset: ","").replace("Scale:","").split(",")
+                        log_info_mssg("Offset: " + offset + ", Scale: " + scale)
+                        scale = int(scale)
+                        offset = int(offset)
+                gdalinfo_stderr = gdalinfo.stderr.read()
+                if len(gdalinfo_stderr) > 0:
+                    log_sig_err(gdalinfo_stderr, sigevent_url)
+
+                # Convert the tile to PNG
+                gdal_translate_command_list = ['gdal_translate', '-of', 'PNG', tile, output_tile]
+                log_the_command(gdal_translate_command_list)
+                gdal_translate = subprocess.Popen(gdal_translate_command_list,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+                returncode = gdal_translate.wait()
+                gdal_translate_stderr = gdal_translate.stderr.read()
+                if len(gdal_translate_stderr) > 0:
+                    log_sig_err(gdal_translate_stderr, sigevent_url)
+                if returncode != 0:
+                    log_sig_err("gdal_translate return code {0}".format(returncode), sigevent_url)
+                alltiles[i] = output_tile
+
+    #Look for ZenJPEG Output
+    if mrf_compression_type.lower() == 'zen':
+        # mrf_insert doesn't convert tiles automatically to ZenJPEG
+        # so we first convert each input tile individually into smaller "input" MRFs
+        # and then insert and transform them later just like normal tiles
+        for i, tile in enumerate(alltiles):
+            tile_path = os.path.dirname(tile)
+            tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
+            tile_mrf = intermediates.path(tile_basename + "_zen.mrf", get_size_hint(tile))
+            intermediates.track(*[os.path.splitext(tile_mrf)[0] + ext for ext in ['.idx', '.pjg', '.mrf.aux.xml']])
+
+            # Do the MRF creation from the input tile
+            gdal_translate_command_list=['gdal_translate', '-q', '-b', '1', '-b', '2', '-b', '3', '-of', 'MRF', '-co', 'compress=JPEG', '-co', blocksize, '-co', 'PHOTOMETRIC=DEFAULT']    
+            gdal_translate_command_list.append('-co')
+            gdal_translate_command_list.append('QUALITY='+quality_prec)
+            gdal_translate_command_list.append(tile)
+            gdal_translate_command_list.append(tile_mrf)
+
+            # Log and execute gdal_translate to generate "input" ZenJPEG MRFs
             log_the_command(gdal_translate_command_list)
-            gdal_translate = subprocess.Popen(gdal_translate_command_list,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-            returncode = gdal_translate.wait()
-            gdal_translate_stderr = gdal_translate.stderr.read()
-            if len(gdal_translate_stderr) > 0:
-                log_sig_err(gdal_translate_stderr, sigevent_url)
-            if returncode != 0:
-                log_sig_err("gdal_translate return code {0}".format(returncode), sigevent_url)
-            alltiles[i] = output_tile
-
-#Look for ZenJPEG Output
-if mrf_compression_type.lower() == 'zen':
-    # mrf_insert doesn't convert tiles automatically to ZenJPEG
-    # so we first convert each input tile individually into smaller "input" MRFs
-    # and then insert and transform them later just like normal tiles
-    for i, tile in enumerate(alltiles):
-        tile_path = os.path.dirname(tile)
-        tile_basename, tile_extension = os.path.splitext(os.path.basename(tile))
-        tile_mrf = os.path.join(working_dir, tile_basename + "_zen.mrf")
-
-        # Do the MRF creation from the input tile
-        gdal_translate_command_list=['gdal_translate', '-q', '-b', '1', '-b', '2', '-b', '3', '-of', 'MRF', '-co', 'compress=JPEG', '-co', blocksize, '-co', 'PHOTOMETRIC=DEFAULT']    
-        gdal_translate_command_list.append('-co')
-        gdal_translate_command_list.append('QUALITY='+quality_prec)
-        gdal_translate_command_list.append(tile)
-        gdal_translate_command_list.append(tile_mrf)
-
-        # Log and execute gdal_translate to generate "input" ZenJPEG MRFs
-        log_the_command(gdal_translate_command_list)
-        gdal_translate_stderr_filename=str().join([working_dir, basename, '_gdal_translate_zen_stderr.txt'])
-        gdal_translate_stderr_file=open(gdal_translate_stderr_filename, 'w')
-        subprocess.call(gdal_translate_command_list, stderr=gdal_translate_stderr_file)
-        gdal_translate_stderr_file.close()
-        if os.path.getsize(gdal_translate_stderr_filename) == 0:
-            remove_file(gdal_translate_stderr_filename)
-
-        alltiles[i] = tile_mrf
-
-# sort
-alltiles.sort()
-
-# check for different resolutions
-diff_res, res = diff_resolution(alltiles)
-
-# determine if nocopy should be used if not set
-if nocopy is None:
-    if len(alltiles) == 1 and alltiles[0].endswith('.vrt') == False:
-        if is_global_image(alltiles[0],source_xmin, source_ymin, source_xmax, source_ymax) == True:
-            # Don't do inserts if we have a single global image
-            nocopy = False
-        else:
+            gdal_translate_stderr_filename=intermediates.path(basename + '_gdal_translate_zen_stderr.txt', in_memory=False)
+            gdal_translate_stderr_file=open(gdal_translate_stderr_filename, 'w')
+            subprocess.call(gdal_translate_command_list, stderr=gdal_translate_stderr_file)
+            gdal_translate_stderr_file.close()
+            if os.path.getsize(gdal_translate_stderr_filename) == 0:
+                remove_file(gdal_translate_stderr_filename)
+
+            alltiles[i] = tile_mrf
+
+    # sort
+    alltiles.sort()
+
+    # check for different resolutions
+    diff_res, res = diff_resolution(alltiles)
+
+    # determine if nocopy should be used if not set
+    if nocopy is None:
+        if len(alltiles) == 1 and alltiles[0].endswith('.vrt') == False:
+            if is_global_image(alltiles[0],source_xmin, source_ymin, source_xmax, source_ymax) == True:
+                # Don't do inserts if we have a single global image
+                nocopy = False
+            else:
+                nocopy = True
+        elif len(alltiles) == 1 and alltiles[0].endswith('empty.vrt') == True: #empty VRT, use nocopy
             nocopy = True
-    elif len(alltiles) == 1 and alltiles[0].endswith('empty.vrt') == True: #empty VRT, use nocopy
-        nocopy = True
+        else:
+            if source_epsg != target_epsg:
+                # Avoid inserts if reprojecting
+                nocopy = False
+            else:
+                nocopy = True
+        log_info_mssg("Setting MRF nocopy to " + str(nocopy))
+
+    # determine if noaddo should be used if not set
+    if noaddo is None:
+        # nocopy implies mrf_insert is used, which already builds overviews
+        noaddo = nocopy
+
+    # Write all tiles list to a file on disk.
+    all_tiles_filename=str().join([working_dir, basename, '_all_tiles.txt'])
+    try:
+        # Open file.
+        alltilesfile=open(all_tiles_filename, 'w')
+    except IOError:
+        mssg=str().join(['Cannot open for write:  ', all_tiles_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
     else:
-        if source_epsg != target_epsg:
-            # Avoid inserts if reprojecting
-            nocopy = False
+        # Write to file with line termination.
+        if len(alltiles) > 0:
+            for ndx in range(len(alltiles)):
+                alltilesfile.write(str().join([alltiles[ndx], '\n']))
+        elif empty_vrt is not None:
+            # Create a VRT for an empty input
+            alltilesfile.write("{0}\n".format(empty_vrt))
         else:
-            nocopy = True
-    log_info_mssg("Setting MRF nocopy to " + str(nocopy))
-
-# determine if noaddo should be used if not set
-if noaddo is None:
-    # nocopy implies mrf_insert is used, which already builds overviews
-    noaddo = nocopy
-
-# Write all tiles list to a file on disk.
-all_tiles_filename=str().join([working_dir, basename, '_all_tiles.txt'])
-try:
-    # Open file.
-    alltilesfile=open(all_tiles_filename, 'w')
-except IOError:
-    mssg=str().join(['Cannot open for write:  ', all_tiles_filename])
-    log_sig_exit('ERROR', mssg, sigevent_url)
-else:
-    # Write to file with line termination.
-    if len(alltiles) > 0:
-        for ndx in range(len(alltiles)):
-            alltilesfile.write(str().join([alltiles[ndx], '\n']))
-    elif empty_vrt is not None:
-        # Create a VRT for an empty input
-        alltilesfile.write("{0}\n".format(empty_vrt))
+            mssg='No input tiles or empty VRT to process'
+            log_sig_exit('ERROR', mssg, sigevent_url)
+
+        # Close file.
+        alltilesfile.close()
+    # Send to log.
+    log_info_mssg(str().join(['all tiles:  ', str(len(alltiles))]))
+    log_info_mssg(all_tiles_filename)
+
+    #-------------------------------------------------------------------------------
+    # Begin GDAL processing.
+    #-------------------------------------------------------------------------------
+
+    # Convert date of the data into day of the year.  Requred for TWMS server.
+    doy=get_doy_string(date_of_data)
+    # Combine year and doy to conform to TWMS convention (yyyydoy).
+    doy=str().join([date_of_data[0:4], str(doy)])
+    # Send to log.
+    log_info_mssg(str().join(['doy:  ', doy]))
+
+    # The .mrf file is the XML component of the MRF format.
+    mrf_filename=str().join([output_dir, basename, '.mrf'])
+    # The .idx file is the index compnent of the MRF format.
+    idx_filename=str().join([output_dir, basename, '.idx'])
+
+    if mrf_compression_type in ['PNG', 'PPNG', 'EPNG']:
+        # Output filename.
+        out_filename=str().join([output_dir, basename, '.ppg'])
+    elif mrf_compression_type == 'JPNG':
+        # Output filename.
+        out_filename=str().join([output_dir, basename, '.pjp'])
+    elif mrf_compression_type in ['JPG', 'JPEG', 'ZEN']:
+        # Output filename.
+        out_filename=str().join([output_dir, basename, '.pjg'])
+    elif mrf_compression_type in ['TIF', 'TIFF']:
+        # Output filename.
+        out_filename=str().join([output_dir, basename, '.ptf'])
+    elif mrf_compression_type == 'LERC':
+        # Output filename.
+        out_filename=str().join([output_dir, basename, '.lrc'])
     else:
-        mssg='No input tiles or empty VRT to process'
+        mssg='Unrecognized compression type for MRF: ' + mrf_compression_type 
         log_sig_exit('ERROR', mssg, sigevent_url)
 
-    # Close file.
-    alltilesfile.close()
-# Send to log.
-log_info_mssg(str().join(['all tiles:  ', str(len(alltiles))]))
-log_info_mssg(all_tiles_filename)
+    # The .vrt file is the XML describing the virtual image mosaic layout.
+    vrt_filename=intermediates.path(basename + '.vrt')
 
-#-------------------------------------------------------------------------------
-# Begin GDAL processing.
-#-------------------------------------------------------------------------------
+    # Make certain output files do not preexist.  GDAL has issues with that.
+    remove_file(mrf_filename)
+    remove_file(idx_filename)
+    remove_file(out_filename)
+    remove_file(vrt_filename)
 
-# Convert date of the data into day of the year.  Requred for TWMS server.
-doy=get_doy_string(date_of_data)
-# Combine year and doy to conform to TWMS convention (yyyydoy).
-doy=str().join([date_of_data[0:4], str(doy)])
-# Send to log.
-log_info_mssg(str().join(['doy:  ', doy]))
+    # Check if this is an MRF insert update, if not then regenerate a new MRF
+    mrf_list = []
+    if overview_resampling[:4].lower() == 'near' or overview_resampling.lower() == 'nnb':
+        insert_method = 'NNb'
+    else:
+        insert_method = 'Avg'
+
+    for tile in list(alltiles):
+        if '.mrf' in tile.lower() and '_zen.' not in tile:
+            mrf_list.append(tile)
+            alltiles.remove(tile)
+
+    # If more than one MRF, expected behavior is unknown... so exit
+    if len(mrf_list) > 1:
+        log_sig_exit('ERROR', "Multiple MRFs found in input list, expected behavior unknown", sigevent_url)
+    # Only be one MRF, so use that one
+    elif len(mrf_list) == 1:
+        mrf = mrf_list[0]
+        timeout = time.time() + 30 # 30 second timeout if MRF is still being generated
+
+        # Bail if a remote MRF is included in the input list.  Just can't handle this yet.
+        if mrf.startswith("/vsi"):
+            mssg='Cannot support a remote (i.e. /vsi...) MRF input'
+            log_sig_exit('ERROR', mssg, sigevent_url)
 
-# The .mrf file is the XML component of the MRF format.
-mrf_filename=str().join([output_dir, basename, '.mrf'])
-# The .idx file is the index compnent of the MRF format.
-idx_filename=str().join([output_dir, basename, '.idx'])
+        while not os.path.isfile(mrf):
+            mssg=str().join([mrf, ' does not exist'])
+            if time.time() > timeout:
+                log_sig_exit('ERROR', mssg, sigevent_url)
+                break
+            log_sig_warn(mssg + ", waiting 5 seconds...", sigevent_url)
+            time.sleep(5)
+
+        # Check if zdb is used
+        if zlevels != '':
+            mrf, z, zdb_out, con = insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units, time_slice)
+            if con:
+                con.commit()
+                con.close()
+                log_info_mssg("Successfully committed record to " + zdb_out)
+            else:
+                log_info_mssg("No ZDB record created")
+        else:
+            con = None
 
-def get_extension(compression_type):
-    if compression_type in ['PNG', 'PPNG', 'EPNG', 'JPNG']:
-        return "ppg"
-    elif compression_type in ['JPG', 'JPEG']:
-        return "pjg"
-    elif compression_type in ['TIF', 'TIFF']:
-        return "ptf"
-    elif compression_type == 'LERC':
-        return "lrc"
-    else:
-        return None
+        if mrf_parallel:
+            parallel_mrf_insert(alltiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
+                                 [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, mrf_cores)
+        else:
+            run_mrf_insert(alltiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
+                                 [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, max_size=mrf_maxsize)
+    
+        # Clean up
+        remove_file(all_tiles_filename)
+        intermediates.cleanup()
 
-def data_name(mrf_name):
-    bname, ext = os.path.splitext(mrf_name)
-    return bname + os.extsep + get_extension(mrf_compression_type)
+        if mrf_clean and not time_slice:
+            mrf_data_name = data_name(mrf)
+            log_info_mssg("running mrf_clean on data file {}".format(mrf_data_name))
+            clean_mrf(mrf_data_name)
 
-if mrf_compression_type in ['PNG', 'PPNG', 'EPNG']:
-    # Output filename.
-    out_filename=str().join([output_dir, basename, '.ppg'])
-elif mrf_compression_type == 'JPNG':
-    # Output filename.
-    out_filename=str().join([output_dir, basename, '.pjp'])
-elif mrf_compression_type in ['JPG', 'JPEG', 'ZEN']:
-    # Output filename.
-    out_filename=str().join([output_dir, basename, '.pjg'])
-elif mrf_compression_type in ['TIF', 'TIFF']:
-    # Output filename.
-    out_filename=str().join([output_dir, basename, '.ptf'])
-elif mrf_compression_type == 'LERC':
-    # Output filename.
-    out_filename=str().join([output_dir, basename, '.lrc'])
-else:
-    mssg='Unrecognized compression type for MRF: ' + mrf_compression_type 
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-# The .vrt file is the XML describing the virtual image mosaic layout.
-vrt_filename=str().join([working_dir, basename, '.vrt'])
-
-# Make certain output files do not preexist.  GDAL has issues with that.
-remove_file(mrf_filename)
-remove_file(idx_filename)
-remove_file(out_filename)
-remove_file(vrt_filename)
-
-# Check if this is an MRF insert update, if not then regenerate a new MRF
-mrf_list = []
-if overview_resampling[:4].lower() == 'near' or overview_resampling.lower() == 'nnb':
-    insert_method = 'NNb'
-else:
-    insert_method = 'Avg'
-
-for tile in list(alltiles):
-    if '.mrf' in tile.lower() and '_zen.' not in tile:
-        mrf_list.append(tile)
-        alltiles.remove(tile)
-
-# If more than one MRF, expected behavior is unknown... so exit
-if len(mrf_list) > 1:
-    log_sig_exit('ERROR', "Multiple MRFs found in input list, expected behavior unknown", sigevent_url)
-# Only be one MRF, so use that one
-elif len(mrf_list) == 1:
-    mrf = mrf_list[0]
-    timeout = time.time() + 30 # 30 second timeout if MRF is still being generated
-
-    # Bail if a remote MRF is included in the input list.  Just can't handle this yet.
-    if mrf.startswith("/vsi"):
-        mssg='Cannot support a remote (i.e. /vsi...) MRF input'
-        log_sig_exit('ERROR', mssg, sigevent_url)
+        # Exit here since we don't need to build an MRF from scratch
+        mssg=str().join(['MRF updated:  ', mrf])
+        log_info_mssg(mssg)
 
-    while not os.path.isfile(mrf):
-        mssg=str().join([mrf, ' does not exist'])
-        if time.time() > timeout:
-            log_sig_exit('ERROR', mssg, sigevent_url)
-            break
-        log_sig_warn(mssg + ", waiting 5 seconds...", sigevent_url)
-        time.sleep(5)
+        # Return because we are done
+        return mrf, errors
 
-    # Check if zdb is used
+    # Else, no MRF so continue on with the rest of the processing...
+
+
+    # Use zdb index if z-levels are defined
     if zlevels != '':
-        mrf, z, zdb_out, con = insert_zdb(mrf, zlevels, zkey, source_url, scale, offset, units)
+        mrf_filename, idx_filename, out_filename, output_aux, output_vrt = get_mrf_names(out_filename, mrf_name,
+                                                                                         parameter_name, date_of_data,
+                                                                                         time_of_data)
+        mrf_filename = output_dir + mrf_filename
+        idx_filename = output_dir + idx_filename
+        out_filename = output_dir + out_filename
+        gdal_mrf_filename, z, zdb_out, con = insert_zdb(mrf_filename, zlevels, zkey, source_url, scale, offset, units,
+                                                        time_slice)
+        # Commit database if successful
         if con:
             con.commit()
             con.close()
@@ -2377,484 +3108,492 @@ elif len(mrf_list) == 1:
             log_info_mssg("No ZDB record created")
     else:
         con = None
+        gdal_mrf_filename = mrf_filename
 
-    if mrf_parallel:
-        parallel_mrf_insert(alltiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                             [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, working_dir, mrf_cores)
-    else:
-        run_mrf_insert(alltiles, mrf, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                             [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, working_dir, max_size=mrf_maxsize)
-    
-    # Clean up
-    remove_file(all_tiles_filename)
 
-    if mrf_clean:
-        mrf_data_name = data_name(mrf)
-        log_info_mssg("running mrf_clean on data file {}".format(mrf_data_name))
-        clean_mrf(mrf_data_name)
+    gdalbuildvrt_command_list=['gdalbuildvrt', '-q', '-input_file_list', all_tiles_filename]
 
-    # Exit here since we don't need to build an MRF from scratch
-    mssg=str().join(['MRF updated:  ', mrf])
-    log_info_mssg(mssg)
+    # all tiles are now in the target_epsg because:
+    #   a) source_epsg == target_epsg
+    #       OR
+    #   b) source_epsg != target_epsg and we've fixed that by replacing the tile with a VRT
 
-    # Exit mrfgen because we are done
-    if errors > 0:
-        print("{0} errors encountered".format(errors))
-        sys.exit(1)
-    else:
-        sys.exit(0)
-
-# Else, no MRF so continue on with the rest of the processing...
+    # Set the extents and EPSG based on the target since we know that that the EPSG of all tiles is the target EPSG
+    gdalbuildvrt_command_list.extend(['-te', target_xmin, target_ymin, target_xmax, target_ymax])
+    gdalbuildvrt_command_list.append('-a_srs')
+    gdalbuildvrt_command_list.append(target_epsg)
 
+    if target_x != '':
+        # set the output resolution if a target size has been provided
+        xres = repr(abs((float(target_xmax)-float(target_xmin))/float(target_x)))
+        if target_y != '':
+            yres = repr(abs((float(target_ymin)-float(target_ymax))/float(target_y)))
+        else:
+            yres = xres
+        log_info_mssg("x resolution: " + xres + ", y resolution: " + yres)
+        gdalbuildvrt_command_list.append('-resolution')
+        gdalbuildvrt_command_list.append('user')
+        gdalbuildvrt_command_list.append('-tr')
+        gdalbuildvrt_command_list.append(xres)
+        gdalbuildvrt_command_list.append(yres)
+
+    if vrtnodata != "":
+        # set the nodata values if provided
+        gdalbuildvrt_command_list.append('-vrtnodata')
+        gdalbuildvrt_command_list.append(vrtnodata)
+        gdalbuildvrt_command_list.append('-srcnodata')
+        gdalbuildvrt_command_list.append(vrtnodata)
+
+
+    # add VRT filename at the end
+    gdalbuildvrt_command_list.append(vrt_filename)
+    # Log the gdalbuildvrt command.
+    log_the_command(gdalbuildvrt_command_list)
+    # Capture stderr to record skipped .png files that are not valid PNG+World.
+    gdalbuildvrt_stderr_filename=intermediates.path(basename + '_gdalbuildvrt_stderr.txt', in_memory=False)
+    # Open stderr file for write.
+    gdalbuildvrt_stderr_file=open(gdalbuildvrt_stderr_filename, 'w')
 
-# Use zdb index if z-levels are defined
-if zlevels != '':
-    mrf_filename, idx_filename, out_filename, output_aux, output_vrt = get_mrf_names(out_filename, mrf_name,
-                                                                                     parameter_name, date_of_data,
-                                                                                     time_of_data)
-    mrf_filename = output_dir + mrf_filename
-    idx_filename = output_dir + idx_filename
-    out_filename = output_dir + out_filename
-    gdal_mrf_filename, z, zdb_out, con = insert_zdb(mrf_filename, zlevels, zkey, source_url, scale, offset, units)
-    # Commit database if successful
-    if con:
-        con.commit()
-        con.close()
-        log_info_mssg("Successfully committed record to " + zdb_out)
-    else:
-        log_info_mssg("No ZDB record created")
-else:
-    con = None
-    gdal_mrf_filename = mrf_filename
+    #---------------------------------------------------------------------------
+    # Execute gdalbuildvrt.
+    subprocess.call(gdalbuildvrt_command_list, stderr=gdalbuildvrt_stderr_file)
+    #---------------------------------------------------------------------------
+
+    # use gdalwarp if resize with resampling method is declared
+    if resize_resampling != '':
+        if target_y == '':
+            target_y = str(int(target_x)/2)
+        resample_vrt_filename = intermediates.path(basename + '_resample.vrt')
+        gdal_warp_command_list = ['gdalwarp', '-of', 'VRT' ,'-r', resize_resampling, '-ts', str(target_x), str(target_y),
+                                  '-te', target_xmin, target_ymin, target_xmax, target_ymax, '-overwrite', vrt_filename,
+                                  resample_vrt_filename]
+        log_the_command(gdal_warp_command_list)
+        subprocess.call(gdal_warp_command_list, stderr=gdalbuildvrt_stderr_file)
+        vrt_filename = resample_vrt_filename
 
+    # Close stderr file.
+    gdalbuildvrt_stderr_file.close()
 
-gdalbuildvrt_command_list=['gdalbuildvrt', '-q', '-input_file_list', all_tiles_filename]
+    # Open stderr file for read.
+    try:
+        gdalbuildvrt_stderr_file=open(gdalbuildvrt_stderr_filename, 'r')
+        # Report skipped .png files that are not valid PNG+World.
+        gdalbuildvrt_stderr=gdalbuildvrt_stderr_file.readlines()
+        # Loop over all lines in file.
+        for ndx in range(len(gdalbuildvrt_stderr)):
+            # Get line number(s) where skipped files appear in the stderr file.
+            skipped=str(gdalbuildvrt_stderr[ndx]).find('Warning')
+            # If a line (including line 0) was found.
+            if skipped >= 0:
+                mssg=str().join(['gdalbuildvrt ', str(gdalbuildvrt_stderr[ndx])])
+                log_sig_warn(mssg, sigevent_url)
+        # Close file.
+        gdalbuildvrt_stderr_file.close()
+    except IOError:
+        mssg=str().join(['Cannot read:  ', gdalbuildvrt_stderr_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
 
-# all tiles are now in the target_epsg because:
-#   a) source_epsg == target_epsg
-#       OR
-#   b) source_epsg != target_epsg and we've fixed that by replacing the tile with a VRT
+    # Clean up.
+    remove_file(all_tiles_filename)
+    # Check if vrt was created.
+    vrt_output=glob.glob(vrt_filename)
+    if len(vrt_output) == 0:
+        mssg=str().join(['Fail:  gdalbuildvrt',
+                         '  May indicate no georeferenced tiles found.',
+                         #'  May indicate unappropriate target_x.',
+                         '  Look at stderr file:  ',
+                         gdalbuildvrt_stderr_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
 
-# Set the extents and EPSG based on the target since we know that that the EPSG of all tiles is the target EPSG
-gdalbuildvrt_command_list.extend(['-te', target_xmin, target_ymin, target_xmax, target_ymax])
-gdalbuildvrt_command_list.append('-a_srs')
-gdalbuildvrt_command_list.append(target_epsg)
+    # Create mrf only if vrt was successful.
+    vrtf=get_modification_time(vrt_filename)
+    remove_file(gdalbuildvrt_stderr_filename)
 
-if target_x != '':
-    # set the output resolution if a target size has been provided
-    xres = repr(abs((float(target_xmax)-float(target_xmin))/float(target_x)))
-    if target_y != '':
-        yres = repr(abs((float(target_ymin)-float(target_ymax))/float(target_y)))
+    # Set the compression type for gdal_translate (-co NAME=VALUE).
+    if mrf_compression_type == 'PNG' or mrf_compression_type == 'EPNG':
+        # Unpaletted PNG.
+        compress=str('COMPRESS=PNG')
+    elif mrf_compression_type == 'PPNG':
+        # Paletted PNG.
+        compress=str('COMPRESS=PPNG')
+    elif mrf_compression_type == 'JPNG':
+        # JPNG Blended Format
+        compress=str('COMPRESS=JPNG')
+    elif mrf_compression_type == 'JPG':
+        compress=str('COMPRESS=JPEG')
+    elif mrf_compression_type == 'JPEG':
+        compress=str('COMPRESS=JPEG')
+    elif mrf_compression_type == 'ZEN':
+        compress=str('COMPRESS=JPEG')
+    elif mrf_compression_type == 'TIFF' or mrf_compression_type == 'TIF':
+        compress=str('COMPRESS=TIF')
+    elif mrf_compression_type == 'LERC':
+        compress=str('COMPRESS=LERC')
     else:
-        yres = xres
-    log_info_mssg("x resolution: " + xres + ", y resolution: " + yres)
-    gdalbuildvrt_command_list.append('-resolution')
-    gdalbuildvrt_command_list.append('user')
-    gdalbuildvrt_command_list.append('-tr')
-    gdalbuildvrt_command_list.append(xres)
-    gdalbuildvrt_command_list.append(yres)
-
-if vrtnodata != "":
-    # set the nodata values if provided
-    gdalbuildvrt_command_list.append('-vrtnodata')
-    gdalbuildvrt_command_list.append(vrtnodata)
-    gdalbuildvrt_command_list.append('-srcnodata')
-    gdalbuildvrt_command_list.append(vrtnodata)
-
-
-# add VRT filename at the end
-gdalbuildvrt_command_list.append(vrt_filename)
-# Log the gdalbuildvrt command.
-log_the_command(gdalbuildvrt_command_list)
-# Capture stderr to record skipped .png files that are not valid PNG+World.
-gdalbuildvrt_stderr_filename=str().join([working_dir, basename,
-                                         '_gdalbuildvrt_stderr.txt'])
-# Open stderr file for write.
-gdalbuildvrt_stderr_file=open(gdalbuildvrt_stderr_filename, 'w')
-
-#---------------------------------------------------------------------------
-# Execute gdalbuildvrt.
-subprocess.call(gdalbuildvrt_command_list, stderr=gdalbuildvrt_stderr_file)
-#---------------------------------------------------------------------------
-
-# use gdalwarp if resize with resampling method is declared
-if resize_resampling != '':
-    if target_y == '':
-        target_y = str(int(target_x)/2)
-    gdal_warp_command_list = ['gdalwarp', '-of', 'VRT' ,'-r', resize_resampling, '-ts', str(target_x), str(target_y),
-                              '-te', target_xmin, target_ymin, target_xmax, target_ymax, '-overwrite', vrt_filename,
-                              vrt_filename.replace('.vrt','_resample.vrt')]
-    log_the_command(gdal_warp_command_list)
-    subprocess.call(gdal_warp_command_list, stderr=gdalbuildvrt_stderr_file)
-    vrt_filename = vrt_filename.replace('.vrt','_resample.vrt')
-
-# Close stderr file.
-gdalbuildvrt_stderr_file.close()
-
-# Open stderr file for read.
-try:
-    gdalbuildvrt_stderr_file=open(gdalbuildvrt_stderr_filename, 'r')
-    # Report skipped .png files that are not valid PNG+World.
-    gdalbuildvrt_stderr=gdalbuildvrt_stderr_file.readlines()
-    # Loop over all lines in file.
-    for ndx in range(len(gdalbuildvrt_stderr)):
-        # Get line number(s) where skipped files appear in the stderr file.
-        skipped=str(gdalbuildvrt_stderr[ndx]).find('Warning')
-        # If a line (including line 0) was found.
-        if skipped >= 0:
-            mssg=str().join(['gdalbuildvrt ', str(gdalbuildvrt_stderr[ndx])])
-            log_sig_warn(mssg, sigevent_url)
-    # Close file.
-    gdalbuildvrt_stderr_file.close()
-except IOError:
-    mssg=str().join(['Cannot read:  ', gdalbuildvrt_stderr_filename])
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-# Clean up.
-remove_file(all_tiles_filename)
-# Check if vrt was created.
-vrt_output=glob.glob(vrt_filename)
-if len(vrt_output) == 0:
-    mssg=str().join(['Fail:  gdalbuildvrt',
-                     '  May indicate no georeferenced tiles found.',
-                     #'  May indicate unappropriate target_x.',
-                     '  Look at stderr file:  ',
-                     gdalbuildvrt_stderr_filename])
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-# Create mrf only if vrt was successful.
-vrtf=get_modification_time(vrt_filename)
-remove_file(gdalbuildvrt_stderr_filename)
-
-# Set the compression type for gdal_translate (-co NAME=VALUE).
-if mrf_compression_type == 'PNG' or mrf_compression_type == 'EPNG':
-    # Unpaletted PNG.
-    compress=str('COMPRESS=PNG')
-elif mrf_compression_type == 'PPNG':
-    # Paletted PNG.
-    compress=str('COMPRESS=PPNG')
-elif mrf_compression_type == 'JPNG':
-    # JPNG Blended Format
-    compress=str('COMPRESS=JPNG')
-elif mrf_compression_type == 'JPG':
-    compress=str('COMPRESS=JPEG')
-elif mrf_compression_type == 'JPEG':
-    compress=str('COMPRESS=JPEG')
-elif mrf_compression_type == 'ZEN':
-    compress=str('COMPRESS=JPEG')
-elif mrf_compression_type == 'TIFF' or mrf_compression_type == 'TIF':
-    compress=str('COMPRESS=TIF')
-elif mrf_compression_type == 'LERC':
-    compress=str('COMPRESS=LERC')
-else:
-    mssg='Unrecognized compression type for MRF.'
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-# Insert colormap into VRT if a colormap is provided and colormap overwriting is enabled.
-# This could be problematic if we're overwriting with a different palette than what is in the imagery.
-if overwrite_colormap and colormap != '':
-    new_vrt_filename = vrt_filename.replace('.vrt','_newcolormap.vrt')
-    colormap2vrt_command_list=[script_dir+'colormap2vrt.py','--colormap',colormap,'--output',new_vrt_filename,'--merge',vrt_filename]
-    if add_transparency == True:
-        colormap2vrt_command_list.append('--transparent')
-    if send_email == True:
-        colormap2vrt_command_list.append('--send_email')
-    if email_server != '':
-        colormap2vrt_command_list.append('--email_server')
-        colormap2vrt_command_list.append(email_server)
-    if email_recipient != '':
-        colormap2vrt_command_list.append('--email_recipient')
-        colormap2vrt_command_list.append(email_recipient)
-    if email_sender != '':
-        colormap2vrt_command_list.append('--email_sender')
-        colormap2vrt_command_list.append(email_sender)
-    log_the_command(colormap2vrt_command_list)
-    colormap2vrt_stderr_filename=str().join([working_dir, basename,'_colormap2vrt_stderr.txt'])
-    colormap2vrt_stderr_file=open(colormap2vrt_stderr_filename, 'w+')
-    subprocess.call(colormap2vrt_command_list, stderr=colormap2vrt_stderr_file)
-    colormap2vrt_stderr_file.seek(0)
-    colormap2vrt_stderr = colormap2vrt_stderr_file.read()
-    log_info_mssg(colormap2vrt_stderr)
-    if "Error" in colormap2vrt_stderr:
-        log_sig_exit('ERROR', "Error executing colormap2vrt.py with colormap:" + colormap, sigevent_url)
-    colormap2vrt_stderr_file.close()
-    if os.path.isfile(new_vrt_filename):
-        remove_file(colormap2vrt_stderr_filename)
-        vrt_filename = new_vrt_filename
-
-# Get input size.
-dom=xml.dom.minidom.parse(vrt_filename)
-rastersize_elements=dom.getElementsByTagName('VRTDataset')
-x_size=rastersize_elements[0].getAttribute('rasterXSize') #width
-y_size=rastersize_elements[0].getAttribute('rasterYSize') #height
-
-if target_x == '':
-    log_info_mssg('x size and y size from VRT ' + x_size + "," + y_size)
-    exp=11 #minimum outsize 20480 for EPSG4326_2km
-    while int(10*(2**exp)) < int(x_size):
-        exp+=1
-    target_x=str(10*(2**exp))
-    log_info_mssg('Calculating target_x from VRT to ' + target_x)
-
-# Only use new target size if different.
-if target_x != x_size:
-    # Calculate output size of Y dimension and maintain aspect ratio.
-    if target_y == '':
-        target_y=str(int(float(target_x)*(float(y_size)/float(x_size))))
-        log_info_mssg('Calculating target_y ' + target_y)
-    if resize_resampling == '':
-        log_sig_warn("Target size ({0}x{1}) differs from input size ({2}x{3}), but <resize_resampling> flag has not been set.".
-                     format(target_x, target_y, x_size, y_size), sigevent_url)
-else: #don't bother calculating y
-    if target_y == '':
-        target_y=y_size
-        log_info_mssg("Setting target_y from VRT to {0}".format(target_y))
-    elif float(target_y) != float(y_size):
-        log_sig_warn("Target y size ({0}) differs from raster y size ({1})".format(target_y, y_size), sigevent_url)
-
-
-#-----------------------------------------------------------------------
-# Seed the MRF data file (.ppg or .pjg) with a copy of the empty tile.
-if mrf_empty_tile_filename != '' and (z is None or z == 0):
-    log_info_mssg('Seed the MRF data file with a copy of the empty tile.' )
-    log_info_mssg(str().join(['Copy ', mrf_empty_tile_filename,' to ', out_filename]))
-    shutil.copy(mrf_empty_tile_filename, out_filename)
-#-----------------------------------------------------------------------
-
-# Create the gdal_translate command.
-gdal_translate_command_list=['gdal_translate', '-q', '-of', 'MRF', '-co', compress, '-co', blocksize,'-outsize', target_x, target_y]    
-if compress in ["COMPRESS=JPEG", "COMPRESS=PNG", "COMPRESS=JPNG"]:
-    gdal_translate_command_list.append('-co')
-    gdal_translate_command_list.append('QUALITY='+quality_prec)
-if compress == "COMPRESS=LERC":
-    # Default to V1 for Javascript decoding
-    gdal_translate_command_list.append('-co')
-    gdal_translate_command_list.append('OPTIONS="LERC_PREC=' + quality_prec + ' V1=ON DEFLATE=ON"')
-if zlevels != '':
-    gdal_translate_command_list.append('-co')
-    gdal_translate_command_list.append('ZSIZE='+str(zlevels))
-if use_brunsli == False and compress == "COMPRESS=JPEG":
-    gdal_translate_command_list.append('-co')
-    gdal_translate_command_list.append('OPTIONS=JFIF:on')
-
-if nocopy == True:
-    gdal_translate_command_list.append('-co')
-    gdal_translate_command_list.append('NOCOPY=true')
-    if noaddo or len(alltiles) <= 1: # use UNIFORM_SCALE if empty MRF, single input, or noaddo
+        mssg='Unrecognized compression type for MRF.'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+    # Insert colormap into VRT if a colormap is provided and colormap overwriting is enabled.
+    # This could be problematic if we're overwriting with a different palette than what is in the imagery.
+    if overwrite_colormap and colormap != '':
+        new_vrt_filename = intermediates.path(os.path.basename(vrt_filename).replace('.vrt','_newcolormap.vrt'))
+        colormap2vrt_command_list=[script_dir+'colormap2vrt.py','--colormap',colormap,'--output',new_vrt_filename,'--merge',vrt_filename]
+        if add_transparency == True:
+            colormap2vrt_command_list.append('--transparent')
+        if send_email == True:
+            colormap2vrt_command_list.append('--send_email')
+        if email_server != '':
+            colormap2vrt_command_list.append('--email_server')
+            colormap2vrt_command_list.append(email_server)
+        if email_recipient != '':
+            colormap2vrt_command_list.append('--email_recipient')
+            colormap2vrt_command_list.append(email_recipient)
+        if email_sender != '':
+            colormap2vrt_command_list.append('--email_sender')
+            colormap2vrt_command_list.append(email_sender)
+        log_the_command(colormap2vrt_command_list)
+        colormap2vrt_stderr_filename=intermediates.path(basename + '_colormap2vrt_stderr.txt', in_memory=False)
+        colormap2vrt_stderr_file=open(colormap2vrt_stderr_filename, 'w+')
+        subprocess.call(colormap2vrt_command_list, stderr=colormap2vrt_stderr_file)
+        colormap2vrt_stderr_file.seek(0)
+        colormap2vrt_stderr = colormap2vrt_stderr_file.read()
+        log_info_mssg(colormap2vrt_stderr)
+        if "Error" in colormap2vrt_stderr:
+            log_sig_exit('ERROR', "Error executing colormap2vrt.py with colormap:" + colormap, sigevent_url)
+        colormap2vrt_stderr_file.close()
+        if os.path.isfile(new_vrt_filename):
+            remove_file(colormap2vrt_stderr_filename)
+            vrt_filename = new_vrt_filename
+
+    # Get input size.
+    dom=xml.dom.minidom.parse(vrt_filename)
+    rastersize_elements=dom.getElementsByTagName('VRTDataset')
+    x_size=rastersize_elements[0].getAttribute('rasterXSize') #width
+    y_size=rastersize_elements[0].getAttribute('rasterYSize') #height
+
+    if target_x == '':
+        log_info_mssg('x size and y size from VRT ' + x_size + "," + y_size)
+        exp=11 #minimum outsize 20480 for EPSG4326_2km
+        while int(10*(2**exp)) < int(x_size):
+            exp+=1
+        target_x=str(10*(2**exp))
+        log_info_mssg('Calculating target_x from VRT to ' + target_x)
+
+    # Only use new target size if different.
+    if target_x != x_size:
+        # Calculate output size of Y dimension and maintain aspect ratio.
+        if target_y == '':
+            target_y=str(int(float(target_x)*(float(y_size)/float(x_size))))
+            log_info_mssg('Calculating target_y ' + target_y)
+        if resize_resampling == '':
+            log_sig_warn("Target size ({0}x{1}) differs from input size ({2}x{3}), but <resize_resampling> flag has not been set.".
+                         format(target_x, target_y, x_size, y_size), sigevent_url)
+    else: #don't bother calculating y
+        if target_y == '':
+            target_y=y_size
+            log_info_mssg("Setting target_y from VRT to {0}".format(target_y))
+        elif float(target_y) != float(y_size):
+            log_sig_warn("Target y size ({0}) differs from raster y size ({1})".format(target_y, y_size), sigevent_url)
+
+
+    #-----------------------------------------------------------------------
+    # Seed the MRF data file (.ppg or .pjg) with a copy of the empty tile.
+    if mrf_empty_tile_filename != '' and (z is None or z == 0) and not (time_slice and os.path.isfile(out_filename)):
+        log_info_mssg('Seed the MRF data file with a copy of the empty tile.' )
+        log_info_mssg(str().join(['Copy ', mrf_empty_tile_filename,' to ', out_filename]))
+        shutil.copy(mrf_empty_tile_filename, out_filename)
+    #-----------------------------------------------------------------------
+
+    # Create the gdal_translate command.
+    gdal_translate_command_list=['gdal_translate', '-q', '-of', 'MRF', '-co', compress, '-co', blocksize,'-outsize', target_x, target_y]    
+    if compress in ["COMPRESS=JPEG", "COMPRESS=PNG", "COMPRESS=JPNG"]:
+        gdal_translate_command_list.append('-co')
+        gdal_translate_command_list.append('QUALITY='+quality_prec)
+    if compress == "COMPRESS=LERC":
+        # Default to V1 for Javascript decoding
+        gdal_translate_command_list.append('-co')
+        gdal_translate_command_list.append('OPTIONS="LERC_PREC=' + quality_prec + ' V1=ON DEFLATE=ON"')
+    if zlevels != '':
+        gdal_translate_command_list.append('-co')
+        gdal_translate_command_list.append('ZSIZE='+str(zlevels))
+    if use_brunsli == False and compress == "COMPRESS=JPEG":
+        gdal_translate_command_list.append('-co')
+        gdal_translate_command_list.append('OPTIONS=JFIF:on')
+
+    if nocopy == True:
+        gdal_translate_command_list.append('-co')
+        gdal_translate_command_list.append('NOCOPY=true')
+        if noaddo or len(alltiles) <= 1: # use UNIFORM_SCALE if empty MRF, single input, or noaddo
+            gdal_translate_command_list.append('-co')
+            gdal_translate_command_list.append('UNIFORM_SCALE='+str(int(overview)))
+    elif cascade_overviews and not noaddo:
+        # allocate the overview levels so they can be built level by level
         gdal_translate_command_list.append('-co')
         gdal_translate_command_list.append('UNIFORM_SCALE='+str(int(overview)))
         
-# add ending parameters
-gdal_translate_command_list.append(vrt_filename)
-gdal_translate_command_list.append(gdal_mrf_filename)
-
-# Log the gdal_translate command.
-log_the_command(gdal_translate_command_list)
-# Capture stderr.
-gdal_translate_stderr_filename=str().join([working_dir, basename, '_gdal_translate_stderr.txt'])
-# Open stderr file for write.
-gdal_translate_stderr_file=open(gdal_translate_stderr_filename, 'w')
-
-#-----------------------------------------------------------------------
-# Execute gdal_translate.
-subprocess.call(gdal_translate_command_list, stderr=gdal_translate_stderr_file)
-#-----------------------------------------------------------------------
-
-# Close stderr file.
-gdal_translate_stderr_file.close()
-
-# Copy vrt to output
-if not data_only:
-    shutil.copy(vrt_filename, str().join([output_dir, basename, '.vrt']))
-
-# Clean up temporary VRT files
-for vrt in [v for v in glob.glob(str().join([working_dir, basename, '*.vrt'])) if (v not in alltiles)]:
-    remove_file(vrt)
-
-# Check if MRF was created.
-mrf_output=glob.glob(mrf_filename)
-if len(mrf_output) == 0:
-    mssg=str().join(['Fail:  gdal_translate',
-                     ' Check gdal mrf driver plugin.',
-                     ' Check stderr file:  ',
-                     gdal_translate_stderr_filename])
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-# Get largest x,y dimension of MRF, usually x.
-try:
-    # Open file.
-    mrf_file=open(mrf_filename, 'r+')
-except IOError:
-    mssg=str().join(['Cannot read:  ', mrf_filename])
-    log_sig_exit('ERROR', mssg, sigevent_url)
-else:
-    try:
-        dom=xml.dom.minidom.parse(mrf_file)
-    except:
-        mssg=str().join(['Cannot parse:  ', mrf_filename])
+    # add ending parameters
+    gdal_translate_command_list.append(vrt_filename)
+    gdal_translate_command_list.append(gdal_mrf_filename)
+
+    # Log the gdal_translate command.
+    log_the_command(gdal_translate_command_list)
+    # Capture stderr.
+    gdal_translate_stderr_filename=intermediates.path(basename + '_gdal_translate_stderr.txt', in_memory=False)
+    # Open stderr file for write.
+    gdal_translate_stderr_file=open(gdal_translate_stderr_filename, 'w')
+
+    #-----------------------------------------------------------------------
+    # Execute gdal_translate.
+    subprocess.call(gdal_translate_command_list, stderr=gdal_translate_stderr_file)
+    #-----------------------------------------------------------------------
+
+    # Close stderr file.
+    gdal_translate_stderr_file.close()
+
+    # Copy vrt to output
+    if not data_only:
+        shutil.copy(vrt_filename, str().join([output_dir, basename, '.vrt']))
+
+    # Clean up temporary VRT files
+    intermediates.remove(*[v for v in intermediates.files if v.endswith('.vrt') and v not in alltiles])
+
+    # Check if MRF was created.
+    mrf_output=glob.glob(mrf_filename)
+    if len(mrf_output) == 0:
+        mssg=str().join(['Fail:  gdal_translate',
+                         ' Check gdal mrf driver plugin.',
+                         ' Check stderr file:  ',
+                         gdal_translate_stderr_filename])
         log_sig_exit('ERROR', mssg, sigevent_url)
-    # Raster
-    size_elements=dom.getElementsByTagName('Size')
-    sizeX=size_elements[0].getAttribute('x') #width
-    sizeY=size_elements[0].getAttribute('y') #height
-    sizeC=size_elements[0].getAttribute('c') #bands
-    sizeZ=size_elements[0].getAttribute('z') #bands
-    # Send to log.
-    log_info_mssg(str().join(['size of MRF:  ', sizeX, ' x ', sizeY]))
 
-    # Add mp_safe to Raster if using z levels
-    if zlevels != '':
-        mrf_file.seek(0)
-        lines = mrf_file.readlines()
-        for idx in range(0, len(lines)):
-            if '<Raster>' in str(lines[idx]):
-                lines[idx] = str(lines[idx]).replace('<Raster>','<Raster mp_safe="on">')
-                log_info_mssg("Set MRF mp_safe on")
-        mrf_file.seek(0)
-        mrf_file.truncate()
-        mrf_file.writelines(lines)
-
-    # Close file.
-    mrf_file.close()
-    # Get largest dimension, usually X.
-    actual_size = max([float(sizeX), float(sizeY)])
-
-# Insert if there are input tiles to process
-if len(alltiles) > 0 and nocopy==True:
-    if mrf_parallel:
-        parallel_mrf_insert(alltiles, gdal_mrf_filename, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                             [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, working_dir, mrf_cores)
+    # Get largest x,y dimension of MRF, usually x.
+    try:
+        # Open file.
+        mrf_file=open(mrf_filename, 'r+')
+    except IOError:
+        mssg=str().join(['Cannot read:  ', mrf_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
     else:
-        run_mrf_insert(alltiles, gdal_mrf_filename, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
-                             [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, working_dir, max_size=mrf_maxsize)
-
-
-# Create pyramid only if idx (MRF index file) was successfully created.
-idxf=get_modification_time(idx_filename)
-compare_time=time.strftime('%Y%m%d.%H%M%S', time.localtime())
-old_stats=os.stat(idx_filename)
-if idxf >= vrtf:
-    remove_file(gdal_translate_stderr_filename)
-
-    # Run gdaladdo if noaddo==False or if we have no overviews
-    if (not noaddo) or (overview_levels == '' or int(overview_levels[0]) == 0):
-        # Create the gdaladdo command.
-        gdaladdo_command_list=['gdaladdo', '-r', overview_resampling,
-                               str(gdal_mrf_filename)]
-        # Build out the list of gdaladdo pyramid levels (a.k.a. overviews).
-        if overview_levels == '':
-            overview=2
-            gdaladdo_command_list.append(str(overview))
-            exp=2
-            while (overview*int(mrf_blocksize)) < actual_size:
-                overview=2**exp
-                exp=exp+1
-                gdaladdo_command_list.append(str(overview))
+        try:
+            dom=xml.dom.minidom.parse(mrf_file)
+        except:
+            mssg=str().join(['Cannot parse:  ', mrf_filename])
+            log_sig_exit('ERROR', mssg, sigevent_url)
+        # Raster
+        size_elements=dom.getElementsByTagName('Size')
+        sizeX=size_elements[0].getAttribute('x') #width
+        sizeY=size_elements[0].getAttribute('y') #height
+        # Send to log.
+        log_info_mssg(str().join(['size of MRF:  ', sizeX, ' x ', sizeY]))
+
+        # Add mp_safe to Raster if using z levels
+        if zlevels != '':
+            mrf_file.seek(0)
+            lines = mrf_file.readlines()
+            mp_safe_set = False
+            for idx in range(0, len(lines)):
+                if '<Raster>' in str(lines[idx]):
+                    lines[idx] = str(lines[idx]).replace('<Raster>','<Raster mp_safe="on">')
+                    log_info_mssg("Set MRF mp_safe on")
+                    mp_safe_set = True
+            # Only rewrite the header if needed, other time slices may be reading it
+            if mp_safe_set:
+                mrf_file.seek(0)
+                mrf_file.truncate()
+                mrf_file.writelines(lines)
+
+        # Close file.
+        mrf_file.close()
+        # Get largest dimension, usually X.
+        actual_size = max([float(sizeX), float(sizeY)])
+
+    # Insert if there are input tiles to process
+    if len(alltiles) > 0 and nocopy==True:
+        if mrf_parallel:
+            parallel_mrf_insert(alltiles, gdal_mrf_filename, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
+                                 [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, mrf_cores)
         else:
-            for overview in overview_levels:
+            run_mrf_insert(alltiles, gdal_mrf_filename, insert_method, resize_resampling, target_x, target_y, mrf_blocksize,
+                                 [target_xmin, target_ymin, target_xmax, target_ymax], target_epsg, vrtnodata, merge, max_size=mrf_maxsize)
+
+
+    # Create pyramid only if idx (MRF index file) was successfully created.
+    idxf=get_modification_time(idx_filename)
+    compare_time=time.strftime('%Y%m%d.%H%M%S', time.localtime())
+    old_stats=os.stat(idx_filename)
+    if idxf >= vrtf:
+        remove_file(gdal_translate_stderr_filename)
+
+        overview_plan = None
+        if cascade_overviews and ((not noaddo) or (overview_levels == '' or int(overview_levels[0]) == 0)):
+            overview_plan = plan_overviews(gdal_mrf_filename, overview_resampling, mrf_blocksize, mrf_cores)
+
+        if overview_plan is not None:
+            overview_timings, empty_tiles = build_overviews(gdal_mrf_filename, overview_plan, overview_resampling, mrf_cores,
+                                               suppress_empty, vrtnodata)
+            log_info_mssg("Built {0} overview levels in {1:.2f} seconds".format(
+                          len(overview_timings), sum([timing[3] for timing in overview_timings])))
+        # Run gdaladdo if noaddo==False or if we have no overviews
+        elif (not noaddo) or (overview_levels == '' or int(overview_levels[0]) == 0):
+            # Create the gdaladdo command.
+            gdaladdo_command_list=['gdaladdo', '-r', overview_resampling,
+                                   str(gdal_mrf_filename)]
+            # Build out the list of gdaladdo pyramid levels (a.k.a. overviews).
+            if overview_levels == '':
+                overview=2
                 gdaladdo_command_list.append(str(overview))
-        # Log the gdaladdo command.
-        log_the_command(gdaladdo_command_list)
-        # Capture stderr.
-        gdaladdo_stderr_filename=str().join([working_dir, basename,
-                                             '_gdaladdo_stderr.txt'])
-        # Open stderr file for write.
-        gdaladdo_stderr_file=open(gdaladdo_stderr_filename, 'w')
-
-        #-------------------------------------------------------------------
-        # Execute gdaladdo.
-        gdaladdo_process = subprocess.Popen(gdaladdo_command_list, stdout=subprocess.PIPE, stderr=gdaladdo_stderr_file)
-        out, err = gdaladdo_process.communicate()
-        log_info_mssg(out)
-        if gdaladdo_process.returncode != 0:
-            log_sig_err("gdaladdo return code {0}".format(gdaladdo_process.returncode), sigevent_url)
-        #-------------------------------------------------------------------
-
-        # Close stderr file.
-        gdaladdo_stderr_file.close()
-
-        # Update previous cycle time only if gdaladdo was successful.
-        addf=get_modification_time(idx_filename)
-        new_stats=os.stat(idx_filename)
-
-        # Check for gdaladdo success by checking time stamp and file size.
-        if gdaladdo_process.returncode == -11:
-            log_sig_exit('ERROR', 'Unsuccessful:  gdaladdo   Segmentation fault', sigevent_url)
-        elif (addf >= compare_time) or (new_stats.st_size >= old_stats.st_size):
-            remove_file(gdaladdo_stderr_filename)
+                exp=2
+                while (overview*int(mrf_blocksize)) < actual_size:
+                    overview=2**exp
+                    exp=exp+1
+                    gdaladdo_command_list.append(str(overview))
+            else:
+                for overview in overview_levels:
+                    gdaladdo_command_list.append(str(overview))
+            # Log the gdaladdo command.
+            log_the_command(gdaladdo_command_list)
+            # Capture stderr.
+            gdaladdo_stderr_filename=intermediates.path(basename + '_gdaladdo_stderr.txt', in_memory=False)
+            # Open stderr file for write.
+            gdaladdo_stderr_file=open(gdaladdo_stderr_filename, 'w')
+
+            #-------------------------------------------------------------------
+            # Execute gdaladdo.
+            gdaladdo_process = subprocess.Popen(gdaladdo_command_list, stdout=subprocess.PIPE, stderr=gdaladdo_stderr_file)
+            out, err = gdaladdo_process.communicate()
+            log_info_mssg(out)
+            if gdaladdo_process.returncode != 0:
+                log_sig_err("gdaladdo return code {0}".format(gdaladdo_process.returncode), sigevent_url)
+            #-------------------------------------------------------------------
+
+            # Close stderr file.
+            gdaladdo_stderr_file.close()
+
+            # Update previous cycle time only if gdaladdo was successful.
+            addf=get_modification_time(idx_filename)
+            new_stats=os.stat(idx_filename)
+
+            # Check for gdaladdo success by checking time stamp and file size.
+            if gdaladdo_process.returncode == -11:
+                log_sig_exit('ERROR', 'Unsuccessful:  gdaladdo   Segmentation fault', sigevent_url)
+            elif (addf >= compare_time) or (new_stats.st_size >= old_stats.st_size):
+                remove_file(gdaladdo_stderr_filename)
+            else:
+                log_info_mssg(str().join(['addf = ',str(addf)]))
+                log_info_mssg(str().join(['compare_time = ',str(compare_time)]))
+                log_info_mssg('addf should be >= compare_time')
+                log_info_mssg(str().join(['new_stats.st_size = ',
+                                          str(new_stats.st_size)]))
+                log_info_mssg(str().join(['old_stats.st_size = ',
+                                          str(old_stats.st_size)]))
+                log_info_mssg('new_stats.st_size should be >= old_stats.st_size')
+                mssg=str().join(['Unsuccessful:  gdaladdo   Errors: ', str(err)])
+                log_sig_exit('ERROR', mssg, sigevent_url)
+    else:
+        log_info_mssg(str().join(['idxf = ',str(idxf)]))
+        log_info_mssg(str().join(['vrtf = ',str(vrtf)]))
+        log_info_mssg('idxf should be >= vrtf')
+        mssg = mrf_filename + ' already exists'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+    if suppress_empty:
+        if overview_plan is not None:
+            clear_index_entries(gdal_mrf_filename, idx_filename, empty_tiles)
         else:
-            log_info_mssg(str().join(['addf = ',str(addf)]))
-            log_info_mssg(str().join(['compare_time = ',str(compare_time)]))
-            log_info_mssg('addf should be >= compare_time')
-            log_info_mssg(str().join(['new_stats.st_size = ',
-                                      str(new_stats.st_size)]))
-            log_info_mssg(str().join(['old_stats.st_size = ',
-                                      str(old_stats.st_size)]))
-            log_info_mssg('new_stats.st_size should be >= old_stats.st_size')
-            mssg=str().join(['Unsuccessful:  gdaladdo   Errors: ', str(err)])
-            log_sig_exit('ERROR', mssg, sigevent_url)
-else:
-    log_info_mssg(str().join(['idxf = ',str(idxf)]))
-    log_info_mssg(str().join(['vrtf = ',str(vrtf)]))
-    log_info_mssg('idxf should be >= vrtf')
-    mssg = mrf_filename + ' already exists'
-    log_sig_exit('ERROR', mssg, sigevent_url)
-
-if mrf_clean:
-    log_info_mssg("running mrf_clean on data file {}".format(out_filename))
-    clean_mrf(out_filename)
-
-# Rename MRFs
-if mrf_name != '':
-    output_mrf, output_idx, output_data, output_aux, output_vrt = get_mrf_names(out_filename, mrf_name, parameter_name, date_of_data, time_of_data)
-    if (output_dir+output_mrf) != mrf_filename:
-        log_info_mssg(str().join(['Moving ',mrf_filename, ' to ', output_dir+output_mrf]))
-        shutil.move(mrf_filename, output_dir+output_mrf)
-    if (output_dir+output_data) != out_filename:
-        log_info_mssg(str().join(['Moving ',out_filename, ' to ', output_dir+output_data]))
-        shutil.move(out_filename, output_dir+output_data)
-    if (output_dir+output_idx) != idx_filename:
-        log_info_mssg(str().join(['Moving ',idx_filename, ' to ', output_dir+output_idx]))
-        shutil.move(idx_filename, output_dir+output_idx)
-    if data_only == False:
-        if os.path.isfile(mrf_filename+".aux.xml"):
-            log_info_mssg(str().join(['Moving ',mrf_filename+".aux.xml", ' to ', working_dir+output_aux]))
-            shutil.move(mrf_filename+".aux.xml", working_dir+output_aux)
-        if os.path.isfile(str().join([output_dir, basename, '.vrt'])):
-            log_info_mssg(str().join(['Moving ',str().join([output_dir, basename, '.vrt']), ' to ', working_dir+output_vrt]))
-            shutil.move(str().join([output_dir, basename, '.vrt']), working_dir+output_vrt)
-    mrf_filename = output_dir+output_mrf
-    out_filename = output_dir+output_data
-
-# Leave only MRF data, index, and header files
-if data_only:
-    remove_file(log_filename)
-    remove_file(output_dir+"/"+basename+".mrf.aux.xml")
-    remove_file(working_dir+"/"+basename+".configuration_file.xml")
-
-# Remove temp tiles
-working_dir_files = glob.glob(working_dir+"/*")
-for tilename in (alltiles):
-    if os.path.normpath(tilename) in working_dir_files:
-        if tiff_compress != None:
-            remove_file(tilename+'.aux.xml')
-        if '_indexed.' in tilename:
-            remove_file(tilename.rsplit('.',1)[0]+'.pgw')
-        # Remove intermediary zen MRF files
-        if mrf_compression_type.lower() == 'zen':
-            if '_zen.' in tilename:
-                for zen_file in glob.iglob(os.path.splitext(tilename)[0]+'*'):
-                    remove_file(zen_file)
-
-# Send to log.
-mssg=str().join(['MRF created:  ', out_filename])
-try:
-    log_info_mssg(mssg)
-    # sigevent('INFO', mssg, sigevent_url)
-except urllib.error.URLError:
-    None
-if errors > 0:
-    print("{0} errors encountered".format(errors))
-    sys.exit(1)
-else:
-    sys.exit(0)
+            suppress_empty_tiles(gdal_mrf_filename, idx_filename, out_filename, vrtnodata)
+
+    if mrf_clean and not time_slice:
+        log_info_mssg("running mrf_clean on data file {}".format(out_filename))
+        clean_mrf(out_filename)
+
+    # Rename MRFs
+    if mrf_name != '':
+        output_mrf, output_idx, output_data, output_aux, output_vrt = get_mrf_names(out_filename, mrf_name, parameter_name, date_of_data, time_of_data)
+        if (output_dir+output_mrf) != mrf_filename:
+            log_info_mssg(str().join(['Moving ',mrf_filename, ' to ', output_dir+output_mrf]))
+            shutil.move(mrf_filename, output_dir+output_mrf)
+        if (output_dir+output_data) != out_filename:
+            log_info_mssg(str().join(['Moving ',out_filename, ' to ', output_dir+output_data]))
+            shutil.move(out_filename, output_dir+output_data)
+        if (output_dir+output_idx) != idx_filename:
+            log_info_mssg(str().join(['Moving ',idx_filename, ' to ', output_dir+output_idx]))
+            shutil.move(idx_filename, output_dir+output_idx)
+        if data_only == False:
+            if os.path.isfile(mrf_filename+".aux.xml") and not time_slice:
+                log_info_mssg(str().join(['Moving ',mrf_filename+".aux.xml", ' to ', working_dir+output_aux]))
+                shutil.move(mrf_filename+".aux.xml", working_dir+output_aux)
+            if os.path.isfile(str().join([output_dir, basename, '.vrt'])):
+                log_info_mssg(str().join(['Moving ',str().join([output_dir, basename, '.vrt']), ' to ', working_dir+output_vrt]))
+                shutil.move(str().join([output_dir, basename, '.vrt']), working_dir+output_vrt)
+        mrf_filename = output_dir+output_mrf
+        out_filename = output_dir+output_data
+
+    # Leave only MRF data, index, and header files
+    if data_only:
+        remove_file(log_filename)
+        remove_file(output_dir+"/"+basename+".mrf.aux.xml")
+        remove_file(working_dir+"/"+basename+".configuration_file.xml")
+
+    # Remove temp tiles and other intermediate files
+    intermediates.cleanup()
+
+    # Send to log.
+    mssg=str().join(['MRF created:  ', out_filename])
+    try:
+        log_info_mssg(mssg)
+        # sigevent('INFO', mssg, sigevent_url)
+    except urllib.error.URLError:
+        None
+    return mrf_filename, errors
+
+
+if __name__ == '__main__':
+    # Define command line options and args.
+    parser=OptionParser(version=versionNumber)
+    parser.add_option('-c', '--configuration_filename',
+                      action='store', type='string', dest='configuration_filename',
+                      default='./mrfgen_configuration_file.xml',
+                      help='Full path of configuration filename.  Default:  ./mrfgen_configuration_file.xml')
+    parser.add_option("-d", "--data_only", action="store_true", dest="data_only",
+                      default=False, help="Only output the MRF data, index, and header files")
+    parser.add_option("-s", "--send_email", action="store_true", dest="send_email",
+                      default=False, help="Send email notification for errors and warnings.")
+    parser.add_option('--email_server', action='store', type='string', dest='email_server',
+                      default='', help='The server where email is sent from (overrides configuration file value)')
+    parser.add_option('--email_recipient', action='store', type='string', dest='email_recipient',
+                      default='', help='The recipient address for email notifications (overrides configuration file value)')
+    parser.add_option('--email_sender', action='store', type='string', dest='email_sender',
+                      default='', help='The sender for email notifications (overrides configuration file value)')
+    parser.add_option('--email_logging_level', action='store', type='string', dest='email_logging_level',
+                      default='ERROR', help='Logging level for email notifications: ERROR, WARN, or INFO.  Default: ERROR')
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+    # Configuration filename.
+    configuration_filename=options.configuration_filename
+    # Send email.
+    send_email=options.send_email
+    # Email server.
+    email_server=options.email_server
+    # Email recipient
+    email_recipient=options.email_recipient
+    # Email sender.
+    email_sender=options.email_sender
+    # Data only.
+    data_only = options.data_only
+    # Email logging level
+    logging_level = options.email_logging_level.upper()
+
+    try:
+        mrf, errors = mrfgen(configuration_filename, data_only, send_email, email_server, email_recipient,
+                             email_sender, logging_level)
+    except SystemExit:
+        # Don't leave intermediates behind in memory when mrfgen aborts
+        if intermediates is not None:
+            intermediates.release()
+        raise
+    if errors > 0:
+        print("{0} errors encountered".format(errors))
+        sys.exit(1)
+    else:
+        sys.exit(0)
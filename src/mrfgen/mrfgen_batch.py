@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# Batch driver for mrfgen.  Runs many mrfgen configurations from a single process
+# across a shared worker pool, instead of launching one mrfgen process per layer.
+#
+# Example:
+#
+#  mrfgen_batch.py
+#   -d /mrfgen/configs
+#   -j 16
+#   -r /mrfgen/logs/mrfgen_batch_report.json
+#
+
+from optparse import OptionParser
+import concurrent.futures
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import xml.dom.minidom
+import mrfgen
+from oe_utils import get_dom_tag_value
+
+versionNumber = os.environ.get('ONEARTH_VERSION')
+
+
+def get_config_cores(configuration_filename, max_cores):
+    """
+    Returns the number of cores a configuration is expected to use, based on <mrf_parallel> and <mrf_cores>.
+    Arguments:
+        configuration_filename -- Full path of the mrfgen configuration file
+        max_cores -- Total number of cores available to the batch
+    """
+    try:
+        dom = xml.dom.minidom.parse(configuration_filename)
+    except Exception:
+        return 1
+    try:
+        mrf_parallel = get_dom_tag_value(dom, 'mrf_parallel') == "true"
+    except:
+        mrf_parallel = False
+    if not mrf_parallel:
+        return 1
+    try:
+        mrf_cores = int(get_dom_tag_value(dom, 'mrf_cores'))
+    except:
+        mrf_cores = 4
+    return max(1, min(mrf_cores, max_cores))
+
+
+def init_worker(metadata_cache, empty_tile_cache, colormap_cache_dir, gdal_cachemax, max_memory):
+    """
+    Sets up a batch worker process with the shared caches and per-MRF resource limits.
+    Arguments:
+        metadata_cache -- Shared dictionary of gdalinfo results
+        empty_tile_cache -- Shared dictionary of empty_config lookups
+        colormap_cache_dir -- Directory used to cache remote colormaps
+        gdal_cachemax -- GDAL_CACHEMAX for each MRF, in MB
+        max_memory -- Address space limit for each MRF, in MB
+    """
+    mrfgen.metadata_cache = metadata_cache
+    mrfgen.empty_tile_cache = empty_tile_cache
+    mrfgen.colormap_cache_dir = colormap_cache_dir
+    # Each worker gets its own lock so parallel inserts of different MRFs don't block each other
+    mrfgen.lock = mrfgen.rw_lock()
+    if gdal_cachemax is not None:
+        os.environ['GDAL_CACHEMAX'] = str(gdal_cachemax)
+    if max_memory is not None:
+        limit = max_memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_config(configuration_filename, data_only, send_email, email_server, email_recipient, email_sender,
+               logging_level):
+    """
+    Runs mrfgen for a single configuration inside a batch worker and returns a report entry.
+    Arguments:
+        configuration_filename -- Full path of the mrfgen configuration file
+        data_only ... logging_level: Same as mrfgen
+    """
+    start_time = time.time()
+    # mrfgen changes to its working_dir; restore the directory so relative paths in the next configuration resolve
+    cwd = os.getcwd()
+    entry = {'configuration': configuration_filename, 'mrf': None, 'errors': 0, 'status': 'success',
+             'pid': os.getpid()}
+    try:
+        entry['mrf'], entry['errors'] = mrfgen.mrfgen(configuration_filename, data_only, send_email, email_server,
+                                                      email_recipient, email_sender, logging_level)
+        if entry['errors'] > 0:
+            entry['status'] = 'errors'
+    except SystemExit as e:
+        # log_sig_exit aborts the run; record it and keep the worker alive for the next configuration
+        entry['status'] = 'failed'
+        entry['errors'] = max(mrfgen.errors, 1)
+        entry['message'] = 'mrfgen exited with code {0}'.format(e.code)
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['errors'] = max(mrfgen.errors, 1)
+        entry['message'] = '{0}: {1}'.format(type(e).__name__, e)
+    finally:
+        if entry['status'] == 'failed' and mrfgen.intermediates is not None:
+            mrfgen.intermediates.release()
+        os.chdir(cwd)
+    entry['start_time'] = datetime.datetime.utcfromtimestamp(start_time).isoformat() + 'Z'
+    entry['duration'] = round(time.time() - start_time, 3)
+    return entry
+
+
+def run_batch(configs, max_cores, data_only=False, send_email=False, email_server='', email_recipient='',
+              email_sender='', logging_level='ERROR', colormap_cache_dir=None, gdal_cachemax=None, max_memory=None):
+    """
+    Schedules mrfgen configurations across a shared worker pool and returns the combined run report.
+    A configuration with <mrf_parallel> reserves <mrf_cores> cores, so running configurations never use more
+    than max_cores in total.
+    Arguments:
+        configs -- List of mrfgen configuration files
+        max_cores -- Total number of cores to use for the batch
+        data_only ... logging_level: Same as mrfgen
+        colormap_cache_dir -- Directory used to cache remote colormaps
+        gdal_cachemax -- GDAL_CACHEMAX for each MRF, in MB
+        max_memory -- Address space limit for each MRF, in MB
+    """
+    start_time = time.time()
+    pending = [(config, get_config_cores(config, max_cores)) for config in configs]
+    # Schedule the largest configurations first so they don't end up waiting on a full pool
+    pending.sort(key=lambda p: p[1], reverse=True)
+
+    manager = multiprocessing.Manager()
+    metadata_cache = manager.dict()
+    empty_tile_cache = manager.dict()
+    if colormap_cache_dir is not None and not os.path.isdir(colormap_cache_dir):
+        os.makedirs(colormap_cache_dir)
+
+    entries = []
+    running = {}
+    free_cores = max_cores
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_cores, initializer=init_worker,
+                                                initargs=(metadata_cache, empty_tile_cache, colormap_cache_dir,
+                                                          gdal_cachemax, max_memory)) as executor:
+        while pending or running:
+            while pending:
+                fits = [p for p in pending if p[1] <= free_cores]
+                if not fits:
+                    if running:
+                        break
+                    fits = pending
+                config, cores = fits[0]
+                pending.remove(fits[0])
+                print("Starting {0} with {1} core(s)".format(config, cores))
+                future = executor.submit(run_config, config, data_only, send_email, email_server, email_recipient,
+                                         email_sender, logging_level)
+                running[future] = (config, cores)
+                free_cores -= cores
+            done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                config, cores = running.pop(future)
+                free_cores += cores
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    entry = {'configuration': config, 'mrf': None, 'errors': 1, 'status': 'failed',
+                             'message': '{0}: {1}'.format(type(e).__name__, e)}
+                entry['cores'] = cores
+                print("Finished {0}: {1} ({2} errors)".format(config, entry['status'], entry['errors']))
+                entries.append(entry)
+    metadata_entries = len(metadata_cache)
+    manager.shutdown()
+
+    entries.sort(key=lambda e: configs.index(e['configuration']))
+    return {
+        'start_time': datetime.datetime.utcfromtimestamp(start_time).isoformat() + 'Z',
+        'duration': round(time.time() - start_time, 3),
+        'max_cores': max_cores,
+        'total': len(entries),
+        'succeeded': len([e for e in entries if e['status'] == 'success']),
+        'failed': len([e for e in entries if e['status'] != 'success']),
+        'errors': sum(e['errors'] for e in entries),
+        'metadata_cache_entries': metadata_entries,
+        'mrfs': entries
+    }
+
+
+if __name__ == '__main__':
+    # Define command line options and args.
+    parser = OptionParser(usage='usage: %prog [options] [configuration_filename ...]', version=versionNumber)
+    parser.add_option('-c', '--configuration_filename', action='append', dest='configuration_filenames',
+                      default=[], help='Full path of a configuration filename.  May be repeated.')
+    parser.add_option('-d', '--configuration_dir', action='store', type='string', dest='configuration_dir',
+                      default=None, help='Directory of configuration files (*.xml) to process')
+    parser.add_option('-j', '--cores', action='store', type='int', dest='cores',
+                      default=multiprocessing.cpu_count(), help='Total number of cores to use for the batch.  Default: number of CPUs')
+    parser.add_option('-r', '--report', action='store', type='string', dest='report',
+                      default=None, help='Write the combined run report (JSON) to this file')
+    parser.add_option('--colormap_cache_dir', action='store', type='string', dest='colormap_cache_dir',
+                      default=None, help='Directory used to cache remote colormaps shared by the batch')
+    parser.add_option('--gdal_cachemax', action='store', type='int', dest='gdal_cachemax',
+                      default=None, help='GDAL_CACHEMAX (MB) for each MRF')
+    parser.add_option('--max_memory', action='store', type='int', dest='max_memory',
+                      default=None, help='Maximum memory (MB) for each MRF')
+    parser.add_option("--data_only", action="store_true", dest="data_only",
+                      default=False, help="Only output the MRF data, index, and header files")
+    parser.add_option("-s", "--send_email", action="store_true", dest="send_email",
+                      default=False, help="Send email notification for errors and warnings.")
+    parser.add_option('--email_server', action='store', type='string', dest='email_server',
+                      default='', help='The server where email is sent from (overrides configuration file value)')
+    parser.add_option('--email_recipient', action='store', type='string', dest='email_recipient',
+                      default='', help='The recipient address for email notifications (overrides configuration file value)')
+    parser.add_option('--email_sender', action='store', type='string', dest='email_sender',
+                      default='', help='The sender for email notifications (overrides configuration file value)')
+    parser.add_option('--email_logging_level', action='store', type='string', dest='email_logging_level',
+                      default='ERROR', help='Logging level for email notifications: ERROR, WARN, or INFO.  Default: ERROR')
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+
+    configs = options.configuration_filenames + args
+    if options.configuration_dir is not None:
+        configs += sorted(glob.glob(os.path.join(options.configuration_dir, '*.xml')))
+    # mrfgen changes to each working_dir, so configuration paths must be absolute
+    configs = [os.path.abspath(config) for config in configs]
+    if len(configs) == 0:
+        parser.error('No configuration files provided')
+    if options.cores < 1:
+        parser.error('--cores must be at least 1')
+
+    report = run_batch(configs, options.cores, options.data_only, options.send_email, options.email_server,
+                       options.email_recipient, options.email_sender, options.email_logging_level.upper(),
+                       options.colormap_cache_dir, options.gdal_cachemax, options.max_memory)
+
+    if options.report is not None:
+        with open(options.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    print("{0} of {1} MRFs succeeded in {2} seconds, {3} errors encountered".format(
+          report['succeeded'], report['total'], report['duration'], report['errors']))
+    sys.exit(1 if report['failed'] > 0 else 0)
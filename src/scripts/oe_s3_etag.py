@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+This script calculates S3 ETags of local files, or verifies a local archive against the objects of an S3 bucket.
+When verifying, every object under the prefix must exist on the file system with a matching size and ETag;
+the part size of multipart ETags is inferred from the part count.
+With --block-manifest, it also writes the block checksum manifests used by oe_sync_s3_idx.py --delta.
+"""
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from oe_s3_utils import DEFAULT_BLOCK_SIZE, DEFAULT_MAX_WORKERS, calculate_file_etag, calculate_s3_etag, \
+                        createClient, listObjects, loadETagCache, saveETagCache, writeBlockManifest
+
+
+def verifyObject(dir, prefix, obj):
+    """
+    Returns None if the local copy of an S3 object matches it, otherwise a description of the problem.
+    """
+    filepath = os.path.join(dir, obj['Key'][len(prefix):].lstrip('/'))
+    if not os.path.isfile(filepath):
+        return 'missing {0}'.format(filepath)
+    size = os.path.getsize(filepath)
+    if size != obj['Size']:
+        return 'size mismatch {0} ({1} != {2})'.format(filepath, size, obj['Size'])
+    s3_etag = obj['ETag'].strip('"')
+    file_etag = calculate_file_etag(filepath, s3_etag)
+    if file_etag != s3_etag:
+        return 'etag mismatch {0} ({1} != {2})'.format(filepath, file_etag, s3_etag)
+    return None
+
+
+def verifyArchive(bucket, dir, prefix, s3_uri=None, workers=DEFAULT_MAX_WORKERS, shard_depth=0):
+    """
+    Verifies the files in dir against the objects under prefix in bucket and returns (objects checked, problems).
+    """
+    s3 = createClient(s3_uri, workers)
+    checked = 0
+    problems = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for obj in listObjects(s3, bucket, prefix, shard_depth, workers):
+            if obj['Key'].endswith('/'):
+                continue
+            futures.append(executor.submit(verifyObject, dir, prefix, obj))
+        for future in futures:
+            checked += 1
+            problem = future.result()
+            if problem is not None:
+                print(problem)
+                problems.append(problem)
+    return checked, problems
+
+
+# Routine when run from CLI
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Calculates S3 ETags of local files, or verifies a local archive against an S3 bucket.')
+    parser.add_argument(
+        'files',
+        nargs='*',
+        help='Files to calculate the ETag of')
+    parser.add_argument(
+        '-b',
+        '--bucket',
+        dest='bucket',
+        help='bucket name to verify the directory against',
+        action='store')
+    parser.add_argument(
+        '-d',
+        '--dir',
+        dest='dir',
+        help='Directory on file system to verify',
+        action='store')
+    parser.add_argument(
+        '-p',
+        '--prefix',
+        dest='prefix',
+        action='store',
+        default='',
+        help='S3 prefix to use')
+    parser.add_argument(
+        '-s',
+        '--s3_uri',
+        dest='s3_uri',
+        action='store',
+        help='S3 URI -- for use with localstack testing')
+    parser.add_argument(
+        '-c',
+        '--chunk-size',
+        dest='chunk_size',
+        action='store',
+        type=int,
+        default=8,
+        help='Multipart part size in MB used when calculating the ETags of files (default: 8)')
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help='Number of files to verify concurrently')
+    parser.add_argument(
+        '--shard-depth',
+        dest='shard_depth',
+        action='store',
+        type=int,
+        default=0,
+        help='Levels of the keyspace to split the S3 listing on (default: 0)')
+    parser.add_argument(
+        '--cache',
+        dest='cache',
+        action='store',
+        help='File used to keep calculated ETags between runs')
+    parser.add_argument(
+        '--block-manifest',
+        default=False,
+        dest='block_manifest',
+        help='Also write a block checksum manifest (file.blocks) next to each file, to be published with it',
+        action='store_true')
+    parser.add_argument(
+        '--block-size',
+        dest='block_size',
+        action='store',
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help='Block size in bytes of the block checksum manifests (default: {0})'.format(DEFAULT_BLOCK_SIZE))
+
+    args = parser.parse_args()
+
+    if args.bucket is None and not args.files:
+        parser.error('Either files or a bucket to verify against are required')
+    if args.bucket is not None and args.dir is None:
+        parser.error('--dir is required with --bucket')
+
+    loadETagCache(args.cache)
+    failed = False
+    try:
+        for filepath in args.files:
+            etag = calculate_s3_etag(filepath, args.chunk_size * 1024 * 1024).strip('"')
+            print('{0}  {1}'.format(etag, filepath))
+            if args.block_manifest:
+                writeBlockManifest(filepath, args.block_size, etag)
+        if args.bucket is not None:
+            checked, problems = verifyArchive(args.bucket, args.dir, args.prefix, s3_uri=args.s3_uri,
+                                              workers=args.workers, shard_depth=args.shard_depth)
+            print('{0} objects checked, {1} problems found'.format(checked, len(problems)))
+            failed = len(problems) > 0
+    finally:
+        if args.cache is not None:
+            saveETagCache(args.cache)
+
+    sys.exit(1 if failed else 0)
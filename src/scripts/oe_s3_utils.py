@@ -0,0 +1,716 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Shared S3 helpers for the OnEarth sync and time scrape tools.
+"""
+import csv
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, unquote_plus
+import boto3, botocore
+from boto3.s3.transfer import TransferConfig
+
+# Number of concurrent requests, which is also the size of the client's connection pool
+DEFAULT_MAX_WORKERS = 10
+# Number of attempts for each transfer before it is reported as failed
+DEFAULT_MAX_ATTEMPTS = 4
+# Seconds between progress reports
+DEFAULT_PROGRESS_INTERVAL = 30
+
+# Large objects (e.g. z-level indexes and shapefiles) are downloaded as concurrent ranged parts
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=64 * 1024 * 1024,
+                                 multipart_chunksize=16 * 1024 * 1024,
+                                 max_concurrency=4)
+
+# Client errors that won't go away by retrying
+NON_RETRYABLE_ERRORS = ('403', '404', 'AccessDenied', 'NoSuchKey', 'NoSuchBucket')
+
+# Threads used to hash the parts of a file
+HASH_WORKERS = os.cpu_count() or 4
+
+# ETags of local files, by (device, inode, size, mtime, part size)
+etag_cache = {}
+etag_lock = threading.Lock()
+hash_executor = None
+
+# Downloads are written to hidden temporary files with this suffix next to their destination
+TEMP_SUFFIX = '.oe-sync-tmp'
+# Temporary files that haven't been written to for this many seconds are left by interrupted syncs, not running ones
+TEMP_MAX_AGE = 60 * 60
+
+# Block checksum manifests are published next to the files they describe, with this suffix (e.g. file.idx.blocks)
+BLOCK_MANIFEST_SUFFIX = '.blocks'
+# 4096 IDX records per block
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+
+class VerificationError(Exception):
+    pass
+
+
+def createClient(s3_uri=None, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Creates an S3 client whose connection pool matches the number of concurrent workers.
+    """
+    session = boto3.session.Session()
+
+    aws_config = botocore.config.Config(
+        connect_timeout=10,
+        read_timeout=30,
+        max_pool_connections=max_workers,
+        retries=dict(max_attempts=2))
+
+    return session.client(service_name='s3', endpoint_url=s3_uri, config=aws_config)
+
+
+def listPrefix(conn, bucket, prefix, delimiter=None):
+    """
+    Yields each page of a list_objects_v2 listing of a prefix.
+    """
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    if delimiter is not None:
+        kwargs['Delimiter'] = delimiter
+
+    while True:
+        resp = conn.list_objects_v2(**kwargs)
+        yield resp
+
+        try:
+            kwargs['ContinuationToken'] = resp['NextContinuationToken']
+        except KeyError:
+            break
+
+
+def listObjects(conn, bucket, prefix='', shard_depth=0, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Yields the objects (as returned in 'Contents' by list_objects_v2) found under a prefix.
+
+    With a shard_depth > 0, the keyspace is first split on '/' into sub-prefixes up to shard_depth levels below
+    the prefix (e.g. projection/layer/year for a depth of 3), and the sub-prefixes are then listed concurrently
+    with up to max_workers requests in flight. Objects are yielded in no particular order as pages arrive.
+    """
+    if shard_depth <= 0 or max_workers <= 1:
+        for resp in listPrefix(conn, bucket, prefix):
+            yield from resp.get('Contents', [])
+        return
+
+    def listLevel(level_prefix):
+        contents = []
+        common_prefixes = []
+        for resp in listPrefix(conn, bucket, level_prefix, delimiter='/'):
+            contents.extend(resp.get('Contents', []))
+            common_prefixes.extend(p['Prefix'] for p in resp.get('CommonPrefixes', []))
+        return contents, common_prefixes
+
+    # Bounded so that listing doesn't run far ahead of the consumer
+    pages = queue.Queue(maxsize=max_workers * 4)
+    cancelled = threading.Event()
+    done = object()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def listShard(shard_prefix):
+        try:
+            if cancelled.is_set():
+                return
+            for resp in listPrefix(conn, bucket, shard_prefix):
+                put(resp.get('Contents', []))
+                if cancelled.is_set():
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            # Walk down the delimiter levels, yielding any objects found above the shard level
+            shards = [prefix]
+            for _ in range(shard_depth):
+                next_shards = []
+                for contents, common_prefixes in executor.map(listLevel, shards):
+                    yield from contents
+                    next_shards.extend(common_prefixes)
+                shards = next_shards
+                if not shards:
+                    return
+
+            for shard_prefix in shards:
+                executor.submit(listShard, shard_prefix)
+
+            remaining = len(shards)
+            while remaining > 0:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            cancelled.set()
+
+
+def scanFiles(dir, extensions, name_prefix='', max_workers=DEFAULT_MAX_WORKERS, sweep_temp=False, dry_run=False):
+    """
+    Returns the paths, relative to dir, of the files under dir whose names start with name_prefix and end with one of
+    extensions (case-insensitive). Each subdirectory of dir (e.g. each year directory of a layer) is walked in its own
+    thread with os.scandir. With sweep_temp, stale temporary files left by interrupted downloads are removed from the
+    directories as they are scanned (see sweepTempFile).
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+
+    def matches(name):
+        return name.startswith(name_prefix) and name.lower().endswith(extensions)
+
+    def walk(top, rel_top):
+        found = []
+        stack = [(top, rel_top)]
+        while stack:
+            path, rel_path = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        rel_entry = os.path.join(rel_path, entry.name) if rel_path else entry.name
+                        if entry.is_dir():
+                            stack.append((entry.path, rel_entry))
+                        elif sweep_temp and sweepTempFile(entry, dry_run):
+                            continue
+                        elif matches(entry.name):
+                            found.append(rel_entry)
+            except OSError:
+                # Removed while scanning, or not a directory
+                pass
+        return found
+
+    try:
+        with os.scandir(dir) as it:
+            entries = list(it)
+    except OSError:
+        return []
+
+    files = [entry.name for entry in entries if not entry.is_dir()
+             and not (sweep_temp and sweepTempFile(entry, dry_run)) and matches(entry.name)]
+    subdirs = [entry for entry in entries if entry.is_dir()]
+    if len(subdirs) == 1 or max_workers <= 1:
+        for entry in subdirs:
+            files.extend(walk(entry.path, entry.name))
+    elif subdirs:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for found in executor.map(lambda entry: walk(entry.path, entry.name), subdirs):
+                files.extend(found)
+    return files
+
+
+def sweepTempFiles(dir, max_workers=DEFAULT_MAX_WORKERS, dry_run=False):
+    """
+    Removes stale temporary download files under dir (see sweepTempFile) without collecting any other files. Used for
+    directories whose files are known without scanning them, e.g. from a manifest.
+    """
+    scanFiles(dir, (), max_workers=max_workers, sweep_temp=True, dry_run=dry_run)
+
+
+def parseEventRecords(message):
+    """
+    Returns the S3 event records of a notification, unwrapping SNS and SQS envelopes.
+    """
+    for envelope in ('Message', 'Body'):
+        if 'Records' not in message and isinstance(message.get(envelope), str):
+            message = json.loads(message[envelope])
+    if 'Records' in message:
+        return message['Records']
+    # A bare record
+    return [message] if 'eventName' in message else []
+
+
+def readEvents(events_path, offset=0, sequencers=None):
+    """
+    Reads the S3 event notifications appended to a newline-delimited JSON file since offset.
+
+    Returns the latest change for each key, as a dict of 'size' and 'etag' for objects that were created and None for
+    objects that were removed, along with the offset of the end of the last complete line that was read.
+    Notifications may arrive out of order, so the events of a key are ordered by their sequencer, and an event older
+    than one already seen is ignored. sequencers maps each key to the latest sequencer seen, and is updated in place
+    so that it can be passed to the next call.
+    """
+    changes = {}
+    if sequencers is None:
+        sequencers = {}
+    with open(events_path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            # The last line may still be being written
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                records = parseEventRecords(json.loads(line))
+            except ValueError as e:
+                print("Skipping unreadable event: {0}".format(e))
+                continue
+            for record in records:
+                event_name = record.get('eventName', '')
+                obj = record.get('s3', {}).get('object', {})
+                if 'key' not in obj:
+                    continue
+                key = unquote_plus(obj['key'])
+                try:
+                    # Sequencers are hexadecimal, and only comparable between events of the same key
+                    sequencer = int(obj['sequencer'], 16)
+                except (KeyError, TypeError, ValueError):
+                    sequencer = None
+                if sequencer is not None:
+                    if sequencer < sequencers.get(key, -1):
+                        continue
+                    sequencers[key] = sequencer
+                if event_name.startswith('ObjectCreated'):
+                    changes[key] = {'size': obj.get('size'), 'etag': obj.get('eTag')}
+                elif event_name.startswith('ObjectRemoved'):
+                    changes[key] = None
+    return changes, offset
+
+
+def readInventory(inventory_path):
+    # S3 Inventory CSVs start with the bucket and (URL-encoded) key; any remaining columns are compared as they are
+    opener = gzip.open if inventory_path.endswith('.gz') else open
+    with opener(inventory_path, mode='rt') as f:
+        return {unquote(row[1]): tuple(row[2:]) for row in csv.reader(f) if len(row) > 1}
+
+
+def inventoryDelta(previous_path, latest_path):
+    """
+    Returns the changes between two S3 Inventory CSV files, in the same form as readEvents.
+    """
+    previous = readInventory(previous_path)
+    latest = readInventory(latest_path)
+    changes = {key: {'size': None, 'etag': None} for key, row in latest.items() if previous.get(key) != row}
+    changes.update({key: None for key in previous if key not in latest})
+    return changes
+
+
+def loadJson(path):
+    """
+    Loads a JSON state file, such as a sync manifest. Returns an empty dictionary if it doesn't exist or can't be read.
+    """
+    if path is None or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        print("Ignoring unreadable file {0}".format(path))
+        return {}
+
+
+def saveJson(path, data):
+    """
+    Saves a JSON state file, replacing it atomically.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def hashExecutor():
+    # Shared by all ETag calculations; hashlib releases the GIL, so the parts of a file are hashed in parallel
+    global hash_executor
+    with etag_lock:
+        if hash_executor is None:
+            hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+    return hash_executor
+
+
+def loadETagCache(cache_path):
+    """
+    Loads ETags saved with saveETagCache into the ETag cache.
+    """
+    if cache_path is None or not os.path.isfile(cache_path):
+        return
+    with open(cache_path, 'r') as f:
+        entries = json.load(f)
+    with etag_lock:
+        etag_cache.update((tuple(entry[:-1]), entry[-1]) for entry in entries)
+
+
+def saveETagCache(cache_path):
+    """
+    Saves the ETag cache, so that files that haven't changed are not hashed again by later runs.
+    """
+    with etag_lock:
+        entries = [list(key) + [etag] for key, etag in etag_cache.items()]
+    saveJson(cache_path, entries)
+
+
+def calculate_s3_etag(file_path, chunk_size=8 * 1024 * 1024):
+    """
+    Calculates the S3 ETag (quoted) of a file uploaded in parts of chunk_size bytes.
+
+    The file is memory-mapped and its parts are hashed in parallel. Results are cached by the file's device, inode,
+    size and modification time, so a file is only hashed again once it has been changed or replaced.
+    """
+    stat = os.stat(file_path)
+    # Any part size at least as large as the file gives the same single-part ETag
+    chunk_size = min(chunk_size, stat.st_size) if stat.st_size > 0 else 0
+    cache_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, chunk_size)
+    with etag_lock:
+        etag = etag_cache.get(cache_key)
+    if etag is not None:
+        return etag
+
+    if stat.st_size == 0:
+        etag = '"{}"'.format(hashlib.md5().hexdigest())
+    else:
+        with open(file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                offsets = range(0, stat.st_size, chunk_size)
+                if len(offsets) == 1:
+                    etag = '"{}"'.format(hashlib.md5(view).hexdigest())
+                else:
+                    def hashPart(offset):
+                        return hashlib.md5(view[offset:offset + chunk_size]).digest()
+
+                    digests = list(hashExecutor().map(hashPart, offsets))
+                    etag = '"{}-{}"'.format(hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+            finally:
+                view.release()
+
+    with etag_lock:
+        etag_cache[cache_key] = etag
+    return etag
+
+
+def multipartChunkSizes(file_size, parts):
+    """
+    Returns the part sizes that could have produced a multipart upload of a file with the given number of parts: the
+    smallest whole number of MB first, then the common client defaults.
+    """
+    bytesPerPart   = float(file_size) / float(parts)
+    bytesChunkSize = bytesPerPart + 1048576.0 - (bytesPerPart % 1048576.0)
+    mbChunkSize    = int(bytesChunkSize / float(1024 *  1024))
+
+    chunk_sizes = []
+    for mb in [mbChunkSize, 8, 16, 5, 32, 64, 128]:
+        chunk_size = mb * 1024 * 1024
+        if chunk_size not in chunk_sizes and -(-file_size // chunk_size) == parts:
+            chunk_sizes.append(chunk_size)
+    return chunk_sizes or [mbChunkSize * 1024 * 1024]
+
+
+def calculate_file_etag(file_path, s3_etag):
+    """
+    Calculates the ETag of a local file for comparison with the ETag of an S3 object. For multipart ETags, the part
+    size is inferred from the part count.
+    """
+    m = re.match("[a-f0-9]*-([0-9]*)", s3_etag)
+    if m:
+        file_etag = None
+        for chunk_size in multipartChunkSizes(os.stat(file_path).st_size, int(m.group(1))):
+            file_etag = calculate_s3_etag(file_path, chunk_size).replace("\"","").strip()
+            if file_etag == s3_etag:
+                break
+        return file_etag
+
+    return calculate_s3_etag(file_path, os.stat(file_path).st_size).replace("\"","").strip()
+
+
+def calculateBlockChecksums(file_path, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Returns the MD5 (hex) of each block_size block of a file.
+    """
+    if os.path.getsize(file_path) == 0:
+        return []
+    with open(file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            return [hashlib.md5(view[offset:offset + block_size]).hexdigest()
+                    for offset in range(0, len(view), block_size)]
+        finally:
+            view.release()
+
+
+def writeBlockManifest(file_path, block_size=DEFAULT_BLOCK_SIZE, etag=None):
+    """
+    Writes the block checksum manifest of a file next to it, to be published with the file for delta syncs.
+    etag is the S3 ETag the file will have once uploaded; it defaults to that of a single part or 8 MB part upload.
+    Returns the path of the manifest.
+    """
+    if etag is None:
+        etag = calculate_s3_etag(file_path)
+    manifest_path = file_path + BLOCK_MANIFEST_SUFFIX
+    saveJson(manifest_path, {'etag': etag.replace('"', '').strip(),
+                             'size': os.path.getsize(file_path),
+                             'block_size': block_size,
+                             'blocks': calculateBlockChecksums(file_path, block_size)})
+    return manifest_path
+
+
+def changedRanges(local_blocks, block_manifest):
+    """
+    Returns the (first, last) byte ranges of the blocks in a block manifest that differ from the local blocks,
+    with adjacent blocks merged into a single range.
+    """
+    block_size = block_manifest['block_size']
+    ranges = []
+    for i, block in enumerate(block_manifest['blocks']):
+        if i < len(local_blocks) and local_blocks[i] == block:
+            continue
+        first = i * block_size
+        last = min(first + block_size, block_manifest['size']) - 1
+        if ranges and ranges[-1][1] == first - 1:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+    return ranges
+
+
+def tempPath(filepath):
+    dirname, basename = os.path.split(filepath)
+    return os.path.join(dirname, '.{0}.{1}{2}'.format(basename, os.urandom(4).hex(), TEMP_SUFFIX))
+
+
+def sweepTempFile(entry, dry_run=False):
+    """
+    Returns True if a directory entry is a temporary download file, and removes it if it is older than TEMP_MAX_AGE.
+    Newer ones may still be written by another sync.
+    """
+    # s3transfer may also leave its own temporary file, named after ours
+    if TEMP_SUFFIX not in entry.name or not entry.name.startswith('.'):
+        return False
+    try:
+        if time.time() - entry.stat().st_mtime >= TEMP_MAX_AGE:
+            print("Removing incomplete download {0}".format(entry.path))
+            if not dry_run:
+                os.remove(entry.path)
+    except OSError:
+        # Moved into place or removed by another sync in the meantime
+        pass
+    return True
+
+
+class TransferEngine:
+    """
+    Runs downloads and deletes on a bounded thread pool.
+
+    Each download is written to a temporary file in the destination directory, verified against the expected size
+    and ETag (when given), and then moved into place with os.replace, so the destination path never holds a partial
+    file. Files that fail verification are retried.
+
+    Patches fetch only the blocks of an existing file that differ from a published block manifest, with ranged
+    GETs pinned to the object's ETag, and fall back to a full download if the ETag isn't known, the manifest is
+    missing or was made for another version of the object, or the patched file fails verification.
+
+    Submitting blocks once twice max_workers transfers are pending, so callers can queue work straight from a
+    listing without holding it all in memory. Failed downloads are retried with exponential backoff and full jitter,
+    and progress and throughput are reported every progress_interval seconds and when the engine is closed.
+    """
+
+    def __init__(self, s3, bucket, max_workers=DEFAULT_MAX_WORKERS, dry_run=False,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        self.s3 = s3
+        self.bucket = bucket
+        self.dry_run = dry_run
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = threading.BoundedSemaphore(max_workers * 2)
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.last_report = self.start_time
+        self.counters = {'downloaded': 0, 'patched': 0, 'deleted': 0, 'failed': 0, 'retries': 0, 'bytes': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def download(self, key, filepath, on_success=None, size=None, etag=None):
+        """
+        Queues the download of an object to a file. on_success(filepath) is called once it has been downloaded.
+        """
+        self.submit(self.downloadObject, key, filepath, on_success, size, etag)
+
+    def patch(self, key, filepath, blocks_key, on_success=None, size=None, etag=None):
+        """
+        Queues an update of an existing file to an object, fetching only the blocks that differ from the block
+        manifest at blocks_key. on_success(filepath) is called once it has been updated.
+        """
+        self.submit(self.patchObject, key, filepath, blocks_key, on_success, size, etag)
+
+    def delete(self, filepath, on_success=None):
+        """
+        Queues the deletion of a local file. on_success(filepath) is called once it has been deleted.
+        """
+        self.submit(self.deleteFile, filepath, on_success)
+
+    def submit(self, fn, *args):
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.pending.release()
+            raise
+        future.add_done_callback(self.done)
+
+    def done(self, future):
+        self.pending.release()
+        if future.exception() is not None:
+            print("Transfer failed: {0}".format(future.exception()))
+            self.record('failed')
+
+    def downloadObject(self, key, filepath, on_success, size, etag):
+        print("Downloading {0} to {1}".format(key, filepath))
+        if self.dry_run:
+            return
+
+        for attempt in range(1, self.max_attempts + 1):
+            tmp_filepath = tempPath(filepath)
+            try:
+                self.s3.download_file(self.bucket, key, tmp_filepath, Config=TRANSFER_CONFIG)
+                self.verify(tmp_filepath, size, etag)
+                os.replace(tmp_filepath, filepath)
+                break
+            except Exception as e:
+                if os.path.exists(tmp_filepath):
+                    os.remove(tmp_filepath)
+                retryable = not (isinstance(e, botocore.exceptions.ClientError) and
+                                 e.response.get('Error', {}).get('Code') in NON_RETRYABLE_ERRORS)
+                if not retryable or attempt == self.max_attempts:
+                    print("Failed to download {0}: {1}".format(key, e))
+                    self.record('failed')
+                    return
+                self.record('retries')
+                time.sleep(random.uniform(0, min(30, 0.5 * 2 ** attempt)))
+
+        self.record('downloaded', os.path.getsize(filepath))
+        if on_success is not None:
+            on_success(filepath)
+
+    def patchObject(self, key, filepath, blocks_key, on_success, size, etag):
+        print("Patching {0} from {1}".format(filepath, key))
+        if self.dry_run:
+            return
+
+        tmp_filepath = tempPath(filepath)
+        try:
+            # Without the ETag, neither the manifest nor the fetched blocks can be tied to the same version
+            if etag is None:
+                raise VerificationError("No ETag to patch against")
+            block_manifest = json.loads(self.s3.get_object(Bucket=self.bucket, Key=blocks_key)['Body'].read())
+            if block_manifest.get('etag') != etag:
+                raise VerificationError("Block manifest is for ETag {0}, expected {1}".format(block_manifest.get('etag'),
+                                                                                            etag))
+            if size is not None and block_manifest['size'] != size:
+                raise VerificationError("Block manifest is for {0} bytes, expected {1}".format(block_manifest['size'],
+                                                                                             size))
+            ranges = changedRanges(calculateBlockChecksums(filepath, block_manifest['block_size']), block_manifest)
+
+            # Patch a copy, so the file being served is only ever replaced by a verified one
+            shutil.copyfile(filepath, tmp_filepath)
+            fetched = 0
+            with open(tmp_filepath, 'r+b') as f:
+                f.truncate(block_manifest['size'])
+                for first, last in ranges:
+                    resp = self.s3.get_object(Bucket=self.bucket, Key=key, Range='bytes={0}-{1}'.format(first, last),
+                                              IfMatch=etag)
+                    data = resp['Body'].read()
+                    if len(data) != last - first + 1:
+                        raise VerificationError("Received {0} bytes for range {1}-{2}".format(len(data), first, last))
+                    f.seek(first)
+                    f.write(data)
+                    fetched += len(data)
+            self.verify(tmp_filepath, size, etag)
+            os.replace(tmp_filepath, filepath)
+        except Exception as e:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            print("Falling back to a full download of {0}: {1}".format(key, e))
+            self.downloadObject(key, filepath, on_success, size, etag)
+            return
+
+        self.record('patched', fetched)
+        if on_success is not None:
+            on_success(filepath)
+
+    def verify(self, filepath, size, etag):
+        if size is not None and os.path.getsize(filepath) != size:
+            raise VerificationError("Downloaded {0} bytes, expected {1}".format(os.path.getsize(filepath), size))
+        if etag is not None:
+            file_etag = calculate_file_etag(filepath, etag)
+            if file_etag != etag:
+                raise VerificationError("Downloaded file has ETag {0}, expected {1}".format(file_etag, etag))
+
+    def deleteFile(self, filepath, on_success):
+        if not os.path.isfile(filepath):
+            return
+        print("Deleting file not found on S3: {0}".format(filepath))
+        if self.dry_run:
+            return
+
+        try:
+            os.remove(filepath)
+        except OSError as e:
+            print("Failed to delete {0}: {1}".format(filepath, e))
+            self.record('failed')
+            return
+
+        self.record('deleted')
+        if on_success is not None:
+            on_success(filepath)
+
+    def record(self, counter, size=0):
+        with self.lock:
+            self.counters[counter] += 1
+            self.counters['bytes'] += size
+            now = time.time()
+            if now - self.last_report >= self.progress_interval:
+                self.last_report = now
+                print(self.progress())
+
+    def progress(self):
+        elapsed = max(time.time() - self.start_time, 0.001)
+        return "Downloaded {0} files and patched {1} ({2:.1f} MB, {3:.2f} MB/s), deleted {4} files, {5} retries, " \
+               "{6} failures in {7:.1f} seconds".format(self.counters['downloaded'], self.counters['patched'],
+                                                        self.counters['bytes'] / 1e6,
+                                                        self.counters['bytes'] / 1e6 / elapsed,
+                                                        self.counters['deleted'], self.counters['retries'],
+                                                        self.counters['failed'], elapsed)
+
+    def close(self):
+        """
+        Waits for all queued transfers to complete and reports the totals.
+        """
+        self.executor.shutdown(wait=True)
+        print(self.progress())
+        return self.counters
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+This script runs the config, IDX and shapefile syncs of a node from a single process.
+All the syncs share one S3 client, and each bucket prefix is listed once no matter how many syncs use it.
+Syncs run in priority order (configs, then IDX, then shapefiles) while the listings of the later syncs are fetched
+in the background. With --interval, the syncs are repeated until the process is stopped.
+"""
+import os
+import sys
+import time
+import argparse
+import json
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from oe_s3_utils import DEFAULT_MAX_WORKERS, createClient, listObjects
+from oe_sync_s3_configs import syncConfigs
+from oe_sync_s3_idx import syncIdx
+from oe_sync_s3_shapefiles import syncShapefile
+
+# Syncs with a lower priority run first; configs are needed before anything can be served
+PRIORITIES = {'configs': 0, 'idx': 1, 'shapefiles': 2}
+
+# How deep each sync shards its listing when it lists the bucket itself
+SHARD_DEPTHS = {'configs': 2, 'idx': 3, 'shapefiles': 3}
+
+
+def loadJobs(config_path):
+    """
+    Reads the syncs to run from a YAML file with a list of 'jobs', each with a 'type' (configs, idx or
+    shapefiles), 'bucket', 'dir' and optional 'prefix', 'force', 'checksum', 'manifest' (configs and idx) and
+    'delta' (idx).
+    """
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+
+    jobs = []
+    for job in config.get('jobs', []):
+        if job.get('type') not in PRIORITIES:
+            raise ValueError("Unknown sync type {0} in {1}".format(job.get('type'), config_path))
+        job = dict(job)
+        bucket = job['bucket']
+        if bucket.startswith('http'):
+            bucket = bucket.split('/')[2].split('.')[0]
+        job['bucket'] = bucket
+        job['prefix'] = job.get('prefix') or ''
+        if job['type'] == 'configs' and job['prefix'].endswith('/'):
+            job['prefix'] = job['prefix'][:-1]
+        job['name'] = job.get('name') or '{0}:{1}/{2}'.format(job['type'], bucket, job['prefix'])
+        jobs.append(job)
+
+    # sorted is stable, so jobs of the same type keep their order in the file
+    return sorted(jobs, key=lambda job: PRIORITIES[job['type']])
+
+
+def coveringPrefixes(jobs):
+    """
+    Returns the (bucket, prefix) pairs to list so that every job's objects are included, leaving out prefixes that
+    are already covered by a shorter prefix of the same bucket. Each pair is mapped to the shard depth to list it
+    with and the priority of its first job.
+    """
+    covering = {}
+    for job in sorted(jobs, key=lambda job: (job['bucket'], job['prefix'])):
+        for (bucket, prefix) in covering:
+            if bucket == job['bucket'] and job['prefix'].startswith(prefix):
+                covering[(bucket, prefix)]['shard_depth'] = max(covering[(bucket, prefix)]['shard_depth'],
+                                                                SHARD_DEPTHS[job['type']])
+                covering[(bucket, prefix)]['priority'] = min(covering[(bucket, prefix)]['priority'],
+                                                             PRIORITIES[job['type']])
+                break
+        else:
+            covering[(job['bucket'], job['prefix'])] = {'shard_depth': SHARD_DEPTHS[job['type']],
+                                                        'priority': PRIORITIES[job['type']]}
+    return covering
+
+
+class SyncService:
+    """
+    Runs sync jobs on a shared S3 client and listing, and keeps progress counters for each job.
+    """
+
+    def __init__(self, jobs, s3_uri=None, workers=DEFAULT_MAX_WORKERS, dry_run=False, status_path=None):
+        self.jobs = jobs
+        self.workers = workers
+        self.dry_run = dry_run
+        self.status_path = status_path
+        # Listings of the later jobs run alongside the transfers of the current one
+        self.s3 = createClient(s3_uri, workers * 2)
+        self.status = {'started': None, 'finished': None, 'runs': 0, 'jobs': {}}
+
+    def listPrefix(self, bucket, prefix, shard_depth):
+        start_time = time.time()
+        objects = [obj for obj in listObjects(self.s3, bucket, prefix, shard_depth, self.workers)
+                   if not obj['Key'].endswith('/')]
+        print("Listed {0} objects under {1}/{2} in {3:.1f} seconds".format(len(objects), bucket, prefix,
+                                                                          time.time() - start_time))
+        return objects
+
+    def runJob(self, job, listing):
+        print("Running {0}".format(job['name']))
+        if job['type'] == 'configs':
+            return syncConfigs(job['bucket'], job['dir'], job['prefix'], job.get('force', False), self.dry_run,
+                               workers=self.workers, s3=self.s3, listing=listing, manifest_path=job.get('manifest'))
+        if job['type'] == 'idx':
+            return syncIdx(job['bucket'], job['dir'], job['prefix'], job.get('force', False),
+                           job.get('checksum', False), self.dry_run, manifest_path=job.get('manifest'),
+                           workers=self.workers, s3=self.s3, listing=listing, delta=job.get('delta', False))
+        return syncShapefile(job['bucket'], job['dir'], job['prefix'], job.get('force', False),
+                             job.get('checksum', False), self.dry_run, workers=self.workers, s3=self.s3,
+                             listing=listing)
+
+    def update(self, name, **values):
+        self.status['jobs'].setdefault(name, {}).update(values)
+        self.saveStatus()
+
+    def saveStatus(self):
+        if self.status_path is not None:
+            tmp_path = self.status_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.status, f, indent=2)
+            os.replace(tmp_path, self.status_path)
+
+    def run(self):
+        """
+        Lists every covering prefix once, then runs the jobs in priority order. Returns the number of failed jobs.
+        """
+        self.status['started'] = time.time()
+        self.status['finished'] = None
+        for job in self.jobs:
+            self.update(job['name'], state='pending', counters=None, duration=None, error=None)
+
+        covering = coveringPrefixes(self.jobs)
+        failed = 0
+        with ThreadPoolExecutor(max_workers=min(len(covering), 4) or 1) as listing_executor:
+            listings = {}
+            for (bucket, prefix), cover in sorted(covering.items(), key=lambda item: item[1]['priority']):
+                listings[(bucket, prefix)] = listing_executor.submit(self.listPrefix, bucket, prefix,
+                                                                     cover['shard_depth'])
+
+            for job in self.jobs:
+                start_time = time.time()
+                self.update(job['name'], state='listing')
+                try:
+                    for (bucket, prefix), objects in listings.items():
+                        if bucket == job['bucket'] and job['prefix'].startswith(prefix):
+                            listing = [obj for obj in objects.result() if obj['Key'].startswith(job['prefix'])]
+                            break
+                    self.update(job['name'], state='syncing')
+                    counters = self.runJob(job, listing)
+                    self.update(job['name'], state='failed' if counters['failed'] else 'done', counters=counters,
+                                duration=round(time.time() - start_time, 3))
+                    if counters['failed']:
+                        failed += 1
+                except Exception as e:
+                    print("{0} failed: {1}".format(job['name'], e))
+                    self.update(job['name'], state='failed', error=str(e),
+                                duration=round(time.time() - start_time, 3))
+                    failed += 1
+
+        self.status['runs'] += 1
+        self.status['finished'] = time.time()
+        self.saveStatus()
+        print("Ran {0} syncs in {1:.1f} seconds, {2} failed".format(len(self.jobs),
+                                                                  self.status['finished'] - self.status['started'],
+                                                                  failed))
+        return failed
+
+
+# Routine when run from CLI
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Syncs OnEarth configs, IDX files and shapefiles from S3 in a single process.')
+    parser.add_argument(
+        'config',
+        help='YAML file listing the sync jobs')
+    parser.add_argument(
+        '-n',
+        '--dry-run',
+        default=False,
+        dest='dry_run',
+        help='Perform a trial run with no changes made',
+        action='store_true')
+    parser.add_argument(
+        '-s',
+        '--s3_uri',
+        dest='s3_uri',
+        action='store',
+        help='S3 URI -- for use with localstack testing')
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help='Number of concurrent S3 requests')
+    parser.add_argument(
+        '--status',
+        dest='status',
+        action='store',
+        help='JSON file to write the state and transfer counters of each sync to as they run')
+    parser.add_argument(
+        '--interval',
+        dest='interval',
+        action='store',
+        type=float,
+        default=0,
+        help='Seconds between the start of each round of syncs; by default the syncs are run once')
+
+    args = parser.parse_args()
+
+    jobs = loadJobs(args.config)
+    if not jobs:
+        parser.error('No jobs found in {0}'.format(args.config))
+
+    service = SyncService(jobs, s3_uri=args.s3_uri, workers=args.workers, dry_run=args.dry_run,
+                          status_path=args.status)
+    while True:
+        start_time = time.time()
+        failed = service.run()
+        if args.interval <= 0:
+            break
+        time.sleep(max(0, args.interval - (time.time() - start_time)))
+
+    sys.exit(1 if failed else 0)
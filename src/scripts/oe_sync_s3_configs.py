@@ -15,15 +15,13 @@
 This script synchronizes OnEarth config files on S3 with those on a file system.
 Files on S3 will always act as the 'master' (i.e., files found on S3 that are not on the file system
 will be downloaded, while files found on the file system but not on S3 will be deleted).
-File modifications are not detected. Use --force to overwrite existing files.
+Existing files are replaced when their size or ETag don't match the S3 object. Use --force to overwrite all files.
 """
 import argparse
 import os
-import boto3, botocore
-import threading
-from botocore.exceptions import ClientError
 from functools import reduce
-from pathlib import Path
+from oe_s3_utils import DEFAULT_MAX_WORKERS, TransferEngine, calculate_file_etag, createClient, listObjects, loadJson, \
+                        saveJson, scanFiles
 
 
 def keyMapper(acc, obj):
@@ -31,181 +29,210 @@ def keyMapper(acc, obj):
     filename = keyElems[-1]
 
     if not acc.get('config'):
-        acc = {'config': set([])}
+        acc = {'config': {}}
 
     # works with yaml/xml/json/html configs or images (e.g., empty tiles)
     ext = ['.yaml', '.xml', '.html', '.jpeg', '.jpg', '.png', '.svg', '.header', '.txt', '.sym', '.json', '.xsd']
     if filename.endswith(tuple(ext)):
-        acc['config'].add(filename)
+        acc['config'][filename] = {'key': obj['Key'], 'etag': obj['ETag'].replace('"', '').strip(),
+                                   'size': obj['Size']}
 
     return acc
 
 
-# https://alexwlchan.net/2017/07/listing-s3-keys/
-def getAllKeys(conn, bucket, prefix):
-    keys = []
-    kwargs = {'Bucket': bucket, 'Prefix': prefix}
-
-    while True:
-        resp = conn.list_objects_v2(**kwargs)
-        keys = keys + (resp['Contents'] if 'Contents' in resp else [])
-
-        try:
-            kwargs['ContinuationToken'] = resp['NextContinuationToken']
-        except KeyError:
-            break
-    return keys
-
-
 def syncConfigs(bucket,
                 dir,
                 prefix,
                 force,
                 dry_run,
-                s3_uri=None):
+                s3_uri=None,
+                workers=DEFAULT_MAX_WORKERS,
+                s3=None,
+                listing=None,
+                manifest_path=None):
+    # s3 and listing let oe_sync_s3.py share its client and bucket listing. Returns the transfer counters, with the
+    # IDs of the layers whose configs were downloaded or deleted under 'changed'
 
-    session = boto3.session.Session()
-
-    aws_config = botocore.config.Config(
-        connect_timeout=10,
-        read_timeout=30,
-        max_pool_connections=10,
-        retries=dict(max_attempts=2))
-
-    s3 = session.client(service_name='s3', endpoint_url=s3_uri, config=aws_config)
+    if s3 is None:
+        s3 = createClient(s3_uri, workers)
 
     if bucket.startswith('http'):
         bucket = bucket.split('/')[2].split('.')[0]
     if prefix.endswith('/'):
         prefix = prefix[:-1]
-    objects = reduce(keyMapper, getAllKeys(s3, bucket, prefix), {})
-
-    sync_threads    = []
-    sync_semaphore  = threading.BoundedSemaphore(10)
-
-    def copyObject(cfg_prefix, cfg_filepath):
-        try:
-            print("Downloading {0} to {1}".format(cfg_prefix, cfg_filepath))
-            if not dry_run:
-                s3.download_file(bucket, cfg_prefix, cfg_filepath)
-        except botocore.exceptions.ClientError as e:
-            print(e)
-        finally:
-            sync_semaphore.release()
-
-
-    def deleteObject(cfg_filepath):
-        try:
-            if os.path.isfile(cfg_filepath):
-                print("Deleting file not found on S3: {0}".format(cfg_filepath))
-                if not dry_run:
-                    os.remove(cfg_filepath)
-        finally:
-            sync_semaphore.release()
-
-
-    for data, config in objects.items():
-        print(f'Loading configs from: {prefix}')
-
-        # Find existing files on file system
-        if force:  # we don't care about existing files when forcing overwrite
-            fs_files = []
+    if listing is None:
+        # Shard the listing by the sub-directories of the prefix
+        listing = listObjects(s3, bucket, prefix, shard_depth=2, max_workers=workers)
+    objects = reduce(keyMapper, listing, {})
+    # The manifest maps each config path to the ETag it was verified against and its size and mtime at the time
+    manifest = loadJson(manifest_path)
+    changed = set()
+
+
+    def match_checksums(cfg_filepath, s3_meta):
+        stat = os.stat(cfg_filepath)
+
+        # A size mismatch is a mismatch, no need to hash
+        if stat.st_size != s3_meta['size']:
+            return False
+
+        # Only re-hash the file if it has changed since its checksum was last recorded
+        manifest_key = os.path.normpath(cfg_filepath)
+        entry = manifest.get(manifest_key)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            file_cksum = entry['etag']
         else:
-            fs_list = list(Path(dir).rglob("*.[yY][aA][mM][lL]"))
-            fs_files = [str(f).split('/')[-1] for f in fs_list]
-        s3_files = [v for v in config]
-
-        # Copy files from S3 that aren't on file system
-        for s3_file in list(set(s3_files) - set(fs_files)):
-            if dir.endswith('index.html') and s3_file == ('index.html'):  # avoid issues with index.html files
-                s3_file = ''
+            file_cksum = calculate_file_etag(cfg_filepath, s3_meta['etag'])
+            manifest[manifest_key] = {'etag': file_cksum, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+        return file_cksum == s3_meta['etag']
+
+    def recordLayer(cfg_filepath):
+        # Layer configs are named after their layer ID
+        if cfg_filepath.endswith('.yaml'):
+            changed.add(os.path.splitext(os.path.basename(cfg_filepath))[0])
+
+    def recordChange(cfg_filepath, etag=None, deleted=False):
+        if dry_run:
+            # Nothing is transferred in a dry run, so report what would have changed
+            recordLayer(cfg_filepath)
+            return None
+
+        def onChange(filepath):
+            recordLayer(cfg_filepath)
+            manifest_key = os.path.normpath(cfg_filepath)
+            if deleted:
+                manifest.pop(manifest_key, None)
+            elif etag is not None:
+                stat = os.stat(filepath)
+                manifest[manifest_key] = {'etag': etag, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        return onChange
+
+    with TransferEngine(s3, bucket, max_workers=workers, dry_run=dry_run) as engine:
+        for data, config in objects.items():
+            print(f'Loading configs from: {prefix}')
+
+            # Find existing files on file system
+            if force:  # we don't care about existing files when forcing overwrite
+                fs_files = []
             else:
-                s3_file = '/' + s3_file
+                fs_list = scanFiles(dir, ['.yaml'], max_workers=workers, sweep_temp=True, dry_run=dry_run)
+                fs_files = [os.path.basename(f) for f in fs_list]
+            s3_files = [v for v in config]
 
-            cfg_prefix = prefix + s3_file
-            cfg_filepath = dir + s3_file
+            # Copy files from S3 that aren't on file system or whose size or ETag don't match the S3 object
+            for s3_file in s3_files:
+                s3_meta = config[s3_file]
+                if dir.endswith('index.html') and s3_file == ('index.html'):  # avoid issues with index.html files
+                    cfg_file = ''
+                else:
+                    cfg_file = '/' + s3_file
 
-            sync_semaphore.acquire()
-            t = threading.Thread(target=copyObject, args=(cfg_prefix, cfg_filepath))
-            t.start()
-            sync_threads.append(t)
+                cfg_prefix = prefix + cfg_file
+                cfg_filepath = dir + cfg_file
 
+                # Only verify against the listing if it's the object being downloaded
+                if s3_meta['key'] == cfg_prefix:
+                    if not force and os.path.isfile(cfg_filepath) and match_checksums(cfg_filepath, s3_meta):
+                        continue
+                    engine.download(cfg_prefix, cfg_filepath, recordChange(cfg_filepath, s3_meta['etag']),
+                                    size=s3_meta['size'], etag=s3_meta['etag'])
+                elif s3_file not in fs_files:
+                    engine.download(cfg_prefix, cfg_filepath, recordChange(cfg_filepath))
 
-        # Delete files from file system that aren't on S3
-        for fs_file in list(set(fs_files) - set(s3_files)):
-            cfg_filepath = os.path.join(dir, fs_file)
 
-            sync_semaphore.acquire()
-            t = threading.Thread(target=deleteObject, args=(cfg_filepath,))
-            t.start()
-            sync_threads.append(t)
+            # Delete files from file system that aren't on S3
+            for fs_file in list(set(fs_files) - set(s3_files)):
+                cfg_filepath = os.path.join(dir, fs_file)
 
+                engine.delete(cfg_filepath, recordChange(cfg_filepath, deleted=True))
 
-    # Wait for all threads to complete
-    while len(sync_threads) > 0:
-        completed = []
-
-        for t in sync_threads:
-            if not t.is_alive():
-                completed.append(t)
-            else:
-                t.join(10)
+    if manifest_path is not None and not dry_run:
+        saveJson(manifest_path, manifest)
 
-        for t in completed:
-            sync_threads.remove(t)
+    if changed:
+        print("Changed layers: {0}".format(' '.join(sorted(changed))))
+    engine.counters['changed'] = sorted(changed)
+    return engine.counters
 
 
 # Routine when run from CLI
 
-parser = argparse.ArgumentParser(
-    description='Downloads OnEarth layer configurations from S3 bucket contents.')
-parser.add_argument(
-    '-b',
-    '--bucket',
-    default='gitc-dev-onearth-configs',
-    dest='bucket',
-    help='bucket name',
-    action='store')
-parser.add_argument(
-    '-d',
-    '--dir',
-    default='/etc/onearth/config',
-    dest='dir',
-    help='Directory on file system to sync',
-    action='store')
-parser.add_argument(
-    '-f',
-    '--force',
-    default=False,
-    dest='force',
-    help='Force update even if file exists',
-    action='store_true')
-parser.add_argument(
-    '-n',
-    '--dry-run',
-    default=False,
-    dest='dry_run',
-    help='Perform a trial run with no changes made',
-    action='store_true')
-parser.add_argument(
-    '-p',
-    '--prefix',
-    dest='prefix',
-    action='store',
-    default='',
-    help='S3 prefix to use')
-parser.add_argument(
-    '-s',
-    '--s3_uri',
-    dest='s3_uri',
-    action='store',
-    help='S3 URI -- for use with localstack testing')
-
-args = parser.parse_args()
-
-syncConfigs(args.bucket,
-            args.dir,
-            args.prefix,
-            args.force,
-            args.dry_run,
-            s3_uri=args.s3_uri)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Downloads OnEarth layer configurations from S3 bucket contents.')
+    parser.add_argument(
+        '-b',
+        '--bucket',
+        default='gitc-dev-onearth-configs',
+        dest='bucket',
+        help='bucket name',
+        action='store')
+    parser.add_argument(
+        '-d',
+        '--dir',
+        default='/etc/onearth/config',
+        dest='dir',
+        help='Directory on file system to sync',
+        action='store')
+    parser.add_argument(
+        '-f',
+        '--force',
+        default=False,
+        dest='force',
+        help='Force update even if file exists',
+        action='store_true')
+    parser.add_argument(
+        '-n',
+        '--dry-run',
+        default=False,
+        dest='dry_run',
+        help='Perform a trial run with no changes made',
+        action='store_true')
+    parser.add_argument(
+        '-p',
+        '--prefix',
+        dest='prefix',
+        action='store',
+        default='',
+        help='S3 prefix to use')
+    parser.add_argument(
+        '-s',
+        '--s3_uri',
+        dest='s3_uri',
+        action='store',
+        help='S3 URI -- for use with localstack testing')
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help='Number of concurrent S3 requests')
+    parser.add_argument(
+        '-m',
+        '--manifest',
+        dest='manifest',
+        action='store',
+        help='Local manifest of the synced files and their verified checksums, used to skip re-hashing unchanged files')
+    parser.add_argument(
+        '--changed',
+        dest='changed',
+        action='store',
+        help='File to write the IDs of the layers whose configs were downloaded or deleted to, one per line')
+
+    args = parser.parse_args()
+
+    counters = syncConfigs(args.bucket,
+                           args.dir,
+                           args.prefix,
+                           args.force,
+                           args.dry_run,
+                           s3_uri=args.s3_uri,
+                           workers=args.workers,
+                           manifest_path=args.manifest)
+
+    if args.changed is not None:
+        with open(args.changed, 'w') as f:
+            f.writelines(layer_id + '\n' for layer_id in counters['changed'])
\ No newline at end of file
@@ -15,16 +15,18 @@
 This script synchronizes IDX files inside S3 tar balls with those on a file system.
 Files on S3 will always act as the 'master' (i.e., files found on S3 that are not on the file system
 will be downloaded, while files found on the file system but not on S3 will be deleted).
-File modifications are not detected. Use --force to overwrite existing files.
+File modifications are not detected. Use --force to overwrite existing files, or --checksum to overwrite
+files whose size or ETag don't match the S3 object.
+With --events or --inventory-delta, only the listed changes are applied, with a full sync every --reconcile-interval.
+With --delta, existing files are updated by fetching only their changed blocks.
 """
 import os
-import boto3, botocore
+import time
+from bisect import bisect_left
 from functools import reduce
-from pathlib import Path
 import argparse
-import threading
-import re
-import hashlib
+from oe_s3_utils import BLOCK_MANIFEST_SUFFIX, DEFAULT_MAX_WORKERS, TransferEngine, calculate_file_etag, createClient, \
+                        inventoryDelta, listObjects, loadJson, readEvents, saveJson, scanFiles, sweepTempFiles
 
 
 def keyMapper(acc, obj):
@@ -52,68 +54,66 @@ def keyMapper(acc, obj):
                 acc[proj] = {}
 
             if not acc[proj].get(layer_name):
-                acc[proj][layer_name] = {'idx': set([])}
+                acc[proj][layer_name] = {'idx': {}, 'blocks': set()}
 
-            if filename.endswith('.idx'):
+            if filename.endswith('.idx' + BLOCK_MANIFEST_SUFFIX):
+                # The IDX file has a published block manifest, so it can be patched with --delta
                 idx = (year + '/' if year is not None else '') + (day + '/' if day is not None else '') + filename
-                acc[proj][layer_name]['idx'].add(idx)
+                acc[proj][layer_name]['blocks'].add(idx[:-len(BLOCK_MANIFEST_SUFFIX)])
+            elif filename.endswith('.idx'):
+                idx = (year + '/' if year is not None else '') + (day + '/' if day is not None else '') + filename
+                # Keep the listing metadata so checksum comparisons don't need a head_object per file
+                acc[proj][layer_name]['idx'][idx] = {'etag': obj['ETag'].replace('"', '').strip(),
+                                                     'size': obj['Size']}
 
     return acc
 
 
-# https://alexwlchan.net/2017/07/listing-s3-keys/
-def getAllKeys(conn, bucket, prefix):
-    keys = []
-    kwargs = {'Bucket': bucket, 'Prefix': prefix}
-
-    while True:
-        resp = conn.list_objects_v2(**kwargs)
-        keys = keys + (resp['Contents'] if 'Contents' in resp else [])
-
-        try:
-            kwargs['ContinuationToken'] = resp['NextContinuationToken']
-        except KeyError:
-            break
-    return keys
-
-
-def listAllFiles(dir_proj_layer, prefix):
+def listAllFiles(dir_proj_layer, prefix, workers=DEFAULT_MAX_WORKERS, dry_run=False):
     prefixElems = prefix.split("/") if prefix is not None else []
 
     # If there are 1 or 2 prefix elements, then we're not filtering the object year or "file" name, so take them all
     if len(prefixElems) <= 2:
-        fs_list = list(Path(dir_proj_layer).rglob("*.[iI][dD][xX]"))
+        return scanFiles(dir_proj_layer, ['.idx'], max_workers=workers, sweep_temp=True, dry_run=dry_run)
 
     # Else if there are 3 prefix elements, then we're filtering on the object year
     elif len(prefixElems) == 3:
-        fs_list = list(Path(os.path.join(dir_proj_layer, prefixElems[2])).rglob("*.[iI][dD][xX]"))
+        fs_list = scanFiles(os.path.join(dir_proj_layer, prefixElems[2]), ['.idx'], max_workers=workers,
+                            sweep_temp=True, dry_run=dry_run)
 
     # Else if there are 4 prefix elements, then we're filtering on the object year _and_ "file" name
-    elif len(prefixElems) == 4:
-        fs_list = list(Path(os.path.join(dir_proj_layer, prefixElems[2])).rglob(prefixElems[3] + "*.[iI][dD][xX]"))
-
-    return [str(f).replace(dir_proj_layer + '/', '') for f in fs_list]
-
-
-def calculate_s3_etag(file_path, chunk_size=8 * 1024 * 1024):
-    md5s = []
+    else:
+        fs_list = scanFiles(os.path.join(dir_proj_layer, prefixElems[2]), ['.idx'], prefixElems[3], max_workers=workers,
+                            sweep_temp=True, dry_run=dry_run)
 
-    with open(file_path, 'rb') as fp:
-        while True:
-            data = fp.read(chunk_size)
-            if not data:
-                break
-            md5s.append(hashlib.md5(data))
+    return [os.path.join(prefixElems[2], f) for f in fs_list]
 
-    if len(md5s) < 1:
-        return '"{}"'.format(hashlib.md5().hexdigest())
 
-    if len(md5s) == 1:
-        return '"{}"'.format(md5s[0].hexdigest())
-
-    digests = b''.join(m.digest() for m in md5s)
-    digests_md5 = hashlib.md5(digests)
-    return '"{}-{}"'.format(digests_md5.hexdigest(), len(md5s))
+def listManifestFiles(manifest_keys, layer_key, prefix):
+    # Same as listAllFiles, but from the sorted file paths of the manifest
+    prefixElems = prefix.split("/") if prefix is not None else []
+    layer_prefix = layer_key + '/'
+
+    fs_files = []
+    i = bisect_left(manifest_keys, layer_prefix)
+    while i < len(manifest_keys) and manifest_keys[i].startswith(layer_prefix):
+        fs_file = manifest_keys[i][len(layer_prefix):]
+        i += 1
+        if len(prefixElems) >= 3 and not fs_file.startswith(prefixElems[2] + '/'):
+            continue
+        if len(prefixElems) >= 4 and not os.path.basename(fs_file).startswith(prefixElems[3]):
+            continue
+        fs_files.append(fs_file)
+    return fs_files
+
+
+def loadManifest(manifest_path):
+    # The manifest maps each local file path to the ETag it was verified against and its size and mtime at the time.
+    # 'files' holds the local files and 'scanned' the layers whose files have all been recorded, with the time
+    manifest = loadJson(manifest_path)
+    if 'files' not in manifest:
+        manifest = {'files': manifest, 'scanned': {}}
+    return manifest
 
 
 def syncIdx(bucket,
@@ -122,207 +122,424 @@ def syncIdx(bucket,
             force,
             checksum,
             dry_run,
-            s3_uri=None):
-
-    session = boto3.session.Session()
-
-    aws_config = botocore.config.Config(
-        connect_timeout=10,
-        read_timeout=30,
-        max_pool_connections=10,
-        retries=dict(max_attempts=2))
-
-    s3 = session.client(service_name='s3', endpoint_url=s3_uri, config=aws_config)
+            s3_uri=None,
+            manifest_path=None,
+            workers=DEFAULT_MAX_WORKERS,
+            rescan=False,
+            s3=None,
+            listing=None,
+            delta=False):
+    # s3 and listing let oe_sync_s3.py share its client and bucket listing; returns the transfer counters
+
+    if s3 is None:
+        s3 = createClient(s3_uri, workers)
 
     if bucket.startswith('http'):
         bucket = bucket.split('/')[2].split('.')[0]
-    objects = reduce(keyMapper, getAllKeys(s3, bucket, prefix), {})
-
-    sync_threads    = []
-    sync_semaphore  = threading.BoundedSemaphore(10)
+    if listing is None:
+        # Shard the listing by projection/layer/year prefix
+        listing = listObjects(s3, bucket, prefix, shard_depth=3, max_workers=workers)
+    objects = reduce(keyMapper, listing, {})
+    manifest_data = loadManifest(manifest_path)
+    manifest = manifest_data['files']
+    manifest_keys = sorted(manifest)
+    prefixElems = prefix.split("/") if prefix is not None else []
 
 
-    def match_checksums(idx_prefix, idx_filepath):
-        response = s3.head_object(Bucket=bucket, Key=idx_prefix)
-        s3_cksum = response["ETag"].replace("\"","").strip()
 
-        m = re.match("[a-f0-9]*-([0-9]*)", s3_cksum)
-        if m:
-            bytesPerPart   = float(os.stat(idx_filepath).st_size) / float(m.group(1))
-            bytesChunkSize = bytesPerPart + 1048576.0 - (bytesPerPart % 1048576.0)
-            mbChunkSize    = int(bytesChunkSize / float(1024 *  1024))
+    def match_checksums(manifest_key, idx_filepath, s3_meta):
+        stat = os.stat(idx_filepath)
 
-            '''
-            print("Calculating multi-part checksum with " + m.group(1) + \
-                  " parts and " + str(mbChunkSize) + "MB chunk size for file of size " + \
-                  str(os.stat(idx_filepath).st_size) + " bytes")
-            '''
+        # A size mismatch is a mismatch, no need to hash
+        if stat.st_size != s3_meta['size']:
+            return False
 
-            file_cksum = calculate_s3_etag(idx_filepath, mbChunkSize * 1024 * 1024).replace("\"","").strip()
+        # Only re-hash the file if it has changed since its checksum was last recorded
+        entry = manifest.get(manifest_key)
+        if entry is not None and entry['etag'] is not None and entry['size'] == stat.st_size and \
+                entry['mtime'] == stat.st_mtime:
+            file_cksum = entry['etag']
         else:
-            with open(idx_filepath, 'rb') as idxFile:
-                file_cksum = hashlib.md5(idxFile.read()).hexdigest().replace("\"","").strip()
-
-        return file_cksum == s3_cksum
-
-    def copyObject(idx_prefix, idx_filepath):
-        try:
-            print("Downloading {0} to {1}".format(idx_prefix, idx_filepath))
-            if not dry_run:
-                s3.download_file(bucket, idx_prefix, idx_filepath)
-        except botocore.exceptions.ClientError as e:
-            print(e)
-        finally:
-            sync_semaphore.release()
-
+            file_cksum = calculate_file_etag(idx_filepath, s3_meta['etag'])
+            manifest[manifest_key] = {'etag': file_cksum, 'size': stat.st_size, 'mtime': stat.st_mtime}
 
-    def deleteObject(idx_filepath):
-        try:
-            if os.path.isfile(idx_filepath):
-                print("Deleting file not found on S3: {0}".format(idx_filepath))
-                if not dry_run:
-                    os.remove(idx_filepath)
-        finally:
-            sync_semaphore.release()
+        return file_cksum == s3_meta['etag']
 
+    def recordDownload(manifest_key, s3_meta):
+        def onDownload(idx_filepath):
+            stat = os.stat(idx_filepath)
+            manifest[manifest_key] = {'etag': s3_meta['etag'], 'size': stat.st_size, 'mtime': stat.st_mtime}
+        return onDownload
 
-    for proj, layers in objects.items():
-        print(f'Configuring projection: {proj}')
+    def recordDelete(manifest_key):
+        return lambda idx_filepath: manifest.pop(manifest_key, None)
 
-        dir_proj = os.path.join(dir, proj)
-        if not os.path.isdir(dir_proj) and not dry_run:
-            os.makedirs(dir_proj)
-
-        for layer, data in layers.items():
-            print(f'Configuring layer: {layer}')
-            dir_proj_layer = os.path.join(dir, proj, layer)
-
-            if not os.path.isdir(dir_proj_layer) and not dry_run:
-                os.makedirs(dir_proj_layer)
-
-            # Find existing files on file system
-            fs_files = listAllFiles(dir_proj_layer, prefix)
-
-            # Build list of S3 index files
-            s3_objects = [v for v in data['idx']]
-
-            # Determine what needs to be sync'd. Note we don't care about existing files when forcing overwrite
-            if force:
-                idx_to_sync = s3_objects
+    def fetch(engine, idx_prefix, idx_filepath, manifest_key, s3_meta, has_blocks):
+        # With --delta, existing files with a published block manifest only fetch their changed blocks
+        if delta and has_blocks and os.path.isfile(idx_filepath):
+            engine.patch(idx_prefix, idx_filepath, idx_prefix + BLOCK_MANIFEST_SUFFIX,
+                         recordDownload(manifest_key, s3_meta), size=s3_meta['size'], etag=s3_meta['etag'])
+        else:
+            engine.download(idx_prefix, idx_filepath, recordDownload(manifest_key, s3_meta),
+                            size=s3_meta['size'], etag=s3_meta['etag'])
+
+
+    with TransferEngine(s3, bucket, max_workers=workers, dry_run=dry_run) as engine:
+        for proj, layers in objects.items():
+            print(f'Configuring projection: {proj}')
+
+            dir_proj = os.path.join(dir, proj)
+            if not os.path.isdir(dir_proj) and not dry_run:
+                os.makedirs(dir_proj)
+
+            for layer, data in layers.items():
+                print(f'Configuring layer: {layer}')
+                dir_proj_layer = os.path.join(dir, proj, layer)
+
+                if not os.path.isdir(dir_proj_layer) and not dry_run:
+                    os.makedirs(dir_proj_layer)
+
+                # Find existing files on file system. Layers fully recorded in the manifest don't need to be walked
+                layer_key = os.path.join(proj, layer)
+                if manifest_path is not None and layer_key in manifest_data['scanned'] and not rescan:
+                    fs_files = listManifestFiles(manifest_keys, layer_key, prefix)
+                    # The layer isn't walked for its files, but interrupted downloads still need to be swept
+                    sweepTempFiles(dir_proj_layer, workers, dry_run)
+                else:
+                    scan_time = time.time()
+                    fs_files = listAllFiles(dir_proj_layer, prefix, workers, dry_run)
+                    if manifest_path is not None and len(prefixElems) <= 2:
+                        # Record the whole layer, dropping files that are no longer there
+                        found = set(os.path.join(layer_key, fs_file) for fs_file in fs_files)
+                        for fs_file in listManifestFiles(manifest_keys, layer_key, prefix):
+                            if os.path.join(layer_key, fs_file) not in found:
+                                manifest.pop(os.path.join(layer_key, fs_file), None)
+                        for manifest_key in found:
+                            manifest.setdefault(manifest_key, {'etag': None, 'size': None, 'mtime': None})
+                        manifest_data['scanned'][layer_key] = scan_time
+
+                # Build list of S3 index files
+                s3_objects = list(data['idx'])
+
+                # Determine what needs to be sync'd. Note we don't care about existing files when forcing overwrite
+                if force:
+                    idx_to_sync = s3_objects
+                else:
+                    idx_to_sync = list(set(s3_objects) - set(fs_files))
+
+                idx_to_delete = list(set(fs_files) - set(s3_objects))
+
+                # Copy files from S3 that aren't on file system
+                for s3_object in idx_to_sync:
+                    idx_filepath = os.path.join(dir_proj_layer, s3_object)
+                    idx_prefix = "{0}/{1}/{2}".format(proj, layer, s3_object).replace('//', '/')
+                    manifest_key = os.path.join(proj, layer, s3_object)
+
+                    idx_filedir = os.path.dirname(idx_filepath)
+                    if not os.path.isdir(idx_filedir) and not dry_run:
+                        os.makedirs(idx_filedir)
+
+                    fetch(engine, idx_prefix, idx_filepath, manifest_key, data['idx'][s3_object],
+                          s3_object in data['blocks'])
+
+                # Delete files from file system that aren't on S3
+                for fs_file in idx_to_delete:
+                    idx_filepath = os.path.join(dir_proj_layer, fs_file)
+                    manifest_key = os.path.join(proj, layer, fs_file)
+
+                    engine.delete(idx_filepath, recordDelete(manifest_key))
+
+                # Evaluate checksum of non-deleted index files already on disk against S3 object, if not forcing and
+                # user has requested checksum comparison
+                if not force and checksum:
+                    for fs_file in list(set(fs_files) - set(idx_to_delete)):
+                        idx_filepath = os.path.join(dir_proj_layer, fs_file)
+                        idx_prefix = "{0}/{1}/{2}".format(proj, layer, fs_file).replace('//', '/')
+                        manifest_key = os.path.join(proj, layer, fs_file)
+
+                        s3_meta = data['idx'][fs_file]
+                        if not os.path.isfile(idx_filepath) or not match_checksums(manifest_key, idx_filepath, s3_meta):
+                            fetch(engine, idx_prefix, idx_filepath, manifest_key, s3_meta, fs_file in data['blocks'])
+
+    if manifest_path is not None and not dry_run:
+        saveJson(manifest_path, manifest_data)
+
+    return engine.counters
+
+
+def applyIdxChanges(s3,
+                    bucket,
+                    dir,
+                    prefix,
+                    changes,
+                    dry_run,
+                    manifest_path=None,
+                    workers=DEFAULT_MAX_WORKERS,
+                    delta=False):
+    # Changes map each S3 key to its new size and ETag, or to None if it was deleted
+    manifest_data = loadManifest(manifest_path)
+    manifest = manifest_data['files']
+
+    def recordDownload(manifest_key, etag):
+        def onDownload(idx_filepath):
+            stat = os.stat(idx_filepath)
+            manifest[manifest_key] = {'etag': etag, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        return onDownload
+
+    def recordDelete(manifest_key):
+        return lambda idx_filepath: manifest.pop(manifest_key, None)
+
+    with TransferEngine(s3, bucket, max_workers=workers, dry_run=dry_run) as engine:
+        for key, change in changes.items():
+            # Same layout as keyMapper: projection/layer/[year/][day/]file.idx
+            if not key.startswith(prefix) or not key.endswith('.idx') or len(key.split('/')) < 3:
+                continue
+
+            idx_filepath = os.path.join(dir, *key.split('/'))
+            manifest_key = os.path.relpath(idx_filepath, dir)
+
+            if change is None:
+                engine.delete(idx_filepath, recordDelete(manifest_key))
             else:
-                idx_to_sync = list(set(s3_objects) - set(fs_files))
-
-            idx_to_delete = list(set(fs_files) - set(s3_objects))
-
-            # Copy files from S3 that aren't on file system
-            for s3_object in idx_to_sync:
-                idx_filepath = os.path.join(dir_proj_layer, s3_object)
-                idx_prefix = "{0}/{1}/{2}".format(proj, layer, s3_object).replace('//', '/')
-
                 idx_filedir = os.path.dirname(idx_filepath)
                 if not os.path.isdir(idx_filedir) and not dry_run:
                     os.makedirs(idx_filedir)
 
-                sync_semaphore.acquire()
-                t = threading.Thread(target=copyObject, args=(idx_prefix, idx_filepath))
-                t.start()
-                sync_threads.append(t)
+                etag = change['etag'].replace('"', '').strip() if change['etag'] else None
+                if delta and etag is not None and os.path.isfile(idx_filepath):
+                    # Falls back to a full download if no block manifest has been published. Inventory deltas don't
+                    # carry ETags, so their files are always downloaded in full
+                    engine.patch(key, idx_filepath, key + BLOCK_MANIFEST_SUFFIX, recordDownload(manifest_key, etag),
+                                 size=change['size'], etag=etag)
+                else:
+                    engine.download(key, idx_filepath, recordDownload(manifest_key, etag),
+                                    size=change['size'], etag=etag)
+
+    if manifest_path is not None and not dry_run:
+        saveJson(manifest_path, manifest_data)
+
+
+def syncIdxIncremental(bucket,
+                       dir,
+                       prefix,
+                       checksum,
+                       dry_run,
+                       s3_uri=None,
+                       manifest_path=None,
+                       workers=DEFAULT_MAX_WORKERS,
+                       events_path=None,
+                       inventory_delta=None,
+                       state_path=None,
+                       reconcile_interval=86400,
+                       follow=False,
+                       poll_interval=5,
+                       delta=False):
+
+    s3 = createClient(s3_uri, workers)
 
-            # Delete files from file system that aren't on S3
-            for fs_file in idx_to_delete:
-                idx_filepath = os.path.join(dir_proj_layer, fs_file)
-
-                sync_semaphore.acquire()
-                t = threading.Thread(target=deleteObject, args=(idx_filepath,))
-                t.start()
-                sync_threads.append(t)
-
-            # Evaluate checksum of non-deleted index files already on disk against S3 object, if not forcing and
-            # user has requested checksum comparison
-            if not force and checksum:
-                for fs_file in list(set(fs_files) - set(idx_to_delete)):
-                    idx_filepath = os.path.join(dir_proj_layer, fs_file)
-                    idx_prefix = "{0}/{1}/{2}".format(proj, layer, fs_file).replace('//', '/')
+    if bucket.startswith('http'):
+        bucket = bucket.split('/')[2].split('.')[0]
 
-                    if not match_checksums(idx_prefix, idx_filepath):
-                        sync_semaphore.acquire()
-                        t = threading.Thread(target=copyObject, args=(idx_prefix, idx_filepath))
-                        t.start()
-                        sync_threads.append(t)
+    # The state records how far the events file has been applied and when the last full sync ran
+    if state_path is None:
+        state_path = (events_path or inventory_delta[1]) + '.state'
 
-    # Wait for all threads to complete
-    while len(sync_threads) > 0:
-        completed = []
+    # Latest event sequencer of each key, so notifications that arrive late don't undo newer changes
+    sequencers = {}
+    # Each pair of inventories is only applied once
+    inventory = [os.path.abspath(path) for path in inventory_delta] if inventory_delta is not None else None
 
-        for t in sync_threads:
-            if not t.is_alive():
-                completed.append(t)
+    while True:
+        state = loadJson(state_path) or {'offset': 0, 'last_reconcile': 0}
+        start_time = time.time()
+
+        if start_time - state['last_reconcile'] >= reconcile_interval:
+            print("Running full reconciliation")
+            # Events received from here on are applied after the full sync
+            end_offset = os.path.getsize(events_path) if events_path and os.path.isfile(events_path) else 0
+            syncIdx(bucket, dir, prefix, False, checksum, dry_run, s3_uri=s3_uri, manifest_path=manifest_path,
+                    workers=workers, rescan=True, s3=s3, delta=delta)
+            state = {'offset': end_offset, 'last_reconcile': start_time, 'inventory': inventory}
+            sequencers.clear()
+        elif events_path is not None:
+            if not os.path.isfile(events_path) or os.path.getsize(events_path) < state['offset']:
+                # The events file has been rotated
+                state['offset'] = 0
+            if os.path.isfile(events_path):
+                changes, state['offset'] = readEvents(events_path, state['offset'], sequencers)
+                if changes:
+                    print("Applying {0} changes from {1}".format(len(changes), events_path))
+                    applyIdxChanges(s3, bucket, dir, prefix, changes, dry_run, manifest_path, workers, delta)
+        else:
+            if state.get('inventory') == inventory:
+                print("Changes from {0} have already been applied".format(inventory_delta[1]))
             else:
-                t.join(10)
+                changes = inventoryDelta(*inventory_delta)
+                print("Applying {0} changes from {1}".format(len(changes), inventory_delta[1]))
+                applyIdxChanges(s3, bucket, dir, prefix, changes, dry_run, manifest_path, workers, delta)
+                state['inventory'] = inventory
 
-        for t in completed:
-            sync_threads.remove(t)
+        if not dry_run:
+            saveJson(state_path, state)
+
+        if not follow:
+            break
+        time.sleep(poll_interval)
 
 
 # Routine when run from CLI
 
-parser = argparse.ArgumentParser(
-    description='Rebuilds IDX files on system from S3 bucket contents.')
-parser.add_argument(
-    '-b',
-    '--bucket',
-    default='gitc-deployment-mrf-archive',
-    dest='bucket',
-    help='bucket name',
-    action='store')
-parser.add_argument(
-    '-d',
-    '--dir',
-    default='/onearth/idx',
-    dest='dir',
-    help='Directory on file system to sync',
-    action='store')
-parser.add_argument(
-    '-f',
-    '--force',
-    default=False,
-    dest='force',
-    help='Force update even if file exists',
-    action='store_true')
-parser.add_argument(
-    '-c',
-    '--checksum',
-    default=False,
-    dest='checksum',
-    help='Evaluate checksum of local file against s3 object and update even mismatched',
-    action='store_true')
-parser.add_argument(
-    '-n',
-    '--dry-run',
-    default=False,
-    dest='dry_run',
-    help='Perform a trial run with no changes made',
-    action='store_true')
-parser.add_argument(
-    '-p',
-    '--prefix',
-    dest='prefix',
-    action='store',
-    default='',
-    help='S3 prefix to use')
-parser.add_argument(
-    '-s',
-    '--s3_uri',
-    dest='s3_uri',
-    action='store',
-    help='S3 URI -- for use with localstack testing')
-
-args = parser.parse_args()
-
-syncIdx(args.bucket,
-        args.dir,
-        args.prefix,
-        args.force,
-        args.checksum,
-        args.dry_run,
-        s3_uri=args.s3_uri)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Rebuilds IDX files on system from S3 bucket contents.')
+    parser.add_argument(
+        '-b',
+        '--bucket',
+        default='gitc-deployment-mrf-archive',
+        dest='bucket',
+        help='bucket name',
+        action='store')
+    parser.add_argument(
+        '-d',
+        '--dir',
+        default='/onearth/idx',
+        dest='dir',
+        help='Directory on file system to sync',
+        action='store')
+    parser.add_argument(
+        '-f',
+        '--force',
+        default=False,
+        dest='force',
+        help='Force update even if file exists',
+        action='store_true')
+    parser.add_argument(
+        '-c',
+        '--checksum',
+        default=False,
+        dest='checksum',
+        help='Evaluate checksum of local file against s3 object and update even mismatched',
+        action='store_true')
+    parser.add_argument(
+        '-n',
+        '--dry-run',
+        default=False,
+        dest='dry_run',
+        help='Perform a trial run with no changes made',
+        action='store_true')
+    parser.add_argument(
+        '-p',
+        '--prefix',
+        dest='prefix',
+        action='store',
+        default='',
+        help='S3 prefix to use')
+    parser.add_argument(
+        '-s',
+        '--s3_uri',
+        dest='s3_uri',
+        action='store',
+        help='S3 URI -- for use with localstack testing')
+    parser.add_argument(
+        '-m',
+        '--manifest',
+        dest='manifest',
+        action='store',
+        help='Local manifest of the synced files and their verified checksums, used to skip re-hashing unchanged files '
+             'with --checksum and walking the file system for layers it has recorded')
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help='Number of concurrent S3 requests')
+    parser.add_argument(
+        '-r',
+        '--rescan',
+        default=False,
+        dest='rescan',
+        help='Walk the file system even for layers whose files are recorded in the manifest',
+        action='store_true')
+    parser.add_argument(
+        '-e',
+        '--events',
+        dest='events',
+        action='store',
+        help='Newline-delimited JSON file of S3 event notifications to apply instead of a full sync')
+    parser.add_argument(
+        '-i',
+        '--inventory-delta',
+        dest='inventory_delta',
+        action='store',
+        nargs=2,
+        metavar=('PREVIOUS', 'LATEST'),
+        help='Apply the differences between two S3 Inventory CSV files instead of a full sync')
+    parser.add_argument(
+        '--state',
+        dest='state',
+        action='store',
+        help='State file of the incremental sync (default: the events or latest inventory file + .state)')
+    parser.add_argument(
+        '--reconcile-interval',
+        dest='reconcile_interval',
+        action='store',
+        type=int,
+        default=86400,
+        help='Seconds between full syncs when applying events or inventory deltas')
+    parser.add_argument(
+        '--follow',
+        default=False,
+        dest='follow',
+        help='Keep applying new events as they are appended to the events file (not with --inventory-delta)',
+        action='store_true')
+    parser.add_argument(
+        '--poll-interval',
+        dest='poll_interval',
+        action='store',
+        type=float,
+        default=5,
+        help='Seconds between checks for new events with --follow')
+    parser.add_argument(
+        '-D',
+        '--delta',
+        default=False,
+        dest='delta',
+        help='Update existing files by fetching only the blocks that differ from the block manifest (.idx.blocks) '
+             'published alongside them',
+        action='store_true')
+
+    args = parser.parse_args()
+
+    if args.follow and args.inventory_delta is not None:
+        parser.error('--follow only applies to --events; run --inventory-delta again for each new inventory')
+
+    if args.events is not None or args.inventory_delta is not None:
+        syncIdxIncremental(args.bucket,
+                           args.dir,
+                           args.prefix,
+                           args.checksum,
+                           args.dry_run,
+                           s3_uri=args.s3_uri,
+                           manifest_path=args.manifest,
+                           workers=args.workers,
+                           events_path=args.events,
+                           inventory_delta=args.inventory_delta,
+                           state_path=args.state,
+                           reconcile_interval=args.reconcile_interval,
+                           follow=args.follow,
+                           poll_interval=args.poll_interval,
+                           delta=args.delta)
+    else:
+        syncIdx(args.bucket,
+                args.dir,
+                args.prefix,
+                args.force,
+                args.checksum,
+                args.dry_run,
+                s3_uri=args.s3_uri,
+                manifest_path=args.manifest,
+                workers=args.workers,
+                rescan=args.rescan,
+                delta=args.delta)
\ No newline at end of file
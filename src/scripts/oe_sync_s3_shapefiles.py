@@ -18,13 +18,10 @@ will be downloaded, while files found on the file system but not on S3 will be d
 File modifications are not detected. Use --force to overwrite existing files.
 """
 import os
-import boto3, botocore
 from functools import reduce
-from pathlib import Path
 import argparse
-import threading
-import re
-import hashlib
+from oe_s3_utils import DEFAULT_MAX_WORKERS, TransferEngine, calculate_file_etag, createClient, listObjects, \
+                        scanFiles
 
 
 def keyMapper(acc, obj):
@@ -52,75 +49,38 @@ def keyMapper(acc, obj):
                 acc[proj] = {}
 
             if not acc[proj].get(layer_name):
-                acc[proj][layer_name] = {'shapefile': set([])}
+                acc[proj][layer_name] = {'shapefile': {}}
 
             # works with all the possible components of a shapefile
             ext = ['.shp', '.dbf', '.shx', '.prj', '.qix']
             if filename.endswith(tuple(ext)):
                 shapefile = (year + '/' if year is not None else '') + (day + '/' if day is not None else '') + filename
-                acc[proj][layer_name]['shapefile'].add(shapefile)
+                acc[proj][layer_name]['shapefile'][shapefile] = {'etag': obj['ETag'].replace('"', '').strip(),
+                                                                 'size': obj['Size']}
 
     return acc
 
 
-# https://alexwlchan.net/2017/07/listing-s3-keys/
-def getAllKeys(conn, bucket, prefix):
-    keys = []
-    kwargs = {'Bucket': bucket, 'Prefix': prefix}
-
-    while True:
-        resp = conn.list_objects_v2(**kwargs)
-        keys = keys + (resp['Contents'] if 'Contents' in resp else [])
-
-        try:
-            kwargs['ContinuationToken'] = resp['NextContinuationToken']
-        except KeyError:
-            break
-    return keys
-
-
-def listAllFiles(dir_proj_layer, prefix):
+def listAllFiles(dir_proj_layer, prefix, workers=DEFAULT_MAX_WORKERS, dry_run=False):
     prefixElems = prefix.split("/") if prefix is not None else []
-    ext_patterns = ["*.[sS][hH][pPxX]", "*.[dD][bB][fF]", "*.[pP][rR][jJ]", "*.[qQ][iI][xX]"]
-    fs_list = []
+    # works with all the possible components of a shapefile
+    ext = ['.shp', '.shx', '.dbf', '.prj', '.qix']
 
     # If there are 1 or 2 prefix elements, then we're not filtering the object year or "file" name, so take them all
-    if len(prefixElems) <= 2:    
-        for ext_pattern in ext_patterns:
-            fs_list += list(Path(dir_proj_layer).rglob(ext_pattern))
+    if len(prefixElems) <= 2:
+        return scanFiles(dir_proj_layer, ext, max_workers=workers, sweep_temp=True, dry_run=dry_run)
 
     # Else if there are 3 prefix elements, then we're filtering on the object year
     elif len(prefixElems) == 3:
-        for ext_pattern in ext_patterns:
-            fs_list += list(Path(os.path.join(dir_proj_layer, prefixElems[2])).rglob(ext_pattern))
+        fs_list = scanFiles(os.path.join(dir_proj_layer, prefixElems[2]), ext, max_workers=workers,
+                            sweep_temp=True, dry_run=dry_run)
 
     # Else if there are 4 prefix elements, then we're filtering on the object year _and_ "file" name
-    elif len(prefixElems) == 4:
-        for ext_pattern in ext_patterns:
-            fs_list += list(Path(os.path.join(dir_proj_layer, prefixElems[2])).rglob(prefixElems[3] + ext_pattern))
-
-    return [str(f).replace(dir_proj_layer + '/', '') for f in fs_list]
-
-
-def calculate_s3_etag(file_path, chunk_size=8 * 1024 * 1024):
-    md5s = []
+    else:
+        fs_list = scanFiles(os.path.join(dir_proj_layer, prefixElems[2]), ext, prefixElems[3], max_workers=workers,
+                            sweep_temp=True, dry_run=dry_run)
 
-    with open(file_path, 'rb') as fp:
-        while True:
-            data = fp.read(chunk_size)
-            if not data:
-                break
-            md5s.append(hashlib.md5(data))
-
-    if len(md5s) < 1:
-        return '"{}"'.format(hashlib.md5().hexdigest())
-
-    if len(md5s) == 1:
-        return '"{}"'.format(md5s[0].hexdigest())
-
-    digests = b''.join(m.digest() for m in md5s)
-    digests_md5 = hashlib.md5(digests)
-    return '"{}-{}"'.format(digests_md5.hexdigest(), len(md5s))
+    return [os.path.join(prefixElems[2], f) for f in fs_list]
 
 
 def syncShapefile(bucket,
@@ -129,207 +89,159 @@ def syncShapefile(bucket,
             force,
             checksum,
             dry_run,
-            s3_uri=None):
+            s3_uri=None,
+            workers=DEFAULT_MAX_WORKERS,
+            s3=None,
+            listing=None):
+    # s3 and listing let oe_sync_s3.py share its client and bucket listing; returns the transfer counters
 
-    session = boto3.session.Session()
-
-    aws_config = botocore.config.Config(
-        connect_timeout=10,
-        read_timeout=30,
-        max_pool_connections=10,
-        retries=dict(max_attempts=2))
-
-    s3 = session.client(service_name='s3', endpoint_url=s3_uri, config=aws_config)
+    if s3 is None:
+        s3 = createClient(s3_uri, workers)
 
     if bucket.startswith('http'):
         bucket = bucket.split('/')[2].split('.')[0]
-    objects = reduce(keyMapper, getAllKeys(s3, bucket, prefix), {})
-
-    sync_threads    = []
-    sync_semaphore  = threading.BoundedSemaphore(10)
+    if listing is None:
+        # Shard the listing by projection/layer/year prefix
+        listing = listObjects(s3, bucket, prefix, shard_depth=3, max_workers=workers)
+    objects = reduce(keyMapper, listing, {})
 
 
-    def match_checksums(shapefile_prefix, shapefile_filepath):
-        response = s3.head_object(Bucket=bucket, Key=shapefile_prefix)
-        s3_cksum = response["ETag"].replace("\"","").strip()
+    def match_checksums(shapefile_filepath, s3_meta):
+        if os.stat(shapefile_filepath).st_size != s3_meta['size']:
+            return False
+        return calculate_file_etag(shapefile_filepath, s3_meta['etag']) == s3_meta['etag']
 
-        m = re.match("[a-f0-9]*-([0-9]*)", s3_cksum)
-        if m:
-            bytesPerPart   = float(os.stat(shapefile_filepath).st_size) / float(m.group(1))
-            bytesChunkSize = bytesPerPart + 1048576.0 - (bytesPerPart % 1048576.0)
-            mbChunkSize    = int(bytesChunkSize / float(1024 *  1024))
+    with TransferEngine(s3, bucket, max_workers=workers, dry_run=dry_run) as engine:
+        for proj, layers in objects.items():
+            print(f'Configuring projection: {proj}')
 
-            '''
-            print("Calculating multi-part checksum with " + m.group(1) + \
-                  " parts and " + str(mbChunkSize) + "MB chunk size for file of size " + \
-                  str(os.stat(shapefile_filepath).st_size) + " bytes")
-            '''
-
-            file_cksum = calculate_s3_etag(shapefile_filepath, mbChunkSize * 1024 * 1024).replace("\"","").strip()
-        else:
-            with open(shapefile_filepath, 'rb') as shapefileFile:
-                file_cksum = hashlib.md5(shapefileFile.read()).hexdigest().replace("\"","").strip()
-
-        return file_cksum == s3_cksum
-
-    def copyObject(shapefile_prefix, shapefile_filepath):
-        try:
-            print("Downloading {0} to {1}".format(shapefile_prefix, shapefile_filepath))
-            if not dry_run:
-                s3.download_file(bucket, shapefile_prefix, shapefile_filepath)
-        except botocore.exceptions.ClientError as e:
-            print(e)
-        finally:
-            sync_semaphore.release()
+            dir_proj = os.path.join(dir, proj)
+            if not os.path.isdir(dir_proj) and not dry_run:
+                os.makedirs(dir_proj)
 
+            for layer, data in layers.items():
+                print(f'Configuring layer: {layer}')
+                dir_proj_layer = os.path.join(dir, proj, layer)
 
-    def deleteObject(shapefile_filepath):
-        try:
-            if os.path.isfile(shapefile_filepath):
-                print("Deleting file not found on S3: {0}".format(shapefile_filepath))
-                if not dry_run:
-                    os.remove(shapefile_filepath)
-        finally:
-            sync_semaphore.release()
+                if not os.path.isdir(dir_proj_layer) and not dry_run:
+                    os.makedirs(dir_proj_layer)
 
+                # Find existing files on file system
+                fs_files = listAllFiles(dir_proj_layer, prefix, workers, dry_run)
 
-    for proj, layers in objects.items():
-        print(f'Configuring projection: {proj}')
+                # Build list of S3 index files
+                s3_objects = [v for v in data['shapefile']]
 
-        dir_proj = os.path.join(dir, proj)
-        if not os.path.isdir(dir_proj) and not dry_run:
-            os.makedirs(dir_proj)
+                # Determine what needs to be sync'd. Note we don't care about existing files when forcing overwrite
+                if force:
+                    shapefiles_to_sync = s3_objects
+                else:
+                    shapefiles_to_sync = list(set(s3_objects) - set(fs_files))
 
-        for layer, data in layers.items():
-            print(f'Configuring layer: {layer}')
-            dir_proj_layer = os.path.join(dir, proj, layer)
+                shapefiles_to_delete = list(set(fs_files) - set(s3_objects))
 
-            if not os.path.isdir(dir_proj_layer) and not dry_run:
-                os.makedirs(dir_proj_layer)
+                # Copy files from S3 that aren't on file system
+                for s3_object in shapefiles_to_sync:
+                    shapefile_filepath = os.path.join(dir_proj_layer, s3_object)
+                    shapefile_prefix = "{0}/{1}/{2}".format(proj, layer, s3_object).replace('//', '/')
 
-            # Find existing files on file system
-            fs_files = listAllFiles(dir_proj_layer, prefix)
-
-            # Build list of S3 index files
-            s3_objects = [v for v in data['shapefile']]
-
-            # Determine what needs to be sync'd. Note we don't care about existing files when forcing overwrite
-            if force:
-                shapefiles_to_sync = s3_objects
-            else:
-                shapefiles_to_sync = list(set(s3_objects) - set(fs_files))
+                    shapefile_filedir = os.path.dirname(shapefile_filepath)
+                    if not os.path.isdir(shapefile_filedir) and not dry_run:
+                        os.makedirs(shapefile_filedir)
 
-            shapefiles_to_delete = list(set(fs_files) - set(s3_objects))
+                    s3_meta = data['shapefile'][s3_object]
+                    engine.download(shapefile_prefix, shapefile_filepath, size=s3_meta['size'], etag=s3_meta['etag'])
 
-            # Copy files from S3 that aren't on file system
-            for s3_object in shapefiles_to_sync:
-                shapefile_filepath = os.path.join(dir_proj_layer, s3_object)
-                shapefile_prefix = "{0}/{1}/{2}".format(proj, layer, s3_object).replace('//', '/')
-
-                shapefile_filedir = os.path.dirname(shapefile_filepath)
-                if not os.path.isdir(shapefile_filedir) and not dry_run:
-                    os.makedirs(shapefile_filedir)
-
-                sync_semaphore.acquire()
-                t = threading.Thread(target=copyObject, args=(shapefile_prefix, shapefile_filepath))
-                t.start()
-                sync_threads.append(t)
-
-            # Delete files from file system that aren't on S3
-            for fs_file in shapefiles_to_delete:
-                shapefile_filepath = os.path.join(dir_proj_layer, fs_file)
-
-                sync_semaphore.acquire()
-                t = threading.Thread(target=deleteObject, args=(shapefile_filepath,))
-                t.start()
-                sync_threads.append(t)
-
-            # Evaluate checksum of non-deleted index files already on disk against S3 object, if not forcing and
-            # user has requested checksum comparison
-            if not force and checksum:
-                for fs_file in list(set(fs_files) - set(shapefiles_to_delete)):
+                # Delete files from file system that aren't on S3
+                for fs_file in shapefiles_to_delete:
                     shapefile_filepath = os.path.join(dir_proj_layer, fs_file)
-                    shapefile_prefix = "{0}/{1}/{2}".format(proj, layer, fs_file).replace('//', '/')
 
-                    if not match_checksums(shapefile_prefix, shapefile_filepath):
-                        sync_semaphore.acquire()
-                        t = threading.Thread(target=copyObject, args=(shapefile_prefix, shapefile_filepath))
-                        t.start()
-                        sync_threads.append(t)
+                    engine.delete(shapefile_filepath)
 
-    # Wait for all threads to complete
-    while len(sync_threads) > 0:
-        completed = []
+                # Evaluate checksum of non-deleted index files already on disk against S3 object, if not forcing and
+                # user has requested checksum comparison
+                if not force and checksum:
+                    for fs_file in list(set(fs_files) - set(shapefiles_to_delete)):
+                        shapefile_filepath = os.path.join(dir_proj_layer, fs_file)
+                        shapefile_prefix = "{0}/{1}/{2}".format(proj, layer, fs_file).replace('//', '/')
 
-        for t in sync_threads:
-            if not t.is_alive():
-                completed.append(t)
-            else:
-                t.join(10)
+                        s3_meta = data['shapefile'][fs_file]
+                        if not match_checksums(shapefile_filepath, s3_meta):
+                            engine.download(shapefile_prefix, shapefile_filepath, size=s3_meta['size'],
+                                            etag=s3_meta['etag'])
 
-        for t in completed:
-            sync_threads.remove(t)
+    return engine.counters
 
 
 # Routine when run from CLI
 
-parser = argparse.ArgumentParser(
-    description='Rebuilds shapefiles on system from S3 bucket contents.')
-parser.add_argument(
-    '-b',
-    '--bucket',
-    default='gitc-deployment-shapefile-archive',
-    dest='bucket',
-    help='bucket name',
-    action='store')
-parser.add_argument(
-    '-d',
-    '--dir',
-    default='/onearth/shapefiles',
-    dest='dir',
-    help='Directory on file system to sync',
-    action='store')
-parser.add_argument(
-    '-f',
-    '--force',
-    default=False,
-    dest='force',
-    help='Force update even if file exists',
-    action='store_true')
-parser.add_argument(
-    '-c',
-    '--checksum',
-    default=False,
-    dest='checksum',
-    help='Evaluate checksum of local file against s3 object and update even mismatched',
-    action='store_true')
-parser.add_argument(
-    '-n',
-    '--dry-run',
-    default=False,
-    dest='dry_run',
-    help='Perform a trial run with no changes made',
-    action='store_true')
-parser.add_argument(
-    '-p',
-    '--prefix',
-    dest='prefix',
-    action='store',
-    default='',
-    help='S3 prefix to use')
-parser.add_argument(
-    '-s',
-    '--s3_uri',
-    dest='s3_uri',
-    action='store',
-    help='S3 URI -- for use with localstack testing')
-
-args = parser.parse_args()
-
-syncShapefile(args.bucket,
-        args.dir,
-        args.prefix,
-        args.force,
-        args.checksum,
-        args.dry_run,
-        s3_uri=args.s3_uri)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Rebuilds shapefiles on system from S3 bucket contents.')
+    parser.add_argument(
+        '-b',
+        '--bucket',
+        default='gitc-deployment-shapefile-archive',
+        dest='bucket',
+        help='bucket name',
+        action='store')
+    parser.add_argument(
+        '-d',
+        '--dir',
+        default='/onearth/shapefiles',
+        dest='dir',
+        help='Directory on file system to sync',
+        action='store')
+    parser.add_argument(
+        '-f',
+        '--force',
+        default=False,
+        dest='force',
+        help='Force update even if file exists',
+        action='store_true')
+    parser.add_argument(
+        '-c',
+        '--checksum',
+        default=False,
+        dest='checksum',
+        help='Evaluate checksum of local file against s3 object and update even mismatched',
+        action='store_true')
+    parser.add_argument(
+        '-n',
+        '--dry-run',
+        default=False,
+        dest='dry_run',
+        help='Perform a trial run with no changes made',
+        action='store_true')
+    parser.add_argument(
+        '-p',
+        '--prefix',
+        dest='prefix',
+        action='store',
+        default='',
+        help='S3 prefix to use')
+    parser.add_argument(
+        '-s',
+        '--s3_uri',
+        dest='s3_uri',
+        action='store',
+        help='S3 URI -- for use with localstack testing')
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help='Number of concurrent S3 requests')
+
+    args = parser.parse_args()
+
+    syncShapefile(args.bucket,
+            args.dir,
+            args.prefix,
+            args.force,
+            args.checksum,
+            args.dry_run,
+            s3_uri=args.s3_uri,
+            workers=args.workers)
\ No newline at end of file
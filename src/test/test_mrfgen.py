@@ -25,6 +25,8 @@ import filecmp
 import shutil
 import datetime
 import sqlite3
+import json
+import numpy as np
 from osgeo import gdal
 from optparse import OptionParser
 from io import StringIO
@@ -2082,6 +2084,364 @@ class TestMRFGeneration_Angstrom_Exponent(unittest.TestCase):
             print("Leaving test results in : " + self.staging_area)
 
 
+class TestMRFGeneration_batch(unittest.TestCase):
+
+    def setUp(self):
+        testdata_path = os.path.join(os.getcwd(), 'mrfgen_files')
+        self.staging_area = os.path.join(os.getcwd(), 'mrfgen_test_data')
+        test_config = os.path.join(testdata_path, "mrfgen_test_config1a.xml")
+
+        # Make empty dirs for mrfgen output, one output_dir per batch configuration
+        mrfgen_dirs = ('input_dir', 'output_dir_a', 'output_dir_b', 'working_dir', 'logfile_dir')
+        [make_dir_tree(os.path.join(self.staging_area, path)) for path in mrfgen_dirs]
+
+        # Copy empty output tile
+        shutil.copytree(os.path.join(testdata_path, 'empty_tiles'), os.path.join(self.staging_area, 'empty_tiles'))
+
+        with open(test_config, 'r') as f:
+            config = f.read()
+        self.batch_configs = []
+        for suffix in ('a', 'b'):
+            batch_config = os.path.join(self.staging_area, "mrfgen_batch_config_" + suffix + ".xml")
+            with open(batch_config, 'w') as f:
+                f.write(config.replace('mrfgen_test_data/output_dir', 'mrfgen_test_data/output_dir_' + suffix))
+            self.batch_configs.append(batch_config)
+
+        self.output_mrfs = [os.path.join(self.staging_area, "output_dir_" + suffix + "/MYR4ODLOLLDY2014277_.mrf")
+                            for suffix in ('a', 'b')]
+        self.report = os.path.join(self.staging_area, "mrfgen_batch_report.json")
+
+        # generate MRFs
+        run_command("mrfgen_batch -j 2 -r " + self.report + " " + " ".join(self.batch_configs), show_output=DEBUG)
+
+    def test_generate_mrf_batch(self):
+        # Check MRF generation succeeded for every configuration
+        for output_mrf in self.output_mrfs:
+            self.assertTrue(os.path.isfile(output_mrf), "MRF generation failed for " + output_mrf)
+            dataset = gdal.Open(output_mrf)
+            self.assertEqual(dataset.RasterXSize, 4096, "Size does not match")
+            self.assertEqual(dataset.RasterYSize, 2048, "Size does not match")
+            dataset = None
+
+        # Check the combined run report
+        self.assertTrue(os.path.isfile(self.report), "Batch report not created")
+        with open(self.report, 'r') as f:
+            report = json.load(f)
+        self.assertEqual(report['total'], 2, "Batch report total does not match")
+        self.assertEqual(report['succeeded'], 2, "Batch report succeeded count does not match")
+        self.assertEqual([entry['configuration'] for entry in report['mrfs']], self.batch_configs,
+                         "Batch report configurations do not match")
+
+    def tearDown(self):
+        if not SAVE_RESULTS:
+            shutil.rmtree(self.staging_area)
+        else:
+            print("Leaving test results in : " + self.staging_area)
+
+
+class TestMRFGeneration_time_slices(unittest.TestCase):
+
+    def setUp(self):
+        testdata_path = os.path.join(os.getcwd(), 'mrfgen_files')
+        self.input_dir = os.path.join(testdata_path, 'obpg')
+        self.staging_area = os.path.join(os.getcwd(), 'mrfgen_test_data')
+        test_config = os.path.join(testdata_path, "mrfgen_test_config_time_slices.xml")
+
+        # Make source image dir
+        make_dir_tree(self.input_dir, ignore_existing=True)
+
+        # Make empty dirs for mrfgen output
+        mrfgen_dirs = ('output_dir', 'working_dir', 'logfile_dir')
+        [make_dir_tree(os.path.join(self.staging_area, path)) for path in mrfgen_dirs]
+
+        # Copy empty output tile
+        shutil.copytree(os.path.join(testdata_path, 'empty_tiles'), os.path.join(self.staging_area, 'empty_tiles'))
+
+        # create copy of colormap
+        shutil.copy2(os.path.join(testdata_path, "colormaps/MODIS_Aqua_Chlorophyll_A.xml"), os.path.join(self.staging_area, 'working_dir'))
+
+        self.output_mrf = os.path.join(self.staging_area, "output_dir/OBPG2015336_.mrf")
+        self.output_zdb = os.path.join(self.staging_area, "output_dir/OBPG2015336_.zdb")
+
+        # generate all time slices in one run
+        run_command("mrfgen -c " + test_config, show_output=DEBUG)
+
+    def test_generate_mrf_time_slices(self):
+        # Check MRF generation succeeded
+        self.assertTrue(os.path.isfile(self.output_mrf), "MRF generation failed")
+        with open(self.output_mrf, 'r') as f:
+            self.assertTrue('mp_safe="on"' in f.read(), "MRF is not mp_safe")
+
+        # Every slice should have its own z-level
+        con = sqlite3.connect(self.output_zdb)
+        cur = con.cursor()
+        cur.execute("SELECT z, key_str FROM ZINDEX ORDER BY z;")
+        records = cur.fetchall()
+        con.close()
+        if DEBUG:
+            print("ZDB records: " + str(records))
+        self.assertEqual(len(records), 3, "Number of records not matching in ZDB")
+        self.assertEqual(sorted([record[1] for record in records]),
+                         ['20151202001000', '20151202003000', '20151202T002000'], "Keys do not match in ZDB")
+        self.assertEqual([record[0] for record in records], [0, 1, 2], "Z-levels do not match in ZDB")
+
+        # Each slice has the same granule, so each z-level should have the same base and overviews
+        for z in range(3):
+            dataset = gdal.Open(self.output_mrf + ":MRF:Z" + str(z))
+            self.assertEqual(dataset.RasterXSize, 40960, "Size does not match")
+            self.assertEqual(dataset.RasterYSize, 20480, "Size does not match")
+            self.assertEqual(dataset.GetRasterBand(1).GetOverviewCount(), 7, "Overview count does not match")
+            dataset = None
+
+    def tearDown(self):
+        if not SAVE_RESULTS:
+            shutil.rmtree(self.staging_area)
+        else:
+            print("Leaving test results in : " + self.staging_area)
+
+
+class TestMRFGeneration_cascade_overviews(unittest.TestCase):
+
+    def setUp(self):
+        testdata_path = os.path.join(os.getcwd(), 'mrfgen_files')
+        self.staging_area = os.path.join(os.getcwd(), 'mrfgen_test_data')
+
+        # Build each configuration with gdaladdo, and cascaded with one and several cores
+        builds = {'addo': '',
+                  'cascade_1': '<mrf_cascade_overviews>true</mrf_cascade_overviews><mrf_cores>1</mrf_cores>',
+                  'cascade_3': '<mrf_cascade_overviews>true</mrf_cascade_overviews><mrf_cores>3</mrf_cores>'}
+        # Paletted nearest and RGB average overviews
+        configs = {'mrfgen_test_config1a.xml': 'MYR4ODLOLLDY2014277_.mrf',
+                   'mrfgen_test_config2a.xml': 'MORCR143ARDY2017248_.mrf'}
+
+        # Make empty dirs for mrfgen output, one output_dir per build
+        mrfgen_dirs = ['working_dir', 'logfile_dir'] + ['output_dir_' + build for build in builds]
+        [make_dir_tree(os.path.join(self.staging_area, path)) for path in mrfgen_dirs]
+
+        # Copy empty output tiles
+        shutil.copytree(os.path.join(testdata_path, 'empty_tiles'), os.path.join(self.staging_area, 'empty_tiles'))
+
+        self.output_mrfs = {}
+        for config_name, mrf_name in configs.items():
+            with open(os.path.join(testdata_path, config_name), 'r') as f:
+                config = f.read()
+            for build, tags in builds.items():
+                output_dir = 'mrfgen_test_data/output_dir_' + build
+                test_config = os.path.join(self.staging_area, build + '_' + config_name)
+                with open(test_config, 'w') as f:
+                    f.write(config.replace('mrfgen_test_data/output_dir', output_dir)
+                            .replace('</mrfgen_configuration>', tags + '</mrfgen_configuration>'))
+                run_command("mrfgen -c " + test_config, show_output=DEBUG)
+                self.output_mrfs.setdefault(mrf_name, {})[build] = os.path.join(os.getcwd(), output_dir, mrf_name)
+
+    def read_levels(self, mrf):
+        # Returns the decoded pixels of the base resolution and of each overview level
+        dataset = gdal.Open(mrf)
+        self.assertIsNotNone(dataset, "MRF generation failed for " + mrf)
+        levels = []
+        for band_no in range(1, dataset.RasterCount + 1):
+            band = dataset.GetRasterBand(band_no)
+            levels.append([band.ReadRaster()] + [band.GetOverview(i).ReadRaster()
+                                                 for i in range(band.GetOverviewCount())])
+        dataset = None
+        return list(zip(*levels))
+
+    def test_cascade_overviews(self):
+        for mrf_name, builds in self.output_mrfs.items():
+            addo = self.read_levels(builds['addo'])
+            cascade_1 = self.read_levels(builds['cascade_1'])
+            cascade_3 = self.read_levels(builds['cascade_3'])
+            if DEBUG:
+                print(mrf_name + ' levels: ' + str(len(addo)))
+
+            # Cascaded overviews must not depend on how many stripes each level was split into
+            self.assertEqual(len(cascade_1), len(cascade_3), "Overview count does not match for " + mrf_name)
+            for level, (one_core, many_cores) in enumerate(zip(cascade_1, cascade_3)):
+                self.assertEqual(one_core, many_cores,
+                                 "Level {0} of {1} differs between 1 and 3 cores".format(level, mrf_name))
+
+            # The base and the first overview level are built from the same pixels as with gdaladdo
+            self.assertTrue(len(addo) > 1 and len(cascade_1) >= len(addo),
+                            "Overview count does not match for " + mrf_name)
+            self.assertEqual(addo[0], cascade_1[0], "Base resolution does not match gdaladdo for " + mrf_name)
+            self.assertEqual(addo[1], cascade_1[1], "First overview level does not match gdaladdo for " + mrf_name)
+
+    def tearDown(self):
+        if not SAVE_RESULTS:
+            shutil.rmtree(self.staging_area)
+        else:
+            print("Leaving test results in : " + self.staging_area)
+
+
+class TestMRFGeneration_suppress_empty(unittest.TestCase):
+
+    def setUp(self):
+        testdata_path = os.path.join(os.getcwd(), 'mrfgen_files')
+        self.staging_area = os.path.join(os.getcwd(), 'mrfgen_test_data')
+        test_config = os.path.join(testdata_path, "mrfgen_test_config1b.xml")
+
+        # Build with and without suppression, with gdaladdo and with cascaded overviews; mrf_clean always runs
+        cascade = '<mrf_cascade_overviews>true</mrf_cascade_overviews>'
+        suppress = '<mrf_suppress_empty>true</mrf_suppress_empty>'
+        builds = {'addo': '', 'addo_suppressed': suppress, 'cascade': cascade, 'cascade_suppressed': cascade + suppress}
+
+        # Make empty dirs for mrfgen output, one output_dir per build
+        mrfgen_dirs = ['working_dir', 'logfile_dir', 'bluemarble_small'] + ['output_dir_' + build for build in builds]
+        [make_dir_tree(os.path.join(self.staging_area, path)) for path in mrfgen_dirs]
+
+        # Copy empty output tile
+        shutil.copytree(os.path.join(testdata_path, 'empty_tiles'), os.path.join(self.staging_area, 'empty_tiles'))
+
+        # Create an RGBA PNG whose western half is transparent, keeping its RGB values so those tiles are written
+        if DEBUG:
+            print("Generating global image: partly transparent RGBA PNG")
+        source = gdal.Open(os.path.join(testdata_path, 'bluemarble_small/bluemarble_small.jpg'))
+        rgba = gdal.GetDriverByName('MEM').Create('', source.RasterXSize, source.RasterYSize, 4, gdal.GDT_Byte)
+        rgba.SetGeoTransform(source.GetGeoTransform())
+        rgba.SetProjection(source.GetProjection())
+        for band_no in range(1, 4):
+            rgba.GetRasterBand(band_no).WriteArray(source.GetRasterBand(band_no).ReadAsArray())
+        alpha = np.full((source.RasterYSize, source.RasterXSize), 255, dtype=np.uint8)
+        alpha[:, :source.RasterXSize // 2] = 0
+        rgba.GetRasterBand(4).WriteArray(alpha)
+        rgba.GetRasterBand(4).SetColorInterpretation(gdal.GCI_AlphaBand)
+        input_png = os.path.join(self.staging_area, 'bluemarble_small/bluemarble_small.png')
+        gdal.GetDriverByName('PNG').CreateCopy(input_png, rgba, 0, ['WORLDFILE=YES'])
+        rgba = None
+        source = None
+
+        with open(test_config, 'r') as f:
+            config = f.read()
+        config = config.replace('<vrtnodata>0</vrtnodata>', '')
+        self.output_mrfs = {}
+        for build, tags in builds.items():
+            output_dir = 'mrfgen_test_data/output_dir_' + build
+            build_config = os.path.join(self.staging_area, "mrfgen_suppress_empty_config_" + build + ".xml")
+            with open(build_config, 'w') as f:
+                f.write(config.replace('mrfgen_test_data/output_dir', output_dir)
+                        .replace('</mrfgen_configuration>', tags + '<mrf_clean>true</mrf_clean></mrfgen_configuration>'))
+            run_command("mrfgen -c " + build_config, show_output=DEBUG)
+            self.output_mrfs[build] = os.path.join(os.getcwd(), output_dir, "BlueMarbleSmall2014237_.mrf")
+
+    def read_tiles(self, mrf):
+        # Returns the index entries, encoded tiles, and empty flags of every tile, base resolution first
+        output_idx = mrf.replace('.mrf', '.idx')
+        output_data = mrf.replace('.mrf', '.ppg')
+        self.assertTrue(os.path.isfile(mrf), "MRF generation failed for " + mrf)
+        index = np.fromfile(output_idx, dtype='>u8').reshape(-1, 2)
+        dataset = gdal.Open(mrf)
+        bands = [dataset.GetRasterBand(band_no) for band_no in range(1, dataset.RasterCount + 1)]
+        levels = [bands] + [[band.GetOverview(i) for band in bands] for i in range(bands[0].GetOverviewCount())]
+        block_x, block_y = bands[0].GetBlockSize()
+        tiles = []
+        with open(output_data, 'rb') as f:
+            for level, level_bands in enumerate(levels):
+                for y_off in range(0, level_bands[0].YSize, block_y):
+                    for x_off in range(0, level_bands[0].XSize, block_x):
+                        offset, size = index[len(tiles)]
+                        f.seek(int(offset))
+                        encoded = f.read(int(size))
+                        x_size = min(block_x, level_bands[0].XSize - x_off)
+                        y_size = min(block_y, level_bands[0].YSize - y_off)
+                        alpha = level_bands[3].ReadAsArray(x_off, y_off, x_size, y_size)
+                        tiles.append((level, (int(offset), int(size)), encoded, not alpha.any()))
+        self.assertEqual(len(tiles), len(index), "Index size does not match the MRF levels of " + mrf)
+        dataset = None
+        return tiles, os.path.getsize(output_data)
+
+    def test_suppress_empty(self):
+        for build in ('addo', 'cascade'):
+            reference, reference_size = self.read_tiles(self.output_mrfs[build])
+            suppressed, suppressed_size = self.read_tiles(self.output_mrfs[build + '_suppressed'])
+            self.assertEqual(len(reference), len(suppressed), "Tile count does not match for " + build)
+
+            empty_levels = set()
+            for tile, (expected, actual) in enumerate(zip(reference, suppressed)):
+                level, _, encoded, empty = expected
+                if empty:
+                    # Empty blocks of the base resolution and of the overviews become zero-size entries
+                    self.assertEqual(actual[1], (0, 0), "Empty tile {0} not suppressed for {1}".format(tile, build))
+                    empty_levels.add(level)
+                else:
+                    self.assertEqual(actual[2], encoded, "Tile {0} changed for {1}".format(tile, build))
+            if DEBUG:
+                print(build + ': empty tiles in levels ' + str(sorted(empty_levels)))
+            self.assertTrue(0 in empty_levels and len(empty_levels) > 1, "No empty tiles in overviews for " + build)
+
+            # mrf_clean drops the tiles that are no longer referenced
+            self.assertTrue(suppressed_size < reference_size, "Data file not reduced for " + build)
+
+    def tearDown(self):
+        if not SAVE_RESULTS:
+            shutil.rmtree(self.staging_area)
+        else:
+            print("Leaving test results in : " + self.staging_area)
+
+
+class TestMRFGeneration_intermediate_dir(unittest.TestCase):
+
+    def setUp(self):
+        testdata_path = os.path.join(os.getcwd(), 'mrfgen_files')
+        self.staging_area = os.path.join(os.getcwd(), 'mrfgen_test_data')
+        test_config = os.path.join(testdata_path, "mrfgen_test_config9.xml")
+
+        # Make source image dir
+        input_dir = os.path.join(testdata_path, 'antimeridian_crossing')
+        make_dir_tree(os.path.join(input_dir), ignore_existing=True)
+
+        # Make empty dirs for mrfgen output
+        mrfgen_dirs = ('output_dir', 'working_dir', 'intermediate_dir', 'logfile_dir')
+        [make_dir_tree(os.path.join(self.staging_area, path)) for path in mrfgen_dirs]
+
+        # Copy empty output tile
+        shutil.copytree(os.path.join(testdata_path, 'empty_tiles'), os.path.join(self.staging_area, 'empty_tiles'))
+
+        # Merge and split the antimeridian crossing granules with a budget too small to keep every intermediate in memory
+        with open(test_config, 'r') as f:
+            config = f.read()
+        test_config = os.path.join(self.staging_area, "mrfgen_intermediate_dir_config.xml")
+        with open(test_config, 'w') as f:
+            f.write(config.replace('</mrfgen_configuration>',
+                                   '<intermediate_dir>mrfgen_test_data/intermediate_dir</intermediate_dir>'
+                                   '<intermediate_memory_budget>1</intermediate_memory_budget></mrfgen_configuration>'))
+
+        self.working_dir = os.path.join(self.staging_area, "working_dir")
+        self.intermediate_dir = os.path.join(self.staging_area, "intermediate_dir")
+        self.output_mrf = os.path.join(self.staging_area, "output_dir/vns2019270_.mrf")
+        self.output_img = os.path.join(self.staging_area, "output_dir/vns2019270_.png")
+        self.compare_img = os.path.join(testdata_path, "test_comp9.png")
+
+        # generate MRF, leaving only the MRF files so that any intermediate left behind shows up
+        run_command("mrfgen -d -c " + test_config, show_output=DEBUG)
+
+    def test_generate_mrf(self):
+        # Check MRF generation succeeded
+        self.assertTrue(os.path.isfile(self.output_mrf), "MRF generation failed")
+
+        # Convert and compare MRF to the output of the antimeridian crossing test
+        mrf = gdal.Open(self.output_mrf)
+        driver = gdal.GetDriverByName("PNG")
+        img = driver.CreateCopy(self.output_img, mrf, 0 )
+        img = None
+        mrf = None
+        if DEBUG:
+            print("Comparing: " + self.output_img + " to " + self.compare_img)
+        self.assertTrue(filecmp.cmp(self.output_img, self.compare_img), "Output image does not match")
+
+        # Every intermediate, in memory or spilled to working_dir, is removed
+        if DEBUG:
+            print("working_dir: " + str(os.listdir(self.working_dir)))
+            print("intermediate_dir: " + str(os.listdir(self.intermediate_dir)))
+        self.assertEqual(os.listdir(self.working_dir), [], "Intermediates left in working_dir")
+        self.assertEqual(os.listdir(self.intermediate_dir), [], "Intermediates left in intermediate_dir")
+
+    def tearDown(self):
+        if not SAVE_RESULTS:
+            shutil.rmtree(self.staging_area)
+        else:
+            print("Leaving test results in : " + self.staging_area)
+
+
 class TestRGBA2Pal(unittest.TestCase):
 
     def setUp(self):
@@ -2139,7 +2499,12 @@ if __name__ == '__main__':
         'brunsli_on': TestMRFGeneration_brunsli_on,
         'brunsli_off': TestMRFGeneration_brunsli_off,
         'defaultnocopy': TestMRFGeneration_defaultnocopy,
-        'Angstrom_Exponent': TestMRFGeneration_Angstrom_Exponent
+        'Angstrom_Exponent': TestMRFGeneration_Angstrom_Exponent,
+        'batch': TestMRFGeneration_batch,
+        'time_slices': TestMRFGeneration_time_slices,
+        'cascade_overviews': TestMRFGeneration_cascade_overviews,
+        'suppress_empty': TestMRFGeneration_suppress_empty,
+        'intermediate_dir': TestMRFGeneration_intermediate_dir
     }
     test_help_text = 'Specify a specific test to run. Available tests: {0}'.format(list(available_tests.keys()))
     parser = OptionParser()
@@ -25,7 +25,9 @@ import unittest2 as unittest
 import xmlrunner
 from oe_test_utils import run_command
 from optparse import OptionParser
+import filecmp
 from filecmp import dircmp
+import json
 import boto3, botocore
 import shutil
 import time
@@ -233,6 +235,36 @@ class TestSyncS3(unittest.TestCase):
         success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_s3_configs.py", check_diff_files=True)
         self.assertTrue(success, failure_msg)
     
+    # Test syncing a directory of configs that differ from the configs in the S3 bucket without `-f` (`--force`),
+    # writing the IDs of the changed layers with `--changed`.
+    # Passes if the modified configs are overwritten and exactly their layers are reported as changed.
+    def test_sync_configs_modified(self):
+        test_dir_name = "test_configs_force"
+        mock_dir_name = "test_configs"
+        test_dir_path = os.path.join(os.getcwd(), TEST_FILES_DIR, test_dir_name)
+        mock_dir_path = os.path.join(os.getcwd(), MOCK_DIR, mock_dir_name)
+        changed_path = os.path.join(os.getcwd(), "sync_s3_test_files", "changed_layers.txt")
+        expected = set()
+        for filename in os.listdir(test_dir_path):
+            shutil.copy2(os.path.join(test_dir_path, filename), self.sync_dir_path)
+            if not filecmp.cmp(os.path.join(test_dir_path, filename), os.path.join(mock_dir_path, filename), shallow=False):
+                expected.add(os.path.splitext(filename)[0])
+        expected.update(os.path.splitext(filename)[0] for filename in os.listdir(mock_dir_path)
+                        if filename.endswith('.yaml') and filename not in os.listdir(test_dir_path))
+        upload_files(mock_dir_path)
+        cmd = "python3 /home/oe2/onearth/src/scripts/oe_sync_s3_configs.py --changed {3} -b {0} -d {1} -s {2}".format(TEST_BUCKET, self.sync_dir_path, MOCK_S3_URI, changed_path)
+        try:
+            run_command(cmd)
+            # check results
+            success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_s3_configs.py", check_diff_files=True)
+            self.assertTrue(success, failure_msg)
+            with open(changed_path) as f:
+                changed = set(f.read().split())
+            self.assertEqual(changed, expected, "oe_sync_s3_configs.py reported {0} as changed, expected {1}".format(sorted(changed), sorted(expected)))
+        finally:
+            if os.path.isfile(changed_path):
+                os.remove(changed_path)
+
     # Test syncing an empty directory with an S3 bucket containing idx files.
     # Passes if the idx files are downloaded.
     def test_sync_idx_download_to_empty(self):
@@ -296,6 +328,109 @@ class TestSyncS3(unittest.TestCase):
         success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_idx.py")
         self.assertTrue(success, failure_msg)
 
+    # Test syncing a directory of IDX files that contains temporary files left by an interrupted sync, and one that
+    # a concurrent sync is still writing.
+    # Passes if the stale temporary files are removed, the recent one is kept, and the missing IDX files are downloaded.
+    def test_sync_idx_interrupted(self):
+        test_dir_name = "test_idx_download"
+        mock_dir_name = "test_idx"
+        test_dir_path = os.path.join(os.getcwd(), TEST_FILES_DIR, test_dir_name)
+        mock_dir_path = os.path.join(os.getcwd(), MOCK_DIR, mock_dir_name)
+        shutil.rmtree(self.sync_dir_path)
+        shutil.copytree(os.path.join(test_dir_path), self.sync_dir_path)
+        stale_time = time.time() - 2 * 60 * 60
+        in_flight_path = None
+        for root, _, files in os.walk(self.sync_dir_path):
+            for filename in files:
+                temp_path = os.path.join(root, '.{0}.0a1b2c3d.oe-sync-tmp'.format(filename))
+                with open(temp_path, 'wb') as f:
+                    f.write(b'partial')
+                if in_flight_path is None:
+                    in_flight_path = temp_path
+                else:
+                    os.utime(temp_path, (stale_time, stale_time))
+        upload_files(mock_dir_path)
+        cmd = "python3 /home/oe2/onearth/src/scripts/oe_sync_s3_idx.py -b {0} -d {1} -s {2}".format(TEST_BUCKET, self.sync_dir_path, MOCK_S3_URI)
+        run_command(cmd)
+        # check results
+        self.assertTrue(os.path.isfile(in_flight_path), "oe_sync_s3_idx.py removed the recent temporary file {0}".format(in_flight_path))
+        os.remove(in_flight_path)
+        success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_idx.py")
+        self.assertTrue(success, failure_msg)
+
+    # Test applying S3 event notifications with `-e` (`--events`). The first run performs a full reconciliation,
+    # after which an IDX file is deleted from and another is added to the S3 bucket and their events appended.
+    # Passes if the second run deletes and downloads the files named in the events.
+    def test_sync_idx_events(self):
+        mock_dir_name = "test_idx"
+        mock_dir_path = os.path.join(os.getcwd(), MOCK_DIR, mock_dir_name)
+        events_path = os.path.join(os.getcwd(), "sync_s3_test_files", "idx_events.json")
+        state_path = events_path + ".state"
+        upload_files(mock_dir_path)
+        open(events_path, 'w').close()
+        cmd = "python3 /home/oe2/onearth/src/scripts/oe_sync_s3_idx.py -e {3} -b {0} -d {1} -s {2}".format(TEST_BUCKET, self.sync_dir_path, MOCK_S3_URI, events_path)
+        try:
+            run_command(cmd)
+            success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_idx.py")
+            self.assertTrue(success, failure_msg)
+            self.assertTrue(os.path.isfile(state_path), "oe_sync_s3_idx.py did not write the state file {0}".format(state_path))
+
+            layer_key = "/epsg4326/AMSUA_NOAA16_Brightness_Temp_Channel_1/2001/"
+            deleted_key = layer_key + "AMSUA_NOAA16_Brightness_Temp_Channel_1-2001147000000.idx"
+            added_key = layer_key + "AMSUA_NOAA16_Brightness_Temp_Channel_1-2001152000000.idx"
+            source_path = os.path.join(mock_dir_path, layer_key.strip('/'), "AMSUA_NOAA16_Brightness_Temp_Channel_1-2001151000000.idx")
+            client.delete_object(Bucket=TEST_BUCKET, Key=deleted_key)
+            client.upload_file(Filename=source_path, Bucket=TEST_BUCKET, Key=added_key)
+            events = [
+                {"eventName": "ObjectRemoved:Delete", "s3": {"object": {"key": deleted_key}}},
+                {"eventName": "ObjectCreated:Put", "s3": {"object": {"key": added_key, "size": os.path.getsize(source_path)}}}
+            ]
+            with open(events_path, 'a') as f:
+                for event in events:
+                    f.write(json.dumps({"Records": [event]}) + "\n")
+            run_command(cmd)
+
+            self.assertFalse(os.path.isfile(os.path.join(self.sync_dir_path, deleted_key.strip('/'))),
+                             "oe_sync_s3_idx.py did not delete {0} from its event".format(deleted_key))
+            added_path = os.path.join(self.sync_dir_path, added_key.strip('/'))
+            self.assertTrue(os.path.isfile(added_path), "oe_sync_s3_idx.py did not download {0} from its event".format(added_key))
+            self.assertTrue(filecmp.cmp(added_path, source_path, shallow=False),
+                            "{0} does not match the object in the S3 bucket".format(added_path))
+        finally:
+            for path in (events_path, state_path):
+                if os.path.isfile(path):
+                    os.remove(path)
+
+    # Test syncing IDX files with the oe_sync_s3.py service and a job file, writing its progress with `--status`.
+    # Passes if the IDX files are downloaded and the status file reports the job as done.
+    def test_sync_service_idx(self):
+        test_dir_name = "test_idx_download_delete"
+        mock_dir_name = "test_idx"
+        test_dir_path = os.path.join(os.getcwd(), TEST_FILES_DIR, test_dir_name)
+        mock_dir_path = os.path.join(os.getcwd(), MOCK_DIR, mock_dir_name)
+        jobs_path = os.path.join(os.getcwd(), "sync_s3_test_files", "sync_jobs.yaml")
+        status_path = os.path.join(os.getcwd(), "sync_s3_test_files", "sync_status.json")
+        shutil.rmtree(self.sync_dir_path)
+        shutil.copytree(os.path.join(test_dir_path), self.sync_dir_path)
+        upload_files(mock_dir_path)
+        # JSON is valid YAML
+        with open(jobs_path, 'w') as f:
+            json.dump({"jobs": [{"type": "idx", "bucket": TEST_BUCKET, "dir": self.sync_dir_path}]}, f)
+        cmd = "python3 /home/oe2/onearth/src/scripts/oe_sync_s3.py --status {0} -s {1} {2}".format(status_path, MOCK_S3_URI, jobs_path)
+        try:
+            run_command(cmd)
+            # check results
+            success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_s3.py")
+            self.assertTrue(success, failure_msg)
+            with open(status_path) as f:
+                status = json.load(f)
+            states = [job["state"] for job in status["jobs"].values()]
+            self.assertEqual(states, ["done"], "oe_sync_s3.py reported job states {0}".format(states))
+        finally:
+            for path in (jobs_path, status_path):
+                if os.path.isfile(path):
+                    os.remove(path)
+
     # Test using the `-n` argument to perform a "dry run" of the S3 syncing without
     # actually downloading or deleting any IDX files from the directory.
     # Passes if the directory remains unchanged.
@@ -336,6 +471,34 @@ class TestSyncS3(unittest.TestCase):
         success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_s3_idx.py", check_diff_files=True)
         self.assertTrue(success, failure_msg)
 
+    # Test overwriting IDX files using `-f` (`--force`) and `-D` (`--delta`), with block manifests written by
+    # oe_s3_etag.py published alongside the IDX files in the S3 bucket.
+    # Passes if the existing IDX files are patched without falling back to full downloads, and the contents of the
+    # directory's IDX files match those of the IDX files in the S3 bucket.
+    def test_sync_idx_delta(self):
+        test_dir_name = "test_idx_force"
+        mock_dir_name = "test_idx"
+        test_dir_path = os.path.join(os.getcwd(), TEST_FILES_DIR, test_dir_name)
+        mock_dir_path = os.path.join(os.getcwd(), MOCK_DIR, mock_dir_name)
+        publish_dir_path = os.path.join(os.getcwd(), "sync_s3_test_files", "publish_idx")
+        shutil.rmtree(self.sync_dir_path)
+        shutil.copytree(os.path.join(test_dir_path), self.sync_dir_path)
+        shutil.copytree(mock_dir_path, publish_dir_path)
+        try:
+            idx_files = [os.path.join(path, filename) for path, _, files in os.walk(publish_dir_path)
+                         for filename in files if filename.endswith('.idx')]
+            run_command("python3 /home/oe2/onearth/src/scripts/oe_s3_etag.py --block-manifest --block-size 4096 " + " ".join(idx_files))
+            upload_files(publish_dir_path)
+            cmd = "python3 /home/oe2/onearth/src/scripts/oe_sync_s3_idx.py -f -D -b {0} -d {1} -s {2}".format(TEST_BUCKET, self.sync_dir_path, MOCK_S3_URI)
+            output = run_command(cmd)
+            # check results
+            self.assertNotIn("Falling back", output, "oe_sync_s3_idx.py fell back to full downloads instead of patching")
+            self.assertRegex(output, r"patched [1-9]", "oe_sync_s3_idx.py did not patch any files")
+            success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_s3_idx.py", check_diff_files=True)
+            self.assertTrue(success, failure_msg)
+        finally:
+            shutil.rmtree(publish_dir_path)
+
     # Test syncing a directory of IDX files with an S3 bucket such that the directory's IDX files
     # that share the same name as files in the S3 bucket but have unique contents (i.e. checksum mismatch)
     # are overwritten by the IDX files in the S3 bucket using `-c` (`--checksum`).
@@ -359,6 +522,46 @@ class TestSyncS3(unittest.TestCase):
         success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_idx.py", check_diff_files=True)
         self.assertTrue(success, failure_msg)
 
+    # Test syncing a directory of IDX files with mismatched checksums using `-c` (`--checksum`) and `-m` (`--manifest`),
+    # then corrupting a file that is recorded in the manifest, leaving a stale temporary file, and syncing again.
+    # Passes if the manifest is written, the files are overwritten with the contents of the S3 bucket on both runs,
+    # and the temporary file is removed.
+    def test_sync_idx_checksum_manifest(self):
+        test_dir_name = "test_idx_checksum"
+        mock_dir_name = "test_idx"
+        test_dir_path = os.path.join(os.getcwd(), TEST_FILES_DIR, test_dir_name)
+        mock_dir_path = os.path.join(os.getcwd(), MOCK_DIR, mock_dir_name)
+        manifest_path = os.path.join(os.getcwd(), "sync_s3_test_files", "idx_manifest.json")
+        shutil.rmtree(self.sync_dir_path)
+        shutil.copytree(os.path.join(test_dir_path), self.sync_dir_path)
+        upload_files(mock_dir_path)
+        cmd = "python3 /home/oe2/onearth/src/scripts/oe_sync_s3_idx.py -c -m {3} -b {0} -d {1} -s {2}".format(TEST_BUCKET, self.sync_dir_path, MOCK_S3_URI, manifest_path)
+        try:
+            run_command(cmd)
+            self.assertTrue(os.path.isfile(manifest_path), "oe_sync_s3_idx.py did not write the manifest {0}".format(manifest_path))
+            success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_idx.py", check_diff_files=True)
+            self.assertTrue(success, failure_msg)
+
+            # Modifying a file changes its mtime, so the manifest entry must not be trusted
+            for root, _, files in os.walk(self.sync_dir_path):
+                if files:
+                    with open(os.path.join(root, files[0]), 'r+b') as f:
+                        f.write(b'\xff' * 16)
+                    # Layers taken from the manifest are not walked, but interrupted downloads are still removed
+                    stale_path = os.path.join(root, '.{0}.0a1b2c3d.oe-sync-tmp'.format(files[0]))
+                    with open(stale_path, 'wb') as f:
+                        f.write(b'partial')
+                    stale_time = time.time() - 2 * 60 * 60
+                    os.utime(stale_path, (stale_time, stale_time))
+                    break
+            run_command(cmd)
+            self.assertFalse(os.path.isfile(stale_path), "oe_sync_s3_idx.py did not remove the stale temporary file {0}".format(stale_path))
+            success, failure_msg = compare_directories(self.sync_dir_path, mock_dir_path, "oe_sync_idx.py", check_diff_files=True)
+            self.assertTrue(success, failure_msg)
+        finally:
+            if os.path.isfile(manifest_path):
+                os.remove(manifest_path)
+
     """
     # Test syncing a directory of configs with an empty S3 bucket.
     # Passes if the configs are all deleted from the directory.
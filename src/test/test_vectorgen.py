@@ -82,6 +82,8 @@ class TestVectorgen(unittest.TestCase):
         self.mrf_clust_reduce_rate_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_mvt_mrf_clust_reduce_rate.xml')
         self.mrf_feature_filters_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_mvt_mrf_feature_filters.xml')
         self.mrf_overview_filters_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_mvt_mrf_overview_filters.xml')
+        self.mrf_parallel_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_mvt_mrf_parallel.xml')
+        self.mrf_incremental_update_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_mvt_mrf_incremental_update.xml')
         self.shapefile_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_shapefile.xml')
         self.shapefile_diff_proj_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_shapefile_diff_proj.xml')
         self.geojson_test_config = os.path.join(self.test_data_path, 'vectorgen_test_create_geojson.xml')
@@ -630,6 +632,160 @@ class TestVectorgen(unittest.TestCase):
                     else:
                         self.assertTrue(feature['properties']['type'] == "MGRS", "Overview filter failed to filter features. Zoom {0} contains a feature of type {1}, which isn't 'MGRS'.".format(zoom_level, feature['type']))
             
+    # Tests that an MRF encoded with multiple cores has the same tiles, in the same order, as one encoded with a single core.
+    # Alerts if any index entry or unzipped tile differs between the two.
+    def test_MVT_MRF_generation_parallel(self):
+        # Process config files
+        test_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_parallel')
+        config = self.parse_vector_config(self.mrf_parallel_test_config, test_artifact_path)
+        serial_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_parallel_serial')
+        serial_config = self.parse_vector_config(self.mrf_test_config, serial_artifact_path)
+
+        # Run vectorgen
+        prevdir = os.getcwd()
+        for artifact_path, vector_config in ((test_artifact_path, self.mrf_parallel_test_config),
+                                             (serial_artifact_path, self.mrf_test_config)):
+            os.chdir(artifact_path)
+            cmd = 'oe_vectorgen -c ' + vector_config
+            run_command(cmd, ignore_warnings=True)
+            os.chdir(prevdir)
+
+        # The index entries should match exactly, and so should the unzipped tiles they point to
+        tiles = []
+        for cfg in (config, serial_config):
+            with open(os.path.join(cfg['output_dir'], cfg['prefix'] + '.idx'), 'rb') as idx:
+                idx_data = idx.read()
+            with open(os.path.join(cfg['output_dir'], cfg['prefix'] + '.pvt'), 'rb') as pvt:
+                pvt_data = pvt.read()
+            tile_data = []
+            for i in range(0, len(idx_data), 16):
+                offset, size = struct.unpack('>qq', idx_data[i:i + 16])
+                tile_data.append(gzip.decompress(pvt_data[offset:offset + size]) if size else b'')
+            tiles.append((idx_data, tile_data))
+        self.assertTrue(any(tiles[0][1]), "MRF encoded with multiple cores contains no tiles")
+        self.assertEqual(tiles[0][0], tiles[1][0], "Index of MRF encoded with multiple cores doesn't match single core index")
+        self.assertEqual(tiles[0][1], tiles[1][1], "Tiles of MRF encoded with multiple cores don't match single core tiles")
+
+    # Tests that updating an MRF with unchanged input leaves its tiles as they were, and keeps a record of its features.
+    # Alerts if the index or data file changed, or if no feature record was written.
+    def test_MVT_MRF_generation_incremental_update(self):
+        # Process config file
+        test_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_incremental_update')
+        config = self.parse_vector_config(self.mrf_incremental_update_test_config, test_artifact_path)
+        output_basename = os.path.join(config['output_dir'], config['prefix'])
+
+        # Run vectorgen twice, the second time updating the MRF from the first
+        prevdir = os.getcwd()
+        os.chdir(test_artifact_path)
+        cmd = 'oe_vectorgen -c ' + self.mrf_incremental_update_test_config
+        run_command(cmd, ignore_warnings=True)
+        self.assertTrue(os.path.isfile(output_basename + '.features'), "No feature record created with the MRF")
+        with open(output_basename + '.idx', 'rb') as idx:
+            first_idx_data = idx.read()
+        first_pvt_size = os.path.getsize(output_basename + '.pvt')
+        run_command(cmd, ignore_warnings=True)
+        os.chdir(prevdir)
+
+        with open(output_basename + '.idx', 'rb') as idx:
+            self.assertEqual(first_idx_data, idx.read(), "Index changed when updating MRF with the same features")
+        self.assertEqual(first_pvt_size, os.path.getsize(output_basename + '.pvt'),
+                         "Tiles were added when updating MRF with the same features")
+
+    # Tests that updating an MRF after a feature was modified, one added, and one removed gives the same tiles as rebuilding it.
+    # Alerts if no tiles were re-encoded, or if any tile of the updated MRF differs from the rebuilt MRF.
+    def test_MVT_MRF_generation_incremental_update_changed_features(self):
+        # Process config files
+        test_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_incremental_update_changed')
+        config = self.parse_vector_config(self.mrf_incremental_update_test_config, test_artifact_path)
+        rebuild_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_incremental_update_rebuild')
+        rebuild_config = self.parse_vector_config(self.mrf_incremental_update_test_config, rebuild_artifact_path)
+        input_file = os.path.basename(config['input_files'][0])
+        cmd = 'oe_vectorgen -c ' + self.mrf_incremental_update_test_config
+
+        # Run vectorgen to create the MRF that will be updated
+        prevdir = os.getcwd()
+        os.chdir(test_artifact_path)
+        run_command(cmd, ignore_warnings=True)
+        os.chdir(prevdir)
+        first_pvt_size = os.path.getsize(os.path.join(config['output_dir'], config['prefix'] + '.pvt'))
+
+        # Move the first feature, remove the second, and add a new one, in both copies of the input
+        with fiona.open(os.path.join(test_artifact_path, input_file)) as src:
+            schema = src.schema
+            crs = src.crs
+            features = [{'geometry': {'type': 'Point', 'coordinates': tuple(feature['geometry']['coordinates'])},
+                         'properties': dict(feature['properties'])} for feature in src]
+        x, y = features[0]['geometry']['coordinates']
+        features[0]['geometry']['coordinates'] = (x - 20, y + 10)
+        added = {'geometry': {'type': 'Point', 'coordinates': (0.5, 0.5)}, 'properties': dict(features[1]['properties'])}
+        added['properties']['ident'] = max([feature['properties']['ident'] for feature in features]) + 1
+        features = features[:1] + features[2:] + [added]
+        for artifact_path in (test_artifact_path, rebuild_artifact_path):
+            with fiona.open(os.path.join(artifact_path, input_file), 'w', driver='ESRI Shapefile', schema=schema, crs=crs) as dst:
+                dst.writerecords(features)
+
+        # Update the first MRF, and build the second from scratch
+        for artifact_path in (test_artifact_path, rebuild_artifact_path):
+            os.chdir(artifact_path)
+            run_command(cmd, ignore_warnings=True)
+            os.chdir(prevdir)
+        self.assertGreater(os.path.getsize(os.path.join(config['output_dir'], config['prefix'] + '.pvt')), first_pvt_size,
+                           "No tiles were re-encoded when updating MRF with changed features")
+
+        # Tiles are appended when updating, so compare the unzipped tiles each index entry points to
+        tiles = []
+        for cfg in (config, rebuild_config):
+            with open(os.path.join(cfg['output_dir'], cfg['prefix'] + '.idx'), 'rb') as idx:
+                idx_data = idx.read()
+            with open(os.path.join(cfg['output_dir'], cfg['prefix'] + '.pvt'), 'rb') as pvt:
+                pvt_data = pvt.read()
+            tile_data = []
+            for i in range(0, len(idx_data), 16):
+                offset, size = struct.unpack('>qq', idx_data[i:i + 16])
+                tile_data.append(gzip.decompress(pvt_data[offset:offset + size]) if size else b'')
+            tiles.append(tile_data)
+        self.assertEqual(len(tiles[0]), len(tiles[1]), "Index of updated MRF doesn't match the size of a rebuilt MRF index")
+        self.assertEqual(tiles[0], tiles[1], "Tiles of updated MRF don't match the tiles of a rebuilt MRF")
+
+    # Tests that updating an MRF with a different buffer size rebuilds it instead of keeping tiles encoded with the old one.
+    # Alerts if the index or any tile of the updated MRF differs from an MRF built from scratch with the new buffer size.
+    def test_MVT_MRF_generation_incremental_update_changed_settings(self):
+        # Process config files
+        test_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_incremental_update_settings')
+        config = self.parse_vector_config(self.mrf_incremental_update_test_config, test_artifact_path)
+        rebuild_artifact_path = os.path.join(self.main_artifact_path, 'mvt_mrf_incremental_update_settings_rebuild')
+        rebuild_config = self.parse_vector_config(self.mrf_incremental_update_test_config, rebuild_artifact_path)
+        with open(self.mrf_incremental_update_test_config, 'r') as f:
+            buffer_config = f.read().replace('</vectorgen_configuration>', ' <buffer_size>10</buffer_size>\n</vectorgen_configuration>')
+        buffer_config_name = 'vectorgen_test_create_mvt_mrf_incremental_update_buffer.xml'
+        for artifact_path in (test_artifact_path, rebuild_artifact_path):
+            with open(os.path.join(artifact_path, buffer_config_name), 'w') as f:
+                f.write(buffer_config)
+
+        # Build the first MRF with the default buffer size and update it with the new one, and build the second from scratch
+        prevdir = os.getcwd()
+        os.chdir(test_artifact_path)
+        run_command('oe_vectorgen -c ' + self.mrf_incremental_update_test_config, ignore_warnings=True)
+        run_command('oe_vectorgen -c ' + buffer_config_name, ignore_warnings=True)
+        os.chdir(rebuild_artifact_path)
+        run_command('oe_vectorgen -c ' + buffer_config_name, ignore_warnings=True)
+        os.chdir(prevdir)
+
+        # A rebuilt MRF has the same index as one built from scratch, and the same tiles
+        tiles = []
+        for cfg in (config, rebuild_config):
+            with open(os.path.join(cfg['output_dir'], cfg['prefix'] + '.idx'), 'rb') as idx:
+                idx_data = idx.read()
+            with open(os.path.join(cfg['output_dir'], cfg['prefix'] + '.pvt'), 'rb') as pvt:
+                pvt_data = pvt.read()
+            tile_data = []
+            for i in range(0, len(idx_data), 16):
+                offset, size = struct.unpack('>qq', idx_data[i:i + 16])
+                tile_data.append(gzip.decompress(pvt_data[offset:offset + size]) if size else b'')
+            tiles.append((idx_data, tile_data))
+        self.assertEqual(tiles[0][0], tiles[1][0], "Index of MRF updated with a different buffer size doesn't match a rebuilt MRF index")
+        self.assertEqual(tiles[0][1], tiles[1][1], "Tiles of MRF updated with a different buffer size don't match the tiles of a rebuilt MRF")
+
     # Tests the creation of a shapefile from a single input GeoJSON.
     # Alerts if shapefile has different number of features from the GeoJSON.
     def test_shapefile_generation(self):
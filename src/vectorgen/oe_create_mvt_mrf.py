@@ -37,21 +37,32 @@ or by using the create_vector_mrf() function in another script.
 
 import os
 import sys
-import struct
-import io
-import gzip
+import hashlib
+import itertools
+import json
+import zlib
 import xml.dom.minidom
 import math
-import random
+import multiprocessing
+import numpy as np
 import fiona
+import shapely
 import shapely.geometry
-import rtree
 import mapbox_vector_tile
 from osgeo import osr
 import decimal
 import re
 from oe_utils import *
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# State shared with the tile encoding workers. The workers are forked after it is set, so they share the
+# feature layers and spatial indexes without pickling them.
+tile_context = {}
+
 
 # Main tile-creation function.
 def create_vector_mrf(input_file_path,
@@ -72,6 +83,12 @@ def create_vector_mrf(input_file_path,
                       cluster_reduce_rate=2,
                       buffer_size=5,
                       buffer_edges=False,
+                      cores=1,
+                      seed=None,
+                      compression='gzip',
+                      compression_level=None,
+                      source_projection_str=None,
+                      update=False,
                       debug=False):
     """
     Creates a MVT MRF stack using the specified TileMatrixSet.
@@ -102,6 +119,16 @@ def create_vector_mrf(input_file_path,
             Default is 5 (pixel size in map units at each zoom level) which allows enough room for most styling.
         buffer_edges (boolean) -- Flag indicating whether buffering should be performed on the edges of the tile matrix.
             Default is False
+        cores (int) -- Number of processes used to encode tiles. Default is 1
+        seed (int) -- Seed for the random selection of features during feature and cluster reduction, for repeatable output.
+            Default is None (not repeatable)
+        compression (str) -- Compression of the MVT tiles in the MRF data file: gzip, zstd, or none. Default is gzip
+        compression_level (int) -- Compression level. Defaults to 6 for gzip and 3 for zstd
+        source_projection_str (str) -- EPSG code for the projection of the input files, if it differs from projection_str.
+            Features are reprojected as they are read.
+        update (boolean) -- Flag indicating whether an existing MRF in output_path should be updated instead of rebuilt.
+            Only the tiles touched by features that were added, changed, or removed since the last run are re-encoded.
+            Requires an existing feature_id property. Default is False
         debug (bool) -- Toggle verbose output messages and MVT file artifacts (MVT tile files will be created in addition to MRF)
     """
     # Get projection and calculate overview levels if necessary
@@ -119,206 +146,575 @@ def create_vector_mrf(input_file_path,
     tile_matrices = get_tms(target_x, target_y, target_extents, tile_size,
                             overview_levels, proj)
 
-    # Open MRF data and index files and generate the MRF XML
-    fidx = open(os.path.join(output_path, mrf_prefix + '.idx'), 'wb+')
-    fout = open(os.path.join(output_path, mrf_prefix + '.pvt'), 'wb+')
-    notile = struct.pack('!QQ', 0, 0)
-    pvt_offset = 0
+    try:
+        compress = get_tile_compressor(compression, compression_level)
+    except ValueError as e:
+        log_info_mssg('ERROR -- {0}'.format(e))
+        return False
 
-    mrf_dom = build_mrf_dom(tile_matrices, target_extents, tile_size, proj)
-    with open(os.path.join(output_path, mrf_prefix) + '.mrf', 'w+') as f:
-        f.write(mrf_dom.toprettyxml())
+    rng = np.random.default_rng(seed)
+    settings = get_tile_settings(buffer_size, buffer_edges, overview_filters, feature_filters, feature_reduce_rate,
+                                 cluster_reduce_rate)
 
-    spatial_dbs = []
-    source_schemas = []
-
-    # Dump contents of shapefile into a mutable rtree spatial database for faster searching.
+    mrf_dom = build_mrf_dom(tile_matrices, target_extents, tile_size, proj)
+    mrf_xml = mrf_dom.toprettyxml()
+    mrf_files = {ext: os.path.join(output_path, mrf_prefix + ext) for ext in ['.mrf', '.idx', '.pvt', '.features']}
+
+    # An existing MRF can only be updated if it was built the same way, with a record of its features
+    write_manifest = update and not create_feature_id
+    if update:
+        if create_feature_id:
+            log_info_mssg('Feature IDs are created during processing, so features can\'t be matched to the previous run. Rebuilding MRF')
+            update = False
+        elif not all([os.path.isfile(mrf_file) for mrf_file in mrf_files.values()]):
+            log_info_mssg('No previous MRF with a feature record found in ' + output_path + '. Rebuilding MRF')
+            update = False
+        else:
+            with open(mrf_files['.mrf']) as f:
+                if f.read() != mrf_xml:
+                    log_info_mssg('The tile matrices of the previous MRF are different. Rebuilding MRF')
+                    update = False
+    if update:
+        with open(mrf_files['.features'], 'rb') as f:
+            previous_manifest = dict(np.load(f))
+        # Tiles can't be mixed with ones compressed differently in the same data file
+        if str(previous_manifest.get('compression', '')) != compression.lower():
+            log_info_mssg('The tile compression of the previous MRF is different. Rebuilding MRF')
+            update = False
+        # Unchanged tiles are kept, so they must have been encoded with the same buffers, filters, and reduction
+        elif str(previous_manifest.get('settings', '')) != settings:
+            log_info_mssg('The tile settings of the previous MRF are different. Rebuilding MRF')
+            update = False
+
+    # Open MRF data and index files and generate the MRF XML. When updating, tiles are appended to the data file.
+    if update:
+        previous_index = np.fromfile(mrf_files['.idx'], dtype='>u8').reshape(-1, 2)
+        fidx = open(mrf_files['.idx'], 'r+b')
+        fout = open(mrf_files['.pvt'], 'ab')
+        pvt_offset = os.path.getsize(mrf_files['.pvt'])
+    else:
+        fidx = open(mrf_files['.idx'], 'wb+')
+        fout = open(mrf_files['.pvt'], 'wb+')
+        pvt_offset = 0
+        with open(mrf_files['.mrf'], 'w+') as f:
+            f.write(mrf_xml)
+
+    layers = []
+    transform = None
+    if source_projection_str and source_projection_str != projection_str:
+        transform = get_transform(source_projection_str, projection_str)
+
+    # Stream the features of each input into a shapely geometry array with an STRtree spatial index for faster searching.
     for input_file in input_file_path:
         log_info_mssg('Processing ' + input_file)
-        with fiona.open(input_file) as f:
-            try:
-                spatial_db = rtree.index.Index(rtree_index_generator(list(f), feature_filters,
-                                                                     feature_id, create_feature_id))
-            except rtree.core.RTreeError as e:
-                log_info_mssg('ERROR -- problem importing feature data. If you have filters configured, ' \
-                              'the source dataset may have no features that pass. Err: {0}'.format(e))
-                return False
-            except ValueError as e:
-                log_info_mssg('ERROR -- problem processing feature data. Err: {0}'.format(e))
-                return False
-
-            spatial_dbs.append(spatial_db)
-            source_schema = f.schema['geometry']
-            source_schemas.append(source_schema)
-            if debug:
-                log_info_mssg('Points to process: ' + str(spatial_db.count(spatial_db.bounds)))
-
+        try:
+            layer = load_features(input_file, feature_filters, feature_id, create_feature_id, transform)
+        except ValueError as e:
+            log_info_mssg('ERROR -- problem processing feature data. Err: {0}'.format(e))
+            return False
+        if not len(layer['geometries']):
+            log_info_mssg('ERROR -- problem importing feature data. If you have filters configured, ' \
+                          'the source dataset may have no features that pass.')
+            return False
+
+        layers.append(layer)
+        if debug:
+            log_info_mssg('Points to process: ' + str(len(layer['geometries'])))
+
+    for layer in layers:
+        layer['bounds'] = shapely.bounds(layer['geometries'])
+        if write_manifest and feature_id not in layer['properties']:
+            log_info_mssg('ERROR -- feature_id property ' + feature_id + ' not found, which is required to update MRFs')
+            return False
+
+    # Work out the lowest zoom level each feature appears in, from random feature reduction and cluster reduction.
+    # The spatial indexes are never modified; tiles only include features whose min zoom is at or below their level.
+    # When updating, features keep the zoom levels they had in the previous run.
+    if update:
+        dirty_bounds, dirty_min_zoom = diff_features(layers, previous_manifest, feature_id, tile_matrices,
+                                                     feature_reduce_rate, rng)
+    else:
+        for layer in layers:
+            layer['min_zoom'] = np.zeros(len(layer['geometries']), dtype=np.int64)
+            if layer['schema'] == 'Point' and (feature_reduce_rate or cluster_reduce_rate):
+                coords = layer['bounds'][:, 0:2]
+                layer['min_zoom'] = get_min_zooms(coords, tile_matrices, feature_reduce_rate, cluster_reduce_rate, rng)
+
+    # Evaluate the overview filters once for each feature and zoom level
+    overview_filter_predicates = {int(z): compile_filters(filters) for z, filters in overview_filters.items()}
+    for layer in layers:
+        layer['overview_masks'] = {z: passes_filters(layer['properties'], len(layer['geometries']))
+                                   for z, passes_filters in overview_filter_predicates.items()}
+
+    # Find the tiles at each zoom level that contain features, from the bounding boxes of the features.
+    # Only those tiles are encoded; the rest are left empty. When updating, only the tiles touched by
+    # added, changed, or removed features are encoded again.
+    occupied_tiles = []
+    for z, tile_matrix in enumerate(tile_matrices):
+        if update:
+            occupied_tiles.append(get_occupied_tiles(dirty_bounds[dirty_min_zoom <= z], tile_matrix, buffer_size))
+            continue
+        tile_numbers = []
+        for layer in layers:
+            visible = layer['min_zoom'] <= z
+            if z in layer['overview_masks']:
+                visible &= layer['overview_masks'][z]
+            tile_numbers.append(get_occupied_tiles(layer['bounds'][visible], tile_matrix, buffer_size))
+        occupied_tiles.append(np.unique(np.concatenate(tile_numbers)))
+    if update:
+        log_info_mssg('Re-encoding ' + str(sum([len(tile_numbers) for tile_numbers in occupied_tiles])) + ' tiles')
 
     # Build tilematrix pyramid from the bottom (highest zoom) up. We generate tiles left-right,
-    # top-bottom and write them successively to the MRF.
-    for i, tile_matrix in enumerate(reversed(tile_matrices)):
-        z = len(tile_matrices) - i - 1
-        z_orig_features = sum([spatial_dbs[idx].count(spatial_dbs[idx].bounds) for idx, spatial_db in enumerate(spatial_dbs)])
-
-        for idx, spatial_db in enumerate(spatial_dbs):
-            # We do general point rate reduction randomly, deleting those items from the
-            # spatial index. The highest zoom level is never reduced.
-            if source_schemas[idx] == 'Point' and feature_reduce_rate and z != len(tile_matrices) - 1:
-                feature_count = spatial_dbs[idx].count(spatial_dbs[idx].bounds)
-                num_points_to_delete = int(feature_count - math.floor(feature_count / feature_reduce_rate))
-                if debug:
-                    print(("Rate reduced " + str(num_points_to_delete) + " features from zoom level"))
-                for feature in random.sample([feature for feature in spatial_dbs[idx].intersection(
-                      spatial_dbs[idx].bounds, objects=True)], num_points_to_delete):
-                    spatial_dbs[idx].delete(feature.id, feature.bbox)
-
-            # Here we're culling points that are less than a pixel away from each other. We use a queue to keep track
-            # of them and avoid looking at points twice.
-            if source_schemas[idx] == 'Point' and cluster_reduce_rate and z != len(tile_matrices) - 1:
-                feature_queue = [
-                    item for item in spatial_dbs[idx].intersection(
-                        spatial_dbs[idx].bounds, objects=True)
-                ]
-                while feature_queue:
-                    feature = feature_queue.pop()
-                    sub_pixel_bbox = (
-                        feature.bbox[0] - tile_matrix['resolution'],
-                        feature.bbox[1] - tile_matrix['resolution'],
-                        feature.bbox[2] + tile_matrix['resolution'],
-                        feature.bbox[3] + tile_matrix['resolution'])
-                    nearby_points = [
-                        item for item in spatial_dbs[idx].intersection(
-                            sub_pixel_bbox, objects=True)
-                        if item.id != feature.id
-                    ]
-                    if nearby_points:
-                        # We reduce the number of clustered points to 1/nth of their previous number. (user-selectable)
-                        # All the nearby points are then dropped from the queue.
-                        for point in random.sample(
-                                nearby_points,
-                                len(nearby_points) - int(
-                                    math.floor(
-                                        len(nearby_points)**
-                                        (1 / float(cluster_reduce_rate))))):
-                            spatial_dbs[idx].delete(point.id, point.bbox)
-                        for point in nearby_points:
-                            [
-                                feature_queue.remove(item)
-                                for item in feature_queue
-                                if item.id == point.id
-                            ]
-
-        # Capture how many features are left after feature and cluster reduction
-        z_rdct_features = sum([spatial_dbs[idx].count(spatial_dbs[idx].bounds) for idx, spatial_db in enumerate(spatial_dbs)])
-
-        # Start making tiles. We figure out the tile's bbox, then search for all the features that intersect with that bbox,
-        # then turn the resulting list into an MVT tile and write the tile.
-        z_fltr_features = 0
-
-        for y in range(tile_matrix['matrix_height']):
-            for x in range(tile_matrix['matrix_width']):
-                # Get tile bounds
-                tile_size = tile_matrix['tile_size_in_map_units']
-
-                min_x = tile_matrix['matrix_extents'][0] + (x * tile_size)
-                max_y = tile_matrix['matrix_extents'][3] - (y * tile_size)
-                max_x = min_x + tile_size
-                min_y = max_y - tile_size
-                tile_bbox = shapely.geometry.box(min_x, min_y, max_x, max_y)
-
-                # If we're buffering around the edges, then use the same min/max buffer for all dimensions and tiles
-                if buffer_edges:
-                    tile_min_x_buffer = tile_max_x_buffer = tile_min_y_buffer = tile_max_y_buffer = (buffer_size * (tile_size / 256))
-
-                # Else, set the min/max buffer to 0 if we're on an edge
+    # top-bottom and write them successively to the MRF. Tiles are encoded in batches, concurrently
+    # if multiple cores are available, and the results come back in order.
+    tile_context.update({'tile_matrices': tile_matrices, 'layers': layers, 'layer_name': layer_name,
+                         'buffer_size': buffer_size, 'buffer_edges': buffer_edges, 'compress': compress, 'debug': debug})
+
+    # Keep a running count of how many features end up in the tiles in each zoom level after overview filtering
+    z_fltr_features = [0] * len(tile_matrices)
+    level_start = 0
+    for z in reversed(range(len(tile_matrices))):
+        # Simplify lines and polygons for this overview level only, removing the detail that would be lost when the
+        # tile is quantized to the 4096x4096 MVT grid anyway. The highest zoom level keeps the full resolution geometry.
+        for layer in layers:
+            layer['simplified'] = {}
+            if 'Point' not in layer['schema'] and z < len(tile_matrices) - 1:
+                tolerance = tile_matrices[z]['tile_size_in_map_units'] / 4096.0
+                if update:
+                    # Only the features in the tiles being encoded are needed
+                    tile_boxes = get_tile_boxes(tile_matrices[z], occupied_tiles[z], buffer_size)
+                    feature_idxs = np.unique(layer['tree'].query(tile_boxes)[1])
+                    layer['simplified'][z] = layer['geometries'].copy()
+                    layer['simplified'][z][feature_idxs] = shapely.simplify(layer['geometries'][feature_idxs], tolerance,
+                                                                            preserve_topology=True)
                 else:
-                    tile_min_x_buffer = buffer_size * (tile_size / 256) if x != 0 else 0
-                    tile_max_x_buffer = buffer_size * (tile_size / 256) if x != (tile_matrix['matrix_width'] - 1) else 0
-                    tile_min_y_buffer = buffer_size * (tile_size / 256) if y != 0 else 0
-                    tile_max_y_buffer = buffer_size * (tile_size / 256) if y != (tile_matrix['matrix_height'] - 1) else 0
-
-                tile_buffer_bbox = shapely.geometry.box(
-                    min_x - tile_min_x_buffer, min_y - tile_min_y_buffer,
-                    max_x + tile_max_x_buffer, max_y + tile_max_y_buffer)
-
-                if debug:
-                    print(("Processing tile: {0}/{1}/{2}\r".format(z, x, y)))
-                    print(("Tile Bounds: " + str(tile_bbox.bounds)))
-
-                # Iterate through the feature geometry and grab anything in this tile's bounds
-                tile_features = []
-                for spatial_db in spatial_dbs:
-                    for feature in [item.object for item in spatial_db.intersection(
-                          tile_buffer_bbox.bounds, objects=True)]:
-
-                        geometry = shapely.geometry.shape(feature['geometry'])
-                        # If the feature isn't fully contained in the tile bounds, we need to clip it.
-                        if not shapely.geometry.shape(feature['geometry']).within(tile_buffer_bbox):
-                            geometry = tile_buffer_bbox.intersection(geometry)
-
-                        new_feature = {
-                            'geometry': geometry,
-                            'properties': feature['properties']
-                        }
-                        tile_features.append(new_feature)
-
-                # Filter features based on overview feature filters
-                if str(z) in overview_filters:
-                    before_count = len(tile_features)
-                    filtered_features = [f for f in tile_features if passes_filters(f, overview_filters[str(z)], debug)]
-                    tile_features = filtered_features
-                    after_count = len(tile_features)
-
-                    if debug:
-                        print(("Filtered features in tile from " + str(before_count) + " to " + str(after_count)))
-
-                # Keep a running count of how many features end up in the tiles in this zoom level after overview filtering
-                z_fltr_features += len(tile_features)
-
-                # Create MVT tile from the features in this tile (Only doing single layers for now)
-                new_layer = {'name': layer_name, 'features': tile_features}
-
-                # Encode the MVT
-                mvt_tile = mapbox_vector_tile.encode(
-                    [new_layer],
-                    quantize_bounds=tile_bbox.bounds,
-                    y_coord_down=False)
-
-                # Write out artifact mvt files for debug mode.
-                if debug and mvt_tile:
-                    tiles_dir = os.path.join(os.getcwd(), 'tiles')
-                    if not os.path.exists(tiles_dir):
-                        os.mkdir(tiles_dir)
-
-                    mvt_filename = os.path.join(tiles_dir, 'test_{0}_{1}_{2}.mvt'.format(z, x, y))
-                    with open(mvt_filename, 'wb+') as f:
-                        f.write(mvt_tile)
-
-                # Write out MVT tile data to MRF. Note that we have to gzip the tile first.
-                if mvt_tile:
-                    out = io.BytesIO()
-                    gzip_obj = gzip.GzipFile(fileobj=out, mode='wb')
-                    gzip_obj.write(mvt_tile)
-                    gzip_obj.close()
-                    zipped_tile_data = out.getvalue()
-                    tile_index = struct.pack('!QQ', pvt_offset,
-                                             len(zipped_tile_data))
-                    pvt_offset += len(zipped_tile_data)
-                    fout.write(zipped_tile_data)
+                    layer['simplified'][z] = shapely.simplify(layer['geometries'], tolerance, preserve_topology=True)
 
-                else:
-                    tile_index = notile
-                fidx.write(tile_index)
+        batch_size = max(1, int(math.ceil(len(occupied_tiles[z]) / float(cores * 4))))
+        batches = [(z, occupied_tiles[z][i:i + batch_size]) for i in range(0, len(occupied_tiles[z]), batch_size)]
 
-        if debug:
+        # Index entries for the whole zoom level, written in one block. Empty tiles stay 0, 0.
+        level_size = tile_matrices[z]['matrix_width'] * tile_matrices[z]['matrix_height']
+        if update:
+            tile_index = previous_index[level_start:level_start + level_size].copy()
+        else:
+            tile_index = np.zeros((level_size, 2), dtype='>u8')
+        level_start += level_size
+
+        # The workers are forked for each level so that they inherit its simplified geometries along with the rest of
+        # tile_context, whose compressor and spatial indexes can't be pickled
+        pool = multiprocessing.get_context('fork').Pool(cores) if cores > 1 and len(batches) > 1 else None
+        try:
+            encoded_batches = pool.imap(encode_tiles, batches) if pool else map(encode_tiles, batches)
+            for (_, tile_numbers), encoded_batch in zip(batches, encoded_batches):
+                for tile_number, (zipped_tile_data, feature_count) in zip(tile_numbers, encoded_batch):
+                    z_fltr_features[z] += feature_count
+                    if zipped_tile_data:
+                        tile_index[tile_number] = (pvt_offset, len(zipped_tile_data))
+                        pvt_offset += len(zipped_tile_data)
+                        fout.write(zipped_tile_data)
+                    else:
+                        tile_index[tile_number] = (0, 0)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        fidx.write(tile_index.tobytes())
+
+        # Drop the simplified geometries before the next level is simplified
+        for layer in layers:
+            layer['simplified'] = {}
+
+    if debug:
+        for z in reversed(range(len(tile_matrices))):
+            z_orig_features = sum([np.count_nonzero(layer['min_zoom'] <= min(z + 1, len(tile_matrices) - 1)) for layer in layers])
+            z_rdct_features = sum([np.count_nonzero(layer['min_zoom'] <= z) for layer in layers])
             print(("Z-Level (" + str(z) + ") Tile Filtering - Orig: {0} / Reduced: {1} / Filtered: {2}".
-                  format(z_orig_features, z_rdct_features, z_fltr_features)))
+                  format(z_orig_features, z_rdct_features, z_fltr_features[z])))
     fidx.close()
     fout.close()
 
+    # Keep a record of the features, which the next update is compared against
+    if write_manifest:
+        with open(mrf_files['.features'], 'wb') as f:
+            np.savez(f, **get_feature_manifest(layers, feature_id, compression, settings))
+
     return True
 
 
+def encode_tiles(batch):
+    """
+    Encodes a batch of tiles of one zoom level (see tile_context).
+
+    Args:
+        batch (tuple) -- Zoom level, and array of tile numbers (row * matrix width + column) in the batch
+    Returns:
+        List of (compressed MVT tile data, feature count) tuples, one per tile.
+    """
+    z, tile_numbers = batch
+    matrix_width = tile_context['tile_matrices'][z]['matrix_width']
+    return [encode_tile(z, tile_number % matrix_width, tile_number // matrix_width) for tile_number in tile_numbers]
+
+
+def encode_tile(z, x, y):
+    """
+    Encodes a single tile (see tile_context). We figure out the tile's bbox, then search for all the features
+    at this zoom level that intersect with that bbox, then turn the resulting list into an MVT tile.
+
+    Args:
+        z (int) -- Zoom level of the tile
+        x (int) -- Column of the tile
+        y (int) -- Row of the tile
+    Returns:
+        Tuple of the compressed MVT tile data (empty if there is no tile) and the number of features in the tile.
+    """
+    tile_matrix = tile_context['tile_matrices'][z]
+    buffer_size = tile_context['buffer_size']
+    debug = tile_context['debug']
+
+    # Get tile bounds
+    tile_size = tile_matrix['tile_size_in_map_units']
+
+    min_x = tile_matrix['matrix_extents'][0] + (x * tile_size)
+    max_y = tile_matrix['matrix_extents'][3] - (y * tile_size)
+    max_x = min_x + tile_size
+    min_y = max_y - tile_size
+    tile_bbox = shapely.geometry.box(min_x, min_y, max_x, max_y)
+
+    # If we're buffering around the edges, then use the same min/max buffer for all dimensions and tiles
+    if tile_context['buffer_edges']:
+        tile_min_x_buffer = tile_max_x_buffer = tile_min_y_buffer = tile_max_y_buffer = (buffer_size * (tile_size / 256))
+
+    # Else, set the min/max buffer to 0 if we're on an edge
+    else:
+        tile_min_x_buffer = buffer_size * (tile_size / 256) if x != 0 else 0
+        tile_max_x_buffer = buffer_size * (tile_size / 256) if x != (tile_matrix['matrix_width'] - 1) else 0
+        tile_min_y_buffer = buffer_size * (tile_size / 256) if y != 0 else 0
+        tile_max_y_buffer = buffer_size * (tile_size / 256) if y != (tile_matrix['matrix_height'] - 1) else 0
+
+    tile_buffer_bbox = shapely.geometry.box(
+        min_x - tile_min_x_buffer, min_y - tile_min_y_buffer,
+        max_x + tile_max_x_buffer, max_y + tile_max_y_buffer)
+    shapely.prepare(tile_buffer_bbox)
+
+    if debug:
+        print(("Processing tile: {0}/{1}/{2}\r".format(z, x, y)))
+        print(("Tile Bounds: " + str(tile_bbox.bounds)))
+
+    # Iterate through the feature geometry and grab anything in this tile's bounds
+    tile_features = []
+    for layer in tile_context['layers']:
+        feature_idxs = np.sort(layer['tree'].query(tile_buffer_bbox))
+        feature_idxs = feature_idxs[layer['min_zoom'][feature_idxs] <= z]
+
+        # Filter features based on overview feature filters
+        if z in layer['overview_masks']:
+            before_count = len(feature_idxs)
+            feature_idxs = feature_idxs[layer['overview_masks'][z][feature_idxs]]
+            if debug:
+                print(("Filtered features in tile from " + str(before_count) + " to " + str(len(feature_idxs))))
+
+        geometries = layer['simplified'].get(z, layer['geometries'])[feature_idxs]
+
+        # If the feature isn't fully contained in the tile bounds, we need to clip it.
+        clip = ~shapely.contains(tile_buffer_bbox, geometries)
+        geometries[clip] = shapely.intersection(geometries[clip], tile_buffer_bbox)
+
+        for feature_idx, geometry in zip(feature_idxs, geometries):
+            new_feature = {
+                'geometry': geometry,
+                'properties': {name: column[feature_idx] for name, column in layer['properties'].items()}
+            }
+            tile_features.append(new_feature)
+
+    if not tile_features:
+        return b'', 0
+
+    # Create MVT tile from the features in this tile (Only doing single layers for now)
+    new_layer = {'name': tile_context['layer_name'], 'features': tile_features}
+
+    # Encode the MVT
+    mvt_tile = mapbox_vector_tile.encode(
+        [new_layer],
+        quantize_bounds=tile_bbox.bounds,
+        y_coord_down=False)
+
+    # Write out artifact mvt files for debug mode.
+    if debug and mvt_tile:
+        tiles_dir = os.path.join(os.getcwd(), 'tiles')
+        if not os.path.exists(tiles_dir):
+            os.makedirs(tiles_dir, exist_ok=True)
+
+        mvt_filename = os.path.join(tiles_dir, 'test_{0}_{1}_{2}.mvt'.format(z, x, y))
+        with open(mvt_filename, 'wb+') as f:
+            f.write(mvt_tile)
+
+    # Compress the MVT tile data before it's written to the MRF.
+    if not mvt_tile:
+        return b'', len(tile_features)
+    return tile_context['compress'](mvt_tile), len(tile_features)
+
+
+def get_tile_compressor(compression='gzip', level=None):
+    """
+    Returns a function that compresses MVT tile data for the MRF data file.
+
+    Args:
+        compression (str) -- gzip, zstd (requires the zstandard module), or none. Default is gzip
+        level (int) -- Compression level. Defaults to 6 for gzip and 3 for zstd
+    Returns:
+        Function that takes the MVT tile data and returns the compressed data.
+    """
+    compression = compression.lower()
+    if compression == 'gzip':
+        # Set up the compressor once and copy it for each tile
+        gzip_compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        def compress(data):
+            compressor = gzip_compressor.copy()
+            return compressor.compress(data) + compressor.flush()
+        return compress
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compression requires the zstandard module')
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress
+    elif compression == 'none':
+        return bytes
+    raise ValueError('Invalid MVT compression "{0}" -- must be gzip, zstd, or none'.format(compression))
+
+
+def cluster_reduce(coords, resolution, matrix_extents, cluster_reduce_rate, rng):
+    """
+    Selects which points to keep when culling points that are less than a pixel away from each other.
+
+    Points are snapped to a grid of pixels. In each pixel with more than one point, one point is kept along with
+    floor(n ** (1 / cluster_reduce_rate)) of the other n points, chosen randomly.
+
+    Args:
+        coords (numpy array) -- (N, 2) array of point coordinates
+        resolution (float) -- Size of a pixel in map units
+        matrix_extents (list float) -- The bounding box of the tile matrix
+        cluster_reduce_rate (float) -- Rate at which to reduce points in each pixel
+        rng (numpy Generator) -- Random number generator used to choose the points
+    Returns:
+        Boolean array that is True for each point that is kept.
+    """
+    cells = np.floor((coords - (matrix_extents[0], matrix_extents[1])) / resolution).astype(np.int64)
+    _, cell_ids, cell_counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cell_ids = cell_ids.ravel()
+
+    # Shuffle the points within each pixel, then keep the first ones
+    order = np.lexsort((rng.random(len(coords)), cell_ids))
+    cell_starts = np.concatenate(([0], np.cumsum(cell_counts)[:-1]))
+    rank = np.empty(len(coords), dtype=np.int64)
+    rank[order] = np.arange(len(coords)) - cell_starts[cell_ids[order]]
+    keep_counts = 1 + np.floor((cell_counts - 1) ** (1 / float(cluster_reduce_rate))).astype(np.int64)
+    return rank < keep_counts[cell_ids]
+
+
+def get_tile_settings(buffer_size, buffer_edges, overview_filters, feature_filters, feature_reduce_rate,
+                      cluster_reduce_rate):
+    """
+    Returns the settings the encoded tiles depend on, other than the tile matrices and compression, as a JSON string
+    that can be compared with the one recorded by the previous run.
+
+    Args:
+        buffer_size ... cluster_reduce_rate: Same as create_vector_mrf
+    """
+    return json.dumps({'buffer_size': buffer_size, 'buffer_edges': buffer_edges, 'overview_filters': overview_filters,
+                       'feature_filters': feature_filters, 'feature_reduce_rate': feature_reduce_rate,
+                       'cluster_reduce_rate': cluster_reduce_rate}, sort_keys=True, default=str)
+
+
+def get_feature_manifest(layers, feature_id, compression, settings):
+    """
+    Builds the record of features kept alongside an MRF for incremental updates.
+
+    Args:
+        layers (list object) -- Feature layers (see load_features), with their min zoom levels
+        feature_id (str) -- Identifier name of the unique feature property.
+        compression (str) -- Compression of the MVT tiles in the MRF data file
+        settings (str) -- Tile settings (see get_tile_settings)
+    Returns:
+        Dictionary of arrays with the key ('keys'), hash of the geometry and properties ('hashes'), bounding box
+        ('bounds'), and lowest zoom level ('min_zoom') of each feature, the tile compression ('compression'), and
+        the tile settings ('settings').
+    """
+    keys, hashes = get_feature_hashes(layers, feature_id)
+    return {'keys': keys, 'hashes': hashes, 'bounds': np.concatenate([layer['bounds'] for layer in layers]),
+            'min_zoom': np.concatenate([layer['min_zoom'] for layer in layers]),
+            'compression': np.array(compression.lower()), 'settings': np.array(settings)}
+
+
+def get_feature_hashes(layers, feature_id):
+    """
+    Returns the keys (input file number and feature ID) and hashes of the geometry and properties of each feature.
+
+    Args:
+        layers (list object) -- Feature layers (see load_features)
+        feature_id (str) -- Identifier name of the unique feature property.
+    Returns:
+        Tuple of the array of keys and the array of hashes.
+    """
+    keys = []
+    hashes = []
+    for layer_idx, layer in enumerate(layers):
+        columns = list(layer['properties'].values())
+        for feature_idx, wkb in enumerate(shapely.to_wkb(layer['geometries'])):
+            keys.append('{0}/{1}'.format(layer_idx, layer['properties'][feature_id][feature_idx]))
+            feature_hash = hashlib.blake2b(wkb, digest_size=16)
+            feature_hash.update(repr(tuple([column[feature_idx] for column in columns])).encode())
+            hashes.append(feature_hash.digest())
+    return np.array(keys, dtype=str), np.array(hashes, dtype='S16')
+
+
+def diff_features(layers, previous_manifest, feature_id, tile_matrices, feature_reduce_rate, rng):
+    """
+    Compares features with those of the previous run by feature ID, and sets the min zoom level of each layer's features.
+    Features that are still there keep their previous min zoom level. Added points get one at random,
+    using the feature reduction rate (see get_added_min_zooms).
+
+    Args:
+        layers (list object) -- Feature layers (see load_features)
+        previous_manifest (dict) -- Record of the features of the previous run (see get_feature_manifest)
+        feature_id (str) -- Identifier name of the unique feature property.
+        tile_matrices (list object) -- Tile matrices, from the lowest to the highest zoom level
+        feature_reduce_rate (float) -- Rate at which to reduce points for each successive zoom level
+        rng (numpy Generator) -- Random number generator used for added points
+    Returns:
+        Bounding boxes and min zoom levels of the added, changed (old and new versions), and removed features.
+    """
+    previous_idxs = {key: idx for idx, key in enumerate(previous_manifest['keys'])}
+    keys, hashes = get_feature_hashes(layers, feature_id)
+    bounds = np.concatenate([layer['bounds'] for layer in layers])
+    matches = np.array([previous_idxs.get(key, -1) for key in keys], dtype=np.int64)
+    found = matches >= 0
+
+    # Set the min zoom levels of each layer
+    min_zoom = np.zeros(len(matches), dtype=np.int64)
+    min_zoom[found] = previous_manifest['min_zoom'][matches[found]]
+    layer_start = 0
+    for layer in layers:
+        layer_end = layer_start + len(layer['geometries'])
+        added = ~found[layer_start:layer_end]
+        if layer['schema'] == 'Point' and feature_reduce_rate:
+            min_zoom[layer_start:layer_end][added] = get_added_min_zooms(np.count_nonzero(added), tile_matrices,
+                                                                         feature_reduce_rate, rng)
+        layer['min_zoom'] = min_zoom[layer_start:layer_end]
+        layer_start = layer_end
+
+    changed = found.copy()
+    changed[found] = hashes[found] != previous_manifest['hashes'][matches[found]]
+    removed = np.ones(len(previous_manifest['keys']), dtype=bool)
+    removed[matches[found]] = False
+    log_info_mssg('Updating MRF: {0} features added, {1} changed, {2} removed'.format(
+        np.count_nonzero(~found), np.count_nonzero(changed), np.count_nonzero(removed)))
+
+    # Changed features dirty the tiles of both their old and new versions
+    previous_dirty = np.zeros(len(previous_manifest['keys']), dtype=bool)
+    previous_dirty[matches[changed]] = True
+    previous_dirty |= removed
+    dirty = ~found | changed
+    return (np.concatenate([bounds[dirty], previous_manifest['bounds'][previous_dirty]]),
+            np.concatenate([min_zoom[dirty], previous_manifest['min_zoom'][previous_dirty]]))
+
+
+def get_added_min_zooms(count, tile_matrices, feature_reduce_rate, rng):
+    """
+    Works out the lowest zoom level of points added by an incremental update. Going up from the highest zoom level,
+    each point is kept with a probability of 1 / feature_reduce_rate, which matches the rate of a full build.
+    Cluster reduction isn't applied to added points.
+
+    Args:
+        count (int) -- Number of added points
+        tile_matrices (list object) -- Tile matrices, from the lowest to the highest zoom level
+        feature_reduce_rate (float) -- Rate at which to reduce points for each successive zoom level
+        rng (numpy Generator) -- Random number generator used to choose the levels
+    Returns:
+        Array with the lowest zoom level of each point.
+    """
+    levels_kept = np.floor(np.log(1 - rng.random(count)) / np.log(1 / float(feature_reduce_rate)))
+    return np.clip(len(tile_matrices) - 1 - levels_kept, 0, len(tile_matrices) - 1).astype(np.int64)
+
+
+def get_tile_boxes(tile_matrix, tile_numbers, buffer_size):
+    """
+    Returns the buffered boxes of tiles of a tile matrix.
+
+    Args:
+        tile_matrix (object) -- The tile matrix
+        tile_numbers (numpy array) -- Tile numbers (row * matrix width + column)
+        buffer_size (float) -- The buffer size around each tile, in pixels
+    Returns:
+        Array of shapely boxes.
+    """
+    tile_size = tile_matrix['tile_size_in_map_units']
+    buffer = buffer_size * (tile_size / 256)
+    min_x = tile_matrix['matrix_extents'][0] + (tile_numbers % tile_matrix['matrix_width']) * tile_size
+    max_y = tile_matrix['matrix_extents'][3] - (tile_numbers // tile_matrix['matrix_width']) * tile_size
+    return shapely.box(min_x - buffer, max_y - tile_size - buffer, min_x + tile_size + buffer, max_y + buffer)
+
+
+def get_occupied_tiles(bounds, tile_matrix, buffer_size):
+    """
+    Finds the tiles of a tile matrix that features may appear in, from the bounding boxes of the features.
+    The full tile buffer is used at the edges of the matrix too, so this can include a few tiles that turn out empty.
+
+    Args:
+        bounds (numpy array) -- (N, 4) array of feature bounding boxes
+        tile_matrix (object) -- The tile matrix
+        buffer_size (float) -- The buffer size around each tile, in pixels
+    Returns:
+        Sorted array of the tile numbers (row * matrix width + column) of the occupied tiles.
+    """
+    tile_size = tile_matrix['tile_size_in_map_units']
+    buffer = buffer_size * (tile_size / 256)
+    extents = tile_matrix['matrix_extents']
+    width = tile_matrix['matrix_width']
+    height = tile_matrix['matrix_height']
+
+    # Empty geometries have no bounds
+    bounds = bounds[~np.isnan(bounds).any(axis=1)]
+    first_x = np.clip(np.floor((bounds[:, 0] - buffer - extents[0]) / tile_size), 0, width - 1).astype(np.int64)
+    last_x = np.clip(np.floor((bounds[:, 2] + buffer - extents[0]) / tile_size), 0, width - 1).astype(np.int64)
+    first_y = np.clip(np.floor((extents[3] - bounds[:, 3] - buffer) / tile_size), 0, height - 1).astype(np.int64)
+    last_y = np.clip(np.floor((extents[3] - bounds[:, 1] + buffer) / tile_size), 0, height - 1).astype(np.int64)
+
+    occupied = np.zeros((height, width), dtype=bool)
+    single = (first_x == last_x) & (first_y == last_y)
+    occupied[first_y[single], first_x[single]] = True
+    for x0, x1, y0, y1 in zip(first_x[~single], last_x[~single], first_y[~single], last_y[~single]):
+        occupied[y0:y1 + 1, x0:x1 + 1] = True
+    return np.flatnonzero(occupied)
+
+
+def get_min_zooms(coords, tile_matrices, feature_reduce_rate, cluster_reduce_rate, rng):
+    """
+    Works out the lowest zoom level each point appears in. Going up from the highest zoom level, which is never reduced,
+    each zoom level keeps 1 of every feature_reduce_rate points of the level below (chosen randomly), then culls the points
+    that are less than a pixel away from each other (see cluster_reduce).
+
+    Args:
+        coords (numpy array) -- (N, 2) array of point coordinates
+        tile_matrices (list object) -- Tile matrices, from the lowest to the highest zoom level
+        feature_reduce_rate (float) -- Rate at which to reduce points for each successive zoom level
+        cluster_reduce_rate (float) -- Rate at which to reduce points in clusters of 1px or less
+        rng (numpy Generator) -- Random number generator used to choose the points
+    Returns:
+        Array with the lowest zoom level of each point.
+    """
+    min_zoom = np.full(len(coords), len(tile_matrices) - 1, dtype=np.int64)
+    survivors = np.arange(len(coords))
+    for z in reversed(range(len(tile_matrices) - 1)):
+        if feature_reduce_rate:
+            survivors = np.sort(rng.choice(survivors, int(math.floor(len(survivors) / feature_reduce_rate)), replace=False))
+        if cluster_reduce_rate and len(survivors):
+            survivors = survivors[cluster_reduce(coords[survivors], tile_matrices[z]['resolution'],
+                                                 tile_matrices[z]['matrix_extents'], cluster_reduce_rate, rng)]
+        min_zoom[survivors] = z
+    return min_zoom
+
+
 def get_tms(target_x, target_y, extents, tile_size, o_levels, proj):
     tile_matrices = []
     if proj.IsGeographic():
@@ -433,59 +829,160 @@ def build_mrf_dom(tile_matrices, extents, tile_size, proj):
 
 # UTILITY STUFF
 
-# This is the recommended way of building an rtree index.
-def rtree_index_generator(features, filter_list, feature_id, create_feature_id):
+def get_transform(source_projection_str, target_projection_str):
+    """
+    Returns a function that reprojects coordinates, for use with shapely.transform.
 
-    for idx, feature in enumerate(features):
-        try:
-            if len(filter_list) == 0 or passes_filters(feature, filter_list):
-                if create_feature_id:
-                    if feature_id in feature['properties']:
-                        raise ValueError("Unique ID Property (" + feature_id + " already exists; Cannot create")
-
-                    # Update (or initialize) the static feature id counter if we are assigning feature IDs
-                    try:
-                        rtree_index_generator.feature_id_value += 1
-                    except AttributeError:
-                        rtree_index_generator.feature_id_value = 1
-                    feature['properties'][feature_id] = rtree_index_generator.feature_id_value
-
-                yield (idx, shapely.geometry.shape(feature['geometry']).bounds, feature)
-        except ValueError as e:
-            print("WARN - " + str(e))
+    Args:
+        source_projection_str (str) -- EPSG code of the source projection
+        target_projection_str (str) -- EPSG code of the target projection
+    Returns:
+        Function that takes an (N, 2) array of coordinates and returns the reprojected coordinates.
+    """
+    source_proj = osr.SpatialReference()
+    source_proj.ImportFromEPSG(int(source_projection_str.split(':')[1]))
+    target_proj = osr.SpatialReference()
+    target_proj.ImportFromEPSG(int(target_projection_str.split(':')[1]))
+    # Always use x/y (lon/lat) order, like the input files
+    source_proj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    target_proj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transformation = osr.CoordinateTransformation(source_proj, target_proj)
 
+    def transform(coords):
+        if not len(coords):
+            return coords
+        return np.array(transformation.TransformPoints(coords.tolist()))[:, 0:2]
 
-def passes_filters(feature, filter_list, debug=False):
-    return any([filter_block_func(feature, filter_block, debug) for filter_block in filter_list])
+    return transform
 
 
-def filter_block_func(feature, filter_block, debug=False):
-    if filter_block['logic'].lower() == "and":
-        return all([filter_func(feature, comp, debug) for comp in filter_block['filters']])
-    else:
-        return any([filter_func(feature, comp, debug) for comp in filter_block['filters']])
+def load_features(input_file, feature_filters, feature_id, create_feature_id, transform=None):
+    """
+    Reads the features of a vector datafile one at a time, keeping the ones that pass the feature filters.
+
+    Args:
+        input_file (str) -- Path to the vector datafile. Accepts GeoJSON and Shapefiles
+        feature_filters (list object) -- List of options for filtering features
+        feature_id (str) -- Identifier name of the unique feature property.
+        create_feature_id (boolean) -- Flag indicating whether the unique feature id should be created.
+        transform (function) -- Function used to reproject the geometries (see get_transform). Default is None
+    Returns:
+        Dictionary with the geometry type of the file ('schema'), an array of shapely geometries ('geometries'),
+        an STRtree spatial index of the geometries ('tree'), and a map of property names to lists of
+        property values, one per feature ('properties').
+    """
+    passes_filters = compile_filters(feature_filters)
+    geometries = []
+    with fiona.open(input_file) as f:
+        schema = f.schema['geometry']
+        property_names = list(f.schema['properties'])
+        properties = {name: [] for name in property_names}
+        if create_feature_id:
+            if feature_id in properties:
+                raise ValueError("Unique ID Property (" + feature_id + ") already exists; Cannot create")
+            properties[feature_id] = []
+
+        # Read and filter the features in chunks, so only one chunk of feature dicts is held in memory at a time
+        features = iter(f)
+        while True:
+            chunk = [feature for feature in itertools.islice(features, 10000) if feature['geometry'] is not None]
+            if not chunk:
+                break
+            chunk_properties = {name: [feature['properties'].get(name) for feature in chunk] for name in property_names}
+            passes = passes_filters(chunk_properties, len(chunk))
+
+            chunk_geometries = [shapely.geometry.shape(feature['geometry']) for feature in itertools.compress(chunk, passes)]
+            if transform and chunk_geometries:
+                chunk_geometries = list(shapely.transform(np.array(chunk_geometries, dtype=object), transform))
+            geometries.extend(chunk_geometries)
+            for name in property_names:
+                properties[name].extend(itertools.compress(chunk_properties[name], passes))
+            if create_feature_id:
+                # Update (or initialize) the static feature id counter if we are assigning feature IDs
+                if not hasattr(load_features, 'feature_id_value'):
+                    load_features.feature_id_value = 0
+                passed = int(np.count_nonzero(passes))
+                properties[feature_id].extend(range(load_features.feature_id_value + 1, load_features.feature_id_value + passed + 1))
+                load_features.feature_id_value += passed
+
+    geometry_array = np.empty(len(geometries), dtype=object)
+    geometry_array[:] = geometries
+    return {'schema': schema, 'geometries': geometry_array, 'tree': shapely.STRtree(geometry_array),
+            'properties': properties}
+
+
+def compile_filters(filter_list):
+    """
+    Compiles a list of filter blocks into a predicate that tests many features at once. A feature passes
+    if it passes any of the filter blocks. If there are no filter blocks, every feature passes.
 
+    Args:
+        filter_list (list object) -- List of filter blocks, as parsed from the configuration
+    Returns:
+        Function that takes feature properties stored column-wise (map of property names to lists of values) and the
+        number of features, and returns a boolean array that is True for each feature that passes the filters.
+    """
+    filter_blocks = [(filter_block['logic'].lower() == 'and', [compile_filter(comp) for comp in filter_block['filters']])
+                     for filter_block in filter_list]
+
+    def passes_filters(properties, count):
+        if not filter_blocks:
+            return np.ones(count, dtype=bool)
+        result = np.zeros(count, dtype=bool)
+        for logic_and, filters in filter_blocks:
+            results = [passes_filter(properties, count) for passes_filter in filters]
+            if logic_and:
+                result |= np.logical_and.reduce(results + [np.ones(count, dtype=bool)])
+            else:
+                result |= np.logical_or.reduce(results + [np.zeros(count, dtype=bool)])
+        return result
+
+    return passes_filters
+
+
+def compile_filter(comparison):
+    """
+    Compiles a single filter test (see compile_filters). equals and notEquals compare the property value with
+    the filter value, or search its string value with the regexp. Numeric tests convert the property values to
+    floats; a missing or non-numeric value fails the test.
 
-def filter_func(feature, comparison, debug=False):
-    property_value = str(feature['properties'].get(comparison['name']))
+    Args:
+        comparison (object) -- Filter test, as parsed from the configuration
+    Returns:
+        Function that takes column-wise feature properties and the number of features, and returns a boolean array
+        that is True for each feature that passes the test.
+    """
+    name = comparison['name']
+    value = comparison['value']
 
     if comparison['comparison'] in ['equals', 'notEquals']:
         equality = comparison['comparison'] == 'equals'
         regexp = comparison['regexp']
-        if regexp:
-            result = regexp.search(property_value)
-        else:
-            result = feature['properties'].get(comparison['name']) == comparison['value']
-        return result if equality else not result
+
+        def passes_filter(properties, count):
+            column = properties.get(name, [None] * count)
+            if regexp:
+                result = np.fromiter((regexp.search(str(v)) is not None for v in column), dtype=bool, count=count)
+            else:
+                result = np.fromiter((v == value for v in column), dtype=bool, count=count)
+            return result if equality else ~result
     else:
-        values = sorted(set([float(comparison['value']), float(feature['properties'].get(comparison['name']))]))
+        compare = {'ge': np.greater_equal, 'gt': np.greater, 'le': np.less_equal, 'lt': np.less}[comparison['comparison']]
+
+        def passes_filter(properties, count):
+            column = properties.get(name, [None] * count)
+            try:
+                values = np.array(column, dtype=float)
+            except (TypeError, ValueError):
+                values = np.array([to_float(v) for v in column], dtype=float)
+            with np.errstate(invalid='ignore'):
+                return compare(values, value)
 
-        filterValIdx = values.index(comparison['value'])
+    return passes_filter
 
-        result = (comparison['comparison'] in ['ge', 'le'] and len(values) == 1) or + \
-                 (comparison['comparison'] in ['ge', 'gt'] and filterValIdx == 0) or + \
-                 (comparison['comparison'] in ['le', 'lt'] and filterValIdx == 1)
 
-        if debug and not result:
-            print((str(feature['properties'].get(comparison['name'])) + " not " + comparison['comparison'] + " than " + str(comparison['value'])))
-        return result
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# Compares the compression time and size of <mvt_compression> settings on the tiles of existing MVT MRFs.
+#
+# Example:
+#
+#  oe_mvt_compression_benchmark.py
+#   -c gzip:1 -c gzip:6 -c zstd:3
+#   /onearth/vectors/FIRMS_MODIS_Thermal_Anomalies/2021/FIRMS_MODIS_Thermal_Anomalies2021190_.mrf
+#
+
+from optparse import OptionParser
+import gzip
+import os
+import struct
+import sys
+import time
+from oe_create_mvt_mrf import get_tile_compressor, zstandard
+
+versionNumber = os.environ.get('ONEARTH_VERSION')
+
+DEFAULT_SETTINGS = ['none', 'gzip:1', 'gzip:6', 'gzip:9', 'zstd:3', 'zstd:9', 'zstd:19']
+
+
+def read_tiles(mrf_filename):
+    """
+    Reads and decompresses all the MVT tiles of an MVT MRF.
+    Arguments:
+        mrf_filename -- Path of the MRF header, index, or data file
+    """
+    basename = os.path.splitext(mrf_filename)[0]
+    with open(basename + '.idx', 'rb') as idx:
+        index = idx.read()
+    tiles = []
+    with open(basename + '.pvt', 'rb') as pvt:
+        for i in range(0, len(index), 16):
+            offset, size = struct.unpack('!QQ', index[i:i + 16])
+            if size == 0:
+                continue
+            pvt.seek(offset)
+            data = pvt.read(size)
+            if data[:2] == b'\x1f\x8b':
+                data = gzip.decompress(data)
+            elif data[:4] == b'\x28\xb5\x2f\xfd':
+                data = zstandard.ZstdDecompressor().decompress(data)
+            tiles.append(data)
+    return tiles
+
+
+def benchmark(tiles, compression, level, repeat=3):
+    """
+    Compresses the tiles with a compression setting and returns the best time (in seconds) and the total compressed size.
+    Arguments:
+        tiles -- List of uncompressed MVT tiles
+        compression -- gzip, zstd, or none
+        level -- Compression level, or None for the default
+        repeat -- Number of times to compress the tiles
+    """
+    compress = get_tile_compressor(compression, level)
+    best_time = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        size = sum(len(compress(tile)) for tile in tiles)
+        elapsed = time.perf_counter() - start_time
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time, size
+
+
+if __name__ == '__main__':
+    # Define command line options and args.
+    parser = OptionParser(usage='usage: %prog [options] mrf_filename [mrf_filename ...]', version=versionNumber)
+    parser.add_option('-c', '--compression', action='append', dest='settings', default=[],
+                      help='Compression setting to test, as compression[:level] (e.g. gzip:6).  May be repeated.  '
+                           'Default: ' + ' '.join(DEFAULT_SETTINGS))
+    parser.add_option('-r', '--repeat', action='store', type='int', dest='repeat', default=3,
+                      help='Number of times to compress the tiles for each setting; the best time is reported.  Default: 3')
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+    if len(args) == 0:
+        parser.error('No MRFs provided')
+
+    settings = options.settings or [setting for setting in DEFAULT_SETTINGS
+                                    if zstandard is not None or not setting.startswith('zstd')]
+
+    tiles = []
+    for mrf_filename in args:
+        tiles.extend(read_tiles(mrf_filename))
+    raw_size = sum(len(tile) for tile in tiles)
+    if raw_size == 0:
+        print('No tiles found')
+        sys.exit(1)
+    print('{0} tiles, {1} bytes uncompressed'.format(len(tiles), raw_size))
+
+    print('{0:<12}{1:>14}{2:>10}{3:>14}{4:>14}'.format('setting', 'bytes', 'ratio', 'time (ms)', 'MB/s'))
+    for setting in settings:
+        compression, _, level = setting.partition(':')
+        try:
+            elapsed, size = benchmark(tiles, compression, int(level) if level else None, options.repeat)
+        except ValueError as e:
+            print('{0:<12}{1}'.format(setting, e))
+            continue
+        print('{0:<12}{1:>14}{2:>10.3f}{3:>14.1f}{4:>14.1f}'.format(
+              setting, size, size / float(raw_size), elapsed * 1000, raw_size / elapsed / 1e6 if elapsed else 0))
@@ -59,6 +59,31 @@ except:
 versionNumber = os.environ.get('ONEARTH_VERSION')
 basename = None
 
+def vector_translate(in_filename, out_filename, output_format, source_epsg, target_epsg, sigevent_url, options=None):
+    """
+    Converts a vector file to another format with GDAL, in the same process, reprojecting it if needed.
+    Arguments:
+        in_filename -- the input file
+        out_filename -- the output file
+        output_format -- the OGR driver name of the output format
+        source_epsg -- the EPSG code of source file
+        target_epsg -- the EPSG code of target file
+        sigevent_url -- the URL for SigEvent
+        options -- additional ogr2ogr options
+    """
+    options = options or []
+    log_info_mssg(str().join(['Converting ', in_filename, ' to ', output_format, ' ', out_filename]))
+    reproject = source_epsg != target_epsg
+    translate_options = gdal.VectorTranslateOptions(options=options, format=output_format,
+                                                    srcSRS=source_epsg if reproject else None,
+                                                    dstSRS=target_epsg if reproject else None)
+    dataset = gdal.VectorTranslate(out_filename, in_filename, options=translate_options)
+    if dataset is None:
+        log_sig_err(str().join(['Unable to convert ', in_filename, ': ', gdal.GetLastErrorMsg()]), sigevent_url)
+        raise Exception(gdal.GetLastErrorMsg())
+    # Closing the dataset flushes it to disk
+    dataset = None
+
 def geojson2shp(in_filename, out_filename, source_epsg, target_epsg, sigevent_url):
     """
     Converts GeoJSON into Esri Shapefile.
@@ -69,11 +94,8 @@ def geojson2shp(in_filename, out_filename, source_epsg, target_epsg, sigevent_ur
         target_epsg -- the EPSG code of target file
         sigevent_url -- the URL for SigEvent
     """
-    if source_epsg == target_epsg:
-        ogr2ogr_command_list = ['ogr2ogr', '-f', 'ESRI Shapefile', '-fieldTypeToString', 'Date,Time,DateTime', out_filename, in_filename]
-    else:
-        ogr2ogr_command_list = ['ogr2ogr', '-f', 'ESRI Shapefile', '-fieldTypeToString', 'Date,Time,DateTime', '-s_srs', source_epsg, '-t_srs', target_epsg, out_filename, in_filename]
-    run_command(ogr2ogr_command_list, sigevent_url)
+    vector_translate(in_filename, out_filename, 'ESRI Shapefile', source_epsg, target_epsg, sigevent_url,
+                     ['-fieldTypeToString', 'Date,Time,DateTime'])
 
 def shp2geojson(in_filename, out_filename, source_epsg, target_epsg, sigevent_url):
     """
@@ -85,11 +107,7 @@ def shp2geojson(in_filename, out_filename, source_epsg, target_epsg, sigevent_ur
         target_epsg -- the EPSG code of target file
         sigevent_url -- the URL for SigEvent
     """
-    if source_epsg == target_epsg:
-        ogr2ogr_command_list = ['ogr2ogr', '-f', 'GeoJSON', out_filename, in_filename]
-    else:
-        ogr2ogr_command_list = ['ogr2ogr', '-f', 'GeoJSON', '-s_srs', source_epsg, '-t_srs', target_epsg, out_filename, in_filename]
-    run_command(ogr2ogr_command_list, sigevent_url)
+    vector_translate(in_filename, out_filename, 'GeoJSON', source_epsg, target_epsg, sigevent_url)
 
 
 def parse_filter(elem):
@@ -276,6 +294,11 @@ if __name__ == '__main__':
             cluster_reduce_rate = float(get_dom_tag_value(dom, 'cluster_reduce_rate'))
         except:
             cluster_reduce_rate = 0
+        # Seed for the random selection of reduced features
+        try:
+            reduce_seed = int(get_dom_tag_value(dom, 'reduce_seed'))
+        except:
+            reduce_seed = None
         # Input files.
         try:
             input_files = get_input_files(dom)
@@ -308,6 +331,28 @@ if __name__ == '__main__':
         except:
             buffer_edges = False
 
+        # Compression of MVT tiles in the MRF data file
+        try:
+            mvt_compression = get_dom_tag_value(dom, "mvt_compression").lower()
+        except:
+            mvt_compression = 'gzip'
+        try:
+            mvt_compression_level = int(get_dom_attr_value(dom, "mvt_compression", "level"))
+        except:
+            mvt_compression_level = None
+
+        # Update an existing MVT MRF instead of rebuilding it
+        try:
+            incremental_update = get_dom_tag_value(dom, "incremental_update").lower() == "true"
+        except:
+            incremental_update = False
+
+        # Number of processes used to encode MVT tiles
+        try:
+            mrf_cores = int(get_dom_tag_value(dom, "mrf_cores"))
+        except:
+            mrf_cores = 1
+
         # Feature Filtering options
         feature_filters = []
         filter_options = dom.getElementsByTagName('feature_filters')
@@ -468,8 +513,14 @@ if __name__ == '__main__':
     log_info_mssg(str().join(['config create_feature_id:       ', str(create_feature_id)]))
     log_info_mssg(str().join(['config feature_reduce_rate:     ', str(feature_reduce_rate)]))
     log_info_mssg(str().join(['config cluster_reduce_rate:     ', str(cluster_reduce_rate)]))
+    log_info_mssg(str().join(['config reduce_seed:             ', str(reduce_seed)]))
     log_info_mssg(str().join(['config buffer_size:             ', str(buffer_size)]))
     log_info_mssg(str().join(['config buffer_edges:            ', str(buffer_edges)]))
+    if output_format == 'mvt-mrf':
+        log_info_mssg(str().join(['config mrf_cores:               ', str(mrf_cores)]))
+        log_info_mssg(str().join(['config incremental_update:      ', str(incremental_update)]))
+        log_info_mssg(str().join(['config mvt_compression:         ', mvt_compression,
+                                  '' if mvt_compression_level is None else ' level ' + str(mvt_compression_level)]))
     log_info_mssg(str().join(['config target_epsg:             ', target_epsg]))
     log_info_mssg(str().join(['config source_epsg:             ', source_epsg]))
     log_info_mssg(str().join(['vectorgen current_cycle_time:   ', current_cycle_time]))
@@ -550,25 +601,27 @@ if __name__ == '__main__':
                 mssg=str().join(['Output created:  ', out_filename+".shp"])
 
         elif output_format == 'mvt-mrf': # Create MVT-MRF
-            for idx, tile in enumerate(alltiles):
-                # create_vector_mrf can handle GeoJSON and Shapefile, but the file's projection has to match the desired output
-                if source_epsg != target_epsg:
-                    outfile = os.path.join(working_dir, basename + '_reproject_' + str(idx) + os.path.splitext(tile)[1])
-                    ogr2ogr_command_list = ['ogr2ogr', '-preserve_fid', '-f', "GeoJSON" if "json" in os.path.splitext(tile)[1]
-                        else "ESRI Shapefile", '-s_srs', source_epsg, '-t_srs', target_epsg, outfile, tile]
-                    run_command(ogr2ogr_command_list, sigevent_url)
-                    alltiles[idx] = outfile
+            # create_vector_mrf can handle GeoJSON and Shapefile, and reprojects features as they are read
+            mrf_exts = [".mrf", ".idx", ".pvt"] + ([".features"] if incremental_update else [])
+            if incremental_update:
+                # Move the existing MRF to the working directory so it can be updated in place
+                for ext in mrf_exts:
+                    if os.path.isfile(out_filename+ext):
+                        log_info_mssg(str().join(['Moving ', out_filename+ext, ' to ', os.path.join(working_dir, basename+ext)]))
+                        shutil.move(out_filename+ext, os.path.join(working_dir, basename+ext))
             log_info_mssg("Creating vector mrf with " + ', '.join(alltiles))
             success = create_vector_mrf(alltiles, working_dir, basename, tile_layer_name, target_x, target_y,
                                         target_extents, tile_size, overview_levels, target_epsg, feature_filters, overview_filters,
                                         feature_id, create_feature_id, feature_reduce_rate=feature_reduce_rate,
                                         cluster_reduce_rate=cluster_reduce_rate,
-                                        buffer_size=buffer_size, buffer_edges=buffer_edges, debug=False)
+                                        buffer_size=buffer_size, buffer_edges=buffer_edges, cores=mrf_cores,
+                                        seed=reduce_seed, compression=mvt_compression,
+                                        compression_level=mvt_compression_level, source_projection_str=source_epsg,
+                                        update=incremental_update, debug=False)
             if not success: errors += 1
 
-            files = [os.path.join(working_dir, basename + ".mrf"),
-                     os.path.join(working_dir, basename + ".idx"),
-                     os.path.join(working_dir, basename + ".pvt")]
+            files = [os.path.join(working_dir, basename + ext) for ext in mrf_exts
+                     if ext != ".features" or os.path.isfile(os.path.join(working_dir, basename + ext))]
 
             for mfile in files:
                 title, ext = os.path.splitext(os.path.basename(mfile))